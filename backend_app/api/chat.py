@@ -4,11 +4,17 @@ from langchain.prompts import PromptTemplate
 from langchain.tools import Tool
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_tavily import TavilySearch
-from langchain_core.runnables import RunnableBranch, RunnablePassthrough
+from langchain_core.runnables import RunnableBranch, RunnableLambda, RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
 
-from backend_app.core.memory import VectorMemory
+from backend_app.core.executors import run_in_vector_executor
+from backend_app.core.intent_router import (
+    MEMORY_SEARCH, ROUTER_BATCHING, WEB_SEARCH, get_intent_router, get_route_batcher
+)
+from backend_app.core.memory import get_vector_memory
 from backend_app.core.memory_manager import MemoryManager
+from backend_app.core.response_cache import get_response_cache
+from backend_app.core.speculation import Speculation, speculation_metrics
 from backend_app.core.config import get_api_key
 import os
 import logging
@@ -31,6 +37,7 @@ failed_responses_logger.setLevel(logging.INFO)
 class UserInput(BaseModel):
     text: str
     session_id: str = None  # Optional session ID, will generate if not provided
+    user_id: str = None  # Optional user ID, scopes long-term memory to this user
 
 class AppResponse(BaseModel):
     reply: str
@@ -163,13 +170,100 @@ You are a world-class researcher and assistant. Answer the following question ba
 
 Question: {question}
 
+Conversation context (only to resolve references to earlier messages; may be empty):
+{context}
+
 Search Results: {search_results}
 
 Provide a clear, accurate, and helpful response in Portuguese. If the search results seem outdated, mention this but still provide the information found.
 """)
 
+# Pesquisa Tavily (só a pergunta, sem o contexto); None se não houver API key
+async def search_web(question_text: str):
+    # Verificar se a API key do Tavily está disponível
+    try:
+        tavily_key = get_api_key('TAVILY_API_KEY')
+        print(f"🔑 Tavily API Key configurada: {tavily_key[:20] if tavily_key else 'NÃO'}")
+        print("✅ Tavily API Key válida, executando pesquisa...")
+    except ValueError as e:
+        print(f"⚠️  Tavily API Key não configurada: {e}")
+        return None
+    
+    # Criar a ferramenta de pesquisa com API key configurada
+    web_search_tool = TavilySearch(max_results=3)
+    print("🔧 Ferramenta Tavily criada, executando pesquisa...")
+    
+    # Usar o campo 'query' que a Tavily espera (assíncrono: pode ser cancelado)
+    search_results = await web_search_tool.ainvoke({"query": question_text})
+    print(f"📊 Resultados da pesquisa recebidos: {type(search_results)}")
+    print(f"📊 Conteúdo dos resultados: {search_results}")
+    
+    # Formatar os resultados para o prompt
+    formatted_results = ""
+    if search_results and 'results' in search_results:
+        print(f"📝 Formatando {len(search_results['results'])} resultados...")
+        for i, result in enumerate(search_results['results'][:3], 1):
+            formatted_results += f"\n{i}. {result.get('title', 'Sem título')}\n"
+            formatted_results += f"   {result.get('content', 'Sem conteúdo')[:300]}...\n"
+    else:
+        print("⚠️  Nenhum resultado encontrado ou formato inesperado")
+    
+    print(f"📝 Resultados formatados: {formatted_results[:200]}...")
+    return formatted_results
+
+# Resposta final a partir dos resultados da pesquisa (o contexto só entra aqui)
+async def answer_from_search(question_text: str, context: str, formatted_results) -> str:
+    if formatted_results is None:
+        # Se não há API key, usar apenas o LLM
+        from backend_app.core.llm import get_llm_response
+        return get_llm_response(with_context(f"Responda à seguinte pergunta: {question_text}", context))
+    
+    # Executar o LLM com os resultados
+    llm_instance = get_web_search_llm()
+    if llm_instance is None:
+        print("❌ LLM não disponível para processar resultados")
+        return "Desculpe, não posso fazer pesquisas na web no momento. Por favor, verifique a configuração das API keys."
+    
+    print("🤖 LLM disponível, processando resultados...")
+    response = await llm_instance.ainvoke(
+        web_search_prompt.format(question=question_text, context=context or "(none)",
+                                 search_results=formatted_results)
+    )
+    print(f"✅ Resposta do LLM gerada: {len(response.content)} caracteres")
+    return response.content
+
+# Semantic answer cache: only answers that do not depend on session memory
+async def cached_answer(question_text: str, context: str):
+    """
+    Cached answer for a near-identical question
+
+    The MemoryManager context is empty exactly when no recent turns, summary or
+    memories were included; any memory in the context bypasses the cache.
+    """
+    cache = get_response_cache()
+    if cache is None or context:
+        return None
+    try:
+        return await run_in_vector_executor(cache.lookup, question_text)
+    except Exception as e:
+        print(f"⚠️ Response cache lookup failed: {e}")
+        return None
+
+async def answer_and_cache(question_text: str, context: str, formatted_results) -> str:
+    """Final web answer, stored in the response cache when it is context-free"""
+    answer = await answer_from_search(question_text, context, formatted_results)
+    cache = get_response_cache()
+    if cache is not None and not context and not is_failed_response(answer):
+        # Answers without search results get the longer "general" TTL
+        route = WEB_SEARCH if formatted_results is not None else "general"
+        try:
+            await run_in_vector_executor(cache.store, question_text, answer, route)
+        except Exception as e:
+            print(f"⚠️ Response cache store failed: {e}")
+    return answer
+
 # Função para executar pesquisa web
-async def execute_web_search(question: str) -> str:
+async def execute_web_search(question: str, context: str = "") -> str:
     try:
         print(f"🔍 Executando pesquisa na web para: {question}")
         
@@ -180,59 +274,49 @@ async def execute_web_search(question: str) -> str:
         else:
             question_text = str(question)
         
-        # Verificar se a API key do Tavily está disponível
-        try:
-            tavily_key = get_api_key('TAVILY_API_KEY')
-            print(f"🔑 Tavily API Key configurada: {tavily_key[:20] if tavily_key else 'NÃO'}")
-            print("✅ Tavily API Key válida, executando pesquisa...")
-        except ValueError as e:
-            print(f"⚠️  Tavily API Key não configurada: {e}")
-            # Se não há API key, usar apenas o LLM
-            from backend_app.core.llm import get_llm_response
-            return get_llm_response(f"Responda à seguinte pergunta: {question_text}")
-        
-        # Criar a ferramenta de pesquisa com API key configurada
-        web_search_tool = TavilySearch(max_results=3)
-        print("🔧 Ferramenta Tavily criada, executando pesquisa...")
-        
-        # Usar o campo 'query' que a Tavily espera
-        search_results = web_search_tool.invoke({"query": question_text})
-        print(f"📊 Resultados da pesquisa recebidos: {type(search_results)}")
-        print(f"📊 Conteúdo dos resultados: {search_results}")
-        
-        # Formatar os resultados para o prompt
-        formatted_results = ""
-        if search_results and 'results' in search_results:
-            print(f"📝 Formatando {len(search_results['results'])} resultados...")
-            for i, result in enumerate(search_results['results'][:3], 1):
-                formatted_results += f"\n{i}. {result.get('title', 'Sem título')}\n"
-                formatted_results += f"   {result.get('content', 'Sem conteúdo')[:300]}...\n"
-        else:
-            print("⚠️  Nenhum resultado encontrado ou formato inesperado")
+        cached = await cached_answer(question_text, context)
+        if cached is not None:
+            return cached
         
-        print(f"📝 Resultados formatados: {formatted_results[:200]}...")
-        
-        # Executar o LLM com os resultados
-        llm_instance = get_web_search_llm()
-        if llm_instance is None:
-            print("❌ LLM não disponível para processar resultados")
-            return "Desculpe, não posso fazer pesquisas na web no momento. Por favor, verifique a configuração das API keys."
-        
-        print("🤖 LLM disponível, processando resultados...")
-        response = await llm_instance.ainvoke(
-            web_search_prompt.format(question=question_text, search_results=formatted_results)
-        )
-        print(f"✅ Resposta do LLM gerada: {len(response.content)} caracteres")
-        return response.content
+        formatted_results = await search_web(question_text)
+        return await answer_and_cache(question_text, context, formatted_results)
         
     except Exception as e:
         print(f"❌ Erro na pesquisa web: {e}")
         import traceback
         traceback.print_exc()
         # Se falhar, usar apenas o LLM
-        print("🔄 Usando fallback para LLM apenas...")
-        from backend_app.core.llm import get_llm_response
-        return get_llm_response(f"Responda à seguinte pergunta: {question_text if 'question_text' in locals() else question}")
+        return llm_only_answer(question_text if 'question_text' in locals() else question, context)
+
+def llm_only_answer(question_text: str, context: str = "") -> str:
+    """Answer with the LLM alone when the web search is unavailable"""
+    print("🔄 Usando fallback para LLM apenas...")
+    from backend_app.core.llm import get_llm_response
+    return get_llm_response(with_context(f"Responda à seguinte pergunta: {question_text}", context))
+
+def with_context(prompt: str, context: str) -> str:
+    """Prepend the conversation context to a final answer prompt"""
+    if not context:
+        return prompt
+    return f"Context from previous conversations:\n{context}\n\n{prompt}"
+
+# Pesquisa na memória semântica (bloqueante)
+def search_memories(question_text: str) -> list:
+    # Reutilizar a ligação Weaviate partilhada do processo
+    memory_manager = get_vector_memory()
+    print("✅ VectorMemory obtida da pool partilhada")
+    
+    # Buscar na memória
+    memory_results = memory_manager.search_memory(question_text, limit=3)
+    print(f"📊 Memory search results: {memory_results}")
+    print(f"📊 Number of results: {len(memory_results) if memory_results else 0}")
+    return memory_results or []
+
+def format_memory_answer(memory_results: list) -> str:
+    memory_text = "\n".join(memory_results)
+    result = f"Com base nas nossas conversas anteriores, encontrei esta informação:\n\n{memory_text}"
+    print(f"✅ Returning memory-based response: {result[:100]}...")
+    return result
 
 # Especialista em Memória
 async def execute_memory_search(question: str) -> str:
@@ -246,20 +330,10 @@ async def execute_memory_search(question: str) -> str:
         else:
             question_text = str(question)
         
-        # Criar o gerenciador de memória
-        memory_manager = VectorMemory()
-        print("✅ VectorMemory instance created")
-        
-        # Buscar na memória
-        memory_results = memory_manager.search_memory(question_text, limit=3)
-        print(f"📊 Memory search results: {memory_results}")
-        print(f"📊 Number of results: {len(memory_results) if memory_results else 0}")
+        memory_results = await run_in_vector_executor(search_memories, question_text)
         
         if memory_results:
-            memory_text = "\n".join(memory_results)
-            result = f"Com base nas nossas conversas anteriores, encontrei esta informação:\n\n{memory_text}"
-            print(f"✅ Returning memory-based response: {result[:100]}...")
-            return result
+            return format_memory_answer(memory_results)
         else:
             result = "Não encontrei informações relevantes nas nossas conversas anteriores. Posso ajudar-te com uma pesquisa na web?"
             print(f"⚠️  No memory results found, returning: {result}")
@@ -315,16 +389,42 @@ def get_router_chain():
         return router_prompt | llm | StrOutputParser()
     return None
 
+# Router LLM as a fallback only: most questions are classified locally
+def invoke_router_llm(prompt: str) -> str:
+    """Blocking router LLM call used by the batched classifier"""
+    llm = get_router_llm()
+    if llm is None:
+        raise RuntimeError("Router LLM não disponível")
+    return llm.invoke(prompt).content
+
+async def llm_route(question: str) -> str:
+    """Ask the router LLM for the route of a question"""
+    if ROUTER_BATCHING:
+        # Concurrent requests share one structured batch prompt
+        return await get_route_batcher(invoke_router_llm).classify(question)
+    router_chain = get_router_chain()
+    if router_chain is None:
+        raise RuntimeError("Router LLM não disponível")
+    return await router_chain.ainvoke({"question": question})
+
+async def classify_question(input_dict) -> str:
+    """Local intent classification (rules, example centroids, cache), LLM only when unsure"""
+    question = input_dict.get("question", "") if isinstance(input_dict, dict) else str(input_dict)
+    decision = await get_intent_router().classify(question, llm_classify=llm_route)
+    print(f"🧭 Router: {decision.route} (source={decision.source}, "
+          f"confidence={decision.confidence:.2f}, cached={decision.cached})")
+    return decision.route
+
 # --- 3. Lógica de Roteamento ---
 
 # Função para executar web search
 async def web_search_expert(input_dict):
-    print(f"🌐 WEB SEARCH EXPERT called with: {input_dict}")
-    return await execute_web_search(input_dict["question"])
+    print(f"🌐 WEB SEARCH EXPERT called with: {input_dict['question']}")
+    return await execute_web_search(input_dict["question"], input_dict.get("context", ""))
 
 # Função para executar memory search
 async def memory_search_expert(input_dict):
-    print(f"🧠 MEMORY SEARCH EXPERT called with: {input_dict}")
+    print(f"🧠 MEMORY SEARCH EXPERT called with: {input_dict['question']}")
     return await execute_memory_search(input_dict["question"])
 
 # Função para verificar se é web_search
@@ -348,14 +448,69 @@ full_branch = RunnableBranch(
 
 # Função para obter a cadeia completa (lazy initialization)
 def get_full_chain():
-    """Get or create the full chain"""
-    router_chain = get_router_chain()
-    if router_chain:
-        return {
-            "classification": router_chain, 
-            "question": RunnablePassthrough()
-        } | full_branch
-    return None
+    """
+    Get or create the full chain
+
+    Input: {"question": raw user message, "context": memory context}. Only the
+    question is classified and searched; the context reaches the answer prompt.
+    """
+    return RunnablePassthrough.assign(classification=RunnableLambda(classify_question)) | full_branch
+
+# --- Speculative experts ---
+
+# Start memory lookup and web search together with the classification
+SPECULATIVE_EXPERTS = os.getenv("CHAT_SPECULATIVE_EXPERTS", "false").lower() in ("1", "true", "yes")
+# Per-request cap on the cost of branches started before the route is known
+SPECULATIVE_COST_CAP = float(os.getenv("CHAT_SPECULATIVE_COST_CAP", "1.2"))
+WEB_SEARCH_COST = float(os.getenv("CHAT_WEB_SEARCH_COST", "1.0"))  # one Tavily search
+MEMORY_SEARCH_COST = float(os.getenv("CHAT_MEMORY_SEARCH_COST", "0.2"))  # one embedding + vector query
+
+async def speculative_answer(question: str, context: str) -> str:
+    """
+    Run the classification, the memory lookup and the web search concurrently
+
+    The losing branch is cancelled as soon as the route is known. When the
+    memory route finds nothing or fails, the already running web search answers
+    instead; when the web search fails, the LLM answers alone. Failures never
+    start a second web search. A response cache hit returns before any branch
+    is started.
+    """
+    cached = await cached_answer(question, context)
+    if cached is not None:
+        return cached
+    
+    speculation = Speculation(SPECULATIVE_COST_CAP)
+    memory_search = lambda: run_in_vector_executor(search_memories, question)
+    web_search = lambda: search_web(question)
+    speculation.start("memory", memory_search, MEMORY_SEARCH_COST)
+    speculation.start("web", web_search, WEB_SEARCH_COST)
+    try:
+        try:
+            route = await classify_question({"question": question})
+        except Exception as e:
+            print(f"❌ Classification failed, answering from the web search: {e}")
+            route = WEB_SEARCH
+        if route == MEMORY_SEARCH:
+            try:
+                memory_results = await speculation.result("memory", memory_search)
+            except Exception as e:
+                print(f"❌ Speculative memory search failed: {e}")
+                memory_results = []
+            if memory_results:
+                speculation.cancel("web")
+                return format_memory_answer(memory_results)
+            print("🔀 No memory results, answering from the web search")
+            speculation.fallback()
+        else:
+            speculation.cancel("memory")
+        try:
+            formatted_results = await speculation.result("web", web_search)
+            return await answer_and_cache(question, context, formatted_results)
+        except Exception as e:
+            print(f"❌ Speculative web search failed: {e}")
+            return llm_only_answer(question, context)
+    finally:
+        speculation.cancel_all()
 
 # --- 4. Endpoints da API ---
 
@@ -455,6 +610,16 @@ async def handle_voice_chat(audio_file: UploadFile = File(...)):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
+@router.get("/chat/metrics")
+async def chat_metrics():
+    """Routing, speculation and response cache counters of this worker"""
+    response_cache = get_response_cache()
+    return {
+        "router": get_intent_router().stats(),
+        "speculation": speculation_metrics.stats(),
+        "response_cache": response_cache.stats() if response_cache else {"enabled": False},
+    }
+
 @router.post("/chat", response_model=AppResponse)
 async def handle_chat(user_input: UserInput):
     """
@@ -484,7 +649,8 @@ async def handle_chat(user_input: UserInput):
             session_id=session_id,
             query=user_input.text,
             recent_message_count=5,
-            semantic_search_results=3
+            semantic_search_results=3,
+            user_id=user_input.user_id
         )
         print(f"🧠 Context retrieved: {len(context)} characters")
         
@@ -494,10 +660,11 @@ async def handle_chat(user_input: UserInput):
         
         # 4. Save successful conversation to memory
         if not is_failed_response(response):
-            success = memory_manager.add_message(
+            success = await memory_manager.add_message_async(
                 session_id=session_id,
                 user_message=user_input.text,
-                assistant_message=response
+                assistant_message=response,
+                user_id=user_input.user_id
             )
             if success:
                 print("💾 Conversation saved to both PostgreSQL and Weaviate")
@@ -555,32 +722,31 @@ async def process_with_context(user_message: str, context: str) -> str:
         str: Agent's response
     """
     try:
-        # Enhanced prompt that includes context
-        contextual_message = f"""
-        Context from previous conversations:
-        {context}
-        
-        Current user message: {user_message}
-        
-        Please provide a helpful response considering both the current message and the conversation context.
-        """
+        # Route and search on the raw message; the token-budgeted context only
+        # goes into the final answer prompt
+        if SPECULATIVE_EXPERTS:
+            print("🔄 Using speculative experts with context...")
+            try:
+                return await speculative_answer(user_message, context)
+            except Exception as speculative_error:
+                print(f"❌ Speculative experts failed: {speculative_error}")
+                return await execute_web_search(user_message, context)
         
-        # Try to use the full chain with routing
         full_chain = get_full_chain()
         if full_chain:
             print("🔄 Using intelligent routing with context...")
             try:
-                response = await full_chain.ainvoke({"question": contextual_message})
+                response = await full_chain.ainvoke({"question": user_message, "context": context})
                 print("✅ Routing with context successful")
                 return response
             except Exception as router_error:
                 print(f"❌ Router with context failed: {router_error}")
                 # Fallback to web search with context
-                return await execute_web_search(contextual_message)
+                return await execute_web_search(user_message, context)
         else:
             # Direct web search with context
             print("🔄 Using direct web search with context...")
-            return await execute_web_search(contextual_message)
+            return await execute_web_search(user_message, context)
             
     except Exception as e:
         print(f"❌ Error processing with context: {e}")
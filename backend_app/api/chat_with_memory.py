@@ -7,15 +7,17 @@ Integra o MemoryManager com FastAPI para conversas com memória persistente
 from dotenv import load_dotenv
 load_dotenv()
 
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, FastAPI
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, FastAPI, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
+from contextlib import asynccontextmanager
 from sqlalchemy.orm import Session
 import weaviate
 import logging
 import json
 import asyncio
-from typing import Dict, Any, AsyncGenerator
+import time
+from typing import Dict, Any, AsyncGenerator, Optional
 from pydantic import BaseModel
 import uuid
 from datetime import datetime
@@ -25,9 +27,21 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 from ..core.hybrid_memory_manager import MemoryManager
-from ..models.database import get_db
+from ..models.database import get_db, get_db_session, close_db_session
 from ..core.weaviate_client import get_weaviate_client
 from ..core.ai_agent import get_ai_agent
+from ..core.streaming import StreamEncoder, negotiate_stream_protocol
+from ..core.executors import run_in_db_executor, shutdown_executors
+from ..core.outbox_indexer import get_outbox_indexer, stop_outbox_indexer
+from ..core.group_commit import stop_chat_history_writer
+from ..core.embeddings import stop_embedding_pipeline
+from ..core.session_summaries import stop_session_summarizer
+from ..core.memory_backends import close_memory_backend, uses_weaviate
+from ..core.tenancy import MEMORY_MULTI_TENANCY, get_tenant_registry, stop_tenant_registry
+from ..core.context_assembler import analyze_context
+from ..core.session_history import (
+    MAX_PAGE_SIZE, decode_cursor, fetch_history_page, iter_history, parse_fields
+)
 
 # Router do FastAPI
 chat_router = APIRouter(tags=["chat"])
@@ -37,13 +51,16 @@ class ChatRequest(BaseModel):
     message: str
     session_id: str = None  # Opcional - será gerado se não fornecido
     context_mode: str = "hybrid"  # "hybrid", "recent_only", "semantic_only"
+    stream_protocol: Optional[int] = None  # Versão do protocolo de streaming (None = v1)
+    include_stats: bool = False  # Incluir estatísticas de memória na resposta
+    user_id: Optional[str] = None  # Dono da conversa (tenant da memória semântica)
 
 class ChatResponse(BaseModel):
     response: str
     session_id: str
     timestamp: str
     context_used: Dict[str, Any]
-    memory_stats: Dict[str, Any]
+    memory_stats: Optional[Dict[str, Any]] = None  # Só quando include_stats=True
 
 class MemoryStatsResponse(BaseModel):
     stats: Dict[str, Any]
@@ -51,11 +68,12 @@ class MemoryStatsResponse(BaseModel):
 
 # Dependência para obter MemoryManager
 def get_memory_manager(
-    db: Session = Depends(get_db),
-    weaviate_client: weaviate.Client = Depends(get_weaviate_client)
+    db: Session = Depends(get_db)
 ) -> MemoryManager:
     """Cria uma instância do MemoryManager com as dependências necessárias"""
     try:
+        # Com MEMORY_BACKEND=local não há ligação ao Weaviate
+        weaviate_client = get_weaviate_client() if uses_weaviate() else None
         return MemoryManager(db_session=db, weaviate_client=weaviate_client)
     except Exception as e:
         logger.error(f"❌ Erro ao criar MemoryManager: {e}")
@@ -93,7 +111,8 @@ async def chat_with_memory(
             try:
                 context = await memory_manager.get_context(
                     session_id=session_id,
-                    query=request.message
+                    query=request.message,
+                    user_id=request.user_id
                 )
                 
                 # Extrair informações sobre o contexto usado
@@ -130,11 +149,12 @@ async def chat_with_memory(
             memory_manager,
             session_id,
             request.message,
-            assistant_message
+            assistant_message,
+            request.user_id
         )
         
-        # 6. OBTER ESTATÍSTICAS DE MEMÓRIA
-        memory_stats = memory_manager.get_memory_stats()
+        # 6. OBTER ESTATÍSTICAS DE MEMÓRIA (apenas se pedidas)
+        memory_stats = memory_manager.get_memory_stats() if request.include_stats else None
         
         # 7. CONSTRUIR RESPOSTA
         response = ChatResponse(
@@ -165,10 +185,18 @@ async def chat_with_memory_stream(
 ):
     """
     Endpoint de chat com streaming para respostas em tempo real
-    Retorna chunks de resposta conforme são gerados pelo AI
+    Retorna chunks de resposta conforme são gerados pelo AI e regista
+    o tempo até ao primeiro token (time-to-first-token)
+    
+    Protocolos (campo stream_protocol do pedido):
+    - v1 (por omissão): eventos "content" com chunk + texto acumulado
+    - v2: eventos "delta" com número de sequência; o evento "complete"
+      leva length + sha256 para verificação no cliente
     """
     
     async def generate_stream() -> AsyncGenerator[str, None]:
+        started_at = time.perf_counter()
+        encoder = StreamEncoder(negotiate_stream_protocol(request.stream_protocol))
         try:
             # 1. GESTÃO DE SESSÃO
             session_id = request.session_id or str(uuid.uuid4())
@@ -181,9 +209,10 @@ async def chat_with_memory_stream(
                 "type": "metadata",
                 "session_id": session_id,
                 "timestamp": timestamp.isoformat(),
-                "status": "processing"
+                "status": "processing",
+                "protocol": encoder.version
             }
-            yield f"data: {json.dumps(metadata)}\n\n"
+            yield encoder.event(metadata)
             
             # 2. RECUPERAR CONTEXTO DA MEMÓRIA
             context = ""
@@ -193,7 +222,8 @@ async def chat_with_memory_stream(
                 try:
                     context = await memory_manager.get_context(
                         session_id=session_id,
-                        query=request.message
+                        query=request.message,
+                        user_id=request.user_id
                     )
                     context_info = _analyze_context(context)
                     logger.info(f"🧠 Contexto recuperado para stream: {context_info}")
@@ -203,7 +233,7 @@ async def chat_with_memory_stream(
                         "type": "context",
                         "context_info": context_info
                     }
-                    yield f"data: {json.dumps(context_data)}\n\n"
+                    yield encoder.event(context_data)
                     
                 except Exception as e:
                     logger.warning(f"⚠️ Erro ao recuperar contexto: {e}")
@@ -214,37 +244,26 @@ async def chat_with_memory_stream(
             
             # 4. PROCESSAR COM AGENTE AI E STREAM
             try:
-                # Simular streaming por agora (mais tarde integrar com streaming real do LLM)
-                ai_response = await ai_agent.process_message(
+                # Streaming real: cada token do LLM segue para o cliente assim que é gerado
+                accumulated_response = ""
+                time_to_first_token = None
+                
+                async for chunk_text in ai_agent.stream_message(
                     message=enhanced_prompt,
                     session_id=session_id
-                )
+                ):
+                    if time_to_first_token is None:
+                        time_to_first_token = time.perf_counter() - started_at
+                        logger.info(f"⚡ Primeiro token em {time_to_first_token:.3f}s - Sessão: {session_id}")
+                    
+                    accumulated_response += chunk_text
+                    yield encoder.content(chunk_text)
                 
-                if not ai_response or not ai_response.get("response"):
+                if not accumulated_response.strip():
                     raise Exception("Resposta vazia do agente AI")
                 
-                assistant_message = ai_response["response"]
-                
-                # Simular streaming dividindo a resposta em chunks
-                words = assistant_message.split()
-                chunk_size = 3  # palavras por chunk
-                
-                accumulated_response = ""
-                
-                for i in range(0, len(words), chunk_size):
-                    chunk_words = words[i:i + chunk_size]
-                    chunk_text = " ".join(chunk_words)
-                    accumulated_response += chunk_text + " "
-                    
-                    chunk_data = {
-                        "type": "content",
-                        "chunk": chunk_text + " ",
-                        "accumulated": accumulated_response.strip()
-                    }
-                    yield f"data: {json.dumps(chunk_data)}\n\n"
-                    
-                    # Pequena pausa para simular processamento
-                    await asyncio.sleep(0.1)
+                assistant_message = accumulated_response
+                total_time = time.perf_counter() - started_at
                 
                 # 5. GUARDAR CONVERSA EM BACKGROUND
                 background_tasks.add_task(
@@ -252,22 +271,25 @@ async def chat_with_memory_stream(
                     memory_manager,
                     session_id,
                     request.message,
-                    assistant_message
+                    assistant_message,
+                    request.user_id
                 )
                 
-                # 6. OBTER ESTATÍSTICAS FINAIS
-                memory_stats = memory_manager.get_memory_stats()
-                
                 # Enviar dados finais
                 final_data = {
-                    "type": "complete",
                     "session_id": session_id,
                     "timestamp": datetime.now().isoformat(),
                     "context_used": context_info,
-                    "memory_stats": memory_stats,
-                    "final_response": assistant_message
+                    "metrics": {
+                        "time_to_first_token": round(time_to_first_token, 3),
+                        "total_time": round(total_time, 3)
+                    }
                 }
-                yield f"data: {json.dumps(final_data)}\n\n"
+                
+                # 6. OBTER ESTATÍSTICAS FINAIS (apenas se pedidas)
+                if request.include_stats:
+                    final_data["memory_stats"] = memory_manager.get_memory_stats()
+                yield encoder.complete(final_data, assistant_message)
                 
             except Exception as e:
                 logging.error(f"❌ ERRO NO STREAMING: {e}", exc_info=True)
@@ -275,7 +297,7 @@ async def chat_with_memory_stream(
                     "type": "error",
                     "message": "Desculpa, tive dificuldades em processar a tua mensagem. Podes tentar novamente?"
                 }
-                yield f"data: {json.dumps(error_data)}\n\n"
+                yield encoder.event(error_data)
                 
         except Exception as e:
             logging.error(f"❌ ERRO CRÍTICO NO STREAMING: {e}", exc_info=True)
@@ -283,7 +305,7 @@ async def chat_with_memory_stream(
                 "type": "error",
                 "message": "Erro interno do servidor. Tenta novamente."
             }
-            yield f"data: {json.dumps(error_data)}\n\n"
+            yield encoder.event(error_data)
     
     return StreamingResponse(
         generate_stream(),
@@ -297,11 +319,16 @@ async def chat_with_memory_stream(
 
 @chat_router.get("/memory/stats", response_model=MemoryStatsResponse)
 async def get_memory_statistics(
+    fresh: bool = False,
     memory_manager: MemoryManager = Depends(get_memory_manager)
 ):
-    """Endpoint para obter estatísticas do sistema de memória"""
+    """
+    Endpoint para obter estatísticas do sistema de memória
+    
+    Por omissão devolve o snapshot em cache; fresh=true força o recálculo.
+    """
     try:
-        stats = memory_manager.get_memory_stats()
+        stats = memory_manager.get_memory_stats(fresh=fresh)
         
         return MemoryStatsResponse(
             stats=stats,
@@ -319,13 +346,15 @@ async def get_memory_statistics(
 async def get_session_context(
     session_id: str,
     query: str = "conversa geral",
+    user_id: Optional[str] = None,
     memory_manager: MemoryManager = Depends(get_memory_manager)
 ):
     """Endpoint para testar a recuperação de contexto para uma sessão específica"""
     try:
         context = await memory_manager.get_context(
             session_id=session_id,
-            query=query
+            query=query,
+            user_id=user_id
         )
         
         return {
@@ -342,6 +371,61 @@ async def get_session_context(
             detail="Erro ao recuperar contexto da sessão"
         )
 
+@chat_router.get("/sessions/{session_id}/history")
+async def get_session_history(
+    session_id: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    format: str = Query("json", pattern="^(json|ndjson)$")
+):
+    """
+    Histórico de uma sessão com paginação por cursor (keyset em session_id, sequence)
+    
+    - cursor: valor next_cursor da página anterior
+    - fields: campos separados por vírgulas (sequence, type, content, timestamp, indexed)
+    - format=ndjson: exporta o resto da sessão em streaming, uma mensagem por linha,
+      lendo páginas de `limit` mensagens de cada vez
+    """
+    try:
+        selected_fields = parse_fields(fields)
+        after = decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    descending = order == "desc"
+    
+    if format == "ndjson":
+        def generate_ndjson():
+            for message in iter_history(session_id, after, limit, selected_fields, descending):
+                yield json.dumps(message, ensure_ascii=False) + "\n"
+        
+        # Gerador síncrono: o Starlette consome-o numa thread, fora do event loop
+        return StreamingResponse(generate_ndjson(), media_type="application/x-ndjson")
+    
+    def load_page():
+        db = get_db_session()
+        try:
+            return fetch_history_page(db, session_id, after, limit, selected_fields, descending)
+        finally:
+            close_db_session(db)
+    
+    try:
+        messages, next_cursor = await run_in_db_executor(load_page)
+    except Exception as e:
+        logger.error(f"❌ Erro ao obter histórico da sessão: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail="Erro ao recuperar histórico da sessão"
+        )
+    
+    return {
+        "session_id": session_id,
+        "messages": messages,
+        "next_cursor": next_cursor
+    }
+
 @chat_router.delete("/sessions/{session_id}")
 async def clear_session_memory(
     session_id: str,
@@ -365,55 +449,22 @@ async def clear_session_memory(
 # FUNÇÕES AUXILIARES
 
 def _build_enhanced_prompt(user_message: str, context: str, context_mode: str) -> str:
-    """Constrói o prompt melhorado com contexto de memória"""
+    """Constrói o prompt com o contexto de memória (formato compacto)"""
     
     if not context or context_mode == "none":
         return user_message
     
-    enhanced_prompt = f"""CONTEXTO DE MEMÓRIA:
+    return f"""Contexto de memória (usa-o só se for relevante para a mensagem):
 {context}
 
----
-
-MENSAGEM ATUAL DO UTILIZADOR:
-{user_message}
-
----
-
-INSTRUÇÕES:
-- Usa o contexto de memória acima para fornecer respostas mais personalizadas e consistentes
-- Se houver informações relevantes no histórico, refere-te a elas de forma natural
-- Mantém a continuidade das conversas anteriores quando apropriado
-- Se não houver contexto relevante, responde normalmente à mensagem atual"""
-
-    return enhanced_prompt
+Mensagem do utilizador:
+{user_message}"""
 
 def _analyze_context(context: str) -> Dict[str, Any]:
-    """Analisa o contexto retornado para extrair metadados"""
-    analysis = {
-        "type": "unknown",
-        "recent_count": 0,
-        "semantic_count": 0,
-        "has_recent": False,
-        "has_semantic": False
-    }
-    
-    if not context:
-        analysis["type"] = "none"
-        return analysis
-    
-    # Contar secções
-    if "HISTÓRICO RECENTE" in context:
-        analysis["has_recent"] = True
-        # Contar mensagens do utilizador no histórico recente
-        recent_section = context.split("MEMÓRIAS RELEVANTES")[0]
-        analysis["recent_count"] = recent_section.count("🙋 **Utilizador:**")
-    
-    if "MEMÓRIAS RELEVANTES" in context:
-        analysis["has_semantic"] = True
-        # Contar memórias relevantes
-        semantic_section = context.split("MEMÓRIAS RELEVANTES")[1] if "MEMÓRIAS RELEVANTES" in context else ""
-        analysis["semantic_count"] = semantic_section.count("**Memória")
+    """Analisa o contexto retornado para extrair metadados (itens e tokens por secção)"""
+    analysis = analyze_context(context)
+    analysis["has_recent"] = analysis["recent_count"] > 0
+    analysis["has_semantic"] = analysis["semantic_count"] > 0
     
     # Determinar tipo
     if analysis["has_recent"] and analysis["has_semantic"]:
@@ -422,6 +473,8 @@ def _analyze_context(context: str) -> Dict[str, Any]:
         analysis["type"] = "recent_only"
     elif analysis["has_semantic"]:
         analysis["type"] = "semantic_only"
+    else:
+        analysis["type"] = "none"
     
     return analysis
 
@@ -429,14 +482,16 @@ async def _save_conversation_background(
     memory_manager: MemoryManager,
     session_id: str,
     user_message: str,
-    assistant_message: str
+    assistant_message: str,
+    user_id: Optional[str] = None
 ):
     """Função para guardar conversa em background sem bloquear a resposta"""
     try:
-        success = memory_manager.add_message(
+        success = await memory_manager.add_message_async(
             session_id=session_id,
             user_message=user_message,
-            assistant_message=assistant_message
+            assistant_message=assistant_message,
+            user_id=user_id
         )
         
         if success:
@@ -447,11 +502,29 @@ async def _save_conversation_background(
     except Exception as e:
         logger.error(f"❌ Erro crítico ao guardar conversa: {e}")
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Gere recursos partilhados do worker (arranque e encerramento)"""
+    # Retomar a indexação de conversas que ficaram pendentes no outbox
+    get_outbox_indexer().start()
+    if MEMORY_MULTI_TENANCY and uses_weaviate():
+        # Descarregar periodicamente os tenants sem atividade recente
+        get_tenant_registry().start()
+    yield
+    stop_chat_history_writer()
+    stop_outbox_indexer()
+    stop_tenant_registry()
+    stop_session_summarizer()
+    close_memory_backend()
+    stop_embedding_pipeline()
+    shutdown_executors()
+
 # Criar a aplicação FastAPI
 app = FastAPI(
     title="Ethic Companion API",
     description="API para chat com sistema de memória híbrida",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
 # Configurar CORS
@@ -15,7 +15,7 @@ Integra LLM com ferramenta            # Comentar OpenAI temporariamente para usa
 
 import asyncio
 import logging
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, AsyncIterator
 import os
 from datetime import datetime
 
@@ -263,6 +263,73 @@ Responde sempre em português e mantém um tom caloroso e acessível."""
                 "timestamp": datetime.now().isoformat()
             }
     
+    async def stream_message(self, message: str, session_id: str) -> AsyncIterator[str]:
+        """
+        Processa uma mensagem em streaming, produzindo fragmentos de texto
+        à medida que o LLM os gera (em vez de esperar pela resposta completa)
+        
+        Args:
+            message: Mensagem do utilizador
+            session_id: ID da sessão para contexto
+            
+        Yields:
+            str: Fragmentos (tokens) da resposta
+        """
+        # Se temos agente com ferramentas, propagar os tokens do ciclo de ferramentas
+        if self.agent_executor:
+            emitted = False
+            try:
+                async for chunk in self._agent_stream(message):
+                    emitted = True
+                    yield chunk
+                if emitted:
+                    return
+                logger.warning(f"⚠️ Agente não produziu texto em streaming - Sessão: {session_id}")
+            except Exception as e:
+                logger.error(f"❌ Erro no streaming do agente executor: {e}")
+                if emitted:
+                    # Já enviámos parte da resposta; não misturar com outra geração
+                    raise
+        
+        # Se só temos LLM direto (ou o agente falhou antes do primeiro token)
+        if self.llm:
+            async for chunk in self._direct_llm_stream(message):
+                yield chunk
+            return
+        
+        # Se não temos nenhum LLM
+        yield self._fallback_response(message)
+    
+    async def _agent_stream(self, message: str) -> AsyncIterator[str]:
+        """Propaga os tokens do LLM gerados dentro do AgentExecutor"""
+        root_run_id = None
+        streamed_text = False
+        final_output = None
+        
+        async for event in self.agent_executor.astream_events(
+            {"input": message, "chat_history": []},  # Memória gerida externamente
+            version="v2"
+        ):
+            if root_run_id is None:
+                root_run_id = event.get("run_id")
+            
+            kind = event.get("event")
+            if kind == "on_chat_model_stream":
+                chunk = event.get("data", {}).get("chunk")
+                text = getattr(chunk, "content", None)
+                # Chamadas de ferramentas chegam sem conteúdo textual
+                if isinstance(text, str) and text:
+                    streamed_text = True
+                    yield text
+            elif kind == "on_chain_end" and event.get("run_id") == root_run_id:
+                output = event.get("data", {}).get("output") or {}
+                if isinstance(output, dict):
+                    final_output = output.get("output")
+        
+        # O LLM não emitiu tokens (ex.: resposta vinda diretamente de uma ferramenta)
+        if not streamed_text and final_output:
+            yield final_output
+    
     async def _direct_llm_response(self, message: str) -> str:
         """Resposta direta do LLM sem ferramentas"""
         try:
@@ -282,6 +349,27 @@ Responde de forma empática, reflexiva e em português.""")
             logger.error(f"❌ Erro na resposta direta do LLM: {e}")
             return "Desculpa, tive dificuldades em processar a tua mensagem. Podes tentar novamente?"
     
+    async def _direct_llm_stream(self, message: str) -> AsyncIterator[str]:
+        """Resposta direta do LLM em streaming, sem ferramentas"""
+        emitted = False
+        try:
+            system_msg = SystemMessage(content="""És o Ethic Companion, especializado em ética e desenvolvimento pessoal. 
+Responde de forma empática, reflexiva e em português.""")
+            
+            human_msg = HumanMessage(content=message)
+            
+            async for chunk in self.llm.astream([system_msg, human_msg]):
+                if chunk.content:
+                    emitted = True
+                    yield chunk.content
+            
+        except Exception as e:
+            logger.error(f"❌ Erro no streaming direto do LLM: {e}")
+            if emitted:
+                # Resposta já parcialmente enviada: o endpoint sinaliza o erro
+                raise
+            yield "Desculpa, tive dificuldades em processar a tua mensagem. Podes tentar novamente?"
+    
     def _fallback_response(self, message: str) -> str:
         """Resposta de fallback quando nenhum LLM está disponível"""
         return """Olá! Sou o Ethic Companion e estou aqui para ajudar com questões éticas e reflexões pessoais.
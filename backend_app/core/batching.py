@@ -0,0 +1,122 @@
+"""
+Micro-Batching de Chamadas Concorrentes
+Junta os pedidos que chegam de várias threads ou coroutines durante alguns
+milissegundos e processa-os com uma única chamada; cada chamador recebe o seu
+resultado através de um Future.
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """
+    Thread dedicada que agrupa itens e chama `handler` uma vez por lote
+
+    - O primeiro item abre uma janela de `window_ms`; o lote fecha quando a
+      janela termina ou quando atinge `max_batch` itens
+    - `handler` recebe a lista de itens e devolve uma lista de resultados
+      com o mesmo tamanho e ordem
+    - Se `handler` falhar, todos os Futures do lote recebem a exceção
+    """
+
+    def __init__(self, handler: Callable[[List[Any]], List[Any]], window_ms: float,
+                 max_batch: int, name: str = "micro-batcher"):
+        self.handler = handler
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.name = name
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        self.batches = 0
+        self.items = 0
+        self.failed_batches = 0
+
+    def submit(self, item: Any) -> Future:
+        """Agenda um item; o Future resolve com o resultado desse item"""
+        self._ensure_started()
+        future: Future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def stop(self, timeout: float = 10.0):
+        """Processa os itens pendentes e pára a thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def stats(self) -> Dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "failed_batches": self.failed_batches,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "pending": self._queue.qsize(),
+        }
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            entry = self._queue.get()
+            if entry is _STOP:
+                break
+
+            batch = [entry]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if entry is _STOP:
+                    stopping = True
+                    break
+                batch.append(entry)
+
+            self._process(batch)
+
+    def _process(self, batch: List[Tuple[Any, Future]]):
+        # Chamadores que desistiram (cancelaram) não precisam de resultado
+        batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        try:
+            results = self.handler([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"{self.name}: {len(results)} resultados para {len(batch)} itens")
+        except Exception as e:
+            self.failed_batches += 1
+            logger.error(f"❌ Lote {self.name} falhou ({len(batch)} itens): {e}")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.items += len(batch)
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
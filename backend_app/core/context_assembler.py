@@ -0,0 +1,244 @@
+"""
+Montagem do Contexto de Memória com Orçamento de Tokens
+Preenche um orçamento de tokens por prioridade (resumo da sessão, turnos
+recentes, depois memórias ordenadas por relevância), encurta mensagens longas e usa um
+formato compacto, para que o prompt não cresça com o tamanho da sessão.
+"""
+
+import math
+import os
+from typing import Callable, Dict, List, Optional
+
+# Configuração por omissão
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+CONTEXT_MESSAGE_MAX_TOKENS = int(os.getenv("CONTEXT_MESSAGE_MAX_TOKENS", "160"))
+CONTEXT_SUMMARY_MAX_TOKENS = int(os.getenv("CONTEXT_SUMMARY_MAX_TOKENS", "300"))
+# Parte do orçamento guardada para memórias quando as há (o histórico não a consome)
+CONTEXT_MEMORY_RESERVE_TOKENS = int(os.getenv("CONTEXT_MEMORY_RESERVE_TOKENS", "300"))
+CONTEXT_CHARS_PER_TOKEN = float(os.getenv("CONTEXT_CHARS_PER_TOKEN", "4"))
+
+# Cabeçalhos das secções (também usados para analisar o contexto gerado)
+SUMMARY_HEADER = "## Resumo da conversa"
+RECENT_HEADER = "## Conversa recente"
+MEMORIES_HEADER = "## Memórias relevantes"
+
+ELISION = " […] "
+# Abaixo disto não vale a pena incluir uma mensagem cortada
+_MIN_LINE_TOKENS = 12
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa rápida de tokens (sem tokenizer): ~4 caracteres por token"""
+    if not text:
+        return 0
+    return math.ceil(len(text) / CONTEXT_CHARS_PER_TOKEN)
+
+
+class AssembledContext:
+    """Resultado da montagem: texto final e tokens usados por secção"""
+
+    def __init__(self, text: str, sections: Dict[str, int], recent_count: int,
+                 semantic_count: int, elided: int, dropped: int):
+        self.text = text
+        self.sections = sections
+        self.recent_count = recent_count
+        self.semantic_count = semantic_count
+        self.elided = elided
+        self.dropped = dropped
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(self.sections.values())
+
+    def usage(self) -> Dict:
+        return {
+            "tokens": dict(self.sections, total=self.total_tokens),
+            "recent_count": self.recent_count,
+            "semantic_count": self.semantic_count,
+            "elided_messages": self.elided,
+            "dropped_items": self.dropped,
+        }
+
+
+class ContextAssembler:
+    """
+    Monta o contexto de memória dentro de um orçamento de tokens
+
+    - Resumo da sessão primeiro (até `max_summary_tokens`)
+    - Depois os turnos recentes, do mais recente para o mais antigo, sem
+      buracos: o primeiro que não cabe encerra a secção
+    - Por fim as memórias pela ordem da pesquisa (mais relevantes primeiro)
+    - Mensagens acima de `max_message_tokens` ficam com o início e o fim
+    - Secções vazias não são escritas
+    """
+
+    def __init__(self, max_tokens: int = CONTEXT_TOKEN_BUDGET,
+                 max_message_tokens: int = CONTEXT_MESSAGE_MAX_TOKENS,
+                 memory_reserve_tokens: int = CONTEXT_MEMORY_RESERVE_TOKENS,
+                 max_summary_tokens: int = CONTEXT_SUMMARY_MAX_TOKENS,
+                 token_counter: Callable[[str], int] = estimate_tokens):
+        """
+        Args:
+            max_tokens: Orçamento total do contexto
+            max_message_tokens: Tamanho máximo de cada mensagem incluída
+            memory_reserve_tokens: Tokens que o histórico recente deixa para as memórias
+            max_summary_tokens: Tamanho máximo do resumo da sessão
+            token_counter: Função que conta os tokens de um texto
+        """
+        self.max_tokens = max_tokens
+        self.max_message_tokens = max_message_tokens
+        self.memory_reserve_tokens = memory_reserve_tokens
+        self.max_summary_tokens = max_summary_tokens
+        self.count_tokens = token_counter
+
+    def assemble(self, recent_history: List[Dict], memories: List,
+                 summary: Optional[str] = None) -> AssembledContext:
+        """
+        Args:
+            recent_history: Mensagens em ordem cronológica ({"type", "content"})
+            memories: Memórias ordenadas por relevância (dicts com
+                user_message/assistant_message ou content, ou texto simples)
+            summary: Resumo dos turnos anteriores da sessão
+
+        Returns:
+            AssembledContext com o texto e a contagem de tokens por secção
+        """
+        remaining = self.max_tokens
+        summary_lines, summary_tokens, summary_elided = self._fill(
+            [_single_line(summary)], SUMMARY_HEADER,
+            min(remaining, self.max_summary_tokens + self.count_tokens(SUMMARY_HEADER) + 1)
+        )
+        remaining -= summary_tokens
+        reserve = min(self.memory_reserve_tokens, remaining) if memories else 0
+
+        recent_lines, recent_tokens, recent_elided = self._fill(
+            [self._recent_line(message) for message in reversed(recent_history)],
+            RECENT_HEADER, remaining - reserve
+        )
+        recent_lines.reverse()
+        remaining -= recent_tokens
+
+        memory_lines, memory_tokens, memory_elided = self._fill(
+            [self._memory_line(memory) for memory in memories], MEMORIES_HEADER, remaining
+        )
+
+        parts = []
+        if summary_lines:
+            parts.append("\n".join([SUMMARY_HEADER] + summary_lines))
+        if recent_lines:
+            parts.append("\n".join([RECENT_HEADER] + recent_lines))
+        if memory_lines:
+            parts.append("\n".join([MEMORIES_HEADER] + memory_lines))
+
+        return AssembledContext(
+            text="\n\n".join(parts),
+            sections={"summary": summary_tokens, "recent": recent_tokens, "memories": memory_tokens},
+            recent_count=sum(1 for line in recent_lines if line.startswith("U: ")),
+            semantic_count=len(memory_lines),
+            elided=summary_elided + recent_elided + memory_elided,
+            dropped=len(recent_history) - len(recent_lines) + len(memories) - len(memory_lines),
+        )
+
+    def _fill(self, lines: List[str], header: str, budget: int):
+        """Acrescenta linhas por ordem até esgotar o orçamento da secção"""
+        selected = []
+        used = elided = 0
+        for line in lines:
+            if not line:
+                continue
+            # O cabeçalho só conta quando a secção tem conteúdo
+            overhead = self.count_tokens(header) + 1 if not selected else 1
+            available = budget - used - overhead
+            if available < _MIN_LINE_TOKENS:
+                break
+            limit = self.max_summary_tokens if header == SUMMARY_HEADER else self.max_message_tokens
+            shortened = self._shorten(line, min(available, limit))
+            cost = self.count_tokens(shortened) + overhead
+            if cost > budget - used:
+                break
+            selected.append(shortened)
+            used += cost
+            elided += shortened is not line
+        return selected, used, elided
+
+    def _shorten(self, text: str, max_tokens: int) -> str:
+        """Mantém o início e o fim de um texto longo, com uma marca no meio"""
+        if self.count_tokens(text) <= max_tokens:
+            return text
+        keep = max(int(max_tokens * CONTEXT_CHARS_PER_TOKEN) - len(ELISION), 2)
+        head = keep * 2 // 3
+        shortened = text[:head].rstrip() + ELISION + text[len(text) - (keep - head):].lstrip()
+        # Contadores mais exatos do que a estimativa: cortar até caber
+        while self.count_tokens(shortened) > max_tokens and head > 1:
+            head = head * 3 // 4
+            shortened = text[:head].rstrip() + ELISION
+        return shortened
+
+    @staticmethod
+    def _recent_line(message: Dict) -> str:
+        content = _single_line(message.get("content"))
+        if not content:
+            return ""
+        return f"{'U' if message.get('type') == 'user' else 'A'}: {content}"
+
+    @staticmethod
+    def _memory_line(memory) -> str:
+        if isinstance(memory, str):
+            return f"- {_single_line(memory)}" if memory.strip() else ""
+        user_message = _single_line(memory.get("user_message"))
+        assistant_message = _single_line(memory.get("assistant_message"))
+        if user_message or assistant_message:
+            return f"- U: {user_message} → A: {assistant_message}"
+        content = _single_line(memory.get("content"))
+        return f"- {content}" if content else ""
+
+
+def _single_line(text: Optional[str]) -> str:
+    """Junta espaços e quebras de linha (o formato usa uma linha por item)"""
+    return " ".join((text or "").split())
+
+
+def analyze_context(context: str, token_counter: Callable[[str], int] = estimate_tokens) -> Dict:
+    """
+    Metadados de um contexto montado: número de itens e tokens por secção
+
+    Returns:
+        Dict com has_summary, recent_count, semantic_count e tokens (summary,
+        recent, memories, total)
+    """
+    sections = {"summary": "", "recent": "", "memories": ""}
+    for block in (context or "").split("\n\n"):
+        if block.startswith(SUMMARY_HEADER):
+            sections["summary"] = block
+        elif block.startswith(RECENT_HEADER):
+            sections["recent"] = block
+        elif block.startswith(MEMORIES_HEADER):
+            sections["memories"] = block
+
+    tokens = {name: token_counter(text) for name, text in sections.items()}
+    tokens["total"] = token_counter(context or "")
+    return {
+        "has_summary": bool(sections["summary"]),
+        "recent_count": sum(1 for line in sections["recent"].splitlines() if line.startswith("U: ")),
+        "semantic_count": sum(1 for line in sections["memories"].splitlines() if line.startswith("- ")),
+        "tokens": tokens,
+    }
+
+
+# Montador partilhado do processo (sem estado entre pedidos)
+_context_assembler: Optional[ContextAssembler] = None
+
+
+def get_context_assembler() -> ContextAssembler:
+    """
+    Obtém o montador de contexto do worker
+
+    Returns:
+        ContextAssembler: Instância partilhada
+    """
+    global _context_assembler
+
+    if _context_assembler is None:
+        _context_assembler = ContextAssembler()
+
+    return _context_assembler
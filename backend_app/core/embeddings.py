@@ -0,0 +1,530 @@
+"""
+Pipeline de Embeddings no Cliente
+Os vetores são calculados explicitamente por um fornecedor configurável (API
+Gemini ou OpenAI, modelo local em CPU ou vectorizer por hashing para uso
+offline), com os
+textos de escritas e pesquisas concorrentes agrupados numa chamada por lote.
+Os vetores das perguntas são reutilizados: uma cache LRU em memória e,
+opcionalmente, uma tabela em disco mapeada em memória (np.memmap), partilhada
+entre workers e reinícios. A chave é o SHA-256 do modelo e do texto normalizado.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .batching import MicroBatcher
+from .config import get_api_key
+from .text_analysis import portuguese_analyzer
+
+logger = logging.getLogger(__name__)
+
+# Configuração por omissão
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "gemini")  # gemini | openai | local | hashing
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL")  # None = modelo por omissão do fornecedor
+GEMINI_EMBEDDING_MODEL = "models/text-embedding-004"
+OPENAI_EMBEDDING_MODEL = "text-embedding-3-small"
+LOCAL_EMBEDDING_MODEL = os.getenv("LOCAL_EMBEDDING_MODEL", "paraphrase-multilingual-MiniLM-L12-v2")
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "384"))  # vectorizer por hashing
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "10"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))  # textos por chamada
+EMBEDDING_TIMEOUT = float(os.getenv("EMBEDDING_TIMEOUT", "30"))
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))  # vetores em memória
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR")  # None = só memória
+EMBEDDING_CACHE_DISK_SLOTS = int(os.getenv("EMBEDDING_CACHE_DISK_SLOTS", "65536"))
+
+# Tentativas de sondagem linear na tabela em disco antes de substituir uma entrada
+_DISK_PROBES = 8
+_KEY_BYTES = 32
+
+
+def normalize_text(text: str) -> str:
+    """Normaliza espaços para que variações triviais partilhem a mesma entrada"""
+    return " ".join(text.split())
+
+
+def content_key(model: str, text: str) -> bytes:
+    """Chave da cache: SHA-256 do modelo e do texto normalizado"""
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).digest()
+
+
+class GeminiEmbeddingProvider:
+    """Calcula embeddings com a API do Gemini (google-generativeai, vários textos por pedido)"""
+
+    api_key_name = "GOOGLE_API_KEY"
+
+    def __init__(self, model: Optional[str] = None, api_key: Optional[str] = None):
+        self.model = model or EMBEDDING_MODEL or GEMINI_EMBEDDING_MODEL
+        self.api_key = api_key or os.getenv(self.api_key_name)
+        self._configured = False
+
+    @property
+    def name(self) -> str:
+        return f"gemini:{self.model}"
+
+    def embed(self, texts: Sequence[str]) -> List[np.ndarray]:
+        import google.generativeai as genai
+        if not self._configured:
+            genai.configure(api_key=self.api_key)
+            self._configured = True
+
+        response = genai.embed_content(model=self.model, content=list(texts))
+        return [np.asarray(vector, dtype=np.float32) for vector in response["embedding"]]
+
+
+class OpenAIEmbeddingProvider:
+    """Calcula embeddings com a API de embeddings da OpenAI (vários textos por pedido)"""
+
+    api_key_name = "OPENAI_API_KEY"
+
+    def __init__(self, model: Optional[str] = None, api_key: Optional[str] = None):
+        self.model = model or EMBEDDING_MODEL or OPENAI_EMBEDDING_MODEL
+        self.api_key = api_key or os.getenv(self.api_key_name)
+        self._client = None
+
+    @property
+    def name(self) -> str:
+        return f"openai:{self.model}"
+
+    def embed(self, texts: Sequence[str]) -> List[np.ndarray]:
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(api_key=self.api_key)
+
+        response = self._client.embeddings.create(model=self.model, input=list(texts))
+        data = sorted(response.data, key=lambda item: item.index)
+        return [np.asarray(item.embedding, dtype=np.float32) for item in data]
+
+
+class SentenceTransformerProvider:
+    """
+    Modelo local em CPU (sentence-transformers, dependência opcional)
+
+    O modelo é carregado na primeira chamada; os vetores são normalizados.
+    """
+
+    def __init__(self, model: str = LOCAL_EMBEDDING_MODEL):
+        self.model = model
+        self._model = None
+
+    @property
+    def name(self) -> str:
+        return f"local:{self.model}"
+
+    def embed(self, texts: Sequence[str]) -> List[np.ndarray]:
+        if self._model is None:
+            try:
+                from sentence_transformers import SentenceTransformer
+            except ImportError:
+                raise ImportError(
+                    "EMBEDDING_PROVIDER=local requer o pacote sentence-transformers "
+                    "(pip install sentence-transformers)"
+                )
+            self._model = SentenceTransformer(self.model, device="cpu")
+            logger.info(f"✅ Modelo de embeddings local carregado: {self.model}")
+
+        vectors = self._model.encode(list(texts), convert_to_numpy=True, normalize_embeddings=True)
+        return [np.asarray(vector, dtype=np.float32) for vector in vectors]
+
+
+class HashingEmbeddingProvider:
+    """
+    Vectorizer por hashing de palavras e trigramas de caracteres (offline)
+
+    Sem modelo nem rede: útil para desenvolvimento, testes e benchmarks. Capta
+    sobreposição lexical, não semântica.
+    """
+
+    def __init__(self, dimensions: int = EMBEDDING_DIMENSIONS):
+        self.dimensions = dimensions
+
+    @property
+    def name(self) -> str:
+        return f"hashing:{self.dimensions}"
+
+    def embed(self, texts: Sequence[str]) -> List[np.ndarray]:
+        return [self._embed_one(text) for text in texts]
+
+    def _embed_one(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for feature in self._features(text):
+            digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+            sign = 1.0 if digest >> 63 else -1.0
+            vector[digest % self.dimensions] += sign
+
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    @staticmethod
+    def _features(text: str):
+        for token in portuguese_analyzer.tokenize(text):
+            yield f"w:{token}"
+            padded = f"<{token}>"
+            for start in range(len(padded) - 2):
+                yield f"c:{padded[start:start + 3]}"
+
+
+def create_embedding_provider(name: str = EMBEDDING_PROVIDER):
+    """
+    Cria o fornecedor de embeddings configurado
+
+    Args:
+        name: "gemini", "openai", "local" (sentence-transformers) ou "hashing"
+
+    Raises:
+        ValueError: Fornecedor desconhecido ou API remota sem a chave configurada
+    """
+    providers = {
+        "gemini": GeminiEmbeddingProvider,
+        "openai": OpenAIEmbeddingProvider,
+        "local": SentenceTransformerProvider,
+        "sentence-transformers": SentenceTransformerProvider,
+        "hashing": HashingEmbeddingProvider,
+    }
+    if name not in providers:
+        raise ValueError(f"EMBEDDING_PROVIDER desconhecido: {name} (opções: {', '.join(providers)})")
+    provider_class = providers[name]
+    key_name = getattr(provider_class, "api_key_name", None)
+    if key_name:
+        # Falhar já, e não no primeiro pedido que precise de um vetor
+        try:
+            get_api_key(key_name)
+        except ValueError:
+            raise ValueError(f"EMBEDDING_PROVIDER={name} requer {key_name} "
+                             f"(ou outro fornecedor: local, hashing)")
+    return provider_class()
+
+
+class EmbeddingBatcher:
+    """
+    Agrupa os textos de escritas e pesquisas concorrentes numa chamada ao fornecedor
+
+    Textos repetidos no mesmo lote são calculados uma única vez.
+    """
+
+    def __init__(self, provider, window_ms: float = EMBEDDING_BATCH_WINDOW_MS,
+                 max_batch: int = EMBEDDING_BATCH_SIZE):
+        self.provider = provider
+        self.provider_calls = 0
+        self._batcher = MicroBatcher(self._embed_batch, window_ms, max_batch, name="embedding-batcher")
+
+    @property
+    def name(self) -> str:
+        return self.provider.name
+
+    def embed(self, texts: Sequence[str], timeout: float = EMBEDDING_TIMEOUT) -> List[np.ndarray]:
+        """Calcula os vetores de `texts`, partilhando o lote com outros chamadores"""
+        futures = [self._batcher.submit(text) for text in texts]
+        return [future.result(timeout) for future in futures]
+
+    def stats(self) -> Dict:
+        return {"provider": self.provider.name, "provider_calls": self.provider_calls, **self._batcher.stats()}
+
+    def stop(self):
+        self._batcher.stop()
+
+    def _embed_batch(self, texts: List[str]) -> List[np.ndarray]:
+        unique = list(dict.fromkeys(texts))
+        self.provider_calls += 1
+        vectors = dict(zip(unique, self.provider.embed(unique)))
+        return [vectors[text] for text in texts]
+
+
+class DiskEmbeddingTable:
+    """
+    Tabela de hash de tamanho fixo em ficheiros .npy mapeados em memória
+
+    - keys: (slots, 32) uint8 com o SHA-256 de cada entrada (zeros = vazio)
+    - vectors: (slots, dimensões) float32
+    - checks: (slots,) uint64 com um checksum da chave e do vetor juntos
+    As páginas só são lidas do disco quando usadas, e o sistema operativo
+    partilha-as entre os workers do mesmo contentor.
+
+    As escritas de todos os workers são serializadas por um lock fcntl num
+    ficheiro ao lado da tabela; as leituras não bloqueiam e só aceitam uma
+    posição cujo checksum confere, por isso nunca devolvem o vetor de outra
+    chave nem uma escrita a meio.
+    """
+
+    def __init__(self, directory: str, name: str, dimensions: int, slots: int = EMBEDDING_CACHE_DISK_SLOTS):
+        os.makedirs(directory, exist_ok=True)
+        prefix = os.path.join(directory, f"{_slug(name)}-{dimensions}")
+        self.slots = slots
+        self.dimensions = dimensions
+        self._lock_file = open(f"{prefix}.lock", "a+b")
+        # Criar/recriar os ficheiros também é uma escrita: outro worker pode estar a abri-los
+        with self._write_lock():
+            self.keys = _open_memmap(f"{prefix}.keys.npy", np.uint8, (slots, _KEY_BYTES))
+            self.vectors = _open_memmap(f"{prefix}.vectors.npy", np.float32, (slots, dimensions))
+            self.checks = _open_memmap(f"{prefix}.checks.npy", np.uint64, (slots,))
+
+    @staticmethod
+    def existing_dimensions(directory: str, name: str) -> Optional[int]:
+        """Dimensão de uma tabela já existente para `name`, se houver"""
+        prefix = f"{_slug(name)}-"
+        if not os.path.isdir(directory):
+            return None
+        for filename in sorted(os.listdir(directory)):
+            if filename.startswith(prefix) and filename.endswith(".vectors.npy"):
+                dimensions = filename[len(prefix):-len(".vectors.npy")]
+                if dimensions.isdigit():
+                    return int(dimensions)
+        return None
+
+    @property
+    def nbytes(self) -> int:
+        return self.keys.nbytes + self.vectors.nbytes + self.checks.nbytes
+
+    def get(self, key: bytes) -> Optional[np.ndarray]:
+        wanted = np.frombuffer(key, dtype=np.uint8)
+        for slot in self._probe(key):
+            stored = self.keys[slot]
+            if not stored.any():
+                return None
+            if np.array_equal(stored, wanted):
+                vector = np.array(self.vectors[slot])
+                # Escrita de outro worker a meio (ou entrada antiga sem checksum): miss
+                return vector if int(self.checks[slot]) == _checksum(key, vector) else None
+        return None
+
+    def put(self, key: bytes, vector: np.ndarray):
+        wanted = np.frombuffer(key, dtype=np.uint8)
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._write_lock():
+            slots = list(self._probe(key))
+            # Zona cheia: a posição substituída depende da chave, para não ser sempre a mesma
+            target = slots[int(wanted[8]) % len(slots)]
+            for slot in slots:
+                stored = self.keys[slot]
+                if not stored.any() or np.array_equal(stored, wanted):
+                    target = slot
+                    break
+            # Invalidar primeiro: um leitor concorrente vê um checksum que não confere
+            self.checks[target] = 0
+            self.vectors[target] = vector
+            self.keys[target] = wanted
+            self.checks[target] = _checksum(key, vector)
+
+    def flush(self):
+        self.keys.flush()
+        self.vectors.flush()
+        self.checks.flush()
+
+    def _probe(self, key: bytes):
+        start = int.from_bytes(key[:8], "little") % self.slots
+        for offset in range(min(_DISK_PROBES, self.slots)):
+            yield (start + offset) % self.slots
+
+    @contextmanager
+    def _write_lock(self):
+        import fcntl
+
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+
+def _checksum(key: bytes, vector: np.ndarray) -> int:
+    """Checksum (nunca zero) de uma entrada da tabela em disco"""
+    digest = hashlib.blake2b(key + np.asarray(vector, dtype=np.float32).tobytes(), digest_size=8).digest()
+    return int.from_bytes(digest, "little") or 1
+
+
+class EmbeddingCache:
+    """
+    Cache de embeddings em dois níveis (LRU em memória + tabela em disco opcional)
+
+    O nível em disco é aberto logo se já existir uma tabela para este modelo;
+    caso contrário, quando o primeiro vetor é guardado (define a dimensão).
+    """
+
+    def __init__(self, name: str, max_entries: int = EMBEDDING_CACHE_SIZE,
+                 disk_dir: Optional[str] = EMBEDDING_CACHE_DIR,
+                 disk_slots: int = EMBEDDING_CACHE_DISK_SLOTS):
+        self.name = name
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.disk_slots = disk_slots
+
+        self._memory: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: Optional[DiskEmbeddingTable] = None
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if disk_dir:
+            dimensions = DiskEmbeddingTable.existing_dimensions(disk_dir, name)
+            if dimensions is not None:
+                self._open_disk(dimensions)
+
+    def get(self, key: bytes) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return vector
+
+            if self._disk is not None:
+                vector = self._disk.get(key)
+                if vector is not None:
+                    self.disk_hits += 1
+                    self._remember(key, vector)
+                    return vector
+
+            self.misses += 1
+            return None
+
+    def put(self, key: bytes, vector: np.ndarray):
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._remember(key, vector)
+            disk = self._open_disk(vector.shape[0])
+            if disk is not None and disk.dimensions == vector.shape[0]:
+                disk.put(key, vector)
+
+    def get_or_compute(self, text: str, compute: Callable[[List[str]], List[np.ndarray]]) -> np.ndarray:
+        """Devolve o vetor em cache ou calcula-o com `compute` e guarda-o"""
+        key = content_key(self.name, text)
+        vector = self.get(key)
+        if vector is None:
+            vector = np.asarray(compute([text])[0], dtype=np.float32)
+            self.put(key, vector)
+        return vector
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._memory),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                "memory_bytes": self._memory_bytes,
+                "disk_bytes": self._disk.nbytes if self._disk is not None else 0,
+            }
+
+    def flush(self):
+        with self._lock:
+            if self._disk is not None:
+                self._disk.flush()
+
+    def _remember(self, key: bytes, vector: np.ndarray):
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= previous.nbytes
+        self._memory[key] = vector
+        self._memory_bytes += vector.nbytes
+
+        while len(self._memory) > self.max_entries:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.nbytes
+
+    def _open_disk(self, dimensions: int) -> Optional[DiskEmbeddingTable]:
+        if self._disk is None and self.disk_dir:
+            try:
+                self._disk = DiskEmbeddingTable(self.disk_dir, self.name, dimensions, self.disk_slots)
+            except Exception as e:
+                logger.error(f"❌ Cache de embeddings em disco indisponível: {e}")
+                self.disk_dir = None
+        return self._disk
+
+
+class QueryEmbedder:
+    """Embeddings das perguntas de pesquisa, com cache por hash de conteúdo"""
+
+    def __init__(self, batcher=None, cache: Optional[EmbeddingCache] = None):
+        self.batcher = batcher or get_embedding_batcher()
+        self.cache = cache or EmbeddingCache(self.batcher.name)
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return self.cache.get_or_compute(text, self.batcher.embed)
+
+    def stats(self) -> Dict:
+        return {"provider": self.batcher.name, **self.cache.stats()}
+
+
+def _slug(name: str) -> str:
+    return "".join(char if char.isalnum() else "-" for char in name)
+
+
+def _open_memmap(path: str, dtype, shape) -> np.memmap:
+    if os.path.exists(path):
+        existing = np.load(path, mmap_mode="r+")
+        if existing.shape == shape and existing.dtype == dtype:
+            return existing
+        logger.warning(f"⚠️ Cache de embeddings {path} com formato diferente; a recriar")
+    return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+
+
+# Instâncias globais do processo
+_embedding_batcher: Optional[EmbeddingBatcher] = None
+_query_embedder: Optional[QueryEmbedder] = None
+_embeddings_lock = threading.Lock()
+
+
+def get_embedding_batcher() -> EmbeddingBatcher:
+    """
+    Obtém o pipeline de embeddings partilhado pelo worker (EMBEDDING_PROVIDER,
+    ou o vectorizer por hashing se o fornecedor configurado não estiver disponível)
+
+    Returns:
+        EmbeddingBatcher: Instância partilhada
+    """
+    global _embedding_batcher
+
+    if _embedding_batcher is None:
+        with _embeddings_lock:
+            if _embedding_batcher is None:
+                try:
+                    provider = create_embedding_provider(EMBEDDING_PROVIDER)
+                except ValueError as e:
+                    # Sem chave da API o serviço continua a funcionar, com pesquisas só lexicais
+                    logger.warning(f"⚠️ {e}; a usar o vectorizer por hashing")
+                    provider = HashingEmbeddingProvider()
+                _embedding_batcher = EmbeddingBatcher(provider)
+
+    return _embedding_batcher
+
+
+def get_query_embedder() -> QueryEmbedder:
+    """
+    Obtém o embedder de perguntas partilhado pelo worker
+
+    Returns:
+        QueryEmbedder: Instância partilhada
+    """
+    global _query_embedder
+
+    if _query_embedder is None:
+        batcher = get_embedding_batcher()
+        with _embeddings_lock:
+            if _query_embedder is None:
+                _query_embedder = QueryEmbedder(batcher)
+
+    return _query_embedder
+
+
+def stop_embedding_pipeline():
+    """Pára o pipeline de embeddings e grava a cache em disco (shutdown)"""
+    global _embedding_batcher, _query_embedder
+
+    with _embeddings_lock:
+        batcher, _embedding_batcher = _embedding_batcher, None
+        embedder, _query_embedder = _query_embedder, None
+    if embedder is not None:
+        embedder.cache.flush()
+    if batcher is not None:
+        batcher.stop()
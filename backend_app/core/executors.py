@@ -0,0 +1,81 @@
+"""
+Executores Dedicados para I/O Bloqueante da Memória
+Os clientes PostgreSQL (SQLAlchemy) e Weaviate são síncronos; correm em pools
+de threads separadas para não bloquearem o event loop e para que as pesquisas
+nas duas bases de dados se sobreponham de facto.
+"""
+
+import asyncio
+import functools
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Número de threads por pool (por worker uvicorn)
+DB_EXECUTOR_WORKERS = int(os.getenv("MEMORY_DB_EXECUTOR_WORKERS", "8"))
+VECTOR_EXECUTOR_WORKERS = int(os.getenv("MEMORY_VECTOR_EXECUTOR_WORKERS", "8"))
+
+_db_executor: Optional[ThreadPoolExecutor] = None
+_vector_executor: Optional[ThreadPoolExecutor] = None
+_executors_lock = threading.Lock()
+
+
+def get_db_executor() -> ThreadPoolExecutor:
+    """Pool de threads dedicada às queries PostgreSQL"""
+    global _db_executor
+
+    if _db_executor is None:
+        with _executors_lock:
+            if _db_executor is None:
+                _db_executor = ThreadPoolExecutor(
+                    max_workers=DB_EXECUTOR_WORKERS,
+                    thread_name_prefix="memory-db"
+                )
+    return _db_executor
+
+
+def get_vector_executor() -> ThreadPoolExecutor:
+    """Pool de threads dedicada às pesquisas vetoriais (Weaviate)"""
+    global _vector_executor
+
+    if _vector_executor is None:
+        with _executors_lock:
+            if _vector_executor is None:
+                _vector_executor = ThreadPoolExecutor(
+                    max_workers=VECTOR_EXECUTOR_WORKERS,
+                    thread_name_prefix="memory-vector"
+                )
+    return _vector_executor
+
+
+async def run_in_db_executor(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Executa uma chamada bloqueante de base de dados fora do event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_db_executor(), functools.partial(func, *args, **kwargs))
+
+
+async def run_in_vector_executor(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Executa uma chamada bloqueante ao Weaviate fora do event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_vector_executor(), functools.partial(func, *args, **kwargs))
+
+
+def shutdown_executors():
+    """Encerra as pools de threads (shutdown do worker)"""
+    global _db_executor, _vector_executor
+
+    with _executors_lock:
+        executors = [_db_executor, _vector_executor]
+        _db_executor = None
+        _vector_executor = None
+
+    for executor in executors:
+        if executor is not None:
+            executor.shutdown(wait=True)
+    logger.info("🔒 Executores de memória encerrados")
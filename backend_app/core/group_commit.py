@@ -0,0 +1,248 @@
+"""
+Escritor com Group Commit para o chat_history
+Junta as trocas de pedidos concorrentes durante alguns milissegundos e grava-as
+com um único INSERT multi-linha e um único commit; cada chamador recebe a
+confirmação de durabilidade através de um Future.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import IntegrityError
+
+from ..models.database import ChatHistory, SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Janela de agrupamento (ms) e tamanho máximo de um lote (trocas)
+GROUP_COMMIT_WINDOW_MS = float(os.getenv("GROUP_COMMIT_WINDOW_MS", "5"))
+GROUP_COMMIT_MAX_BATCH = int(os.getenv("GROUP_COMMIT_MAX_BATCH", "100"))
+GROUP_COMMIT_TIMEOUT = float(os.getenv("GROUP_COMMIT_TIMEOUT", "10"))
+SEQUENCE_RETRIES = 3
+
+_STOP = object()
+
+
+def turn_rows(session_id: str, user_message: str, assistant_message: str,
+              timestamp: datetime, user_id: Optional[str] = None) -> List[Dict]:
+    """Linhas do chat_history (utilizador e assistente) de uma troca"""
+    # O chat_history guarda UTC sem fuso: o mesmo relógio do indexador outbox
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return [
+        {
+            "session_id": session_id,
+            "user_id": user_id,
+            "message_type": "user",
+            "user_message": user_message,
+            "assistant_message": None,
+            "timestamp": timestamp,
+            "processed": False,
+        },
+        {
+            "session_id": session_id,
+            "user_id": user_id,
+            "message_type": "assistant",
+            "user_message": None,
+            "assistant_message": assistant_message,
+            "timestamp": timestamp,
+            "processed": False,
+        },
+    ]
+
+
+class GroupCommitWriter:
+    """
+    Grava trocas no chat_history em lotes a partir de uma thread dedicada
+
+    - A primeira troca abre uma janela de GROUP_COMMIT_WINDOW_MS; as trocas que
+      chegam entretanto seguem no mesmo INSERT multi-linha e no mesmo commit
+    - O Future de cada troca só é resolvido depois do commit
+    - Se o lote falhar, as trocas são regravadas uma a uma para que uma linha
+      inválida não faça falhar os pedidos dos outros utilizadores
+    """
+
+    def __init__(self, session_factory: Callable = SessionLocal,
+                 window_ms: float = GROUP_COMMIT_WINDOW_MS,
+                 max_batch: int = GROUP_COMMIT_MAX_BATCH):
+        self.session_factory = session_factory
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        self.batches = 0
+        self.turns = 0
+
+    def submit(self, session_id: str, user_message: str, assistant_message: str,
+               timestamp: datetime, user_id: Optional[str] = None) -> Future:
+        """
+        Agenda a gravação de uma troca
+
+        Returns:
+            Future: Resolvido após o commit com as posições (sequence) das duas
+            linhas, ou com a exceção da escrita
+        """
+        self._ensure_started()
+        future: Future = Future()
+        self._queue.put((turn_rows(session_id, user_message, assistant_message, timestamp, user_id), future))
+        return future
+
+    def write(self, session_id: str, user_message: str, assistant_message: str,
+              timestamp: datetime, timeout: float = GROUP_COMMIT_TIMEOUT, user_id: Optional[str] = None):
+        """Grava uma troca e espera pelo commit (devolve as posições das duas linhas)"""
+        return self.submit(session_id, user_message, assistant_message, timestamp, user_id).result(timeout)
+
+    def stop(self, timeout: float = 10.0):
+        """Grava as trocas pendentes e pára a thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+            logger.info("🔒 Escritor group commit parado")
+
+    def stats(self) -> Dict:
+        return {
+            "batches": self.batches,
+            "turns": self.turns,
+            "avg_batch_size": round(self.turns / self.batches, 2) if self.batches else 0.0,
+            "pending": self._queue.qsize(),
+        }
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="chat-history-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+
+            batch = [item]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._flush(batch)
+
+    def _flush(self, batch: List[Tuple[List[Dict], Future]]):
+        try:
+            self._insert([row for rows, _ in batch for row in rows])
+        except Exception as e:
+            logger.warning(f"⚠️ Lote de {len(batch)} trocas falhou, a gravar individualmente: {e}")
+            for rows, future in batch:
+                try:
+                    self._insert(rows)
+                except Exception as row_error:
+                    logger.error(f"❌ Erro ao gravar troca no PostgreSQL: {row_error}")
+                    future.set_exception(row_error)
+                else:
+                    future.set_result([row["sequence"] for row in rows])
+            return
+
+        self.batches += 1
+        self.turns += len(batch)
+        for rows, future in batch:
+            future.set_result([row["sequence"] for row in rows])
+        logger.debug(f"💾 Group commit: {len(batch)} trocas gravadas")
+
+    def _insert(self, rows: List[Dict]):
+        for attempt in range(1, SEQUENCE_RETRIES + 1):
+            db = self.session_factory()
+            try:
+                assign_sequences(db, rows)
+                # executemany sobre insert() gera um INSERT multi-linha (insertmanyvalues)
+                db.execute(insert(ChatHistory), rows)
+                db.commit()
+                return
+            except IntegrityError:
+                # Outro worker pode ter usado as mesmas posições; reler e tentar de novo
+                db.rollback()
+                if attempt == SEQUENCE_RETRIES:
+                    raise
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+
+
+def assign_sequences(db, rows: List[Dict]):
+    """
+    Atribui a cada linha a próxima posição da sua sessão
+
+    O máximo atual de cada sessão é lido do índice (session_id, sequence);
+    o índice único garante que escritas concorrentes não repetem posições.
+    """
+    session_ids = sorted({row["session_id"] for row in rows if row["session_id"] is not None})
+    next_sequence: Dict[str, int] = {}
+    if session_ids:
+        result = db.execute(
+            select(ChatHistory.session_id, func.max(ChatHistory.sequence))
+            .where(ChatHistory.session_id.in_(session_ids))
+            .group_by(ChatHistory.session_id)
+        )
+        next_sequence = {session_id: (last or 0) for session_id, last in result}
+
+    for row in rows:
+        session_id = row["session_id"]
+        next_sequence[session_id] = next_sequence.get(session_id, 0) + 1
+        row["sequence"] = next_sequence[session_id]
+
+
+# Escritor global do processo
+_writer: Optional[GroupCommitWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_chat_history_writer() -> GroupCommitWriter:
+    """
+    Obtém o escritor group commit do worker
+
+    Returns:
+        GroupCommitWriter: Instância partilhada
+    """
+    global _writer
+
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = GroupCommitWriter()
+
+    return _writer
+
+
+def stop_chat_history_writer():
+    """Pára o escritor group commit do worker (shutdown)"""
+    global _writer
+
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.stop()
@@ -5,15 +5,42 @@ Combina PostgreSQL (memória episódica) com Weaviate (memória semântica)
 
 import asyncio
 import logging
+import os
 from typing import List, Dict, Optional
-from datetime import datetime
+from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 import weaviate
 import json
 
+from .executors import run_in_db_executor, run_in_vector_executor
+from .session_cache import get_recent_history_cache
+from .memory_stats import get_memory_stats_cache
+from .outbox_indexer import get_outbox_indexer
+from .group_commit import GROUP_COMMIT_TIMEOUT, get_chat_history_writer
+from .embeddings import get_query_embedder
+from .context_assembler import get_context_assembler
+from .session_summaries import SESSION_SUMMARY_MAX_PENDING_TURNS, get_session_summarizer, unsummarized_messages
+from .memory_backends import (
+    MEMORY_HIERARCHICAL, MemoryFilter, get_memory_backend, memory_collection_name, segment_collection_name
+)
+from .tenancy import MEMORY_MULTI_TENANCY
+from ..models.database import get_db_session, close_db_session
+
 logger = logging.getLogger(__name__)
 
+USER_ID_PROPERTY = {
+    "name": "user_id",
+    "dataType": ["string"],
+    "description": "Utilizador dono da memória"
+}
+
+# Coleções já verificadas neste processo (o esquema só é lido uma vez por worker)
+_ensured_collections = set()
+
+# Idade máxima das memórias semânticas usadas no contexto (0 = sem limite)
+SEMANTIC_MEMORY_WINDOW_DAYS = int(os.getenv("SEMANTIC_MEMORY_WINDOW_DAYS", "0"))
+
 class MemoryManager:
     """
     Gestor de memória híbrida que combina:
@@ -21,23 +48,36 @@ class MemoryManager:
     - Weaviate: Pesquisa semântica baseada em embeddings vetoriais
     """
     
-    def __init__(self, db_session: Session, weaviate_client: weaviate.Client):
+    def __init__(self, db_session: Session, weaviate_client: Optional[weaviate.Client]):
         """
         Inicializa o MemoryManager com clientes para ambas as bases de dados
         
         Args:
             db_session: Sessão SQLAlchemy para PostgreSQL
-            weaviate_client: Cliente configurado do Weaviate
+            weaviate_client: Cliente configurado do Weaviate (None com MEMORY_BACKEND=local)
         """
         self.db = db_session
         self.weaviate = weaviate_client
-        self.collection_name = "ConversationMemory"
+        # Com MEMORY_MULTI_TENANCY: coleção com um tenant por utilizador
+        self.collection_name = memory_collection_name()
+        self.history_cache = get_recent_history_cache()
+        self.stats_cache = get_memory_stats_cache()
+        self.outbox = get_outbox_indexer()
+        self.writer = get_chat_history_writer()
+        self.query_embedder = get_query_embedder()
+        self.memory_backend = get_memory_backend(weaviate_client)
+        self.context_assembler = get_context_assembler()
+        self.summarizer = get_session_summarizer()
         
         # Garantir que a coleção existe no Weaviate
         self._ensure_weaviate_schema()
+        if MEMORY_HIERARCHICAL:
+            self._ensure_segment_schema()
     
     def _ensure_weaviate_schema(self):
         """Cria o esquema do Weaviate se não existir"""
+        if self.weaviate is None or self.collection_name in _ensured_collections:
+            return
         try:
             # Verificar se a coleção já existe
             if not self.weaviate.schema.exists(self.collection_name):
@@ -45,6 +85,7 @@ class MemoryManager:
                     "class": self.collection_name,
                     "description": "Memórias de conversas para pesquisa semântica",
                     "vectorizer": "none",  # Sem vectorizer automático para teste
+                    "multiTenancyConfig": {"enabled": MEMORY_MULTI_TENANCY},
                     "properties": [
                         {
                             "name": "content",
@@ -56,6 +97,7 @@ class MemoryManager:
                             "dataType": ["string"],
                             "description": "ID da sessão da conversa"
                         },
+                        USER_ID_PROPERTY,
                         {
                             "name": "timestamp",
                             "dataType": ["date"],
@@ -77,148 +119,233 @@ class MemoryManager:
                 self.weaviate.schema.create_class(schema)
                 logger.info(f"✅ Coleção {self.collection_name} criada no Weaviate")
             else:
+                # Coleções criadas antes do user_id: acrescentar a propriedade (filtros por utilizador)
+                properties = self.weaviate.schema.get(self.collection_name).get("properties", [])
+                if not any(prop.get("name") == "user_id" for prop in properties):
+                    self.weaviate.schema.property.create(self.collection_name, USER_ID_PROPERTY)
+                    logger.info(f"✅ Propriedade user_id adicionada a {self.collection_name}")
                 logger.info(f"✅ Coleção {self.collection_name} já existe no Weaviate")
+            _ensured_collections.add(self.collection_name)
                 
         except Exception as e:
             logger.error(f"❌ Erro ao configurar esquema Weaviate: {e}")
     
-    def add_message(self, session_id: str, user_message: str, assistant_message: str) -> bool:
+    def _ensure_segment_schema(self):
+        """Cria a coleção dos vetores de segmentos de sessão (memória hierárquica)"""
+        segment_collection = segment_collection_name()
+        if self.weaviate is None or segment_collection in _ensured_collections:
+            return
+        try:
+            if not self.weaviate.schema.exists(segment_collection):
+                self.weaviate.schema.create_class({
+                    "class": segment_collection,
+                    "description": "Vetor médio de cada segmento de sessão (pesquisa em dois níveis)",
+                    "vectorizer": "none",
+                    "multiTenancyConfig": {"enabled": MEMORY_MULTI_TENANCY},
+                    "properties": [
+                        {"name": "session_id", "dataType": ["string"], "description": "ID da sessão"},
+                        USER_ID_PROPERTY,
+                        {"name": "timestamp", "dataType": ["date"], "description": "Turno mais recente do segmento"},
+                        {"name": "segment", "dataType": ["int"], "description": "Número do segmento na sessão"},
+                        {"name": "turn_count", "dataType": ["int"], "description": "Turnos incluídos na média"},
+                        {"name": "turn_sequences", "dataType": ["int[]"], "description": "Turnos incluídos (posições)"},
+                        {"name": "centroid_norm", "dataType": ["number"], "description": "Norma do vetor médio"}
+                    ]
+                })
+                logger.info(f"✅ Coleção {segment_collection} criada no Weaviate")
+            _ensured_collections.add(segment_collection)
+
+        except Exception as e:
+            logger.error(f"❌ Erro ao configurar esquema de segmentos Weaviate: {e}")
+
+    def add_message(self, session_id: str, user_message: str, assistant_message: str,
+                    user_id: Optional[str] = None) -> bool:
         """
-        Guarda uma troca de mensagens em ambas as bases de dados
+        Guarda uma troca de mensagens no PostgreSQL e agenda a indexação no Weaviate
         
         Args:
             session_id: Identificador único da sessão
             user_message: Mensagem do utilizador
             assistant_message: Resposta do assistente
+            user_id: Utilizador (tenant da memória semântica); None = anónimo
             
         Returns:
             bool: True se guardado com sucesso, False caso contrário
         """
         try:
-            timestamp = datetime.now()
+            timestamp = datetime.utcnow()
             
-            # 1. POSTGRESQL - Guardar mensagens individuais na tabela chat_history
-            self._save_to_postgresql(session_id, user_message, assistant_message, timestamp)
+            # 1. POSTGRESQL - Gravação em lote (group commit) partilhada com outros pedidos
+            sequences = self.writer.write(session_id, user_message, assistant_message, timestamp, user_id=user_id)
             
-            # 2. WEAVIATE - Criar documento combinado para pesquisa semântica
-            self._save_to_weaviate(session_id, user_message, assistant_message, timestamp)
-            
-            logger.info(f"✅ Conversa guardada - Sessão: {session_id}")
+            self._after_save(session_id, user_message, assistant_message, timestamp, sequences)
             return True
             
         except Exception as e:
             logger.error(f"❌ Erro ao guardar conversa: {e}")
-            self.db.rollback()
             return False
     
-    def _save_to_postgresql(self, session_id: str, user_message: str, assistant_message: str, timestamp: datetime):
-        """Guarda mensagens individuais no PostgreSQL"""
+    async def add_message_async(self, session_id: str, user_message: str, assistant_message: str,
+                                user_id: Optional[str] = None) -> bool:
+        """
+        Versão assíncrona de add_message: espera pelo group commit sem bloquear o event loop
+        
+        Returns:
+            bool: True se guardado com sucesso, False caso contrário
+        """
         try:
-            # Inserir mensagem do utilizador
-            user_query = text("""
-                INSERT INTO chat_history (session_id, user_message, assistant_message, timestamp, message_type)
-                VALUES (:session_id, :user_message, NULL, :timestamp, 'user')
-            """)
+            timestamp = datetime.utcnow()
             
-            self.db.execute(user_query, {
-                'session_id': session_id,
-                'user_message': user_message,
-                'timestamp': timestamp
-            })
+            future = self.writer.submit(session_id, user_message, assistant_message, timestamp, user_id)
+            sequences = await asyncio.wait_for(asyncio.wrap_future(future), GROUP_COMMIT_TIMEOUT)
             
-            # Inserir resposta do assistente
-            assistant_query = text("""
-                INSERT INTO chat_history (session_id, user_message, assistant_message, timestamp, message_type)
-                VALUES (:session_id, NULL, :assistant_message, :timestamp, 'assistant')
-            """)
-            
-            self.db.execute(assistant_query, {
-                'session_id': session_id,
-                'assistant_message': assistant_message,
-                'timestamp': timestamp
-            })
-            
-            self.db.commit()
-            logger.debug(f"💾 Mensagens guardadas no PostgreSQL - Sessão: {session_id}")
+            self._after_save(session_id, user_message, assistant_message, timestamp, sequences)
+            return True
             
         except Exception as e:
-            logger.error(f"❌ Erro PostgreSQL: {e}")
-            self.db.rollback()
-            raise
+            logger.error(f"❌ Erro ao guardar conversa: {e}")
+            return False
     
-    def _save_to_weaviate(self, session_id: str, user_message: str, assistant_message: str, timestamp: datetime):
-        """Cria documento combinado e guarda no Weaviate"""
-        try:
-            # Combinar mensagens num documento único para pesquisa semântica
-            combined_content = f"""Utilizador: {user_message}
-
-Assistente: {assistant_message}"""
-            
-            # Preparar objeto para Weaviate
-            data_object = {
-                "content": combined_content,
-                "session_id": session_id,
-                "timestamp": timestamp.isoformat(),
-                "user_message": user_message,
-                "assistant_message": assistant_message
-            }
-            
-            # Guardar no Weaviate com vetorização automática
-            result = self.weaviate.data_object.create(
-                data_object=data_object,
-                class_name=self.collection_name
-            )
-            
-            logger.debug(f"🔍 Documento vetorizado no Weaviate - ID: {result}")
-            
-        except Exception as e:
-            logger.error(f"❌ Erro Weaviate: {e}")
-            raise
+    def _after_save(self, session_id: str, user_message: str, assistant_message: str, timestamp: datetime,
+                    sequences: Optional[List[int]] = None):
+        """Atualiza caches e agenda a indexação depois de a troca estar gravada"""
+        # Manter a cache de histórico recente alinhada com a base de dados
+        user_sequence, assistant_sequence = sequences or (None, None)
+        self.history_cache.append(session_id, [
+            {'type': 'user', 'content': user_message, 'timestamp': timestamp, 'sequence': user_sequence},
+            {'type': 'assistant', 'content': assistant_message, 'timestamp': timestamp,
+             'sequence': assistant_sequence}
+        ])
+        self.stats_cache.record_write(2, timestamp)
+        
+        # 2. WEAVIATE - Indexação assíncrona pelo outbox (linhas com processed = false)
+        self.outbox.notify()
+        
+        # 3. RESUMO DA SESSÃO - Atualizado em background a cada N turnos
+        self.summarizer.schedule(session_id)
+        
+        logger.info(f"✅ Conversa guardada - Sessão: {session_id}")
     
-    async def get_context(self, session_id: str, query: str, recent_limit: int = 5, semantic_limit: int = 3) -> str:
+    async def get_context(self, session_id: str, query: str, recent_limit: int = 5, semantic_limit: int = 3,
+                          user_id: Optional[str] = None) -> str:
         """
         Recupera contexto híbrido combinando histórico recente e memórias relevantes
         
+        Com resumo da sessão, o contexto leva o resumo mais os turnos que ele
+        ainda não cobre (sequence > last_sequence, no máximo
+        SESSION_SUMMARY_MAX_PENDING_TURNS), sem repetir nem saltar turnos.
+        
         Args:
             session_id: ID da sessão atual
             query: Pergunta/contexto para pesquisa semântica
             recent_limit: Número de mensagens recentes a recuperar
             semantic_limit: Número de resultados semânticos a recuperar
+            user_id: Utilizador cujas memórias são pesquisadas (None = anónimo)
             
         Returns:
             str: Contexto formatado combinando ambos os tipos de memória
         """
         try:
-            # Executar ambas as pesquisas em paralelo para melhor performance
-            recent_task = asyncio.create_task(self._get_recent_history(session_id, recent_limit))
-            semantic_task = asyncio.create_task(self._get_semantic_memories(query, semantic_limit, session_id))
-            
-            recent_history, semantic_memories = await asyncio.gather(recent_task, semantic_task)
+            # Executar as pesquisas em paralelo, cada uma na sua pool de threads,
+            # para que a latência seja a máxima delas (e não a soma)
+            summary_window = recent_limit + max(self.summarizer.every_turns - 1, 0)
+            recent_history, semantic_memories, summary = await asyncio.gather(
+                self._get_recent_history(session_id, summary_window),
+                self._get_semantic_memories(query, semantic_limit, session_id, user_id),
+                self._get_summary(session_id)
+            )
+            if summary is None:
+                # Sem resumo: só os últimos recent_limit turnos
+                recent_history = recent_history[-recent_limit * 2:] if recent_limit > 0 else []
+            else:
+                recent_history = await self._get_unsummarized_history(
+                    session_id, recent_history, summary["last_sequence"]
+                )
             
-            # Formatar contexto final
-            context = self._format_context(recent_history, semantic_memories)
+            # Montar o contexto final dentro do orçamento de tokens
+            assembled = self.context_assembler.assemble(
+                recent_history, semantic_memories, summary["summary"] if summary else None
+            )
             
-            logger.info(f"🧠 Contexto recuperado - Sessão: {session_id}, Recentes: {len(recent_history)}, Semânticas: {len(semantic_memories)}")
-            return context
+            tokens = assembled.usage()["tokens"]
+            logger.info(f"🧠 Contexto recuperado - Sessão: {session_id}, Recentes: {assembled.recent_count}, "
+                        f"Semânticas: {assembled.semantic_count}, Tokens: {tokens}")
+            return assembled.text
             
         except Exception as e:
             logger.error(f"❌ Erro ao recuperar contexto: {e}")
             return "Contexto não disponível devido a erro interno."
     
+    async def _get_summary(self, session_id: str) -> Optional[Dict]:
+        """Resumo incremental da sessão (None se ainda não existe ou em caso de erro)"""
+        try:
+            return await run_in_db_executor(self.summarizer.get, session_id)
+        except Exception as e:
+            logger.warning(f"⚠️ Resumo da sessão indisponível: {e}")
+            return None
+    
+    async def _get_unsummarized_history(self, session_id: str, recent_history: List[Dict],
+                                        last_sequence: int) -> List[Dict]:
+        """
+        Turnos que o resumo ainda não cobre
+
+        A janela lida em paralelo chega quando o resumo está em dia; com o
+        resumo atrasado os turnos em falta são lidos do PostgreSQL.
+        """
+        message_count = SESSION_SUMMARY_MAX_PENDING_TURNS * 2
+        pending = unsummarized_messages(recent_history, last_sequence)
+        if pending is None:
+            pending = await run_in_db_executor(
+                self._fetch_recent_history, session_id, message_count, last_sequence
+            ) or []
+        return pending[-message_count:]
+    
     async def _get_recent_history(self, session_id: str, limit: int) -> List[Dict]:
-        """Recupera histórico recente do PostgreSQL"""
+        """
+        Recupera histórico recente: primeiro da cache do worker e, num miss,
+        do PostgreSQL (sem bloquear o event loop)
+        """
+        message_count = limit * 2  # *2 porque cada troca tem 2 mensagens
+        
+        cached = self.history_cache.get(session_id, message_count)
+        if cached is not None:
+            return cached
+        
+        # Carregar o suficiente para preencher o buffer da sessão
+        fetch_count = max(message_count, self.history_cache.capacity)
+        messages = await run_in_db_executor(self._fetch_recent_history, session_id, fetch_count)
+        if messages is not None:
+            self.history_cache.prime(session_id, messages)
+            return messages[-message_count:] if message_count > 0 else []
+        return []
+    
+    def _fetch_recent_history(self, session_id: str, message_count: int,
+                              after_sequence: Optional[int] = None) -> Optional[List[Dict]]:
+        """
+        Query síncrona do histórico recente (corre na pool de threads da BD)
+        
+        Args:
+            session_id: ID da sessão
+            message_count: Número máximo de mensagens (as mais recentes)
+            after_sequence: Só mensagens posteriores a esta posição (None = todas)
+        
+        Returns:
+            Mensagens em ordem cronológica, ou None em caso de erro
+        """
         try:
-            query = text("""
-                SELECT user_message, assistant_message, timestamp, message_type
+            after_filter = "AND sequence > :after_sequence" if after_sequence is not None else ""
+            query = text(f"""
+                SELECT user_message, assistant_message, timestamp, message_type, sequence
                 FROM chat_history 
-                WHERE session_id = :session_id 
-                ORDER BY timestamp DESC 
+                WHERE session_id = :session_id {after_filter}
+                ORDER BY sequence DESC 
                 LIMIT :limit
             """)
             
             result = self.db.execute(query, {
                 'session_id': session_id,
-                'limit': limit * 2  # *2 porque cada troca tem 2 mensagens
+                'after_sequence': after_sequence,
+                'limit': message_count
             })
             
             messages = []
@@ -227,13 +354,15 @@ Assistente: {assistant_message}"""
                     messages.append({
                         'type': 'user',
                         'content': row.user_message,
-                        'timestamp': row.timestamp
+                        'timestamp': row.timestamp,
+                        'sequence': row.sequence
                     })
                 elif row.message_type == 'assistant' and row.assistant_message:
                     messages.append({
                         'type': 'assistant', 
                         'content': row.assistant_message,
-                        'timestamp': row.timestamp
+                        'timestamp': row.timestamp,
+                        'sequence': row.sequence
                     })
             
             # Inverter para ordem cronológica
@@ -241,82 +370,69 @@ Assistente: {assistant_message}"""
             
         except Exception as e:
             logger.error(f"❌ Erro ao recuperar histórico recente: {e}")
-            return []
+            return None
     
-    async def _get_semantic_memories(self, query: str, limit: int, current_session_id: str) -> List[Dict]:
-        """Recupera memórias semanticamente relevantes do Weaviate"""
+    async def _get_semantic_memories(self, query: str, limit: int, current_session_id: str,
+                                     user_id: Optional[str] = None) -> List[Dict]:
+        """Recupera memórias semanticamente relevantes do Weaviate sem bloquear o event loop"""
+        return await run_in_vector_executor(self._search_semantic_memories, query, limit, current_session_id, user_id)
+    
+    def _search_semantic_memories(self, query: str, limit: int, current_session_id: str,
+                                  user_id: Optional[str] = None) -> List[Dict]:
+        """Pesquisa síncrona na memória semântica (corre na pool de threads vetorial)"""
         try:
-            # Pesquisa semântica no Weaviate
-            result = self.weaviate.query.get(
-                self.collection_name, 
-                ["content", "session_id", "timestamp", "user_message", "assistant_message"]
-            ).with_near_text({
-                "concepts": [query],
-                "certainty": 0.7  # Threshold para relevância
-            }).with_limit(limit + 5).do()  # +5 para filtrar sessão atual
-            
-            memories = []
-            objects = result.get("data", {}).get("Get", {}).get(self.collection_name, [])
-            
-            for obj in objects:
-                # Filtrar memórias da sessão atual (para evitar redundância)
-                if obj.get("session_id") != current_session_id:
-                    memories.append({
-                        'content': obj.get("content", ""),
-                        'session_id': obj.get("session_id", ""),
-                        'timestamp': obj.get("timestamp", ""),
-                        'user_message': obj.get("user_message", ""),
-                        'assistant_message': obj.get("assistant_message", "")
-                    })
-                    
-                    if len(memories) >= limit:
-                        break
-            
-            return memories
+            # Vetor da pergunta calculado no cliente (reutilizado da cache se repetida)
+            query_vector = self.query_embedder.embed_query(query)
+            
+            # Memórias de outras sessões (a atual já está no histórico recente); o
+            # motor vetorial aplica os filtros e devolve exatamente `limit` resultados
+            # Só as memórias do próprio utilizador (o tenant dele com multi-tenancy)
+            filters = MemoryFilter(exclude_session=current_session_id, user_id=user_id)
+            if SEMANTIC_MEMORY_WINDOW_DAYS > 0:
+                filters.since = datetime.utcnow() - timedelta(days=SEMANTIC_MEMORY_WINDOW_DAYS)
+            results = self.memory_backend.search(query_vector, limit, filters)
+            
+            return [
+                {
+                    'content': memory.get("content", ""),
+                    'session_id': memory.get("session_id", ""),
+                    'timestamp': memory.get("timestamp", ""),
+                    'user_message': memory.get("user_message", ""),
+                    'assistant_message': memory.get("assistant_message", "")
+                }
+                for memory in results
+            ]
             
         except Exception as e:
             logger.error(f"❌ Erro na pesquisa semântica: {e}")
             return []
     
-    def _format_context(self, recent_history: List[Dict], semantic_memories: List[Dict]) -> str:
-        """Formata o contexto final combinando ambos os tipos de memória"""
-        context_parts = []
-        
-        # SECÇÃO 1: Histórico Recente
-        if recent_history:
-            context_parts.append("📚 **HISTÓRICO RECENTE DA CONVERSA**")
-            context_parts.append("=" * 50)
-            
-            for msg in recent_history:
-                if msg['type'] == 'user':
-                    context_parts.append(f"🙋 **Utilizador:** {msg['content']}")
-                else:
-                    context_parts.append(f"🤖 **Assistente:** {msg['content']}")
-                context_parts.append("")
-        else:
-            context_parts.append("📚 **HISTÓRICO RECENTE DA CONVERSA**")
-            context_parts.append("(Nenhum histórico recente disponível)")
-            context_parts.append("")
+    def get_memory_stats(self, fresh: bool = False) -> Dict:
+        """
+        Retorna estatísticas sobre o sistema de memória
         
-        # SECÇÃO 2: Memórias Relevantes
-        if semantic_memories:
-            context_parts.append("🧠 **MEMÓRIAS RELEVANTES DE CONVERSAS ANTERIORES**")
-            context_parts.append("=" * 50)
-            
-            for i, memory in enumerate(semantic_memories, 1):
-                context_parts.append(f"**Memória {i}** (Sessão: {memory['session_id']})")
-                context_parts.append(f"🙋 **Utilizador:** {memory['user_message']}")
-                context_parts.append(f"🤖 **Assistente:** {memory['assistant_message']}")
-                context_parts.append("")
-        else:
-            context_parts.append("🧠 **MEMÓRIAS RELEVANTES DE CONVERSAS ANTERIORES**")
-            context_parts.append("(Nenhuma memória relevante encontrada)")
-            context_parts.append("")
+        Servidas a partir de um snapshot partilhado pelo worker (com TTL e
+        atualização em background) em vez de agregados por pedido.
         
-        return "\n".join(context_parts)
+        Args:
+            fresh: Recalcular já o snapshot (ignora o TTL)
+        """
+        stats = self.stats_cache.get(self._load_memory_stats, force=fresh)
+        stats["recent_history_cache"] = self.history_cache.stats()
+        stats["embedding_cache"] = self.query_embedder.stats()
+        stats["memory_backend"] = self.memory_backend.stats()
+        return stats
+    
+    def _load_memory_stats(self) -> Dict:
+        """Calcula um snapshot completo com uma sessão de BD própria (pode correr em background)"""
+        db = get_db_session()
+        try:
+            return self._compute_memory_stats(db)
+        finally:
+            close_db_session(db)
     
-    def get_memory_stats(self) -> Dict:
-        """Retorna estatísticas sobre o sistema de memória"""
+    def _compute_memory_stats(self, db: Session) -> Dict:
+        """Agregados completos sobre PostgreSQL e Weaviate"""
         try:
             # Stats PostgreSQL
             pg_query = text("""
@@ -327,11 +443,14 @@ Assistente: {assistant_message}"""
                 FROM chat_history
             """)
             
-            pg_result = self.db.execute(pg_query).fetchone()
+            pg_result = db.execute(pg_query).fetchone()
             
-            # Stats Weaviate
-            wv_result = self.weaviate.query.aggregate(self.collection_name).with_meta_count().do()
-            wv_count = wv_result.get("data", {}).get("Aggregate", {}).get(self.collection_name, [{}])[0].get("meta", {}).get("count", 0)
+            # Stats Weaviate (sem Weaviate no modo MEMORY_BACKEND=local)
+            wv_count = None
+            # Numa coleção multi-tenant a contagem é por tenant
+            if self.weaviate is not None and not MEMORY_MULTI_TENANCY:
+                wv_result = self.weaviate.query.aggregate(self.collection_name).with_meta_count().do()
+                wv_count = wv_result.get("data", {}).get("Aggregate", {}).get(self.collection_name, [{}])[0].get("meta", {}).get("count", 0)
             
             return {
                 "postgresql": {
@@ -0,0 +1,537 @@
+"""
+Classificação Local da Intenção (router web_search / memory_search)
+Decide o especialista de cada pergunta sem uma chamada ao LLM: primeiro regras
+por palavras-chave e expressões regulares, depois o centróide mais próximo dos
+embeddings de exemplos rotulados. O LLM do router só é chamado quando a
+confiança local fica abaixo de ROUTER_MIN_CONFIDENCE, e as decisões ficam numa
+cache LRU indexada pela pergunta normalizada.
+
+Com ROUTER_BATCHING, as chamadas ao LLM de pedidos concorrentes são agrupadas
+durante alguns milissegundos e enviadas num único prompt estruturado.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+from .batching import MicroBatcher
+from .executors import run_in_vector_executor
+
+logger = logging.getLogger(__name__)
+
+WEB_SEARCH = "web_search"
+MEMORY_SEARCH = "memory_search"
+ROUTES = (WEB_SEARCH, MEMORY_SEARCH)
+
+# Configuração por omissão (por worker)
+ROUTER_MIN_CONFIDENCE = float(os.getenv("ROUTER_MIN_CONFIDENCE", "0.7"))
+ROUTER_CACHE_SIZE = int(os.getenv("ROUTER_CACHE_SIZE", "4096"))
+ROUTER_EMBEDDING_CLASSIFIER = os.getenv("ROUTER_EMBEDDING_CLASSIFIER", "true").lower() in ("1", "true", "yes")
+# Diferença de similaridade entre os dois centróides a partir da qual a decisão é segura
+ROUTER_CENTROID_MARGIN = float(os.getenv("ROUTER_CENTROID_MARGIN", "0.08"))
+# Pausa (duplicada a cada falha seguida) antes de voltar a vetorizar os exemplos
+ROUTER_CENTROID_RETRY_SECONDS = float(os.getenv("ROUTER_CENTROID_RETRY_SECONDS", "60"))
+ROUTER_CENTROID_MAX_RETRY_SECONDS = float(os.getenv("ROUTER_CENTROID_MAX_RETRY_SECONDS", "3600"))
+# JSON opcional {"web_search": [...], "memory_search": [...]} com exemplos adicionais
+ROUTER_EXAMPLES_PATH = os.getenv("ROUTER_EXAMPLES_PATH")
+# Micro-batching das chamadas ao LLM do router (pedidos concorrentes)
+ROUTER_BATCHING = os.getenv("ROUTER_BATCHING", "false").lower() in ("1", "true", "yes")
+ROUTER_BATCH_WINDOW_MS = float(os.getenv("ROUTER_BATCH_WINDOW_MS", "20"))
+ROUTER_BATCH_SIZE = int(os.getenv("ROUTER_BATCH_SIZE", "16"))
+ROUTER_BATCH_TIMEOUT = float(os.getenv("ROUTER_BATCH_TIMEOUT", "30"))
+
+# Padrões sobre a pergunta normalizada (minúsculas, sem acentos nem pontuação)
+ROUTE_PATTERNS = {
+    MEMORY_SEARCH: [
+        r"\blembr(a|as|es|aste|ar)\b",
+        r"\b(recorda|recordas|recordar)\b",
+        r"\b(falamos|conversamos|discutimos|combinamos)\b",
+        r"\b(te disse|te contei|me disseste|me falaste|disseste|mencionei|mencionaste)\b",
+        r"\b(ultima vez|da outra vez|antes disso|conversa anterior|conversas anteriores)\b",
+        r"\b(o meu|a minha|os meus|as minhas) (nome|preferencia|preferencias|gosto|gostos|idade|profissao)\b",
+        r"\b(sabes|lembras) (quem sou|o meu nome|do que gosto)\b",
+        r"\b(remember|we talked|we discussed|i told you|you told me|last time|my name|my preferences)\b",
+    ],
+    WEB_SEARCH: [
+        r"\b(quem e|quem foi|quem sao|who is|who was)\b",
+        r"\b(presidente|primeiro ministro|governo|eleicoes|eleicao)\b",
+        r"\b(noticias|ultimas noticias|news|latest)\b",
+        r"\b(hoje|agora|atualmente|este ano|esta semana|current|today)\b",
+        r"\b(preco|cotacao|bolsa|tempo em|clima|previsao|resultado do jogo)\b",
+        r"\b(capital de|populacao de|onde fica|quando foi|quando e)\b",
+        r"\b(19|20)\d\d\b",
+    ],
+}
+
+# Exemplos rotulados para o classificador por centróides
+INTENT_EXAMPLES = {
+    WEB_SEARCH: [
+        "Quem é o presidente dos Estados Unidos?",
+        "Qual é a capital de França?",
+        "Quais são as últimas notícias sobre inteligência artificial?",
+        "Como está o tempo em Lisboa amanhã?",
+        "Quando foi assinada a Declaração Universal dos Direitos Humanos?",
+        "O que diz a nova lei europeia sobre IA?",
+        "Quantos habitantes tem o Brasil?",
+        "O que é o utilitarismo de Peter Singer?",
+        "Explica a teoria da justiça de John Rawls",
+        "Qual é o preço atual do bitcoin?",
+        "Who won the last football world cup?",
+        "What is the population of Portugal?",
+    ],
+    MEMORY_SEARCH: [
+        "Lembras-te do que falámos antes?",
+        "Do que falámos na última vez?",
+        "Qual é o meu nome?",
+        "O que te disse sobre o meu trabalho?",
+        "Recordas a minha opinião sobre a eutanásia?",
+        "Que livro te recomendei na nossa conversa anterior?",
+        "Quais são as minhas preferências?",
+        "Já te tinha contado sobre a minha família?",
+        "Continua a discussão de ontem sobre ética animal",
+        "O que concluímos da última vez sobre o dilema do elétrico?",
+        "Do you remember what I told you yesterday?",
+        "What did we talk about last time?",
+    ],
+}
+
+BATCH_ROUTER_PROMPT = """Classify each numbered user question as either `web_search` or `memory_search`.
+
+`web_search`: current events, facts, news, people, places, dates, general knowledge.
+`memory_search`: past conversations with the user, the user's preferences or personal information, "do you remember..." questions.
+
+Respond with ONLY a JSON object mapping each question number to its label, e.g. {{"1": "web_search", "2": "memory_search"}}.
+
+Questions:
+{questions}
+
+Labels:"""
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+_JSON_ARRAY = re.compile(r"\[.*\]", re.DOTALL)
+_NUMBERED_LINE = re.compile(r"^\s*\"?(\d+)\"?\s*[.):\-]")
+
+
+def normalize_question(text: str) -> str:
+    """Chave da cache e texto das regras: minúsculas, sem acentos, pontuação nem espaços repetidos"""
+    text = unicodedata.normalize("NFKD", (text or "").lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(_PUNCTUATION.sub(" ", text).split())
+
+
+def parse_route(text: str) -> Optional[str]:
+    """Rota indicada na resposta do LLM do router (None se não reconhecer)"""
+    text = (text or "").lower()
+    if MEMORY_SEARCH in text:
+        return MEMORY_SEARCH
+    if WEB_SEARCH in text:
+        return WEB_SEARCH
+    return None
+
+
+def parse_batch_routes(text: str, count: int) -> List[Optional[str]]:
+    """
+    Rotas de uma resposta ao prompt em lote
+
+    Cada rótulo é associado à pergunta pelo número: objeto JSON
+    {"1": "...", "2": "..."} ou uma linha "1. ..." por pergunta. Um array sem
+    números só é aceite com exatamente `count` rótulos. Perguntas sem rótulo
+    reconhecido ficam None.
+    """
+    text = text or ""
+    labels: Dict[int, object] = {}
+
+    match = _JSON_OBJECT.search(text)
+    if match:
+        try:
+            parsed = json.loads(match.group(0))
+        except ValueError:
+            parsed = None
+        if isinstance(parsed, dict):
+            labels = {int(key): label for key, label in parsed.items() if str(key).strip().isdigit()}
+
+    if not labels:
+        for line in text.splitlines():
+            numbered = _NUMBERED_LINE.match(line)
+            if numbered and parse_route(line):
+                labels.setdefault(int(numbered.group(1)), line[numbered.end():])
+
+    if not labels:
+        match = _JSON_ARRAY.search(text)
+        try:
+            parsed = json.loads(match.group(0)) if match else None
+        except ValueError:
+            parsed = None
+        # Sem números, a posição só é fiável se o número de rótulos bater certo
+        if isinstance(parsed, list) and len(parsed) == count:
+            labels = dict(enumerate(parsed, 1))
+
+    return [parse_route(str(labels[number])) if number in labels else None for number in range(1, count + 1)]
+
+
+class RouteDecision:
+    """Decisão do router: rota, confiança (0-1) e origem (rules, centroid, llm, default)"""
+
+    def __init__(self, route: str, confidence: float, source: str, cached: bool = False):
+        self.route = route
+        self.confidence = confidence
+        self.source = source
+        self.cached = cached
+
+    def as_dict(self) -> Dict:
+        return {"route": self.route, "confidence": round(self.confidence, 3),
+                "source": self.source, "cached": self.cached}
+
+
+class RuleClassifier:
+    """
+    Regras por expressões regulares
+
+    Só decide quando os padrões apontam para uma única rota; cada padrão extra
+    encontrado aumenta a confiança. Sem padrões, ou com padrões das duas rotas,
+    devolve None.
+    """
+
+    def __init__(self, patterns: Dict[str, List[str]] = ROUTE_PATTERNS):
+        self.patterns = {route: [re.compile(pattern) for pattern in route_patterns]
+                         for route, route_patterns in patterns.items()}
+
+    def classify(self, normalized: str) -> Optional[RouteDecision]:
+        matches = {
+            route: sum(1 for pattern in patterns if pattern.search(normalized))
+            for route, patterns in self.patterns.items()
+        }
+        matched = [route for route, count in matches.items() if count]
+        if len(matched) != 1:
+            return None
+        route = matched[0]
+        return RouteDecision(route, min(0.99, 0.8 + 0.1 * matches[route]), "rules")
+
+
+class CentroidClassifier:
+    """
+    Centróide mais próximo dos embeddings dos exemplos de cada rota
+
+    Os exemplos são vetorizados numa única chamada, na primeira classificação.
+    A confiança cresce com a diferença entre as duas similaridades e atinge o
+    máximo quando essa diferença chega a `margin`.
+
+    Se a vetorização dos exemplos falhar, o classificador fica indisponível
+    (`available`) durante `retry_seconds`, com a pausa a duplicar a cada falha
+    seguida até `max_retry_seconds`; a falha é registada uma vez por sequência.
+    """
+
+    def __init__(self, examples: Dict[str, List[str]] = INTENT_EXAMPLES,
+                 embed_texts: Optional[Callable[[List[str]], List[np.ndarray]]] = None,
+                 embed_query: Optional[Callable[[str], np.ndarray]] = None,
+                 margin: float = ROUTER_CENTROID_MARGIN,
+                 retry_seconds: float = ROUTER_CENTROID_RETRY_SECONDS,
+                 max_retry_seconds: float = ROUTER_CENTROID_MAX_RETRY_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.examples = examples
+        self._embed_texts = embed_texts
+        self._embed_query = embed_query
+        self.margin = margin
+        self.retry_seconds = retry_seconds
+        self.max_retry_seconds = max_retry_seconds
+        self.clock = clock
+
+        self._routes: List[str] = []
+        self._centroids: Optional[np.ndarray] = None
+        self._fit_failures = 0
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        """False durante a pausa depois de uma falha a vetorizar os exemplos"""
+        return self._centroids is not None or self.clock() >= self._retry_at
+
+    def classify(self, question: str) -> RouteDecision:
+        centroids = self._fit()
+        vector = np.asarray(self._query_embedder()(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        similarities = centroids @ (vector / norm if norm > 0 else vector)
+
+        order = np.argsort(similarities)[::-1]
+        margin = float(similarities[order[0]] - similarities[order[1]])
+        confidence = 0.5 + 0.5 * min(1.0, margin / self.margin) if self.margin > 0 else 1.0
+        return RouteDecision(self._routes[order[0]], min(confidence, 0.99), "centroid")
+
+    def _fit(self) -> np.ndarray:
+        if self._centroids is not None:
+            return self._centroids
+        with self._lock:
+            if self._centroids is None:
+                if not self.available:
+                    raise RuntimeError("Classificador por centróides em pausa depois de uma falha")
+                routes = [route for route, texts in self.examples.items() if texts]
+                if len(routes) < 2:
+                    raise ValueError("O classificador por centróides precisa de exemplos de pelo menos 2 rotas")
+                texts = [text for route in routes for text in self.examples[route]]
+                try:
+                    vectors = np.asarray(self._texts_embedder()(texts), dtype=np.float32)
+                except Exception as e:
+                    self._fit_failures += 1
+                    delay = min(self.max_retry_seconds, self.retry_seconds * 2 ** (self._fit_failures - 1))
+                    self._retry_at = self.clock() + delay
+                    if self._fit_failures == 1:
+                        logger.warning(f"⚠️ Classificador por centróides indisponível "
+                                       f"(novas tentativas a partir de {delay:.0f}s): {e}")
+                    raise
+                vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+                centroids, start = [], 0
+                for route in routes:
+                    count = len(self.examples[route])
+                    centroid = vectors[start:start + count].mean(axis=0)
+                    centroids.append(centroid / max(np.linalg.norm(centroid), 1e-12))
+                    start += count
+                self._routes = routes
+                self._centroids = np.stack(centroids)
+                self._fit_failures = 0
+                logger.info(f"✅ Classificador de intenção treinado com {len(texts)} exemplos")
+        return self._centroids
+
+    def _texts_embedder(self) -> Callable[[List[str]], List[np.ndarray]]:
+        if self._embed_texts is None:
+            from .embeddings import get_embedding_batcher
+            self._embed_texts = get_embedding_batcher().embed
+        return self._embed_texts
+
+    def _query_embedder(self) -> Callable[[str], np.ndarray]:
+        if self._embed_query is None:
+            # A mesma cache das pesquisas na memória: o vetor da pergunta é reutilizado
+            from .embeddings import get_query_embedder
+            self._embed_query = get_query_embedder().embed_query
+        return self._embed_query
+
+
+def load_examples(path: Optional[str] = ROUTER_EXAMPLES_PATH) -> Dict[str, List[str]]:
+    """Exemplos embutidos mais os do ficheiro ROUTER_EXAMPLES_PATH (se existir)"""
+    examples = {route: list(texts) for route, texts in INTENT_EXAMPLES.items()}
+    if path:
+        try:
+            with open(path, encoding="utf-8") as handle:
+                for route, texts in json.load(handle).items():
+                    if route in ROUTES:
+                        examples[route].extend(texts)
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ Exemplos do router em {path} ignorados: {e}")
+    return examples
+
+
+class IntentRouter:
+    """
+    Router de intenção: cache → regras → centróides → LLM (só com baixa confiança)
+
+    - A cache LRU guarda as decisões confiantes pela pergunta normalizada
+    - O LLM é passado em cada chamada (`llm_classify`), para que o módulo não
+      dependa da API; se falhar, fica a melhor decisão local
+    - Sem decisão local nem LLM a rota é `default_route`
+    """
+
+    def __init__(self, centroid_classifier: Optional[CentroidClassifier] = None,
+                 rules: Optional[RuleClassifier] = None,
+                 min_confidence: float = ROUTER_MIN_CONFIDENCE,
+                 cache_size: int = ROUTER_CACHE_SIZE,
+                 default_route: str = WEB_SEARCH):
+        self.rules = rules or RuleClassifier()
+        self.centroids = centroid_classifier
+        self.min_confidence = min_confidence
+        self.cache_size = cache_size
+        self.default_route = default_route
+
+        self._cache: "OrderedDict[str, RouteDecision]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.cache_hits = 0
+        self.llm_calls = 0
+        self.llm_failures = 0
+        self.centroid_failures = 0
+        self.by_source: Dict[str, int] = {}
+
+    async def classify(self, question: str,
+                       llm_classify: Optional[Callable[[str], Awaitable[str]]] = None) -> RouteDecision:
+        """
+        Rota da pergunta
+
+        Args:
+            question: Pergunta do utilizador (sem contexto)
+            llm_classify: Corrotina que devolve a resposta do LLM do router
+        """
+        key = normalize_question(question)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+
+        decision = self.rules.classify(key)
+        if ((decision is None or decision.confidence < self.min_confidence)
+                and self.centroids is not None and self.centroids.available):
+            try:
+                # O embedding pode ser uma chamada remota: fora do event loop
+                decision = self._best(decision, await run_in_vector_executor(self.centroids.classify, question))
+            except Exception as e:
+                with self._lock:
+                    self.centroid_failures += 1
+                # Falhas a vetorizar os exemplos já foram registadas pelo classificador
+                if self.centroids.available:
+                    logger.warning(f"⚠️ Classificador por centróides indisponível: {e}")
+
+        if (decision is None or decision.confidence < self.min_confidence) and llm_classify is not None:
+            with self._lock:
+                self.llm_calls += 1
+            try:
+                route = parse_route(await llm_classify(question))
+                if route is not None:
+                    decision = RouteDecision(route, 1.0, "llm")
+            except Exception as e:
+                with self._lock:
+                    self.llm_failures += 1
+                logger.error(f"❌ LLM do router falhou: {e}")
+
+        if decision is None:
+            decision = RouteDecision(self.default_route, 0.0, "default")
+        return self._remember(key, decision)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "cache_hits": self.cache_hits,
+                "cache_hit_rate": round(self.cache_hits / self.requests, 3) if self.requests else 0.0,
+                "cached_questions": len(self._cache),
+                "decisions_by_source": dict(self.by_source),
+                "llm_calls": self.llm_calls,
+                "llm_failures": self.llm_failures,
+                "centroid_failures": self.centroid_failures,
+            }
+
+    @staticmethod
+    def _best(first: Optional[RouteDecision], second: RouteDecision) -> RouteDecision:
+        return second if first is None or second.confidence > first.confidence else first
+
+    def _cached(self, key: str) -> Optional[RouteDecision]:
+        with self._lock:
+            self.requests += 1
+            decision = self._cache.get(key)
+            if decision is None:
+                return None
+            self._cache.move_to_end(key)
+            self.cache_hits += 1
+        return RouteDecision(decision.route, decision.confidence, decision.source, cached=True)
+
+    def _remember(self, key: str, decision: RouteDecision) -> RouteDecision:
+        with self._lock:
+            self.by_source[decision.source] = self.by_source.get(decision.source, 0) + 1
+            # Decisões incertas não ficam em cache: a próxima pode chegar ao LLM
+            if decision.confidence >= self.min_confidence:
+                self._cache[key] = decision
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return decision
+
+
+class BatchedRouteClassifier:
+    """
+    Agrupa as classificações pelo LLM de pedidos concorrentes
+
+    Os pedidos que chegam durante `window_ms` vão num único prompt numerado
+    (BATCH_ROUTER_PROMPT) e cada chamador recebe a sua rota por um Future.
+    Uma rota em falta na resposta devolve "" (o router usa a decisão local).
+
+    Args:
+        llm_fn: Função bloqueante que envia um prompt ao LLM e devolve o texto
+    """
+
+    def __init__(self, llm_fn: Callable[[str], str], window_ms: float = ROUTER_BATCH_WINDOW_MS,
+                 max_batch: int = ROUTER_BATCH_SIZE, timeout: float = ROUTER_BATCH_TIMEOUT):
+        self.llm_fn = llm_fn
+        self.timeout = timeout
+        self.batcher = MicroBatcher(self._classify_batch, window_ms=window_ms,
+                                    max_batch=max_batch, name="router-batcher")
+
+    async def classify(self, question: str) -> str:
+        """Compatível com `llm_classify` de IntentRouter.classify"""
+        future = self.batcher.submit(question)
+        return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+
+    def stats(self) -> Dict:
+        return self.batcher.stats()
+
+    def stop(self):
+        self.batcher.stop()
+
+    def _classify_batch(self, questions: List[str]) -> List[str]:
+        numbered = "\n".join(f"{i}. {_single_line(question)}" for i, question in enumerate(questions, 1))
+        routes = parse_batch_routes(self.llm_fn(BATCH_ROUTER_PROMPT.format(questions=numbered)), len(questions))
+        if len(questions) > 1:
+            logger.info(f"🧭 Router em lote: {len(questions)} perguntas numa chamada")
+        return [route or "" for route in routes]
+
+
+def _single_line(text: str) -> str:
+    return " ".join((text or "").split())
+
+
+# Instâncias globais do processo
+_intent_router: Optional[IntentRouter] = None
+_route_batcher: Optional[BatchedRouteClassifier] = None
+_router_lock = threading.Lock()
+
+
+def get_intent_router() -> IntentRouter:
+    """
+    Obtém o router de intenção do worker
+
+    Returns:
+        IntentRouter: Instância partilhada
+    """
+    global _intent_router
+
+    if _intent_router is None:
+        with _router_lock:
+            if _intent_router is None:
+                centroids = CentroidClassifier(load_examples()) if ROUTER_EMBEDDING_CLASSIFIER else None
+                _intent_router = IntentRouter(centroid_classifier=centroids)
+
+    return _intent_router
+
+
+def get_route_batcher(llm_fn: Callable[[str], str]) -> BatchedRouteClassifier:
+    """
+    Obtém o classificador em lote do worker (criado com o primeiro `llm_fn`)
+
+    Returns:
+        BatchedRouteClassifier: Instância partilhada
+    """
+    global _route_batcher
+
+    if _route_batcher is None:
+        with _router_lock:
+            if _route_batcher is None:
+                _route_batcher = BatchedRouteClassifier(llm_fn)
+
+    return _route_batcher
+
+
+def stop_route_batcher():
+    """Pára a thread do router em lote (shutdown)"""
+    global _route_batcher
+
+    with _router_lock:
+        batcher, _route_batcher = _route_batcher, None
+    if batcher is not None:
+        batcher.stop()
@@ -0,0 +1,579 @@
+"""
+Índice Vetorial Local (IVF em NumPy)
+Guarda os vetores das conversas no próprio processo para evitar a ida ao
+Weaviate em cada turno. Os vetores são agrupados em listas invertidas (IVF,
+k-means esférico) e cada pesquisa só compara a pergunta com as listas mais
+próximas. Suporta inserções incrementais, remoções, filtro por sessão e
+persistência em ficheiros mapeados em memória.
+
+Opcionalmente os vetores são quantizados (int8 ou product quantization): a
+pesquisa pontua os candidatos com os códigos compactos e só lê os vetores
+float32 dos melhores para a ordenação final exata.
+"""
+
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Union
+
+import numpy as np
+
+from .quantization import create_quantizer
+
+logger = logging.getLogger(__name__)
+
+# Configuração por omissão
+LOCAL_INDEX_NPROBE = int(os.getenv("LOCAL_INDEX_NPROBE", "8"))
+LOCAL_INDEX_TRAIN_THRESHOLD = int(os.getenv("LOCAL_INDEX_TRAIN_THRESHOLD", "1024"))
+LOCAL_INDEX_AUTOSAVE_EVERY = int(os.getenv("LOCAL_INDEX_AUTOSAVE_EVERY", "100"))
+LOCAL_INDEX_QUANTIZATION = os.getenv("LOCAL_INDEX_QUANTIZATION", "none")  # none | int8 | pq
+LOCAL_INDEX_PQ_SUBVECTORS = int(os.getenv("LOCAL_INDEX_PQ_SUBVECTORS", "48"))
+# Candidatos reordenados com os vetores exatos = limit × LOCAL_INDEX_RERANK
+LOCAL_INDEX_RERANK = int(os.getenv("LOCAL_INDEX_RERANK", "4"))
+
+_INITIAL_CAPACITY = 1024
+_KMEANS_ITERATIONS = 10
+_KMEANS_MAX_SAMPLE = 50000
+_ASSIGN_CHUNK = 8192
+
+
+def _epoch(value: Union[str, datetime, float, None]) -> float:
+    """Timestamp em segundos desde a época (NaN se ausente); datas sem fuso são UTC"""
+    if value is None or value == "":
+        return float("nan")
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return float("nan")
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32, copy=False)
+
+
+class LocalVectorIndex:
+    """
+    Índice IVF de similaridade de cosseno, seguro entre threads
+
+    - Até `train_threshold` vetores a pesquisa é exata (força bruta)
+    - Depois disso treina `nlist` centróides (≈ √n) e pesquisa as `nprobe`
+      listas mais próximas; volta a treinar quando o índice duplica
+    - Com `directory`, os vetores vivem num ficheiro .npy mapeado em memória
+      (o sistema operativo carrega só as páginas usadas) e o estado é gravado
+      a cada `autosave_every` alterações e em close()
+    - Com `quantization` ("int8" ou "pq") o quantizador é treinado junto com o
+      IVF; os candidatos são pontuados pelos códigos e os `limit × rerank`
+      melhores reordenados com os vetores float32
+    """
+
+    def __init__(self, dimensions: Optional[int] = None, directory: Optional[str] = None,
+                 nlist: Optional[int] = None, nprobe: int = LOCAL_INDEX_NPROBE,
+                 train_threshold: int = LOCAL_INDEX_TRAIN_THRESHOLD,
+                 autosave_every: int = LOCAL_INDEX_AUTOSAVE_EVERY,
+                 quantization: str = LOCAL_INDEX_QUANTIZATION,
+                 pq_subvectors: int = LOCAL_INDEX_PQ_SUBVECTORS,
+                 rerank: int = LOCAL_INDEX_RERANK):
+        self.dimensions = dimensions
+        self.directory = directory
+        self.fixed_nlist = nlist
+        self.nprobe = nprobe
+        self.train_threshold = train_threshold
+        self.autosave_every = autosave_every
+        self.quantization = quantization or "none"
+        self.pq_subvectors = pq_subvectors
+        self.rerank = max(1, rerank)
+        # Validar já a configuração (erro no arranque e não no treino)
+        create_quantizer(self.quantization, pq_subvectors)
+
+        self._lock = threading.RLock()
+        self._reset()
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._load()
+
+    def _reset(self):
+        self._count = 0
+        self._vectors: Optional[np.ndarray] = None
+        self._alive = np.zeros(0, dtype=bool)
+        self._session_codes = np.zeros(0, dtype=np.int32)
+        self._user_codes = np.zeros(0, dtype=np.int32)
+        self._timestamps = np.zeros(0, dtype=np.float64)
+        self._assignments = np.zeros(0, dtype=np.int32)
+        self._ids: List[str] = []
+        self._metadata: List[Optional[Dict]] = []
+        self._id_to_row: Dict[str, int] = {}
+        self._session_lookup: Dict[str, int] = {}
+        self._sessions: List[str] = []
+        self._user_lookup: Dict[str, int] = {}
+        self._users: List[str] = []
+        self._centroids: Optional[np.ndarray] = None
+        self._quantizer = create_quantizer(self.quantization, self.pq_subvectors)
+        self._codes: Optional[np.ndarray] = None  # Só existe depois do treino
+        self._trained_size = 0
+        self._dirty = 0
+        # Último id do chat_history já indexado (usado pelo indexador outbox)
+        self.watermark = 0
+
+    # ------------------------------------------------------------------
+    # Escrita
+    # ------------------------------------------------------------------
+
+    def add(self, memory_id: str, vector, metadata: Optional[Dict] = None):
+        """Insere ou substitui um vetor"""
+        self.add_many([memory_id], np.asarray([vector], dtype=np.float32), [metadata or {}])
+
+    def add_many(self, memory_ids: List[str], vectors, metadata: List[Dict]):
+        """Insere ou substitui vários vetores de uma vez"""
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32).reshape(len(memory_ids), -1))
+        with self._lock:
+            if self.dimensions is None:
+                self.dimensions = vectors.shape[1]
+            if vectors.shape[1] != self.dimensions:
+                raise ValueError(f"Dimensão {vectors.shape[1]} diferente da do índice ({self.dimensions})")
+
+            self._reserve(self._count + len(memory_ids))
+            for memory_id, vector, properties in zip(memory_ids, vectors, metadata):
+                row = self._id_to_row.get(memory_id)
+                if row is None:
+                    row = self._count
+                    self._count += 1
+                    self._ids.append(memory_id)
+                    self._metadata.append(None)
+                    self._id_to_row[memory_id] = row
+                self._store_row(row, vector, properties)
+
+            rows = np.fromiter((self._id_to_row[memory_id] for memory_id in memory_ids), dtype=np.int64)
+            if self._centroids is not None:
+                self._assignments[rows] = self._nearest_centroids(vectors)
+            if self._codes is not None:
+                self._codes[rows] = self._quantizer.encode(vectors)
+
+            if self._needs_training():
+                self._train()
+            self._touch(len(memory_ids))
+
+    def delete(self, memory_id: str) -> bool:
+        """Remove um vetor (marcação; o espaço é recuperado na compactação)"""
+        with self._lock:
+            row = self._id_to_row.pop(memory_id, None)
+            if row is None:
+                return False
+            self._alive[row] = False
+            self._metadata[row] = None
+
+            if self._count - len(self._id_to_row) > max(64, self._count // 5):
+                self._compact()
+            self._touch(1)
+            return True
+
+    def delete_session(self, session_id: str) -> int:
+        """Remove todos os vetores de uma sessão"""
+        with self._lock:
+            code = self._session_lookup.get(session_id)
+            if code is None:
+                return 0
+            rows = np.flatnonzero(self._alive[:self._count] & (self._session_codes[:self._count] == code))
+            memory_ids = [self._ids[row] for row in rows]
+            for memory_id in memory_ids:
+                self.delete(memory_id)
+            return len(memory_ids)
+
+    # ------------------------------------------------------------------
+    # Pesquisa
+    # ------------------------------------------------------------------
+
+    def get(self, memory_id: str) -> Optional[Dict]:
+        """Vetor (normalizado) e metadados de um registo, ou None"""
+        with self._lock:
+            row = self._id_to_row.get(memory_id)
+            if row is None:
+                return None
+            return {"id": memory_id, "vector": np.array(self._vectors[row]), **(self._metadata[row] or {})}
+
+    def search(self, vector, limit: int = 3, exclude_session: Optional[str] = None,
+               session_id: Optional[str] = None, min_score: Optional[float] = None,
+               user_id: Optional[str] = None, since: Union[datetime, float, None] = None,
+               until: Union[datetime, float, None] = None,
+               session_ids: Optional[Iterable[str]] = None) -> List[Dict]:
+        """
+        Devolve os vetores mais próximos, do mais para o menos semelhante
+
+        Os filtros são aplicados antes da seleção dos melhores, por isso são
+        devolvidos `limit` resultados sempre que existam.
+
+        Args:
+            vector: Vetor da pergunta
+            limit: Número máximo de resultados
+            exclude_session: Ignorar memórias desta sessão
+            session_id: Restringir a memórias desta sessão
+            min_score: Similaridade de cosseno mínima
+            user_id: Restringir a memórias deste utilizador
+            since: Só memórias com timestamp >= since
+            until: Só memórias com timestamp < until
+            session_ids: Restringir a memórias destas sessões (pesquisa exata só
+                nas suas linhas, sem passar pelas listas IVF)
+
+        Returns:
+            Lista de {"id", "score", **metadados}
+        """
+        query = _normalize(np.asarray(vector, dtype=np.float32).reshape(-1))
+        with self._lock:
+            if self._count == 0 or self._vectors is None:
+                return []
+
+            mask = self._filter_mask(exclude_session, session_id, user_id, since, until, session_ids)
+            if mask is None:
+                return []
+
+            candidates = mask
+            if self._centroids is not None and session_ids is None:
+                probe = np.argsort(-(self._centroids @ query))[:self.nprobe]
+                candidates = mask & np.isin(self._assignments[:self._count], probe)
+                # Filtros muito seletivos: completar com pesquisa exata
+                if np.count_nonzero(candidates) < limit:
+                    candidates = mask
+
+            rows = np.flatnonzero(candidates)
+            rows, scores = self._score(rows, query, limit)
+            return self._top(rows, scores, limit, min_score)
+
+    def _score(self, rows: np.ndarray, query: np.ndarray, limit: int):
+        """Similaridade exata dos candidatos (pré-selecionados pelos códigos, se quantizado)"""
+        if self._codes is not None:
+            shortlist = limit * self.rerank
+            if len(rows) > shortlist:
+                approximate = self._quantizer.scores(self._codes[rows], query)
+                rows = np.sort(rows[np.argpartition(-approximate, shortlist - 1)[:shortlist]])
+        return rows, np.asarray(self._vectors[rows]) @ query
+
+    def _top(self, rows: np.ndarray, scores: np.ndarray, limit: int, min_score: Optional[float]) -> List[Dict]:
+        if limit <= 0:
+            return []
+        if min_score is not None:
+            keep = scores >= min_score
+            rows, scores = rows[keep], scores[keep]
+        if len(rows) > limit:
+            best = np.argpartition(-scores, limit - 1)[:limit]
+            rows, scores = rows[best], scores[best]
+        order = np.argsort(-scores)
+
+        return [
+            {"id": self._ids[rows[i]], "score": float(scores[i]), **(self._metadata[rows[i]] or {})}
+            for i in order
+        ]
+
+    def _filter_mask(self, exclude_session: Optional[str], session_id: Optional[str],
+                     user_id: Optional[str] = None, since=None, until=None,
+                     session_ids: Optional[Iterable[str]] = None) -> Optional[np.ndarray]:
+        mask = self._alive[:self._count].copy()
+        codes = self._session_codes[:self._count]
+        if session_id is not None:
+            code = self._session_lookup.get(session_id)
+            if code is None:
+                return None
+            mask &= codes == code
+        if session_ids is not None:
+            wanted = [self._session_lookup[session] for session in session_ids if session in self._session_lookup]
+            if not wanted:
+                return None
+            mask &= np.isin(codes, wanted)
+        if exclude_session is not None and exclude_session in self._session_lookup:
+            mask &= codes != self._session_lookup[exclude_session]
+        if user_id is not None:
+            code = self._user_lookup.get(user_id)
+            if code is None:
+                return None
+            mask &= self._user_codes[:self._count] == code
+        # Comparações com NaN são falsas: memórias sem timestamp ficam fora das janelas
+        if since is not None:
+            mask &= self._timestamps[:self._count] >= _epoch(since)
+        if until is not None:
+            mask &= self._timestamps[:self._count] < _epoch(until)
+        return mask
+
+    # ------------------------------------------------------------------
+    # Estado e persistência
+    # ------------------------------------------------------------------
+
+    def __len__(self) -> int:
+        return len(self._id_to_row)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "vectors": len(self._id_to_row),
+                "rows": self._count,
+                "dimensions": self.dimensions,
+                "lists": 0 if self._centroids is None else len(self._centroids),
+                "quantization": self.quantization if self._codes is not None else "none",
+                "vector_bytes": int(self._count * (self.dimensions or 0) * 4),
+                "code_bytes": 0 if self._codes is None else int(self._count * self._codes[0].nbytes),
+                "persistent": bool(self.directory),
+            }
+
+    def save(self):
+        """Grava o estado no diretório (escrita atómica dos metadados)"""
+        with self._lock:
+            if not self.directory or self._vectors is None:
+                return
+            for array in (self._vectors, self._codes):
+                if isinstance(array, np.memmap):
+                    array.flush()
+
+            state_path = os.path.join(self.directory, "index_state.npz")
+            np.savez(
+                state_path + ".tmp.npz",
+                alive=self._alive[:self._count],
+                session_codes=self._session_codes[:self._count],
+                user_codes=self._user_codes[:self._count],
+                timestamps=self._timestamps[:self._count],
+                assignments=self._assignments[:self._count],
+                centroids=self._centroids if self._centroids is not None else np.zeros((0, self.dimensions), np.float32),
+                **({f"quantizer_{key}": value for key, value in self._quantizer.state().items()}
+                   if self._codes is not None else {}),
+            )
+            os.replace(state_path + ".tmp.npz", state_path)
+
+            meta_path = os.path.join(self.directory, "index_meta.json")
+            with open(meta_path + ".tmp", "w", encoding="utf-8") as handle:
+                json.dump({
+                    "count": self._count,
+                    "dimensions": self.dimensions,
+                    "trained_size": self._trained_size,
+                    "watermark": self.watermark,
+                    "quantization": self.quantization if self._codes is not None else "none",
+                    "ids": self._ids,
+                    "sessions": self._sessions,
+                    "users": self._users,
+                    "metadata": self._metadata,
+                }, handle, ensure_ascii=False)
+            os.replace(meta_path + ".tmp", meta_path)
+            self._dirty = 0
+
+    def close(self):
+        self.save()
+
+    def _load(self):
+        meta_path = os.path.join(self.directory, "index_meta.json")
+        state_path = os.path.join(self.directory, "index_state.npz")
+        vectors_path = os.path.join(self.directory, "vectors.npy")
+        if not (os.path.exists(meta_path) and os.path.exists(state_path) and os.path.exists(vectors_path)):
+            return
+
+        try:
+            with open(meta_path, encoding="utf-8") as handle:
+                meta = json.load(handle)
+            state = np.load(state_path)
+            vectors = np.load(vectors_path, mmap_mode="r+")
+            count = meta["count"]
+
+            self.dimensions = meta["dimensions"]
+            self._vectors = vectors
+            self._count = count
+            self._ids = meta["ids"]
+            self._metadata = meta["metadata"]
+            self._sessions = meta["sessions"]
+            self._session_lookup = {session: code for code, session in enumerate(self._sessions)}
+            self._users = meta.get("users", [])
+            self._user_lookup = {user: code for code, user in enumerate(self._users)}
+            self._trained_size = meta.get("trained_size", 0)
+            self.watermark = meta.get("watermark", 0)
+
+            capacity = vectors.shape[0]
+            self._alive = np.zeros(capacity, dtype=bool)
+            self._alive[:count] = state["alive"]
+            self._session_codes = np.zeros(capacity, dtype=np.int32)
+            self._session_codes[:count] = state["session_codes"]
+            self._user_codes = np.zeros(capacity, dtype=np.int32)
+            self._timestamps = np.full(capacity, np.nan)
+            if "user_codes" in state.files:
+                self._user_codes[:count] = state["user_codes"]
+                self._timestamps[:count] = state["timestamps"]
+            else:
+                # Índice gravado antes dos filtros: reconstruir a partir dos metadados
+                for row, properties in enumerate(self._metadata):
+                    if properties:
+                        self._user_codes[row] = self._code(self._users, self._user_lookup,
+                                                           str(properties.get("user_id", "")))
+                        self._timestamps[row] = _epoch(properties.get("timestamp"))
+            self._assignments = np.zeros(capacity, dtype=np.int32)
+            self._assignments[:count] = state["assignments"]
+            self._centroids = state["centroids"] if len(state["centroids"]) else None
+            self._id_to_row = {
+                memory_id: row for row, memory_id in enumerate(self._ids) if self._alive[row]
+            }
+
+            codes_path = os.path.join(self.directory, "codes.npy")
+            if self._quantizer is not None and self._centroids is not None:
+                if meta.get("quantization") == self.quantization and os.path.exists(codes_path):
+                    self._quantizer.load_state({
+                        key[len("quantizer_"):]: state[key] for key in state.files if key.startswith("quantizer_")
+                    })
+                    self._codes = np.load(codes_path, mmap_mode="r+")
+                else:
+                    # Quantização mudou na configuração: treinar com os vetores gravados
+                    self._train_quantizer()
+            logger.info(f"✅ Índice vetorial local carregado: {len(self._id_to_row)} vetores")
+        except Exception as e:
+            logger.error(f"❌ Índice vetorial local corrompido, a começar vazio: {e}")
+            self._reset()
+
+    def _touch(self, changes: int):
+        self._dirty += changes
+        if self.directory and self._dirty >= self.autosave_every:
+            self.save()
+
+    @staticmethod
+    def _code(values: List[str], lookup: Dict[str, int], value: str) -> int:
+        code = lookup.get(value)
+        if code is None:
+            code = len(values)
+            values.append(value)
+            lookup[value] = code
+        return code
+
+    def _store_row(self, row: int, vector: np.ndarray, properties: Dict):
+        self._vectors[row] = vector
+        self._alive[row] = True
+        self._session_codes[row] = self._code(self._sessions, self._session_lookup,
+                                              str(properties.get("session_id", "")))
+        self._user_codes[row] = self._code(self._users, self._user_lookup, str(properties.get("user_id", "")))
+        self._timestamps[row] = _epoch(properties.get("timestamp"))
+        self._metadata[row] = properties
+
+    def _reserve(self, needed: int):
+        capacity = 0 if self._vectors is None else self._vectors.shape[0]
+        if needed <= capacity:
+            return
+
+        new_capacity = max(_INITIAL_CAPACITY, capacity * 2)
+        while new_capacity < needed:
+            new_capacity *= 2
+
+        self._vectors = self._allocate("vectors", self._vectors, new_capacity, self.dimensions, np.float32)
+        if self._codes is not None:
+            self._codes = self._allocate("codes", self._codes, new_capacity,
+                                         self._quantizer.code_size, self._quantizer.code_dtype)
+        self._alive = _grow(self._alive, new_capacity)
+        self._session_codes = _grow(self._session_codes, new_capacity)
+        self._user_codes = _grow(self._user_codes, new_capacity)
+        self._timestamps = _grow(self._timestamps, new_capacity)
+        self._assignments = _grow(self._assignments, new_capacity)
+
+    def _allocate(self, name: str, old: Optional[np.ndarray], capacity: int, width: int, dtype) -> np.ndarray:
+        """Matriz (capacity, width) em memória, ou ficheiro <name>.npy mapeado com `directory`"""
+        if not self.directory:
+            array = np.zeros((capacity, width), dtype=dtype)
+            if old is not None:
+                array[:self._count] = old[:self._count]
+            return array
+
+        path = os.path.join(self.directory, f"{name}.npy")
+        tmp_path = os.path.join(self.directory, f"{name}.tmp.npy")
+        array = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=dtype, shape=(capacity, width))
+        if old is not None:
+            array[:self._count] = old[:self._count]
+        array.flush()
+        del array
+        os.replace(tmp_path, path)
+        return np.load(path, mmap_mode="r+")
+
+    # ------------------------------------------------------------------
+    # IVF
+    # ------------------------------------------------------------------
+
+    def _needs_training(self) -> bool:
+        alive = len(self._id_to_row)
+        return alive >= self.train_threshold and alive >= 2 * max(self._trained_size, self.train_threshold // 2)
+
+    def _train(self):
+        rows = np.flatnonzero(self._alive[:self._count])
+        rng = np.random.default_rng(0)
+
+        sample = rows if len(rows) <= _KMEANS_MAX_SAMPLE else rng.choice(rows, _KMEANS_MAX_SAMPLE, replace=False)
+        data = np.asarray(self._vectors[np.sort(sample)])
+        nlist = min(self.fixed_nlist or int(np.clip(np.sqrt(len(rows)), 1, 4096)), len(data))
+        centroids = data[rng.choice(len(data), nlist, replace=False)].copy()
+
+        # k-means esférico: atribuição por produto interno, centróides normalizados
+        for _ in range(_KMEANS_ITERATIONS):
+            labels = np.argmax(data @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, data)
+            # Listas vazias recomeçam num vetor aleatório
+            empty = np.bincount(labels, minlength=nlist) == 0
+            if empty.any():
+                sums[empty] = data[rng.choice(len(data), int(empty.sum()))]
+            centroids = _normalize(sums)
+
+        self._centroids = centroids
+        for start in range(0, self._count, _ASSIGN_CHUNK):
+            stop = min(start + _ASSIGN_CHUNK, self._count)
+            self._assignments[start:stop] = self._nearest_centroids(np.asarray(self._vectors[start:stop]))
+        self._trained_size = len(rows)
+        logger.info(f"🧭 Índice IVF treinado: {nlist} listas para {len(rows)} vetores")
+
+        if self._quantizer is not None:
+            self._train_quantizer(data)
+
+    def _train_quantizer(self, sample: Optional[np.ndarray] = None):
+        """Treina o quantizador e recodifica todas as linhas"""
+        if sample is None:
+            rows = np.flatnonzero(self._alive[:self._count])
+            if len(rows) > _KMEANS_MAX_SAMPLE:
+                rows = np.sort(np.random.default_rng(0).choice(rows, _KMEANS_MAX_SAMPLE, replace=False))
+            sample = np.asarray(self._vectors[rows])
+
+        self._quantizer = create_quantizer(self.quantization, self.pq_subvectors)
+        self._quantizer.train(sample)
+        self._codes = self._allocate("codes", None, self._vectors.shape[0],
+                                     self._quantizer.code_size, self._quantizer.code_dtype)
+        for start in range(0, self._count, _ASSIGN_CHUNK):
+            stop = min(start + _ASSIGN_CHUNK, self._count)
+            self._codes[start:stop] = self._quantizer.encode(np.asarray(self._vectors[start:stop]))
+        logger.info(f"🗜️ Quantização {self.quantization}: {self._quantizer.code_size} bytes por vetor")
+
+    def _nearest_centroids(self, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ self._centroids.T, axis=1).astype(np.int32)
+
+    def _compact(self):
+        rows = np.flatnonzero(self._alive[:self._count])
+        kept_vectors = np.asarray(self._vectors[rows])
+        kept_ids = [self._ids[row] for row in rows]
+        kept_metadata = [self._metadata[row] for row in rows]
+        kept_sessions = self._session_codes[rows].copy()
+        kept_users = self._user_codes[rows].copy()
+        kept_timestamps = self._timestamps[rows].copy()
+        kept_assignments = self._assignments[rows].copy()
+        kept_codes = None if self._codes is None else np.asarray(self._codes[rows]).copy()
+
+        self._count = len(rows)
+        self._vectors[:self._count] = kept_vectors
+        self._alive[:] = False
+        self._alive[:self._count] = True
+        self._session_codes[:self._count] = kept_sessions
+        self._user_codes[:self._count] = kept_users
+        self._timestamps[:self._count] = kept_timestamps
+        self._assignments[:self._count] = kept_assignments
+        if kept_codes is not None:
+            self._codes[:self._count] = kept_codes
+        self._ids = kept_ids
+        self._metadata = kept_metadata
+        self._id_to_row = {memory_id: row for row, memory_id in enumerate(kept_ids)}
+
+
+def _grow(array: np.ndarray, capacity: int) -> np.ndarray:
+    grown = np.zeros(capacity, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
@@ -1,45 +1,70 @@
 import weaviate
 import os
+import threading
+from typing import List, Optional, Tuple
 from backend_app.core.config import get_api_key, get_weaviate_config
+from backend_app.core.text_analysis import portuguese_analyzer
+from backend_app.core.embeddings import get_embedding_batcher
+
+# Intervalo (segundos) entre verificações de saúde da ligação partilhada
+HEALTH_CHECK_INTERVAL = float(os.getenv("WEAVIATE_HEALTH_CHECK_INTERVAL", "30"))
+
+
+def _connect_weaviate():
+    """
+    Abre uma ligação ao Weaviate baseada na configuração do ambiente
+    """
+    # Obtém configuração do Weaviate baseada no ambiente
+    weaviate_config = get_weaviate_config()
+    
+    if weaviate_config["scheme"] == "https":
+        # Produção - conexão remota com HTTPS
+        return weaviate.connect_to_custom(
+            http_host=weaviate_config["host"],
+            http_port=weaviate_config["port"],
+            http_secure=True,
+            auth_credentials=weaviate.auth.AuthApiKey(weaviate_config["api_key"]),
+            skip_init_checks=True
+        )
+    
+    # Desenvolvimento local - conexão local sem autenticação
+    if weaviate_config["api_key"]:
+        return weaviate.connect_to_local(
+            host=weaviate_config["host"],
+            port=weaviate_config["port"],
+            auth_credentials=weaviate.auth.AuthApiKey(weaviate_config["api_key"]),
+            skip_init_checks=True
+        )
+    return weaviate.connect_to_local(
+        host=weaviate_config["host"],
+        port=weaviate_config["port"],
+        skip_init_checks=True
+    )
+
 
 class VectorMemory:
     """
     Classe para gerenciar memória vetorial usando Weaviate
     """
     
-    def __init__(self):
+    def __init__(self, client=None):
         """
         Inicializa a conexão com Weaviate e cria o schema se necessário
+        
+        Args:
+            client: Cliente Weaviate já ligado (ex.: da pool partilhada). Quando
+                fornecido, o schema não é verificado e a ligação não é fechada
+                por esta instância.
         """
-        # Obtém configuração do Weaviate baseada no ambiente
-        weaviate_config = get_weaviate_config()
+        if client is not None:
+            self.client = client
+            self._owns_client = False
+            return
         
         # Conecta ao Weaviate
         try:
-            if weaviate_config["scheme"] == "https":
-                # Produção - conexão remota com HTTPS
-                self.client = weaviate.connect_to_custom(
-                    http_host=weaviate_config["host"],
-                    http_port=weaviate_config["port"],
-                    http_secure=True,
-                    auth_credentials=weaviate.auth.AuthApiKey(weaviate_config["api_key"]),
-                    skip_init_checks=True
-                )
-            else:
-                # Desenvolvimento local - conexão local sem autenticação
-                if weaviate_config["api_key"]:
-                    self.client = weaviate.connect_to_local(
-                        host=weaviate_config["host"],
-                        port=weaviate_config["port"],
-                        auth_credentials=weaviate.auth.AuthApiKey(weaviate_config["api_key"]),
-                        skip_init_checks=True
-                    )
-                else:
-                    self.client = weaviate.connect_to_local(
-                        host=weaviate_config["host"],
-                        port=weaviate_config["port"],
-                        skip_init_checks=True
-                    )
+            self.client = _connect_weaviate()
+            self._owns_client = True
             
             # Cria o schema se não existir
             self._create_schema()
@@ -69,6 +94,8 @@ class VectorMemory:
                 self.client.collections.create(
                     name="MemoryItem",
                     description="Itens de memória vetorial",
+                    # Vetores calculados no cliente pelo pipeline de embeddings
+                    vectorizer_config=weaviate.classes.config.Configure.Vectorizer.none(),
                     properties=[
                         weaviate.classes.config.Property(
                             name="text",
@@ -87,6 +114,8 @@ class VectorMemory:
                 self.client.collections.create(
                     name="MemoryItem",
                     description="Itens de memória vetorial",
+                    # Vetores calculados no cliente pelo pipeline de embeddings
+                    vectorizer_config=weaviate.classes.config.Configure.Vectorizer.none(),
                     properties=[
                         weaviate.classes.config.Property(
                             name="text",
@@ -107,51 +136,66 @@ class VectorMemory:
         """
         try:
             data = {"text": text}
-            self.client.collections.get("MemoryItem").data.insert(data)
+            vector = get_embedding_batcher().embed([text])[0]
+            self.client.collections.get("MemoryItem").data.insert(data, vector=vector.tolist())
             print(f"✅ Memória adicionada: {text[:50]}...")
         except Exception as e:
             print(f"Erro ao adicionar memória: {e}")
     
-    def search_memory(self, query_text: str, limit: int = 3):
+    def search_memory(self, query_text: str, limit: int = 3, min_score: Optional[float] = None):
         """
-        Pesquisa memórias similares usando busca por palavras-chave
+        Pesquisa memórias relevantes por palavras-chave (BM25)
         
         Args:
             query_text: Texto para pesquisa
             limit: Número máximo de resultados
+            min_score: Score BM25 mínimo (opcional)
             
         Returns:
-            Lista de textos mais relevantes
+            Lista de textos mais relevantes, do mais para o menos relevante
         """
-        try:
-            # Extrair palavras-chave da query
-            keywords = query_text.lower().split()
-            # Filtrar palavras muito comuns
-            common_words = {'a', 'o', 'e', 'é', 'de', 'da', 'do', 'em', 'um', 'uma', 'com', 'para', 'por', 'que', 'qual', 'quem', 'como', 'quando', 'onde', 'porque', 'minha', 'meu', 'sua', 'seu', 'é', 'são', 'está', 'estão'}
-            keywords = [word for word in keywords if word not in common_words and len(word) > 2]
+        return [text for text, _ in self.search_memory_with_scores(query_text, limit, min_score)]
+    
+    def search_memory_with_scores(self, query_text: str, limit: int = 3,
+                                  min_score: Optional[float] = None) -> List[Tuple[str, float]]:
+        """
+        Pesquisa memórias numa única query BM25 com todas as palavras-chave
+        
+        Args:
+            query_text: Texto para pesquisa
+            limit: Número máximo de resultados
+            min_score: Score BM25 mínimo (opcional)
             
+        Returns:
+            Lista de pares (texto, score) ordenada por score decrescente
+        """
+        try:
+            keywords = portuguese_analyzer.extract_keywords(query_text)
             print(f"🔍 Palavras-chave extraídas: {keywords}")
             
-            # Buscar por cada palavra-chave
-            all_results = []
-            for keyword in keywords:
-                response = (
-                    self.client.collections.get("MemoryItem")
-                    .query
-                    .fetch_objects(
-                        limit=limit * 2,  # Buscar mais resultados para ter mais opções
-                        filters=weaviate.classes.query.Filter.by_property("text").contains_any([keyword])
-                    )
+            if not keywords:
+                return []
+            
+            # Uma única ida ao servidor: o Weaviate pontua e ordena os resultados
+            response = (
+                self.client.collections.get("MemoryItem")
+                .query
+                .bm25(
+                    query=" ".join(keywords),
+                    query_properties=["text"],
+                    limit=limit,
+                    return_metadata=weaviate.classes.query.MetadataQuery(score=True)
                 )
-                
-                for obj in response.objects:
-                    text = obj.properties["text"]
-                    if text not in all_results:
-                        all_results.append(text)
+            )
+            
+            results = []
+            for obj in response.objects:
+                score = obj.metadata.score or 0.0
+                if min_score is not None and score < min_score:
+                    continue
+                results.append((obj.properties["text"], score))
             
-            # Ordenar por relevância (memórias mais recentes primeiro)
-            # Como não temos timestamp, vamos retornar os primeiros resultados únicos
-            return all_results[:limit]
+            return results
             
         except Exception as e:
             print(f"Erro na pesquisa: {e}")
@@ -159,7 +203,150 @@ class VectorMemory:
     
     def close(self):
         """
-        Fecha a conexão com o Weaviate
+        Fecha a conexão com o Weaviate (se pertencer a esta instância)
+        """
+        if hasattr(self, 'client') and getattr(self, '_owns_client', True):
+            self.client.close()
+
+
+class WeaviateConnectionPool:
+    """
+    Ligação Weaviate partilhada por todo o processo (uma por worker)
+    
+    - Liga-se de forma preguiçosa no primeiro pedido e verifica o schema uma única vez
+    - Segura para uso concorrente (threads e endpoints async)
+    - Uma thread em background verifica a saúde da ligação e volta a ligar se necessário
+    """
+    
+    def __init__(self, health_check_interval: float = HEALTH_CHECK_INTERVAL):
+        self._lock = threading.Lock()
+        self._client = None
+        self._health_check_interval = health_check_interval
+        self._stop_event = threading.Event()
+        self._health_thread: Optional[threading.Thread] = None
+        self.healthy = False
+    
+    def get_client(self):
+        """
+        Devolve o cliente partilhado, ligando-se (e criando o schema) se necessário
+        """
+        client = self._client
+        if client is not None:
+            return client
+        
+        with self._lock:
+            if self._client is None:
+                try:
+                    client = _connect_weaviate()
+                except Exception as e:
+                    raise ValueError(f"Failed to connect to Weaviate: {e}")
+                # O schema só é verificado quando a ligação é criada
+                VectorMemory(client=client)._create_schema()
+                self._client = client
+                self.healthy = True
+                self._start_health_checks()
+            return self._client
+    
+    def check_health(self) -> bool:
+        """
+        Verifica se o Weaviate responde; descarta a ligação se não responder
+        para que o próximo pedido volte a ligar
+        """
+        client = self._client
+        if client is None:
+            return False
+        
+        try:
+            self.healthy = bool(client.is_ready())
+        except Exception as e:
+            print(f"⚠️ Verificação de saúde do Weaviate falhou: {e}")
+            self.healthy = False
+        
+        if not self.healthy:
+            with self._lock:
+                if self._client is client:
+                    self._client = None
+            try:
+                client.close()
+            except Exception:
+                pass
+        return self.healthy
+    
+    def _start_health_checks(self):
+        if self._health_check_interval <= 0:
+            return
+        if self._health_thread is not None and self._health_thread.is_alive():
+            return
+        
+        self._stop_event.clear()
+        self._health_thread = threading.Thread(
+            target=self._health_loop,
+            name="weaviate-health-check",
+            daemon=True
+        )
+        self._health_thread.start()
+    
+    def _health_loop(self):
+        while not self._stop_event.wait(self._health_check_interval):
+            if self._client is None:
+                # Tentar restabelecer a ligação antes do próximo pedido
+                try:
+                    self.get_client()
+                except Exception as e:
+                    print(f"⚠️ Weaviate ainda indisponível: {e}")
+                continue
+            self.check_health()
+    
+    def close(self):
+        """
+        Pára as verificações de saúde e fecha a ligação partilhada
         """
-        if hasattr(self, 'client'):
-            self.client.close() 
\ No newline at end of file
+        self._stop_event.set()
+        with self._lock:
+            client, self._client = self._client, None
+            self.healthy = False
+        if client is not None:
+            client.close()
+
+
+# Pool global do processo
+_connection_pool: Optional[WeaviateConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_weaviate_pool() -> WeaviateConnectionPool:
+    """
+    Obtém a pool de ligação Weaviate do processo
+    
+    Returns:
+        WeaviateConnectionPool: Pool partilhada
+    """
+    global _connection_pool
+    
+    if _connection_pool is None:
+        with _pool_lock:
+            if _connection_pool is None:
+                _connection_pool = WeaviateConnectionPool()
+    
+    return _connection_pool
+
+
+def get_vector_memory() -> VectorMemory:
+    """
+    Obtém uma VectorMemory ligada através da pool partilhada
+    (sem custo de ligação nem de verificação de schema por pedido)
+    
+    Returns:
+        VectorMemory: Instância que reutiliza a ligação do processo
+    """
+    return VectorMemory(client=get_weaviate_pool().get_client())
+
+
+def close_vector_memory():
+    """Fecha a pool de ligação Weaviate do processo (shutdown)"""
+    global _connection_pool
+    
+    with _pool_lock:
+        pool, _connection_pool = _connection_pool, None
+    if pool is not None:
+        pool.close() 
\ No newline at end of file
@@ -0,0 +1,858 @@
+"""
+Armazenamentos da Memória Semântica
+Interface comum (MemoryBackend) com três implementações, escolhidas por
+MEMORY_BACKEND:
+- weaviate: coleção ConversationMemory no Weaviate (por omissão)
+- local: índice vetorial no próprio processo (LocalVectorIndex), sem Weaviate
+- cached: índice local como cache de leitura à frente do Weaviate
+
+Com MEMORY_MULTI_TENANCY as memórias de cada utilizador ficam num tenant
+próprio (ver tenancy.py) e as pesquisas só percorrem esse tenant.
+
+Com MEMORY_HIERARCHICAL há um segundo nível com um vetor por segmento de
+sessão (centróide dos turnos): a pesquisa escolhe primeiro os segmentos mais
+próximos e só depois compara os turnos dessas sessões.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from weaviate.util import generate_uuid5
+
+from .local_index import LOCAL_INDEX_AUTOSAVE_EVERY, LocalVectorIndex
+from .tenancy import (
+    ANONYMOUS_TENANT, MEMORY_MULTI_TENANCY, TENANT_MEMORY_COLLECTION, get_tenant_registry, tenant_for
+)
+
+logger = logging.getLogger(__name__)
+
+MEMORY_BACKEND = os.getenv("MEMORY_BACKEND", "weaviate")  # weaviate | local | cached
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR")  # None = índice só em memória
+# Shards de tenants abertos em simultâneo no índice local (os restantes ficam em disco)
+LOCAL_INDEX_MAX_ACTIVE_TENANTS = int(os.getenv("LOCAL_INDEX_MAX_ACTIVE_TENANTS", "32"))
+# Modo "cached": validade e número máximo de pesquisas guardadas por worker
+READ_THROUGH_TTL_SECONDS = float(os.getenv("MEMORY_READ_THROUGH_TTL_SECONDS", "60"))
+READ_THROUGH_MAX_QUERIES = int(os.getenv("MEMORY_READ_THROUGH_MAX_QUERIES", "4096"))
+
+MEMORY_COLLECTION = "ConversationMemory"
+MEMORY_PROPERTIES = ["content", "session_id", "user_id", "timestamp", "user_message", "assistant_message"]
+
+MEMORY_HIERARCHICAL = os.getenv("MEMORY_HIERARCHICAL", "false").lower() in ("1", "true", "yes")
+SEGMENT_COLLECTION = "SessionSegmentMemory"
+TENANT_SEGMENT_COLLECTION = "TenantSessionSegmentMemory"
+SEGMENT_PROPERTIES = ["session_id", "user_id", "timestamp", "segment", "turn_count", "turn_sequences", "centroid_norm"]
+# Turnos por segmento (cada segmento de uma sessão longa tem o seu vetor)
+SESSION_SEGMENT_TURNS = int(os.getenv("SESSION_SEGMENT_TURNS", "20"))
+# Segmentos escolhidos na pesquisa grosseira antes de descer aos turnos
+HIERARCHICAL_COARSE_SEGMENTS = int(os.getenv("HIERARCHICAL_COARSE_SEGMENTS", "8"))
+
+
+def memory_collection_name(multi_tenant: bool = MEMORY_MULTI_TENANCY) -> str:
+    """Coleção das memórias de conversas (a multi-tenancy só pode ser ativada ao criar a coleção)"""
+    return TENANT_MEMORY_COLLECTION if multi_tenant else MEMORY_COLLECTION
+
+
+def segment_collection_name(multi_tenant: bool = MEMORY_MULTI_TENANCY) -> str:
+    """Coleção dos vetores de segmentos de sessão (nível grosseiro da memória hierárquica)"""
+    return TENANT_SEGMENT_COLLECTION if multi_tenant else SEGMENT_COLLECTION
+
+
+def segment_id_for(session_id: str, segment: int) -> str:
+    """UUID estável do vetor de um segmento de sessão"""
+    return generate_uuid5(f"session_segment:{session_id}:{segment}")
+
+
+def _as_utc(timestamp: datetime) -> datetime:
+    # As datas do chat_history são gravadas em UTC sem fuso
+    return timestamp if timestamp.tzinfo is not None else timestamp.replace(tzinfo=timezone.utc)
+
+
+def to_rfc3339(timestamp: datetime) -> str:
+    """Data no formato RFC 3339 exigido pelas propriedades "date" do Weaviate"""
+    return _as_utc(timestamp).isoformat()
+
+
+class MemoryFilter:
+    """
+    Restrições da pesquisa semântica, aplicadas dentro da query vetorial
+
+    Como o motor filtra antes de escolher os vizinhos, a pesquisa pede
+    exatamente `limit` resultados sem margem para filtragem posterior.
+    """
+
+    def __init__(self, exclude_session: Optional[str] = None, session_id: Optional[str] = None,
+                 user_id: Optional[str] = None, since: Optional[datetime] = None,
+                 until: Optional[datetime] = None, session_ids: Optional[List[str]] = None):
+        self.exclude_session = exclude_session
+        self.session_id = session_id
+        self.user_id = user_id
+        self.since = since
+        self.until = until
+        self.session_ids = session_ids
+
+    def narrowed(self, session_ids: List[str]) -> "MemoryFilter":
+        """Mesmo filtro restrito a um conjunto de sessões"""
+        return MemoryFilter(self.exclude_session, self.session_id, self.user_id,
+                            self.since, self.until, list(session_ids))
+
+    def to_weaviate_where(self) -> Optional[Dict]:
+        """Filtro `where` da API GraphQL (cliente v3)"""
+        operands = []
+        if self.exclude_session is not None:
+            operands.append({"path": ["session_id"], "operator": "NotEqual", "valueString": self.exclude_session})
+        if self.session_id is not None:
+            operands.append({"path": ["session_id"], "operator": "Equal", "valueString": self.session_id})
+        if self.session_ids is not None:
+            matches = [
+                {"path": ["session_id"], "operator": "Equal", "valueString": session}
+                for session in self.session_ids
+            ]
+            operands.append(matches[0] if len(matches) == 1 else {"operator": "Or", "operands": matches})
+        if self.user_id is not None:
+            operands.append({"path": ["user_id"], "operator": "Equal", "valueString": self.user_id})
+        if self.since is not None:
+            operands.append({"path": ["timestamp"], "operator": "GreaterThanEqual", "valueDate": to_rfc3339(self.since)})
+        if self.until is not None:
+            operands.append({"path": ["timestamp"], "operator": "LessThan", "valueDate": to_rfc3339(self.until)})
+
+        if not operands:
+            return None
+        if len(operands) == 1:
+            return operands[0]
+        return {"operator": "And", "operands": operands}
+
+    def to_weaviate_filter(self):
+        """Filtro equivalente para o cliente v4 (weaviate.classes.query.Filter)"""
+        from weaviate.classes.query import Filter
+
+        filters = []
+        if self.exclude_session is not None:
+            filters.append(Filter.by_property("session_id").not_equal(self.exclude_session))
+        if self.session_id is not None:
+            filters.append(Filter.by_property("session_id").equal(self.session_id))
+        if self.session_ids is not None:
+            filters.append(Filter.by_property("session_id").contains_any(list(self.session_ids)))
+        if self.user_id is not None:
+            filters.append(Filter.by_property("user_id").equal(self.user_id))
+        if self.since is not None:
+            filters.append(Filter.by_property("timestamp").greater_or_equal(_as_utc(self.since)))
+        if self.until is not None:
+            filters.append(Filter.by_property("timestamp").less_than(_as_utc(self.until)))
+
+        if not filters:
+            return None
+        return Filter.all_of(filters) if len(filters) > 1 else filters[0]
+
+    def index_arguments(self) -> Dict:
+        """Argumentos equivalentes para LocalVectorIndex.search"""
+        return {
+            "exclude_session": self.exclude_session,
+            "session_id": self.session_id,
+            "user_id": self.user_id,
+            "since": self.since,
+            "until": self.until,
+            "session_ids": self.session_ids,
+        }
+
+
+class MemoryBackend:
+    """
+    Interface dos armazenamentos de memória semântica
+
+    Registos: {"id": str, "vector": lista de floats, "properties": dict}
+    Resultados de pesquisa: propriedades + "id" + "score" (maior = mais próximo)
+    """
+
+    name = "base"
+    tails_history = False
+
+    def add_many(self, records: List[Dict]):
+        raise NotImplementedError
+
+    def search(self, vector, limit: int, filters: Optional[MemoryFilter] = None) -> List[Dict]:
+        raise NotImplementedError
+
+    def delete(self, memory_id: str, user_id: Optional[str] = None):
+        raise NotImplementedError
+
+    def fetch(self, memory_id: str, user_id: Optional[str] = None) -> Optional[Dict]:
+        """Registo guardado ({"id", "vector", **propriedades}) ou None"""
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        return {"backend": self.name}
+
+    def close(self):
+        pass
+
+
+class WeaviateMemoryBackend(MemoryBackend):
+    """
+    Coleção do Weaviate (API v3) com vetores calculados no cliente
+
+    Com `multi_tenant` cada registo é gravado no tenant do seu user_id e cada
+    pesquisa corre só no tenant do filtro; os tenants são ativados a pedido
+    pelo registo de tenants.
+    """
+
+    name = "weaviate"
+
+    def __init__(self, client=None, client_factory: Optional[Callable] = None,
+                 collection_name: Optional[str] = None, certainty: float = 0.7,
+                 multi_tenant: bool = MEMORY_MULTI_TENANCY, tenants=None,
+                 properties: List[str] = MEMORY_PROPERTIES):
+        if client is None and client_factory is None:
+            from .weaviate_client import get_weaviate_client
+            client_factory = get_weaviate_client
+        self._client = client
+        self._client_factory = client_factory
+        self.collection_name = collection_name or memory_collection_name(multi_tenant)
+        self.certainty = certainty
+        self.multi_tenant = multi_tenant
+        self._tenants = tenants
+        self.properties = properties
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self._client_factory()
+        return self._client
+
+    @property
+    def tenants(self):
+        if self._tenants is None:
+            self._tenants = get_tenant_registry()
+        return self._tenants
+
+    def _tenant(self, user_id: Optional[str]) -> Optional[str]:
+        """Tenant ativo para o utilizador (None sem multi-tenancy)"""
+        if not self.multi_tenant:
+            return None
+        tenant = tenant_for(user_id)
+        self.tenants.ensure_active(tenant)
+        return tenant
+
+    def add_many(self, records: List[Dict]):
+        """Envia os registos numa única importação batch"""
+        tenants = {record["id"]: self._tenant(record["properties"].get("user_id")) for record in records}
+
+        batch = self.client.batch
+        batch.configure(batch_size=len(records), dynamic=False, callback=None)
+
+        for record in records:
+            extra = {"tenant": tenants[record["id"]]} if self.multi_tenant else {}
+            batch.add_data_object(
+                data_object=record["properties"],
+                class_name=self.collection_name,
+                uuid=record["id"],
+                vector=[float(value) for value in record["vector"]],
+                **extra
+            )
+
+        results = batch.create_objects() or []
+        errors = [
+            result["result"]["errors"]
+            for result in results
+            if isinstance(result, dict) and result.get("result", {}).get("errors")
+        ]
+        if errors:
+            raise RuntimeError(f"Weaviate rejeitou {len(errors)} objetos: {errors[0]}")
+
+    def search(self, vector, limit: int, filters: Optional[MemoryFilter] = None,
+               include_vectors: bool = False) -> List[Dict]:
+        filters = filters or MemoryFilter()
+        result = self._query(vector, limit, filters, include_vectors)
+        if result.get("errors") and self.multi_tenant:
+            # O tenant pode ter sido descarregado por outro worker: reativar e repetir
+            self.tenants.forget(tenant_for(filters.user_id))
+            result = self._query(vector, limit, filters, include_vectors)
+        if result.get("errors"):
+            raise RuntimeError(f"Pesquisa no Weaviate falhou: {result['errors']}")
+
+        memories = []
+        for obj in result.get("data", {}).get("Get", {}).get(self.collection_name, []) or []:
+            extra = obj.get("_additional") or {}
+            memory = {name: obj.get(name) or "" for name in self.properties}
+            memory["id"] = extra.get("id")
+            memory["score"] = extra.get("certainty")
+            if include_vectors:
+                memory["vector"] = extra.get("vector")
+            memories.append(memory)
+        return memories
+
+    def _query(self, vector, limit: int, filters: MemoryFilter, include_vectors: bool) -> Dict:
+        additional = ["id", "certainty"] + (["vector"] if include_vectors else [])
+        query = self.client.query.get(
+            self.collection_name, self.properties
+        ).with_near_vector({
+            "vector": [float(value) for value in vector],
+            "certainty": self.certainty  # Threshold para relevância
+        })
+
+        tenant = self._tenant(filters.user_id)
+        if tenant is not None:
+            query = query.with_tenant(tenant)
+        # Filtros aplicados pelo Weaviate antes de escolher os vizinhos
+        where = filters.to_weaviate_where()
+        if where is not None:
+            query = query.with_where(where)
+        return query.with_additional(additional).with_limit(limit).do()
+
+    def delete(self, memory_id: str, user_id: Optional[str] = None):
+        self.client.data_object.delete(memory_id, class_name=self.collection_name, tenant=self._tenant(user_id))
+
+    def fetch(self, memory_id: str, user_id: Optional[str] = None) -> Optional[Dict]:
+        obj = self.client.data_object.get_by_id(
+            memory_id, class_name=self.collection_name, with_vector=True, tenant=self._tenant(user_id)
+        )
+        if not obj:
+            return None
+        return {"id": memory_id, "vector": obj.get("vector"), **(obj.get("properties") or {})}
+
+    def stats(self) -> Dict:
+        stats = {"backend": self.name, "collection_name": self.collection_name}
+        if self.multi_tenant:
+            stats["tenants"] = self.tenants.stats()
+        return stats
+
+
+class LocalMemoryBackend(MemoryBackend):
+    """
+    Índice vetorial no próprio processo
+
+    Sem multi-tenancy há um único índice. Com `multi_tenant` cada utilizador
+    tem o seu shard (<diretório>/tenants/<tenant>) e o índice principal fica
+    com o tenant anónimo. Só os `max_active_tenants` shards usados mais
+    recentemente ficam abertos: os restantes são gravados, fechados e
+    reabertos do disco na próxima utilização. A marca d'água do outbox fica
+    então em <diretório>/tenants/watermark.json.
+    """
+
+    name = "local"
+    # Cada worker tem o seu índice: o outbox acompanha o chat_history por id
+    tails_history = True
+
+    def __init__(self, index: LocalVectorIndex, certainty: float = 0.7,
+                 multi_tenant: bool = False, max_active_tenants: int = LOCAL_INDEX_MAX_ACTIVE_TENANTS,
+                 checkpoint_every: int = LOCAL_INDEX_AUTOSAVE_EVERY):
+        self.index = index
+        self.certainty = certainty
+        self.multi_tenant = multi_tenant
+        self.max_active_tenants = max_active_tenants
+        self.checkpoint_every = checkpoint_every
+
+        self._shards: "OrderedDict[str, LocalVectorIndex]" = OrderedDict()
+        # Escritas e descargas de shards são serializadas; pesquisas não
+        self._lock = threading.RLock()
+        self.offloaded_shards = 0
+        self._watermark = self._saved_watermark = self._load_watermark()
+
+    @property
+    def watermark(self) -> int:
+        return self._watermark
+
+    @watermark.setter
+    def watermark(self, value: int):
+        with self._lock:
+            self._watermark = value
+            if not self.multi_tenant:
+                self.index.watermark = value
+            elif self.index.directory and value - self._saved_watermark >= self.checkpoint_every:
+                self.checkpoint()
+
+    def _watermark_path(self) -> Optional[str]:
+        if not (self.multi_tenant and self.index.directory):
+            return None
+        return os.path.join(self.index.directory, "tenants", "watermark.json")
+
+    def _load_watermark(self) -> int:
+        path = self._watermark_path()
+        if path is None or not os.path.exists(path):
+            return self.index.watermark
+        with open(path, encoding="utf-8") as handle:
+            return json.load(handle)["watermark"]
+
+    def checkpoint(self):
+        """
+        Grava os shards e só depois a marca d'água; após uma falha as linhas
+        seguintes são reindexadas, o que é idempotente (upsert por id)
+        """
+        with self._lock:
+            for shard in self._shards.values():
+                shard.save()
+            self.index.save()
+
+            path = self._watermark_path()
+            if path is not None:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path + ".tmp", "w", encoding="utf-8") as handle:
+                    json.dump({"watermark": self._watermark}, handle)
+                os.replace(path + ".tmp", path)
+                self._saved_watermark = self._watermark
+
+    def _shard(self, user_id: Optional[str], create: bool = True) -> Optional[LocalVectorIndex]:
+        tenant = tenant_for(user_id)
+        if not self.multi_tenant or tenant == ANONYMOUS_TENANT:
+            return self.index
+
+        with self._lock:
+            shard = self._shards.get(tenant)
+            if shard is not None:
+                self._shards.move_to_end(tenant)
+                return shard
+
+            directory = os.path.join(self.index.directory, "tenants", tenant) if self.index.directory else None
+            if not create and (directory is None or not os.path.isdir(directory)):
+                return None
+            shard = LocalVectorIndex(directory=directory)
+            self._shards[tenant] = shard
+
+            # Sem diretório não há para onde descarregar: todos os shards ficam em memória
+            while directory and len(self._shards) > self.max_active_tenants:
+                _, evicted = self._shards.popitem(last=False)
+                evicted.close()
+                self.offloaded_shards += 1
+            return shard
+
+    def add_many(self, records: List[Dict]):
+        if not records:
+            return
+        groups: Dict[Optional[str], List[Dict]] = {}
+        for record in records:
+            user_id = record["properties"].get("user_id") if self.multi_tenant else None
+            groups.setdefault(user_id or None, []).append(record)
+
+        with self._lock:
+            for user_id, group in groups.items():
+                self._shard(user_id).add_many(
+                    [record["id"] for record in group],
+                    [record["vector"] for record in group],
+                    [dict(record["properties"]) for record in group]
+                )
+
+    def search(self, vector, limit: int, filters: Optional[MemoryFilter] = None) -> List[Dict]:
+        filters = filters or MemoryFilter()
+        shard = self._shard(filters.user_id, create=False)
+        if shard is None:
+            return []
+        # Mesma escala do Weaviate: certainty = (1 + cosseno) / 2
+        memories = shard.search(vector, limit, min_score=2 * self.certainty - 1, **filters.index_arguments())
+        for memory in memories:
+            memory["score"] = (1 + memory["score"]) / 2
+        return memories
+
+    def delete(self, memory_id: str, user_id: Optional[str] = None):
+        with self._lock:
+            shard = self._shard(user_id, create=False)
+            if shard is not None:
+                shard.delete(memory_id)
+
+    def fetch(self, memory_id: str, user_id: Optional[str] = None) -> Optional[Dict]:
+        shard = self._shard(user_id, create=False)
+        return shard.get(memory_id) if shard is not None else None
+
+    def stats(self) -> Dict:
+        stats = {"backend": self.name, **self.index.stats()}
+        if self.multi_tenant:
+            stats["open_tenant_shards"] = len(self._shards)
+            stats["offloaded_tenant_shards"] = self.offloaded_shards
+        return stats
+
+    def close(self):
+        with self._lock:
+            self.checkpoint()
+            for shard in self._shards.values():
+                shard.close()
+            self._shards.clear()
+            self.index.close()
+
+
+class ReadThroughMemoryBackend(MemoryBackend):
+    """
+    Cache de pesquisas à frente do Weaviate
+
+    - Escritas vão para o Weaviate (fonte de verdade) e depois para o índice local
+    - Cada pesquisa é identificada pelo vetor, filtros e limite; o Weaviate
+      responde à primeira e o top-k (ids e scores) fica válido durante
+      `ttl_seconds`, com os registos guardados no índice local
+    - O índice local só tem registos já vistos, por isso nunca responde sozinho
+      a uma pesquisa nova: uma pesquisa parecida não devolve um top-k errado
+    - Escritas e remoções deste worker invalidam as pesquisas guardadas; as de
+      outros workers ficam visíveis no máximo ao fim de `ttl_seconds`
+    """
+
+    name = "cached"
+
+    def __init__(self, local: LocalMemoryBackend, remote: WeaviateMemoryBackend,
+                 ttl_seconds: float = READ_THROUGH_TTL_SECONDS,
+                 max_queries: int = READ_THROUGH_MAX_QUERIES,
+                 clock: Callable[[], float] = time.monotonic):
+        self.local = local
+        self.remote = remote
+        self.ttl_seconds = ttl_seconds
+        self.max_queries = max_queries
+        self.clock = clock
+        self.query_hits = 0
+        self.remote_reads = 0
+        self._queries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add_many(self, records: List[Dict]):
+        self.remote.add_many(records)
+        self.local.add_many(records)
+        # Memórias novas podem entrar no top-k de qualquer pesquisa guardada
+        self._invalidate()
+
+    def search(self, vector, limit: int, filters: Optional[MemoryFilter] = None) -> List[Dict]:
+        filters = filters or MemoryFilter()
+        key = self._query_key(vector, limit, filters)
+        cached = self._cached(key, filters.user_id)
+        if cached is not None:
+            return cached
+
+        with self._lock:
+            self.remote_reads += 1
+        remote_results = self.remote.search(vector, limit, filters, include_vectors=True)
+
+        warm = [
+            {
+                "id": memory["id"],
+                "vector": memory["vector"],
+                "properties": {name: memory.get(name, "") for name in MEMORY_PROPERTIES},
+            }
+            for memory in remote_results
+            if memory.get("id") and memory.get("vector")
+        ]
+        self.local.add_many(warm)
+
+        results = [{key: value for key, value in memory.items() if key != "vector"} for memory in remote_results]
+        # Só guarda a pesquisa se todos os registos ficaram no índice local
+        if len(warm) == len(results):
+            with self._lock:
+                self._queries[key] = (self.clock() + self.ttl_seconds,
+                                      [(memory["id"], memory.get("score")) for memory in results])
+                self._queries.move_to_end(key)
+                while len(self._queries) > self.max_queries:
+                    self._queries.popitem(last=False)
+        return results
+
+    def delete(self, memory_id: str, user_id: Optional[str] = None):
+        self.remote.delete(memory_id, user_id)
+        self.local.delete(memory_id, user_id)
+        self._invalidate()
+
+    def fetch(self, memory_id: str, user_id: Optional[str] = None) -> Optional[Dict]:
+        return self.remote.fetch(memory_id, user_id)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            searches = self.query_hits + self.remote_reads
+            return {
+                "backend": self.name,
+                "query_hits": self.query_hits,
+                "remote_reads": self.remote_reads,
+                "query_hit_ratio": round(self.query_hits / searches, 4) if searches else 0.0,
+                "cached_queries": len(self._queries),
+                "local": self.local.stats(),
+            }
+
+    def close(self):
+        self.local.close()
+
+    def _cached(self, key: str, user_id: Optional[str]) -> Optional[List[Dict]]:
+        """Resultados de uma pesquisa guardada e ainda válida (None se tiver de ir ao Weaviate)"""
+        with self._lock:
+            entry = self._queries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= self.clock():
+                del self._queries[key]
+                return None
+            self._queries.move_to_end(key)
+
+        results = []
+        for memory_id, score in entry[1]:
+            stored = self.local.fetch(memory_id, user_id)
+            if stored is None:
+                return None
+            stored.pop("vector", None)
+            results.append(dict(stored, id=memory_id, score=score))
+        with self._lock:
+            self.query_hits += 1
+        return results
+
+    def _invalidate(self):
+        with self._lock:
+            self._queries.clear()
+
+    @staticmethod
+    def _query_key(vector, limit: int, filters: MemoryFilter) -> str:
+        arguments = filters.index_arguments()
+        digest = hashlib.sha1(np.asarray(vector, dtype=np.float32).tobytes())
+        digest.update(repr((limit, sorted((name, str(value)) for name, value in arguments.items()))).encode("utf-8"))
+        return digest.hexdigest()
+
+
+class HierarchicalMemoryBackend(MemoryBackend):
+    """
+    Memória em dois níveis: segmentos de sessão e turnos
+
+    - Cada segmento (até SESSION_SEGMENT_TURNS turnos seguidos de uma sessão)
+      tem um vetor: a média dos vetores dos seus turnos, atualizada de forma
+      incremental à medida que os turnos são indexados
+    - A pesquisa compara a pergunta com os vetores dos segmentos, escolhe os
+      `coarse_segments` mais próximos e só depois pesquisa os turnos das
+      sessões correspondentes; o custo cresce com o número de sessões e não
+      com o número de mensagens
+    - Sem segmentos (nível ainda vazio) a pesquisa é feita diretamente nos turnos
+
+    Cada segmento guarda as posições dos turnos que já entraram na média
+    (turn_sequences): a reindexação é idempotente e turnos indexados fora de
+    ordem também contam. A atualização é ler-calcular-escrever, por isso os
+    turnos de uma sessão têm de ser indexados por um único worker de cada
+    vez (o outbox só reserva sessões em que tem a linha pendente mais antiga).
+    """
+
+    def __init__(self, turns: MemoryBackend, segments: MemoryBackend,
+                 coarse_segments: int = HIERARCHICAL_COARSE_SEGMENTS,
+                 segment_turns: int = SESSION_SEGMENT_TURNS):
+        self.turns = turns
+        self.segments = segments
+        self.coarse_segments = coarse_segments
+        self.segment_turns = segment_turns
+        self.name = f"hierarchical-{turns.name}"
+        self.tails_history = turns.tails_history
+
+        self.coarse_searches = 0
+        self.flat_searches = 0
+        # Atualizações dos segmentos são ler-calcular-escrever
+        self._lock = threading.Lock()
+
+    @property
+    def watermark(self) -> int:
+        return self.turns.watermark
+
+    @watermark.setter
+    def watermark(self, value: int):
+        self.turns.watermark = value
+
+    def add_many(self, records: List[Dict]):
+        self.turns.add_many(records)
+
+        groups: Dict[tuple, List[Dict]] = {}
+        for record in records:
+            properties = record["properties"]
+            sequence = record.get("sequence")
+            # Cada troca ocupa 2 posições (utilizador + assistente) na sessão
+            segment = (sequence - 1) // (2 * self.segment_turns) if sequence else 0
+            key = (properties.get("session_id", ""), properties.get("user_id") or None, segment)
+            groups.setdefault(key, []).append(record)
+
+        with self._lock:
+            updates = [self._segment_record(key, group) for key, group in groups.items()]
+            updates = [update for update in updates if update is not None]
+            if updates:
+                self.segments.add_many(updates)
+
+    def _segment_record(self, key: tuple, records: List[Dict]) -> Optional[Dict]:
+        """Novo vetor médio do segmento com os turnos ainda não contados"""
+        session_id, user_id, segment = key
+        segment_id = segment_id_for(session_id, segment)
+        existing = self.segments.fetch(segment_id, user_id)
+
+        count = int(existing.get("turn_count") or 0) if existing else 0
+        members = set(existing.get("turn_sequences") or []) if existing else set()
+        fresh, seen = [], set()
+        for record in records:
+            sequence = record.get("sequence")
+            if sequence and (sequence in members or sequence in seen):
+                continue
+            seen.add(sequence)
+            fresh.append(record)
+        if not fresh:
+            return None
+
+        total = np.zeros(len(fresh[0]["vector"]), dtype=np.float64)
+        if existing and count:
+            # O vetor guardado pode vir normalizado: repor a norma da média
+            previous = np.asarray(existing["vector"], dtype=np.float64)
+            norm = np.linalg.norm(previous)
+            if norm > 0:
+                total += previous / norm * float(existing.get("centroid_norm") or 1.0) * count
+        for record in fresh:
+            vector = np.asarray(record["vector"], dtype=np.float64)
+            norm = np.linalg.norm(vector)
+            total += vector / norm if norm > 0 else vector
+        count += len(fresh)
+        mean = total / count
+
+        timestamps = [record["properties"].get("timestamp") or "" for record in fresh]
+        if existing and existing.get("timestamp"):
+            timestamps.append(existing["timestamp"])
+        properties = {
+            "session_id": session_id,
+            "timestamp": max(timestamps),
+            "segment": segment,
+            "turn_count": count,
+            "turn_sequences": sorted(members | {record["sequence"] for record in fresh if record.get("sequence")}),
+            "centroid_norm": float(np.linalg.norm(mean)),
+        }
+        if user_id:
+            properties["user_id"] = user_id
+        return {"id": segment_id, "vector": mean.astype(np.float32).tolist(), "properties": properties}
+
+    def search(self, vector, limit: int, filters: Optional[MemoryFilter] = None) -> List[Dict]:
+        filters = filters or MemoryFilter()
+        if filters.session_id is None and filters.session_ids is None:
+            # O timestamp do segmento é o do seu turno mais recente: `until` só se aplica aos turnos
+            coarse = MemoryFilter(filters.exclude_session, None, filters.user_id, filters.since)
+            segments = self.segments.search(vector, self.coarse_segments, coarse)
+            session_ids = list(dict.fromkeys(segment["session_id"] for segment in segments if segment.get("session_id")))
+            if session_ids:
+                self.coarse_searches += 1
+                return self.turns.search(vector, limit, filters.narrowed(session_ids))
+
+        self.flat_searches += 1
+        return self.turns.search(vector, limit, filters)
+
+    def delete(self, memory_id: str, user_id: Optional[str] = None):
+        # A média do segmento fica com o turno removido até à próxima reindexação
+        self.turns.delete(memory_id, user_id)
+
+    def fetch(self, memory_id: str, user_id: Optional[str] = None) -> Optional[Dict]:
+        return self.turns.fetch(memory_id, user_id)
+
+    def stats(self) -> Dict:
+        return {
+            "backend": self.name,
+            "coarse_searches": self.coarse_searches,
+            "flat_searches": self.flat_searches,
+            "turns": self.turns.stats(),
+            "segments": self.segments.stats(),
+        }
+
+    def close(self):
+        self.turns.close()
+        self.segments.close()
+
+
+def uses_weaviate(mode: str = MEMORY_BACKEND) -> bool:
+    """Se o modo configurado precisa de uma ligação ao Weaviate"""
+    return mode != "local"
+
+
+def _claim_index_slot(base_dir: str, max_slots: int = 64) -> str:
+    """
+    Reserva um diretório de índice para este worker
+
+    Cada worker fica com o primeiro slot livre (lock exclusivo num ficheiro), por
+    isso após um reinício os workers voltam a usar os índices já gravados em vez
+    de partilharem ficheiros.
+    """
+    import fcntl
+
+    global _slot_lock_handle
+    os.makedirs(base_dir, exist_ok=True)
+    for slot in range(max_slots):
+        handle = open(os.path.join(base_dir, f"slot-{slot}.lock"), "w")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            continue
+        _slot_lock_handle = handle  # Mantido aberto durante a vida do processo
+        return os.path.join(base_dir, f"slot-{slot}")
+    raise RuntimeError(f"Sem slots livres para o índice local em {base_dir}")
+
+
+# Instâncias globais do processo
+_slot_lock_handle = None
+_local_index: Optional[LocalVectorIndex] = None
+_shared_backend: Optional[MemoryBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_local_index() -> LocalVectorIndex:
+    """
+    Obtém o índice vetorial local do worker (persistido em LOCAL_INDEX_DIR)
+
+    Returns:
+        LocalVectorIndex: Instância partilhada
+    """
+    global _local_index
+
+    if _local_index is None:
+        with _backend_lock:
+            if _local_index is None:
+                directory = _claim_index_slot(LOCAL_INDEX_DIR) if LOCAL_INDEX_DIR else None
+                _local_index = LocalVectorIndex(directory=directory)
+
+    return _local_index
+
+
+def _local_segment_index() -> LocalVectorIndex:
+    """Índice dos vetores de segmentos, ao lado do índice local do worker"""
+    directory = get_local_index().directory
+    return LocalVectorIndex(directory=os.path.join(directory, "segments") if directory else None)
+
+
+def _weaviate_segments(weaviate_client=None) -> WeaviateMemoryBackend:
+    """Coleção dos vetores de segmentos (limiar baixo: só ordena sessões candidatas)"""
+    return WeaviateMemoryBackend(client=weaviate_client, collection_name=segment_collection_name(),
+                                 properties=SEGMENT_PROPERTIES, certainty=0.5)
+
+
+def get_memory_backend(weaviate_client=None, mode: str = MEMORY_BACKEND) -> MemoryBackend:
+    """
+    Obtém o armazenamento de memória semântica configurado
+
+    Args:
+        weaviate_client: Cliente Weaviate a usar no modo "weaviate"
+        mode: "weaviate", "local" ou "cached"
+    """
+    global _shared_backend
+
+    if mode == "weaviate":
+        backend = WeaviateMemoryBackend(client=weaviate_client)
+        if MEMORY_HIERARCHICAL:
+            backend = HierarchicalMemoryBackend(backend, _weaviate_segments(weaviate_client))
+        return backend
+    if mode not in ("local", "cached"):
+        raise ValueError(f"MEMORY_BACKEND desconhecido: {mode} (opções: weaviate, local, cached)")
+
+    if _shared_backend is None:
+        local = LocalMemoryBackend(get_local_index(), multi_tenant=MEMORY_MULTI_TENANCY)
+        with _backend_lock:
+            if _shared_backend is None:
+                backend = local if mode == "local" else ReadThroughMemoryBackend(local, WeaviateMemoryBackend())
+                if MEMORY_HIERARCHICAL:
+                    segments = (
+                        LocalMemoryBackend(_local_segment_index(), certainty=0.5, multi_tenant=MEMORY_MULTI_TENANCY)
+                        if mode == "local" else _weaviate_segments()
+                    )
+                    backend = HierarchicalMemoryBackend(backend, segments)
+                _shared_backend = backend
+                logger.info(f"✅ Memória semântica: backend {_shared_backend.name}")
+
+    return _shared_backend
+
+
+def close_memory_backend():
+    """Grava o índice local do worker (shutdown)"""
+    global _shared_backend, _local_index
+
+    with _backend_lock:
+        backend, _shared_backend = _shared_backend, None
+        index, _local_index = _local_index, None
+    if backend is not None:
+        backend.close()
+    elif index is not None:
+        index.close()
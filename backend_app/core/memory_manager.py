@@ -3,17 +3,27 @@ Comprehensive MemoryManager Class
 Orchestrates both PostgreSQL (episodic) and Weaviate (semantic) memory operations
 """
 
+import asyncio
 import weaviate
 from sqlalchemy.orm import Session
 from sqlalchemy import desc
 from datetime import datetime, timezone
 from typing import List, Optional, Tuple
-import uuid
 import logging
 
 from backend_app.models.database import ChatHistory, get_db_session, close_db_session, create_tables
 from backend_app.core.memory import VectorMemory
 from backend_app.core.config import get_weaviate_config
+from backend_app.core.executors import run_in_db_executor, run_in_vector_executor
+from backend_app.core.session_cache import get_recent_history_cache
+from backend_app.core.group_commit import GROUP_COMMIT_TIMEOUT, get_chat_history_writer
+from backend_app.core.embeddings import get_query_embedder
+from backend_app.core.context_assembler import get_context_assembler
+from backend_app.core.session_summaries import (
+    SESSION_SUMMARY_MAX_PENDING_TURNS, get_session_summarizer, unsummarized_messages
+)
+from backend_app.core.memory_backends import MEMORY_BACKEND, MemoryFilter, get_memory_backend
+from backend_app.core.outbox_indexer import get_outbox_indexer
 
 logger = logging.getLogger(__name__)
 
@@ -30,6 +40,8 @@ class MemoryManager:
     
     def __init__(self, db_session: Session, weaviate_client=None):
         self.db = db_session
+        self.history_cache = get_recent_history_cache()
+        self.summarizer = get_session_summarizer()
         
         # Initialize Weaviate client
         if weaviate_client:
@@ -52,7 +64,7 @@ class MemoryManager:
         self.close()
     
     def add_message(self, session_id: str, user_message: str, assistant_message: str, 
-                   timestamp: Optional[datetime] = None) -> bool:
+                   timestamp: Optional[datetime] = None, user_id: Optional[str] = None) -> bool:
         """
         Saves a conversation turn to both PostgreSQL and Weaviate
         
@@ -61,6 +73,7 @@ class MemoryManager:
             user_message: User's input message
             assistant_message: Assistant's response
             timestamp: Optional timestamp (defaults to now)
+            user_id: Optional owner of the conversation (memory tenant)
             
         Returns:
             bool: True if successful, False otherwise
@@ -70,27 +83,76 @@ class MemoryManager:
                 timestamp = datetime.now(timezone.utc)
             
             # --- PostgreSQL: Save individual messages ---
-            success_db = self._save_to_postgresql(session_id, user_message, assistant_message, timestamp)
-            
-            # --- Weaviate: Save combined conversation ---
-            success_vector = self._save_to_weaviate(session_id, user_message, assistant_message, timestamp)
+            sequences = self._save_to_postgresql(session_id, user_message, assistant_message, timestamp, user_id)
+            return self._after_save(session_id, user_message, assistant_message, timestamp, sequences, user_id)
+                
+        except Exception as e:
+            logger.error(f"❌ Error in add_message: {e}")
+            return False
+    
+    async def add_message_async(self, session_id: str, user_message: str, assistant_message: str,
+                                timestamp: Optional[datetime] = None, user_id: Optional[str] = None) -> bool:
+        """
+        Async version of add_message: waits for the group commit without blocking
+        the event loop, so concurrent requests can join the same batch
+        
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        try:
+            if timestamp is None:
+                timestamp = datetime.now(timezone.utc)
             
-            if success_db and success_vector:
-                logger.info(f"✅ Conversation saved successfully to both stores (session: {session_id})")
-                return True
-            elif success_db:
-                logger.warning(f"⚠️ Conversation saved to PostgreSQL only (session: {session_id})")
-                return True
-            else:
-                logger.error(f"❌ Failed to save conversation (session: {session_id})")
-                return False
+            try:
+                future = get_chat_history_writer().submit(session_id, user_message, assistant_message,
+                                                          timestamp, user_id)
+                sequences = await asyncio.wait_for(asyncio.wrap_future(future), GROUP_COMMIT_TIMEOUT)
+                logger.info(f"✅ Messages saved to PostgreSQL (session: {session_id})")
+            except Exception as e:
+                logger.error(f"❌ PostgreSQL save error: {e}")
+                sequences = None
+            
+            return await run_in_vector_executor(
+                self._after_save, session_id, user_message, assistant_message, timestamp, sequences, user_id
+            )
                 
         except Exception as e:
             logger.error(f"❌ Error in add_message: {e}")
             return False
     
+    def _after_save(self, session_id: str, user_message: str, assistant_message: str,
+                    timestamp: datetime, sequences: Optional[List[int]],
+                    user_id: Optional[str] = None) -> bool:
+        """Updates the caches and the vector store once the PostgreSQL write has finished"""
+        success_db = sequences is not None
+        
+        # Keep the per-session recent history cache in step with the database
+        if success_db:
+            user_sequence, assistant_sequence = sequences or (None, None)
+            self.history_cache.append(session_id, [
+                {'type': 'user', 'content': user_message, 'timestamp': timestamp, 'sequence': user_sequence},
+                {'type': 'assistant', 'content': assistant_message, 'timestamp': timestamp,
+                 'sequence': assistant_sequence}
+            ])
+            # Fold older turns into the session summary off the request path
+            self.summarizer.schedule(session_id)
+        
+        # --- Weaviate: Save combined conversation ---
+        success_vector = self._save_to_weaviate(session_id, user_message, assistant_message, timestamp, user_id)
+        
+        if success_db and success_vector:
+            logger.info(f"✅ Conversation saved successfully to both stores (session: {session_id})")
+            return True
+        elif success_db:
+            logger.warning(f"⚠️ Conversation saved to PostgreSQL only (session: {session_id})")
+            return True
+        else:
+            logger.error(f"❌ Failed to save conversation (session: {session_id})")
+            return False
+    
     def _save_to_postgresql(self, session_id: str, user_message: str, 
-                          assistant_message: str, timestamp: datetime) -> bool:
+                          assistant_message: str, timestamp: datetime,
+                          user_id: Optional[str] = None) -> Optional[List[int]]:
         """
         Save messages to PostgreSQL database
         
@@ -99,85 +161,46 @@ class MemoryManager:
             user_message: User's message
             assistant_message: Assistant's response  
             timestamp: Message timestamp
+            user_id: Optional owner of the conversation
             
         Returns:
-            bool: Success status
+            Sequences of the saved user and assistant rows, or None on failure
         """
         try:
-            # Create user message entry
-            user_entry = ChatHistory(
-                session_id=session_id,
-                message_type="user",
-                message_text=user_message,
-                timestamp=timestamp,
-                processed=False
-            )
-            
-            # Create assistant message entry
-            assistant_entry = ChatHistory(
-                session_id=session_id,
-                message_type="assistant", 
-                message_text=assistant_message,
-                timestamp=timestamp,
-                processed=False
-            )
-            
-            # Add to database
-            self.db.add(user_entry)
-            self.db.add(assistant_entry)
-            self.db.commit()
+            # Batched with concurrent requests: one multi-row INSERT and one commit
+            sequences = get_chat_history_writer().write(session_id, user_message, assistant_message, timestamp,
+                                                        user_id=user_id)
             
             logger.info(f"✅ Messages saved to PostgreSQL (session: {session_id})")
-            return True
+            return sequences or []
             
         except Exception as e:
             logger.error(f"❌ PostgreSQL save error: {e}")
-            self.db.rollback()
-            return False
+            return None
     
     def _save_to_weaviate(self, session_id: str, user_message: str, 
-                         assistant_message: str, timestamp: datetime) -> bool:
+                         assistant_message: str, timestamp: datetime,
+                         user_id: Optional[str] = None) -> bool:
         """
-        Save combined conversation to Weaviate for semantic search
+        Schedule the conversation for semantic indexing
+        
+        The turn is already in chat_history with processed = false, so the
+        outbox indexer embeds it once and writes it to the configured memory
+        backend (the shared Weaviate collection, the per-user tenants or the
+        worker's local index) off the request path.
         
         Args:
             session_id: Session identifier
             user_message: User's message
             assistant_message: Assistant's response
             timestamp: Message timestamp
+            user_id: Optional owner of the conversation
             
         Returns:
             bool: Success status
         """
         try:
-            if not self.weaviate and not self.vector_memory:
-                logger.warning("⚠️ Weaviate not available, skipping vector storage")
-                return False
-            
-            # Create combined document for semantic search
-            combined_text = f"User: {user_message}\nAssistant: {assistant_message}"
-            
-            # Prepare metadata
-            metadata = {
-                "session_id": session_id,
-                "timestamp": timestamp.isoformat(),
-                "user_message": user_message,
-                "assistant_message": assistant_message,
-                "conversation_id": str(uuid.uuid4())
-            }
-            
-            # Use VectorMemory if available, otherwise direct Weaviate client
-            if self.vector_memory:
-                self.vector_memory.add_memory(combined_text)
-            else:
-                # Direct Weaviate storage with metadata
-                data = {
-                    "text": combined_text,
-                    **metadata
-                }
-                self.weaviate.collections.get("MemoryItem").data.insert(data)
-            
-            logger.info(f"✅ Conversation saved to Weaviate (session: {session_id})")
+            get_outbox_indexer().notify()
             return True
             
         except Exception as e:
@@ -186,28 +209,48 @@ class MemoryManager:
     
     async def get_context(self, session_id: str, query: str, 
                           recent_message_count: int = 5, 
-                          semantic_search_results: int = 3) -> str:
+                          semantic_search_results: int = 3,
+                          user_id: Optional[str] = None) -> str:
         """
         Retrieves and combines context from both memory systems
         
+        Once a session has a rolling summary, the summary is sent together with
+        the turns it does not cover yet (sequence > last_sequence, at most
+        SESSION_SUMMARY_MAX_PENDING_TURNS) instead of the raw history.
+        
         Args:
             session_id: Current session identifier
             query: User's latest query for semantic search
             recent_message_count: Number of recent messages to retrieve
             semantic_search_results: Number of semantic results to find
+            user_id: Optional user whose memories are searched
             
         Returns:
             str: Formatted context string combining both memory sources
+                 ("" when no recent turns, summary or memories were found)
         """
         try:
-            # --- Retrieve Recent History (PostgreSQL) ---
-            recent_history = self._get_recent_history(session_id, recent_message_count)
-            
-            # --- Retrieve Relevant Memories (Weaviate) ---
-            long_term_memories = self._get_semantic_memories(query, semantic_search_results, session_id)
+            # --- Retrieve Recent History, Session Summary (PostgreSQL) and Relevant Memories (Weaviate) ---
+            # All lookups run concurrently on dedicated thread pools
+            summary_window = recent_message_count + max(self.summarizer.every_turns - 1, 0)
+            recent_messages, long_term_memories, summary = await asyncio.gather(
+                run_in_db_executor(self._get_recent_messages, session_id, summary_window),
+                run_in_vector_executor(self._get_semantic_memories, query, semantic_search_results,
+                                       session_id, user_id),
+                run_in_db_executor(self._get_summary, session_id)
+            )
+            if not summary:
+                # Without a summary only the last recent_message_count turns are sent
+                recent_messages = recent_messages[-recent_message_count * 2:] if recent_message_count > 0 else []
+            else:
+                recent_messages = await run_in_db_executor(
+                    self._get_unsummarized_messages, session_id, recent_messages, summary["last_sequence"]
+                )
+            recent_history = [(msg['type'], msg['content'], msg['timestamp']) for msg in recent_messages]
             
             # --- Format and Combine Context ---
-            formatted_context = self._format_context(recent_history, long_term_memories)
+            formatted_context = self._format_context(recent_history, long_term_memories,
+                                                     summary["summary"] if summary else None)
             
             logger.info(f"✅ Context retrieved for session {session_id}: "
                        f"{len(recent_history)} recent + {len(long_term_memories)} semantic results")
@@ -218,45 +261,99 @@ class MemoryManager:
             logger.error(f"❌ Error retrieving context: {e}")
             return ""
     
+    def _get_summary(self, session_id: str) -> Optional[dict]:
+        """Rolling summary of the session's older turns, with its last_sequence (None when there is none yet)"""
+        try:
+            return self.summarizer.get(session_id)
+        except Exception as e:
+            logger.warning(f"⚠️ Session summary unavailable: {e}")
+            return None
+    
     def _get_recent_history(self, session_id: str, limit: int) -> List[Tuple[str, str, datetime]]:
         """
-        Fetch recent conversation history from PostgreSQL
+        Fetch recent conversation history as (message_type, message_text, timestamp) tuples
+        
+        Args:
+            session_id: Session to retrieve from
+            limit: Maximum number of message pairs to return
+        """
+        return [
+            (msg['type'], msg['content'], msg['timestamp'])
+            for msg in self._get_recent_messages(session_id, limit)
+        ]
+    
+    def _get_recent_messages(self, session_id: str, limit: int) -> List[dict]:
+        """
+        Fetch recent conversation messages, from the worker's cache when possible
+        and from PostgreSQL on a miss
         
         Args:
             session_id: Session to retrieve from
             limit: Maximum number of message pairs to return
             
         Returns:
-            List of (message_type, message_text, timestamp) tuples
+            Messages ({type, content, timestamp, sequence}) in chronological order
         """
         try:
-            # Get recent messages for this session, ordered by timestamp
-            recent_messages = (
-                self.db.query(ChatHistory)
-                .filter(ChatHistory.session_id == session_id)
-                .order_by(desc(ChatHistory.timestamp))
-                .limit(limit * 2)  # *2 because we have user + assistant pairs
-                .all()
-            )
-            
-            # Reverse to get chronological order
-            recent_messages.reverse()
+            message_count = limit * 2  # *2 because we have user + assistant pairs
             
-            # Convert to tuples
-            history = [
-                (msg.message_type, msg.message_text, msg.timestamp)
-                for msg in recent_messages
-            ]
+            messages = self.history_cache.get(session_id, message_count)
+            if messages is None:
+                # Load enough rows to fill the session's ring buffer
+                fetch_count = max(message_count, self.history_cache.capacity)
+                messages = self._fetch_messages(session_id, fetch_count)
+                self.history_cache.prime(session_id, messages)
+                messages = messages[-message_count:] if message_count > 0 else []
+                logger.info(f"📚 Retrieved {len(messages)} recent messages from PostgreSQL")
             
-            logger.info(f"📚 Retrieved {len(history)} recent messages from PostgreSQL")
-            return history
+            return messages
             
         except Exception as e:
             logger.error(f"❌ Error retrieving recent history: {e}")
             return []
     
+    def _get_unsummarized_messages(self, session_id: str, recent_messages: List[dict],
+                                   last_sequence: int) -> List[dict]:
+        """
+        Messages the session summary does not cover yet
+        
+        The recent window is enough while the summary keeps up; when it lags
+        behind, the missing turns are read from PostgreSQL.
+        """
+        message_count = SESSION_SUMMARY_MAX_PENDING_TURNS * 2
+        pending = unsummarized_messages(recent_messages, last_sequence)
+        if pending is None:
+            try:
+                pending = self._fetch_messages(session_id, message_count, after_sequence=last_sequence)
+            except Exception as e:
+                logger.error(f"❌ Error retrieving unsummarized history: {e}")
+                pending = []
+        return pending[-message_count:]
+    
+    def _fetch_messages(self, session_id: str, message_count: int,
+                        after_sequence: Optional[int] = None) -> List[dict]:
+        """Latest messages of a session from PostgreSQL, in chronological order"""
+        query = self.db.query(ChatHistory).filter(ChatHistory.session_id == session_id)
+        if after_sequence is not None:
+            query = query.filter(ChatHistory.sequence > after_sequence)
+        recent_messages = query.order_by(desc(ChatHistory.sequence)).limit(message_count).all()
+        
+        # Reverse to get chronological order
+        recent_messages.reverse()
+        
+        return [
+            {
+                'type': msg.message_type,
+                'content': msg.user_message if msg.message_type == 'user' else msg.assistant_message,
+                'timestamp': msg.timestamp,
+                'sequence': msg.sequence
+            }
+            for msg in recent_messages
+        ]
+    
     def _get_semantic_memories(self, query: str, limit: int, 
-                              exclude_session: Optional[str] = None) -> List[str]:
+                              exclude_session: Optional[str] = None,
+                              user_id: Optional[str] = None) -> List[str]:
         """
         Perform semantic search in Weaviate for relevant past conversations
         
@@ -264,79 +361,48 @@ class MemoryManager:
             query: Search query text
             limit: Maximum results to return
             exclude_session: Session ID to exclude from results
+            user_id: Only search this user's memories
             
         Returns:
             List of relevant conversation texts
         """
         try:
-            if not self.weaviate and not self.vector_memory:
-                logger.warning("⚠️ Weaviate not available for semantic search")
-                return []
-            
-            # Use VectorMemory if available
-            if self.vector_memory:
-                results = self.vector_memory.search_memory(query, limit=limit)
-                logger.info(f"🔍 Retrieved {len(results)} semantic results from VectorMemory")
-                return results
-            
-            # Direct Weaviate search as fallback
-            response = (
-                self.weaviate.collections.get("MemoryItem")
-                .query
-                .near_text(query=query, limit=limit)
-            )
+            filters = MemoryFilter(exclude_session=exclude_session, user_id=user_id)
             
-            results = []
-            for obj in response.objects:
-                text = obj.properties["text"]
-                # Filter out current session if specified
-                if exclude_session and "session_id" in obj.properties:
-                    if obj.properties["session_id"] == exclude_session:
-                        continue
-                results.append(text)
-            
-            logger.info(f"🔍 Retrieved {len(results)} semantic results from Weaviate")
-            return results
+            # Same store the outbox indexer writes to (query vector computed client-side, cached)
+            query_vector = get_query_embedder().embed_query(query)
+            memories = get_memory_backend().search(query_vector, limit, filters)
+            logger.info(f"🔍 Retrieved {len(memories)} semantic results from the {MEMORY_BACKEND} backend")
+            return [memory.get("content", "") for memory in memories]
             
         except Exception as e:
             logger.error(f"❌ Error in semantic search: {e}")
             return []
     
     def _format_context(self, recent_history: List[Tuple[str, str, datetime]], 
-                       long_term_memories: List[str]) -> str:
+                       long_term_memories: List[str], summary: Optional[str] = None) -> str:
         """
-        Format retrieved information into a single context string
+        Format retrieved information into a single, token-budgeted context string
         
         Args:
             recent_history: List of recent message tuples
             long_term_memories: List of relevant memory texts
+            summary: Optional rolling summary of older turns
             
         Returns:
-            str: Formatted context for LLM
+            str: Formatted context for LLM, empty when nothing was included
         """
-        context_parts = []
-        
-        # Add recent conversation history
-        if recent_history:
-            context_parts.append("[Recent Conversation History]")
-            for msg_type, msg_text, timestamp in recent_history:
-                # Format timestamp for readability
-                time_str = timestamp.strftime("%H:%M")
-                context_parts.append(f"{time_str} {msg_type.title()}: {msg_text}")
-            context_parts.append("")  # Empty line separator
-        
-        # Add relevant long-term memories
-        if long_term_memories:
-            context_parts.append("[Relevant Long-Term Memories]")
-            for i, memory in enumerate(long_term_memories, 1):
-                context_parts.append(f"{i}. {memory}")
-            context_parts.append("")  # Empty line separator
-        
-        # If no context available
-        if not context_parts:
-            return "[No previous context available]"
+        # Filled by priority within the token budget, long messages elided
+        assembled = get_context_assembler().assemble(
+            [{'type': msg_type, 'content': msg_text} for msg_type, msg_text, _ in recent_history],
+            long_term_memories,
+            summary
+        )
+        logger.info(f"🧮 Context tokens: {assembled.usage()['tokens']}")
         
-        return "\n".join(context_parts)
+        # Empty when nothing was included: callers use this to tell whether
+        # any session memory went into the prompt (e.g. the response cache)
+        return assembled.text
     
     def get_session_statistics(self, session_id: str) -> dict:
         """
@@ -374,14 +440,14 @@ class MemoryManager:
             first_message = (
                 self.db.query(ChatHistory)
                 .filter(ChatHistory.session_id == session_id)
-                .order_by(ChatHistory.timestamp)
+                .order_by(ChatHistory.sequence)
                 .first()
             )
             
             last_message = (
                 self.db.query(ChatHistory)
                 .filter(ChatHistory.session_id == session_id)
-                .order_by(desc(ChatHistory.timestamp))
+                .order_by(desc(ChatHistory.sequence))
                 .first()
             )
             
@@ -0,0 +1,128 @@
+"""
+Estatísticas do Sistema de Memória com Snapshot em Cache
+Evita agregados sobre toda a tabela chat_history em cada turno: as estatísticas
+são servidas a partir de um snapshot com TTL, atualizado em background e
+incrementado localmente a cada escrita.
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from .executors import get_db_executor
+
+logger = logging.getLogger(__name__)
+
+# Idade máxima (segundos) do snapshot antes de ser atualizado em background
+MEMORY_STATS_TTL_SECONDS = float(os.getenv("MEMORY_STATS_TTL_SECONDS", "60"))
+
+
+class MemoryStatsCache:
+    """
+    Snapshot das estatísticas de memória partilhado pelo worker
+
+    - O primeiro pedido calcula o snapshot de forma síncrona
+    - Depois disso, um snapshot expirado continua a ser servido enquanto uma
+      única atualização corre em background (stale-while-revalidate)
+    - record_write mantém total_messages e last_message atualizados entre
+      atualizações, sem ir à base de dados
+    """
+
+    def __init__(self, ttl_seconds: float = MEMORY_STATS_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._snapshot: Optional[Dict] = None
+        self._fetched_at = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def get(self, loader: Callable[[], Dict], force: bool = False) -> Dict:
+        """
+        Devolve as estatísticas, calculando-as com `loader` quando necessário
+
+        Args:
+            loader: Função que calcula um snapshot completo (abre as suas
+                próprias ligações, pois pode correr noutra thread)
+            force: Calcular já um snapshot novo, ignorando o TTL
+        """
+        with self._lock:
+            snapshot = self._snapshot
+            stale = time.monotonic() - self._fetched_at > self.ttl_seconds
+
+        if snapshot is None or force:
+            return self._refresh(loader)
+
+        if stale:
+            self._schedule_refresh(loader)
+
+        return _copy_snapshot(snapshot, cached=True)
+
+    def record_write(self, message_count: int, timestamp: datetime):
+        """Regista mensagens acabadas de guardar no snapshot atual"""
+        with self._lock:
+            if self._snapshot is None or "postgresql" not in self._snapshot:
+                return
+            postgresql = self._snapshot["postgresql"]
+            postgresql["total_messages"] = (postgresql.get("total_messages") or 0) + message_count
+            postgresql["last_message"] = timestamp.isoformat()
+
+    def invalidate(self):
+        """Descarta o snapshot atual"""
+        with self._lock:
+            self._snapshot = None
+            self._fetched_at = 0.0
+
+    def _refresh(self, loader: Callable[[], Dict]) -> Dict:
+        snapshot = loader()
+        if snapshot.get("status") == "operational":
+            with self._lock:
+                self._snapshot = snapshot
+                self._fetched_at = time.monotonic()
+        return _copy_snapshot(snapshot, cached=False)
+
+    def _schedule_refresh(self, loader: Callable[[], Dict]):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self._refresh(loader)
+            except Exception as e:
+                logger.error(f"❌ Erro ao atualizar estatísticas em background: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        get_db_executor().submit(run)
+
+
+def _copy_snapshot(snapshot: Dict, cached: bool) -> Dict:
+    copy = {key: dict(value) if isinstance(value, dict) else value for key, value in snapshot.items()}
+    copy["cached"] = cached
+    return copy
+
+
+# Cache global do processo
+_stats_cache: Optional[MemoryStatsCache] = None
+_stats_cache_lock = threading.Lock()
+
+
+def get_memory_stats_cache() -> MemoryStatsCache:
+    """
+    Obtém o snapshot de estatísticas partilhado pelo worker
+
+    Returns:
+        MemoryStatsCache: Instância partilhada
+    """
+    global _stats_cache
+
+    if _stats_cache is None:
+        with _stats_cache_lock:
+            if _stats_cache is None:
+                _stats_cache = MemoryStatsCache()
+
+    return _stats_cache
@@ -0,0 +1,494 @@
+"""
+Indexador Outbox da Memória Semântica
+As conversas são gravadas apenas no PostgreSQL (chat_history.processed = false);
+uma thread de background drena as linhas pendentes em lotes, calcula os vetores
+de cada lote no cliente e envia-os para o armazenamento configurado (Weaviate
+através da API de batch, ou o índice local), marcando as linhas como processadas.
+"""
+
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_
+from weaviate.util import generate_uuid5
+
+from ..models.database import ChatHistory, SessionLocal
+from .memory_backends import to_rfc3339
+
+logger = logging.getLogger(__name__)
+
+# Configuração por omissão
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))  # turnos por lote
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "5"))
+OUTBOX_MAX_BACKOFF = float(os.getenv("OUTBOX_MAX_BACKOFF", "300"))
+OUTBOX_SETTLE_SECONDS = float(os.getenv("OUTBOX_SETTLE_SECONDS", "2"))
+# Linhas reservadas por um worker que não as concluiu voltam a ficar livres
+OUTBOX_CLAIM_SECONDS = float(os.getenv("OUTBOX_CLAIM_SECONDS", "300"))
+# Linhas sem par (e sem par pendente) só são dadas como órfãs depois desta idade
+OUTBOX_ORPHAN_SECONDS = float(os.getenv("OUTBOX_ORPHAN_SECONDS", "600"))
+
+
+def memory_id_for(user_row_id: int) -> str:
+    """UUID estável da memória de uma troca (derivado do id da linha do utilizador)"""
+    return generate_uuid5(f"chat_history:{user_row_id}")
+
+
+def build_memory_object(session_id: str, user_message: str, assistant_message: str,
+                        timestamp: datetime, user_id: Optional[str] = None) -> Dict:
+    """Cria o documento combinado de uma troca para pesquisa semântica"""
+    combined_content = f"""Utilizador: {user_message}
+
+Assistente: {assistant_message}"""
+
+    data_object = {
+        "content": combined_content,
+        "session_id": session_id,
+        "timestamp": to_rfc3339(timestamp),
+        "user_message": user_message,
+        "assistant_message": assistant_message
+    }
+    # Define o tenant da memória (sessões anónimas não têm user_id)
+    if user_id:
+        data_object["user_id"] = user_id
+    return data_object
+
+
+def pair_turns(rows: List[ChatHistory]) -> Tuple[List[Tuple[ChatHistory, ChatHistory]], List[ChatHistory]]:
+    """
+    Agrupa linhas pendentes em trocas (utilizador, assistente)
+
+    Args:
+        rows: Linhas pendentes ordenadas por id
+
+    Returns:
+        (trocas completas, linhas sem par neste lote)
+    """
+    by_session: Dict[str, List[ChatHistory]] = {}
+    for row in rows:
+        by_session.setdefault(row.session_id, []).append(row)
+
+    turns, unpaired = [], []
+
+    for session_rows in by_session.values():
+        index = 0
+        while index < len(session_rows):
+            row = session_rows[index]
+            following = session_rows[index + 1] if index + 1 < len(session_rows) else None
+            if row.message_type == "user" and following is not None and following.message_type == "assistant":
+                turns.append((row, following))
+                index += 2
+                continue
+            unpaired.append(row)
+            index += 1
+
+    return turns, unpaired
+
+
+class MemoryOutboxIndexer:
+    """
+    Drena chat_history (processed = false) para a memória semântica em lotes
+
+    - Idempotente: o UUID de cada objeto deriva do id da linha do utilizador,
+      por isso reenviar um lote após uma falha não cria duplicados
+    - Falhas são repetidas com backoff exponencial; as linhas só passam a
+      processed = true depois de o armazenamento confirmar o lote
+    - Vários workers: cada lote é reservado (claimed_at) numa transação curta
+      com SELECT ... FOR UPDATE SKIP LOCKED; os embeddings e a escrita no
+      armazenamento correm sem locks e as reservas expiram ao fim de
+      `claim_seconds` se o worker morrer a meio
+    - Cada sessão é indexada por um worker de cada vez: outro worker só pega
+      nela quando as linhas reservadas estiverem processadas
+    - Linhas sem par ficam pendentes enquanto o par estiver pendente (noutro
+      worker ou fora do lote); só são órfãs com o par já processado ou, sem
+      par nenhum, depois de `orphan_seconds`
+    - Com MEMORY_BACKEND=local cada worker tem o seu índice, por isso cada um
+      acompanha o chat_history por id (marca d'água no índice) em vez de
+      consumir a flag processed
+    """
+
+    def __init__(self, backend_factory: Optional[Callable] = None,
+                 embed_documents: Optional[Callable[[List[str]], List]] = None,
+                 session_factory: Callable = SessionLocal,
+                 batch_size: int = OUTBOX_BATCH_SIZE,
+                 poll_interval: float = OUTBOX_POLL_INTERVAL,
+                 max_backoff: float = OUTBOX_MAX_BACKOFF,
+                 settle_seconds: float = OUTBOX_SETTLE_SECONDS,
+                 claim_seconds: float = OUTBOX_CLAIM_SECONDS,
+                 orphan_seconds: float = OUTBOX_ORPHAN_SECONDS):
+        if backend_factory is None:
+            from .memory_backends import get_memory_backend
+            backend_factory = get_memory_backend
+
+        if embed_documents is None:
+            from .embeddings import get_embedding_batcher
+            embed_documents = lambda texts: get_embedding_batcher().embed(texts)
+
+        self.backend_factory = backend_factory
+        self.embed_documents = embed_documents
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+        self.settle_seconds = settle_seconds
+        self.claim_seconds = claim_seconds
+        self.orphan_seconds = orphan_seconds
+
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        # Modo local: trocas já indexadas acima da marca d'água
+        self._tailed_ids = set()
+
+        self.indexed_turns = 0
+        self.failed_batches = 0
+
+    def start(self):
+        """Inicia a thread de background (idempotente)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="weaviate-outbox", daemon=True)
+            self._thread.start()
+            logger.info("📤 Indexador outbox da memória iniciado")
+
+    def notify(self):
+        """Acorda o indexador após novas escritas (inicia-o se necessário)"""
+        self.start()
+        self._wake_event.set()
+
+    def stop(self, timeout: float = 10.0):
+        """Pára a thread de background depois do lote em curso"""
+        self._stop_event.set()
+        self._wake_event.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        logger.info("🔒 Indexador outbox da memória parado")
+
+    def stats(self) -> Dict:
+        return {
+            "indexed_turns": self.indexed_turns,
+            "failed_batches": self.failed_batches,
+            "consecutive_failures": self._consecutive_failures,
+        }
+
+    def drain_once(self) -> int:
+        """
+        Indexa um lote de linhas pendentes
+
+        Returns:
+            int: Número de linhas processadas
+        """
+        backend = self.backend_factory()
+        if getattr(backend, "tails_history", False):
+            return self._tail_once(backend)
+
+        turns, orphan_count = self._claim_batch()
+        if not turns:
+            return orphan_count
+
+        ids = [row.id for turn in turns for row in turn]
+        try:
+            self._import_batch(backend, turns)
+        except Exception:
+            # Liberta a reserva para a nova tentativa (deste ou de outro worker)
+            self._mark(ids, {ChatHistory.claimed_at: None})
+            raise
+        self._mark(ids, {ChatHistory.processed: True, ChatHistory.claimed_at: None})
+
+        self.indexed_turns += len(turns)
+        logger.info(f"📤 {len(turns)} conversas indexadas ({backend.name}, {orphan_count} órfãs)")
+        return len(ids) + orphan_count
+
+    def _claim_batch(self) -> Tuple[List[Tuple[ChatHistory, ChatHistory]], int]:
+        """
+        Reserva um lote de trocas pendentes e marca as órfãs como processadas
+
+        Os locks das linhas só duram esta transação; as linhas sem par que
+        ainda podem emparelhar ficam livres para a próxima ronda.
+
+        Returns:
+            (trocas reservadas, número de linhas órfãs)
+        """
+        db = self.session_factory()
+        try:
+            now = datetime.utcnow()
+            limit = self.batch_size * 2  # cada troca tem 2 linhas
+            rows = (
+                db.query(ChatHistory)
+                .filter(
+                    ChatHistory.processed == False,  # noqa: E712 - usa o índice parcial
+                    or_(ChatHistory.claimed_at.is_(None),
+                        ChatHistory.claimed_at < now - timedelta(seconds=self.claim_seconds)),
+                )
+                .order_by(ChatHistory.id)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+            rows = self._owned_sessions(db, rows)
+            if not rows:
+                db.commit()
+                return [], 0
+
+            turns, unpaired = pair_turns(rows)
+            orphans = self._orphans(db, unpaired, now)
+
+            claimed_ids = [row.id for turn in turns for row in turn]
+            if claimed_ids:
+                (
+                    db.query(ChatHistory)
+                    .filter(ChatHistory.id.in_(claimed_ids))
+                    .update({ChatHistory.claimed_at: now}, synchronize_session=False)
+                )
+            if orphans:
+                (
+                    db.query(ChatHistory)
+                    .filter(ChatHistory.id.in_([row.id for row in orphans]))
+                    .update({ChatHistory.processed: True}, synchronize_session=False)
+                )
+            # As linhas continuam legíveis depois do commit, sem voltar à base de dados
+            db.expunge_all()
+            db.commit()
+            return turns, len(orphans)
+
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _owned_sessions(self, db, rows: List[ChatHistory]) -> List[ChatHistory]:
+        """
+        Linhas das sessões em que este lote tem a linha pendente mais antiga
+
+        Se a linha pendente mais antiga de uma sessão não está no lote, outro
+        worker tem-na reservada (ou bloqueada) e continua com a sessão: os
+        segmentos da memória hierárquica são atualizados por sessão com
+        ler-calcular-escrever e não podem ter dois workers em simultâneo.
+        """
+        first_ids: Dict[str, int] = {}
+        for row in rows:
+            first_ids.setdefault(row.session_id, row.id)
+        oldest = dict(
+            db.query(ChatHistory.session_id, func.min(ChatHistory.id))
+            .filter(ChatHistory.processed == False,  # noqa: E712 - usa o índice parcial
+                    ChatHistory.session_id.in_(list(first_ids)))
+            .group_by(ChatHistory.session_id)
+            .all()
+        )
+        return [row for row in rows if oldest.get(row.session_id, row.id) >= first_ids[row.session_id]]
+
+    def _orphans(self, db, unpaired: List[ChatHistory], now: datetime) -> List[ChatHistory]:
+        """Linhas sem par que podem ser marcadas como processadas sem indexar"""
+        partners = self._partners(db, unpaired)
+        orphan_before = now - timedelta(seconds=self.orphan_seconds)
+        orphans = []
+        for row in unpaired:
+            partner = partners.get(row.id)
+            if partner is not None:
+                # Par pendente: outro worker tem-no reservado ou ficou fora do lote
+                if partner.processed:
+                    orphans.append(row)
+                continue
+            if row.timestamp <= orphan_before:
+                orphans.append(row)
+        return orphans
+
+    def _partners(self, db, unpaired: List[ChatHistory]) -> Dict[int, ChatHistory]:
+        """
+        Par de cada linha sem par no lote: {id da linha: linha do par}
+
+        O par é a mensagem vizinha da sessão (sequence + 1 para o utilizador,
+        sequence - 1 para o assistente), gravada na mesma transação pelo
+        group commit; linhas sem par existente não aparecem no resultado.
+        """
+        wanted = {}
+        for row in unpaired:
+            if row.sequence is None:
+                continue
+            if row.message_type == "user":
+                wanted[(row.session_id, row.sequence + 1)] = ("assistant", row.id)
+            else:
+                wanted[(row.session_id, row.sequence - 1)] = ("user", row.id)
+        if not wanted:
+            return {}
+
+        found = (
+            db.query(ChatHistory)
+            .filter(or_(*[
+                and_(ChatHistory.session_id == session_id, ChatHistory.sequence == sequence)
+                for session_id, sequence in wanted
+            ]))
+            .all()
+        )
+        partners = {}
+        for partner in found:
+            expected_type, row_id = wanted[(partner.session_id, partner.sequence)]
+            if partner.message_type == expected_type:
+                partners[row_id] = partner
+        return partners
+
+    def _mark(self, ids: List[int], values: Dict):
+        """Atualiza as linhas de um lote já reservado"""
+        db = self.session_factory()
+        try:
+            db.query(ChatHistory).filter(ChatHistory.id.in_(ids)).update(values, synchronize_session=False)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _tail_once(self, backend) -> int:
+        """
+        Indexa as linhas seguintes à marca d'água do índice local deste worker
+
+        A marca d'água nunca passa a primeira linha ainda por estabilizar nem
+        uma linha sem par que ainda pode emparelhar; as trocas completas acima
+        dela são indexadas já e lembradas para não serem reenviadas.
+        """
+        db = self.session_factory()
+        try:
+            now = datetime.utcnow()
+            limit = self.batch_size * 2
+            rows = (
+                db.query(ChatHistory)
+                .filter(ChatHistory.id > backend.watermark)
+                .order_by(ChatHistory.id)
+                .limit(limit)
+                .all()
+            )
+            if not rows:
+                return 0
+
+            # Linhas muito recentes podem ter ids posteriores a transações ainda por confirmar
+            settled_before = now - timedelta(seconds=self.settle_seconds)
+            blocking = next((row.id for row in rows if row.timestamp > settled_before), None)
+            if blocking is not None:
+                rows = [row for row in rows if row.id < blocking]
+
+            turns, unpaired = pair_turns(rows)
+            partners = self._partners(db, unpaired)
+        finally:
+            db.close()
+
+        orphan_before = now - timedelta(seconds=self.orphan_seconds)
+        orphans = []
+        for row in unpaired:
+            partner = partners.get(row.id)
+            if partner is not None and partner.id > row.id:
+                # Resposta fora do lote: a troca é indexada já se estiver estável
+                if partner.timestamp <= settled_before:
+                    turns.append((row, partner))
+                    continue
+                waiting = True
+            elif partner is not None:
+                # Pergunta abaixo da marca d'água: a troca já foi tratada
+                waiting = False
+            else:
+                waiting = row.timestamp > orphan_before
+            if waiting:
+                blocking = row.id if blocking is None else min(blocking, row.id)
+            else:
+                orphans.append(row)
+
+        new_turns = [turn for turn in turns if turn[0].id not in self._tailed_ids]
+        if new_turns:
+            self._import_batch(backend, new_turns)
+            self._tailed_ids.update(turn[0].id for turn in new_turns)
+
+        watermark = blocking - 1 if blocking is not None else (rows[-1].id if rows else None)
+        passed_orphans = 0
+        if watermark is not None and watermark > backend.watermark:
+            passed_orphans = sum(1 for row in orphans if row.id <= watermark)
+            backend.watermark = watermark
+            self._tailed_ids = {row_id for row_id in self._tailed_ids if row_id > watermark}
+
+        self.indexed_turns += len(new_turns)
+        return 2 * len(new_turns) + passed_orphans
+
+    def _import_batch(self, backend, turns: List[Tuple[ChatHistory, ChatHistory]]):
+        """Calcula os vetores do lote e envia-o numa única escrita para o armazenamento"""
+        objects = [
+            build_memory_object(
+                user_row.session_id,
+                user_row.user_message,
+                assistant_row.assistant_message,
+                user_row.timestamp,
+                user_row.user_id
+            )
+            for user_row, assistant_row in turns
+        ]
+        # Uma chamada ao fornecedor de embeddings por lote (a coleção não tem vectorizer)
+        vectors = self.embed_documents([data_object["content"] for data_object in objects])
+
+        backend.add_many([
+            {
+                "id": memory_id_for(user_row.id),
+                "vector": vector,
+                "properties": data_object,
+                # Posição na sessão (segmento da memória hierárquica)
+                "sequence": user_row.sequence,
+            }
+            for (user_row, _), data_object, vector in zip(turns, objects, vectors)
+        ])
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                processed = self.drain_once()
+                self._consecutive_failures = 0
+            except Exception as e:
+                self._consecutive_failures += 1
+                self.failed_batches += 1
+                delay = min(self.max_backoff, self.poll_interval * (2 ** self._consecutive_failures))
+                logger.error(f"❌ Erro no indexador outbox (nova tentativa em {delay:.0f}s): {e}")
+                # Durante o backoff, novas escritas não antecipam a nova tentativa
+                self._stop_event.wait(delay)
+                continue
+
+            if processed:
+                # Ainda pode haver mais linhas pendentes; continuar já
+                continue
+            self._wake_event.wait(self.poll_interval)
+            self._wake_event.clear()
+
+
+# Indexador global do processo
+_outbox_indexer: Optional[MemoryOutboxIndexer] = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox_indexer() -> MemoryOutboxIndexer:
+    """
+    Obtém o indexador outbox do worker
+
+    Returns:
+        MemoryOutboxIndexer: Instância partilhada
+    """
+    global _outbox_indexer
+
+    if _outbox_indexer is None:
+        with _outbox_lock:
+            if _outbox_indexer is None:
+                _outbox_indexer = MemoryOutboxIndexer()
+
+    return _outbox_indexer
+
+
+def stop_outbox_indexer():
+    """Pára o indexador outbox do worker (shutdown)"""
+    global _outbox_indexer
+
+    with _outbox_lock:
+        indexer, _outbox_indexer = _outbox_indexer, None
+    if indexer is not None:
+        indexer.stop()
@@ -0,0 +1,182 @@
+"""
+Quantização de Vetores do Índice Local
+Códigos compactos para os vetores das conversas, usados para pontuar os
+candidatos sem ler os vetores float32 completos:
+- int8: quantização escalar por dimensão (4x mais pequeno)
+- pq: product quantization, 1 byte por subespaço (ex.: 384 dims → 48 bytes)
+
+As pontuações são aproximadas; o índice reordena os melhores candidatos com
+os vetores exatos.
+"""
+
+from typing import Dict, Optional
+
+import numpy as np
+
+_SCORE_CHUNK = 16384
+_PQ_CENTROIDS = 256
+_PQ_ITERATIONS = 12
+_PQ_MAX_SAMPLE = 20000
+
+
+class ScalarQuantizer:
+    """Quantização int8 por dimensão: x ≈ centro + código × passo"""
+
+    kind = "int8"
+
+    def __init__(self):
+        self.center: Optional[np.ndarray] = None
+        self.step: Optional[np.ndarray] = None
+
+    @property
+    def code_size(self) -> int:
+        return len(self.center)
+
+    @property
+    def code_dtype(self):
+        return np.int8
+
+    def train(self, data: np.ndarray):
+        low, high = data.min(axis=0), data.max(axis=0)
+        self.center = ((high + low) / 2).astype(np.float32)
+        step = (high - low) / 254
+        step[step == 0] = 1.0
+        self.step = step.astype(np.float32)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.rint((vectors - self.center) / self.step)
+        return np.clip(codes, -127, 127).astype(np.int8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return (self.center + codes.astype(np.float32) * self.step).astype(np.float32)
+
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """Produto interno aproximado entre cada código e a pergunta"""
+        weighted = query * self.step
+        offset = float(self.center @ query)
+        result = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), _SCORE_CHUNK):
+            chunk = codes[start:start + _SCORE_CHUNK]
+            result[start:start + len(chunk)] = chunk.astype(np.float32) @ weighted + offset
+        return result
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"center": self.center, "step": self.step}
+
+    def load_state(self, state):
+        self.center = np.asarray(state["center"], dtype=np.float32)
+        self.step = np.asarray(state["step"], dtype=np.float32)
+
+
+class ProductQuantizer:
+    """
+    Product quantization: o vetor é dividido em `subvectors` subespaços e cada
+    parte é substituída pelo índice (1 byte) do centróide mais próximo
+    """
+
+    kind = "pq"
+
+    def __init__(self, subvectors: int = 48):
+        self.requested_subvectors = subvectors
+        self.codebooks: Optional[np.ndarray] = None  # (subespaços, 256, dims por subespaço)
+
+    @property
+    def code_size(self) -> int:
+        return self.codebooks.shape[0]
+
+    @property
+    def code_dtype(self):
+        return np.uint8
+
+    def train(self, data: np.ndarray):
+        dimensions = data.shape[1]
+        # Maior divisor da dimensão que não excede o número pedido
+        subvectors = max(m for m in range(1, min(self.requested_subvectors, dimensions) + 1) if dimensions % m == 0)
+        width = dimensions // subvectors
+
+        rng = np.random.default_rng(0)
+        if len(data) > _PQ_MAX_SAMPLE:
+            data = data[rng.choice(len(data), _PQ_MAX_SAMPLE, replace=False)]
+        centroids = min(_PQ_CENTROIDS, len(data))
+
+        codebooks = np.zeros((subvectors, _PQ_CENTROIDS, width), dtype=np.float32)
+        for sub in range(subvectors):
+            part = np.ascontiguousarray(data[:, sub * width:(sub + 1) * width])
+            codebooks[sub, :centroids] = _kmeans(part, centroids, rng)
+            # Centróides não usados (poucos dados) repetem o primeiro
+            codebooks[sub, centroids:] = codebooks[sub, 0]
+        self.codebooks = codebooks
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        subvectors, _, width = self.codebooks.shape
+        codes = np.empty((len(vectors), subvectors), dtype=np.uint8)
+        for sub in range(subvectors):
+            part = vectors[:, sub * width:(sub + 1) * width]
+            codes[:, sub] = _nearest(part, self.codebooks[sub])
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        subvectors = self.codebooks.shape[0]
+        parts = [self.codebooks[sub][codes[:, sub]] for sub in range(subvectors)]
+        return np.concatenate(parts, axis=1).astype(np.float32)
+
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """Soma das tabelas de produtos internos (pergunta × centróides) por subespaço"""
+        subvectors, _, width = self.codebooks.shape
+        table = np.einsum("skd,sd->sk", self.codebooks, query.reshape(subvectors, width))
+        result = np.empty(len(codes), dtype=np.float32)
+        columns = np.arange(subvectors)
+        for start in range(0, len(codes), _SCORE_CHUNK):
+            chunk = codes[start:start + _SCORE_CHUNK]
+            result[start:start + len(chunk)] = table[columns, chunk].sum(axis=1)
+        return result
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"codebooks": self.codebooks}
+
+    def load_state(self, state):
+        self.codebooks = np.asarray(state["codebooks"], dtype=np.float32)
+
+
+def create_quantizer(kind: str, pq_subvectors: int = 48):
+    """
+    Cria o quantizador configurado
+
+    Args:
+        kind: "none", "int8" ou "pq"
+        pq_subvectors: Número de subespaços (bytes por vetor) no modo "pq"
+
+    Returns:
+        Quantizador por treinar, ou None sem quantização
+    """
+    if kind in (None, "", "none"):
+        return None
+    if kind == "int8":
+        return ScalarQuantizer()
+    if kind == "pq":
+        return ProductQuantizer(pq_subvectors)
+    raise ValueError(f"Quantização desconhecida: {kind} (opções: none, int8, pq)")
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    # argmin ||x - c||² = argmax (x·c - ||c||²/2)
+    half_norms = (centroids ** 2).sum(axis=1) / 2
+    result = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), _SCORE_CHUNK):
+        chunk = vectors[start:start + _SCORE_CHUNK]
+        result[start:start + len(chunk)] = np.argmax(chunk @ centroids.T - half_norms, axis=1)
+    return result
+
+
+def _kmeans(data: np.ndarray, k: int, rng) -> np.ndarray:
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+    for _ in range(_PQ_ITERATIONS):
+        labels = _nearest(data, centroids)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.stack([np.bincount(labels, weights=data[:, d], minlength=k) for d in range(data.shape[1])], axis=1)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # Centróides vazios recomeçam num ponto aleatório
+        if not filled.all():
+            centroids[~filled] = data[rng.choice(len(data), int((~filled).sum()))]
+    return centroids
@@ -0,0 +1,149 @@
+"""
+Cache Semântica de Respostas
+Perguntas quase iguais (similaridade do embedding acima de um limiar) reutilizam
+a resposta já gerada, sem router, pesquisa nem LLM. Só guarda respostas que não
+dependem da sessão (pesquisa na web e respostas gerais sem contexto), cada rota
+com a sua validade: curta para web_search, onde os factos mudam depressa.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Configuração por omissão (por worker)
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "2048"))
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))
+# Validade por rota em segundos; rotas sem validade não são guardadas
+RESPONSE_CACHE_TTLS = {
+    "web_search": float(os.getenv("RESPONSE_CACHE_TTL_WEB_SEARCH", "900")),
+    "general": float(os.getenv("RESPONSE_CACHE_TTL_GENERAL", "86400")),
+}
+
+
+class SemanticResponseCache:
+    """
+    Respostas indexadas pelo embedding (normalizado) da pergunta
+
+    - lookup(): resposta da pergunta guardada mais parecida, se a similaridade
+      passar `threshold` e a entrada ainda for válida
+    - store(): guarda a resposta com a validade da rota; com a cache cheia
+      substitui a entrada que expira primeiro
+    - A pesquisa é um produto matricial sobre no máximo `max_entries` vetores
+    """
+
+    def __init__(self, embed_query: Optional[Callable[[str], np.ndarray]] = None,
+                 threshold: float = RESPONSE_CACHE_SIMILARITY,
+                 max_entries: int = RESPONSE_CACHE_SIZE,
+                 ttls: Optional[Dict[str, float]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self._embed_query = embed_query
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttls = dict(RESPONSE_CACHE_TTLS if ttls is None else ttls)
+        self.clock = clock
+
+        self._vectors: Optional[np.ndarray] = None
+        self._expires = np.full(max_entries, -np.inf)
+        self._entries: List[Optional[Dict]] = [None] * max_entries
+        self._lock = threading.Lock()
+
+        self.lookups = 0
+        self.hits = 0
+        self.stores = 0
+        self.hits_by_route: Dict[str, int] = {}
+
+    def lookup(self, question: str) -> Optional[str]:
+        """Resposta em cache para a pergunta (None se não houver uma válida)"""
+        vector = self._vector(question)
+        now = self.clock()
+        with self._lock:
+            self.lookups += 1
+            if self._vectors is None or vector.shape[0] != self._vectors.shape[1]:
+                return None
+            similarities = self._vectors @ vector
+            similarities[self._expires <= now] = -np.inf
+            slot = int(np.argmax(similarities))
+            if similarities[slot] < self.threshold:
+                return None
+            entry = self._entries[slot]
+            self.hits += 1
+            self.hits_by_route[entry["route"]] = self.hits_by_route.get(entry["route"], 0) + 1
+        logger.info(f"⚡ Resposta em cache ({entry['route']}, similaridade {similarities[slot]:.3f})")
+        return entry["answer"]
+
+    def store(self, question: str, answer: str, route: str) -> bool:
+        """Guarda a resposta (False se a rota não tem validade configurada)"""
+        ttl = self.ttls.get(route)
+        if not ttl or not answer:
+            return False
+        vector = self._vector(question)
+        with self._lock:
+            if self._vectors is None or vector.shape[0] != self._vectors.shape[1]:
+                self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+                self._expires[:] = -np.inf
+                self._entries = [None] * self.max_entries
+            # Livre ou expirada primeiro; senão a que expira mais cedo
+            slot = int(np.argmin(self._expires))
+            self._vectors[slot] = vector
+            self._expires[slot] = self.clock() + ttl
+            self._entries[slot] = {"question": question, "answer": answer, "route": route}
+            self.stores += 1
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._expires[:] = -np.inf
+            self._entries = [None] * self.max_entries
+
+    def stats(self) -> Dict:
+        now = self.clock()
+        with self._lock:
+            return {
+                "entries": int(np.count_nonzero(self._expires > now)),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "misses": self.lookups - self.hits,
+                "hit_ratio": round(self.hits / self.lookups, 3) if self.lookups else 0.0,
+                "hits_by_route": dict(self.hits_by_route),
+                "stores": self.stores,
+            }
+
+    def _vector(self, question: str) -> np.ndarray:
+        if self._embed_query is None:
+            # Mesma cache de embeddings das pesquisas na memória e do router
+            from .embeddings import get_query_embedder
+            self._embed_query = get_query_embedder().embed_query
+        vector = np.asarray(self._embed_query(question), dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+
+# Instância global do processo
+_response_cache: Optional[SemanticResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[SemanticResponseCache]:
+    """
+    Obtém a cache de respostas do worker
+
+    Returns:
+        SemanticResponseCache partilhada, ou None com RESPONSE_CACHE_ENABLED=false
+    """
+    global _response_cache
+
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    if _response_cache is None:
+        with _cache_lock:
+            if _response_cache is None:
+                _response_cache = SemanticResponseCache()
+
+    return _response_cache
@@ -0,0 +1,196 @@
+"""
+Cache em Memória do Histórico Recente por Sessão
+LRU limitado de buffers circulares com as últimas mensagens de cada sessão,
+para que os turnos seguintes não precisem de consultar o PostgreSQL.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Configuração por omissão (por worker)
+HISTORY_CACHE_MESSAGES_PER_SESSION = int(os.getenv("HISTORY_CACHE_MESSAGES_PER_SESSION", "20"))
+HISTORY_CACHE_MAX_SESSIONS = int(os.getenv("HISTORY_CACHE_MAX_SESSIONS", "1000"))
+HISTORY_CACHE_MAX_CHARS = int(os.getenv("HISTORY_CACHE_MAX_CHARS", "4000000"))
+HISTORY_CACHE_TTL_SECONDS = float(os.getenv("HISTORY_CACHE_TTL_SECONDS", "600"))
+# Validade das sessões só lidas da base de dados: limita o atraso em relação a
+# mensagens gravadas por outros workers, sem consultar a base de dados num hit
+HISTORY_CACHE_READ_TTL_SECONDS = float(os.getenv("HISTORY_CACHE_READ_TTL_SECONDS", "30"))
+
+
+class _SessionBuffer:
+    """Buffer circular com as mensagens mais recentes de uma sessão"""
+
+    __slots__ = ("messages", "chars", "expires_at")
+
+    def __init__(self, capacity: int, expires_at: float):
+        self.messages = deque(maxlen=capacity)
+        self.chars = 0
+        self.expires_at = expires_at
+
+
+class RecentHistoryCache:
+    """
+    LRU de buffers circulares por sessão
+
+    - Uma sessão só entra na cache depois de carregada da base de dados
+      (prime), por isso um hit nunca esconde mensagens mais antigas
+    - append acrescenta às sessões já em cache as mensagens gravadas por este
+      worker e renova a validade completa (`ttl_seconds`)
+    - Uma sessão só lida da base de dados (prime) expira ao fim de
+      `read_ttl_seconds`: as mensagens gravadas noutros workers aparecem no
+      máximo com esse atraso, e um hit nunca consulta a base de dados
+    - prime junta as mensagens lidas às que já estão em cache, por posição,
+      para que uma leitura mais antiga não apague um append mais recente
+    - Evicção LRU por número de sessões e pelo total de caracteres guardados
+    """
+
+    def __init__(self, messages_per_session: int = HISTORY_CACHE_MESSAGES_PER_SESSION,
+                 max_sessions: int = HISTORY_CACHE_MAX_SESSIONS,
+                 max_chars: int = HISTORY_CACHE_MAX_CHARS,
+                 ttl_seconds: float = HISTORY_CACHE_TTL_SECONDS,
+                 read_ttl_seconds: float = HISTORY_CACHE_READ_TTL_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.capacity = messages_per_session
+        self.max_sessions = max_sessions
+        self.max_chars = max_chars
+        self.ttl_seconds = ttl_seconds
+        self.read_ttl_seconds = min(read_ttl_seconds, ttl_seconds)
+        self.clock = clock
+
+        self._sessions: "OrderedDict[str, _SessionBuffer]" = OrderedDict()
+        self._total_chars = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, session_id: str, limit: int) -> Optional[List[Dict]]:
+        """
+        Devolve as últimas `limit` mensagens da sessão por ordem cronológica
+
+        Returns:
+            Lista de mensagens, ou None se a cache não puder responder (miss)
+        """
+        with self._lock:
+            buffer = self._sessions.get(session_id)
+
+            if buffer is not None and buffer.expires_at <= self.clock():
+                self._remove(session_id)
+                buffer = None
+
+            if buffer is None or limit > self.capacity:
+                self.misses += 1
+                return None
+
+            self._sessions.move_to_end(session_id)
+            self.hits += 1
+            messages = list(buffer.messages)
+            return messages[-limit:] if limit > 0 else []
+
+    def prime(self, session_id: str, messages: List[Dict]):
+        """
+        Carrega a sessão a partir das mensagens mais recentes lidas da base de dados
+
+        Args:
+            session_id: ID da sessão
+            messages: Mensagens em ordem cronológica (pelo menos `capacity`
+                mensagens, ou todas se a sessão tiver menos)
+        """
+        with self._lock:
+            previous = self._sessions.get(session_id)
+            if previous is not None and all(
+                message.get("sequence") is not None for message in list(previous.messages) + messages
+            ):
+                # Mensagens acrescentadas depois da leitura continuam na cache
+                merged = {message["sequence"]: message for message in previous.messages}
+                merged.update((message["sequence"], message) for message in messages)
+                messages = [merged[sequence] for sequence in sorted(merged)]
+            self._remove(session_id)
+            buffer = _SessionBuffer(self.capacity, self.clock() + self.read_ttl_seconds)
+            self._sessions[session_id] = buffer
+            self._extend(buffer, messages)
+            self._enforce_limits()
+
+    def append(self, session_id: str, messages: List[Dict]):
+        """Acrescenta mensagens novas a uma sessão que já esteja em cache"""
+        with self._lock:
+            buffer = self._sessions.get(session_id)
+            if buffer is None:
+                return
+            self._sessions.move_to_end(session_id)
+            buffer.expires_at = self.clock() + self.ttl_seconds
+            self._extend(buffer, messages)
+            self._enforce_limits()
+
+    def invalidate(self, session_id: str):
+        """Remove uma sessão da cache"""
+        with self._lock:
+            self._remove(session_id)
+
+    def stats(self) -> Dict:
+        """Contadores de utilização da cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "sessions": len(self._sessions),
+                "cached_chars": self._total_chars,
+            }
+
+    # Métodos internos (chamados com o lock adquirido)
+
+    def _extend(self, buffer: _SessionBuffer, messages: List[Dict]):
+        for message in messages:
+            if len(buffer.messages) == buffer.messages.maxlen:
+                dropped = len(buffer.messages[0].get("content") or "")
+                buffer.chars -= dropped
+                self._total_chars -= dropped
+            buffer.messages.append(message)
+            size = len(message.get("content") or "")
+            buffer.chars += size
+            self._total_chars += size
+
+    def _remove(self, session_id: str):
+        buffer = self._sessions.pop(session_id, None)
+        if buffer is not None:
+            self._total_chars -= buffer.chars
+
+    def _enforce_limits(self):
+        while self._sessions and (
+            len(self._sessions) > self.max_sessions or self._total_chars > self.max_chars
+        ):
+            _, buffer = self._sessions.popitem(last=False)
+            self._total_chars -= buffer.chars
+            self.evictions += 1
+
+
+# Cache global do processo
+_history_cache: Optional[RecentHistoryCache] = None
+_history_cache_lock = threading.Lock()
+
+
+def get_recent_history_cache() -> RecentHistoryCache:
+    """
+    Obtém a cache de histórico recente partilhada pelo worker
+
+    Returns:
+        RecentHistoryCache: Instância partilhada
+    """
+    global _history_cache
+
+    if _history_cache is None:
+        with _history_cache_lock:
+            if _history_cache is None:
+                _history_cache = RecentHistoryCache()
+
+    return _history_cache
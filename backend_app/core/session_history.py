@@ -0,0 +1,147 @@
+"""
+Leitura Paginada do Histórico de Sessões
+Paginação por keyset sobre o índice (session_id, sequence): cada página é uma
+pesquisa por intervalo no índice, com custo independente da posição na sessão,
+e a exportação em streaming lê uma página de cada vez com memória limitada.
+"""
+
+import base64
+import binascii
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ..models.database import ChatHistory, SessionLocal
+
+# Campos expostos pela API e as colunas de que cada um precisa
+HISTORY_FIELDS = {
+    "sequence": (ChatHistory.sequence,),
+    "type": (ChatHistory.message_type,),
+    "content": (ChatHistory.message_type, ChatHistory.user_message, ChatHistory.assistant_message),
+    "timestamp": (ChatHistory.timestamp,),
+    "indexed": (ChatHistory.processed,),
+}
+DEFAULT_FIELDS = ("sequence", "type", "content", "timestamp")
+
+MAX_PAGE_SIZE = 500
+
+
+def parse_fields(fields: Optional[str]) -> Tuple[str, ...]:
+    """
+    Valida a lista de campos pedida (separada por vírgulas)
+
+    Raises:
+        ValueError: Se algum campo não existir
+    """
+    if not fields:
+        return DEFAULT_FIELDS
+
+    requested = tuple(dict.fromkeys(field.strip() for field in fields.split(",") if field.strip()))
+    unknown = [field for field in requested if field not in HISTORY_FIELDS]
+    if unknown or not requested:
+        raise ValueError(f"Campos inválidos: {', '.join(unknown) or fields}. "
+                         f"Disponíveis: {', '.join(HISTORY_FIELDS)}")
+    return requested
+
+
+def encode_cursor(sequence: int) -> str:
+    """Cursor opaco para a posição a seguir a `sequence`"""
+    return base64.urlsafe_b64encode(f"seq:{sequence}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[int]:
+    """
+    Converte um cursor na última sequência já lida
+
+    Raises:
+        ValueError: Se o cursor for inválido
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        prefix, _, value = base64.urlsafe_b64decode(padded).decode().partition(":")
+        if prefix != "seq":
+            raise ValueError(cursor)
+        return int(value)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError(f"Cursor inválido: {cursor}")
+
+
+def fetch_history_page(db: Session, session_id: str, after: Optional[int] = None,
+                       limit: int = 50, fields: Sequence[str] = DEFAULT_FIELDS,
+                       descending: bool = False) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Lê uma página do histórico de uma sessão
+
+    Args:
+        db: Sessão SQLAlchemy
+        session_id: Sessão a ler
+        after: Última sequência já lida (exclusiva); None para começar do início
+        limit: Número máximo de mensagens
+        fields: Campos a devolver (só as colunas necessárias são lidas)
+        descending: Do mais recente para o mais antigo
+
+    Returns:
+        (mensagens, cursor da página seguinte ou None se não houver mais)
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    columns = {"sequence": ChatHistory.sequence}
+    for field in fields:
+        columns.update((column.key, column) for column in HISTORY_FIELDS[field])
+
+    query = select(*columns.values()).where(ChatHistory.session_id == session_id)
+    if after is not None:
+        query = query.where(ChatHistory.sequence < after if descending else ChatHistory.sequence > after)
+    order = ChatHistory.sequence.desc() if descending else ChatHistory.sequence
+    # Pedir uma linha a mais para saber se existe página seguinte
+    rows = db.execute(query.order_by(order).limit(limit + 1)).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    messages = [_serialize(row, fields) for row in rows]
+    next_cursor = encode_cursor(rows[-1].sequence) if has_more else None
+    return messages, next_cursor
+
+
+def iter_history(session_id: str, after: Optional[int] = None, page_size: int = 200,
+                 fields: Sequence[str] = DEFAULT_FIELDS, descending: bool = False,
+                 session_factory: Callable = SessionLocal) -> Iterator[Dict]:
+    """
+    Percorre todo o histórico de uma sessão, página a página
+
+    Cada página usa uma sessão de base de dados curta, por isso nenhuma ligação
+    fica presa enquanto o cliente consome o stream.
+    """
+    cursor_sequence = after
+    while True:
+        db = session_factory()
+        try:
+            messages, next_cursor = fetch_history_page(
+                db, session_id, cursor_sequence, page_size, fields, descending
+            )
+        finally:
+            db.close()
+
+        yield from messages
+        if next_cursor is None:
+            return
+        cursor_sequence = decode_cursor(next_cursor)
+
+
+def _serialize(row, fields: Sequence[str]) -> Dict:
+    message = {}
+    for field in fields:
+        if field == "sequence":
+            message["sequence"] = row.sequence
+        elif field == "type":
+            message["type"] = row.message_type
+        elif field == "content":
+            message["content"] = row.user_message if row.message_type == "user" else row.assistant_message
+        elif field == "timestamp":
+            message["timestamp"] = row.timestamp.isoformat() if row.timestamp else None
+        elif field == "indexed":
+            message["indexed"] = bool(row.processed)
+    return message
@@ -0,0 +1,289 @@
+"""
+Resumos Incrementais por Sessão
+Cada sessão tem um resumo dos turnos mais antigos (tabela session_summaries,
+ao lado do chat_history). O contexto passa a levar o resumo mais os turnos
+recentes, em vez de todo o histórico.
+
+O resumo é atualizado a cada SESSION_SUMMARY_EVERY_TURNS turnos, fora do
+caminho do pedido, numa pool de threads própria com concorrência limitada.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy.exc import IntegrityError
+
+from ..models.database import ChatHistory, SessionLocal, SessionSummary
+
+logger = logging.getLogger(__name__)
+
+# Configuração por omissão (por worker)
+SESSION_SUMMARY_EVERY_TURNS = int(os.getenv("SESSION_SUMMARY_EVERY_TURNS", "4"))
+# Turnos mais recentes que ficam sempre fora do resumo (enviados tal como estão)
+SESSION_SUMMARY_KEEP_RECENT_TURNS = int(os.getenv("SESSION_SUMMARY_KEEP_RECENT_TURNS", "5"))
+SESSION_SUMMARY_CONCURRENCY = int(os.getenv("SESSION_SUMMARY_CONCURRENCY", "2"))
+SESSION_SUMMARY_MAX_WORDS = int(os.getenv("SESSION_SUMMARY_MAX_WORDS", "150"))
+SESSION_SUMMARY_CACHE_SIZE = int(os.getenv("SESSION_SUMMARY_CACHE_SIZE", "1000"))
+SESSION_SUMMARY_CACHE_TTL_SECONDS = float(os.getenv("SESSION_SUMMARY_CACHE_TTL_SECONDS", "300"))
+# Turnos ainda não resumidos enviados com o resumo, no máximo (resumo atrasado)
+SESSION_SUMMARY_MAX_PENDING_TURNS = int(os.getenv("SESSION_SUMMARY_MAX_PENDING_TURNS", "20"))
+
+SUMMARY_PROMPT = """Atualiza o resumo de uma conversa entre um utilizador e o Ethic Companion.
+Mantém factos sobre o utilizador, decisões, preferências e temas em aberto. Usa no máximo {max_words} palavras, em português, sem preâmbulo.
+
+Resumo atual:
+{summary}
+
+Novas mensagens:
+{messages}
+
+Resumo atualizado:"""
+
+
+def llm_summarize(summary: str, messages: List[Dict], max_words: int = SESSION_SUMMARY_MAX_WORDS) -> Optional[str]:
+    """Resumo com o LLM do agente (None se não houver LLM disponível)"""
+    from langchain_core.messages import HumanMessage
+
+    from .ai_agent import get_ai_agent
+
+    llm = get_ai_agent().llm
+    if llm is None:
+        return None
+    transcript = "\n".join(
+        f"{'Utilizador' if message['type'] == 'user' else 'Assistente'}: {message['content']}"
+        for message in messages
+    )
+    prompt = SUMMARY_PROMPT.format(max_words=max_words, summary=summary or "(vazio)", messages=transcript)
+    return llm.invoke([HumanMessage(content=prompt)]).content.strip()
+
+
+def unsummarized_messages(messages: List[Dict], last_sequence: int) -> Optional[List[Dict]]:
+    """
+    Mensagens que o resumo ainda não cobre (sequence > last_sequence)
+
+    Args:
+        messages: Janela de mensagens recentes em ordem cronológica
+        last_sequence: Última mensagem incluída no resumo
+
+    Returns:
+        As mensagens por resumir, ou None se a janela não chega para responder
+        (começa depois da primeira mensagem por resumir ou não tem posições)
+    """
+    if any(message.get("sequence") is None for message in messages):
+        return None
+    if messages and messages[0]["sequence"] > last_sequence + 1:
+        return None
+    return [message for message in messages if message["sequence"] > last_sequence]
+
+
+class SessionSummarizer:
+    """
+    Mantém o resumo incremental de cada sessão
+
+    - schedule(): pedido de atualização após um turno guardado; no máximo um
+      trabalho por sessão em curso, numa pool com `max_concurrency` threads
+    - update(): junta ao resumo os turnos ainda não resumidos, exceto os
+      `keep_recent_turns` mais recentes, quando já são `every_turns` ou mais
+    - get(): resumo da sessão (cache LRU com TTL, depois a base de dados)
+
+    A gravação é condicional ao last_sequence lido, por isso dois workers a
+    resumir a mesma sessão não se sobrepõem: o segundo desiste.
+    """
+
+    def __init__(self, summarize_fn: Optional[Callable] = None,
+                 session_factory: Callable = SessionLocal,
+                 every_turns: int = SESSION_SUMMARY_EVERY_TURNS,
+                 keep_recent_turns: int = SESSION_SUMMARY_KEEP_RECENT_TURNS,
+                 max_concurrency: int = SESSION_SUMMARY_CONCURRENCY,
+                 cache_size: int = SESSION_SUMMARY_CACHE_SIZE,
+                 cache_ttl_seconds: float = SESSION_SUMMARY_CACHE_TTL_SECONDS):
+        self.summarize_fn = summarize_fn or llm_summarize
+        self.session_factory = session_factory
+        self.every_turns = every_turns
+        self.keep_recent_turns = keep_recent_turns
+        self.cache_size = cache_size
+        self.cache_ttl_seconds = cache_ttl_seconds
+
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="session-summary")
+        self._pending: set = set()
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.updates = 0
+        self.failures = 0
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        """
+        Resumo atual da sessão
+
+        Returns:
+            {"summary", "last_sequence"} ou None se a sessão ainda não tem resumo
+        """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(session_id)
+            if cached is not None and cached[0] > now:
+                self._cache.move_to_end(session_id)
+                return cached[1]
+
+        db = self.session_factory()
+        try:
+            row = db.get(SessionSummary, session_id)
+            value = {"summary": row.summary, "last_sequence": row.last_sequence} if row else None
+        finally:
+            db.close()
+        self._remember(session_id, value)
+        return value
+
+    def schedule(self, session_id: str):
+        """Agenda a atualização do resumo em background (ignora se já há uma pendente)"""
+        with self._lock:
+            if session_id in self._pending:
+                return
+            self._pending.add(session_id)
+        try:
+            self._executor.submit(self._run, session_id)
+        except RuntimeError:
+            # Pool já encerrada (shutdown)
+            with self._lock:
+                self._pending.discard(session_id)
+
+    def update(self, session_id: str) -> bool:
+        """
+        Junta os turnos ainda não resumidos ao resumo da sessão (bloqueante)
+
+        Returns:
+            True se o resumo foi atualizado
+        """
+        # 1. Ler o resumo e os turnos em falta, sem deixar a transação aberta
+        db = self.session_factory()
+        try:
+            row = db.get(SessionSummary, session_id)
+            previous_summary = row.summary if row else ""
+            last_sequence = row.last_sequence if row else 0
+            has_summary = row is not None
+            rows = (
+                db.query(ChatHistory)
+                .filter(ChatHistory.session_id == session_id, ChatHistory.sequence > last_sequence)
+                .order_by(ChatHistory.sequence)
+                .all()
+            )
+            keep = self.keep_recent_turns * 2
+            candidates = rows[:-keep] if keep else rows
+            # Terminar num turno completo (a resposta fica junto da pergunta)
+            if candidates and candidates[-1].message_type == "user":
+                candidates = candidates[:-1]
+            if len(candidates) < self.every_turns * 2:
+                return False
+
+            messages = [
+                {"type": message.message_type,
+                 "content": message.user_message if message.message_type == "user" else message.assistant_message}
+                for message in candidates
+            ]
+            new_sequence = candidates[-1].sequence
+        finally:
+            db.close()
+
+        # 2. Chamada ao LLM sem nenhuma ligação à base de dados reservada
+        summary = self.summarize_fn(previous_summary, messages)
+        if not summary:
+            return False
+
+        # 3. Gravar numa sessão nova; a condição sobre last_sequence protege de corridas
+        db = self.session_factory()
+        try:
+            if not has_summary:
+                db.add(SessionSummary(session_id=session_id, summary=summary, last_sequence=new_sequence))
+            else:
+                # Só grava se nenhum outro worker avançou o resumo entretanto
+                changed = (
+                    db.query(SessionSummary)
+                    .filter(SessionSummary.session_id == session_id,
+                            SessionSummary.last_sequence == last_sequence)
+                    .update({"summary": summary, "last_sequence": new_sequence,
+                             "updated_at": datetime.utcnow()}, synchronize_session=False)
+                )
+                if not changed:
+                    db.rollback()
+                    return False
+            try:
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+                return False
+        finally:
+            db.close()
+
+        self._remember(session_id, {"summary": summary, "last_sequence": new_sequence})
+        self.updates += 1
+        logger.info(f"📝 Resumo da sessão {session_id} atualizado até à mensagem {new_sequence}")
+        return True
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "cached_sessions": len(self._cache),
+                "updates": self.updates,
+                "failures": self.failures,
+            }
+
+    def stop(self):
+        """Cancela os resumos pendentes (não bloqueia o shutdown)"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, session_id: str):
+        try:
+            self.update(session_id)
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"❌ Erro ao resumir a sessão {session_id}: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(session_id)
+
+    def _remember(self, session_id: str, value: Optional[Dict]):
+        with self._lock:
+            self._cache[session_id] = (time.monotonic() + self.cache_ttl_seconds, value)
+            self._cache.move_to_end(session_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+
+# Instância global do processo
+_session_summarizer: Optional[SessionSummarizer] = None
+_summarizer_lock = threading.Lock()
+
+
+def get_session_summarizer() -> SessionSummarizer:
+    """
+    Obtém o gestor de resumos de sessão do worker
+
+    Returns:
+        SessionSummarizer: Instância partilhada
+    """
+    global _session_summarizer
+
+    if _session_summarizer is None:
+        with _summarizer_lock:
+            if _session_summarizer is None:
+                _session_summarizer = SessionSummarizer()
+
+    return _session_summarizer
+
+
+def stop_session_summarizer():
+    """Encerra a pool de resumos (shutdown)"""
+    global _session_summarizer
+
+    with _summarizer_lock:
+        summarizer, _session_summarizer = _session_summarizer, None
+    if summarizer is not None:
+        summarizer.stop()
@@ -0,0 +1,112 @@
+"""
+Execução Especulativa de Ramos com Teto de Custo
+Os ramos que provavelmente vão ser precisos (pesquisa na memória, pesquisa na
+web) arrancam antes de se saber a rota; o ramo perdedor é cancelado assim que
+a classificação chega. Cada pedido tem um teto para o custo dos ramos
+iniciados às cegas: o que não cabe só corre se vier a ser necessário.
+"""
+
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class SpeculationMetrics:
+    """Contadores do processo: ramos especulativos iniciados, usados e desperdiçados"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = 0
+        self.used = 0
+        self.cancelled = 0
+        self.capped = 0
+        self.fallbacks = 0
+        self.wasted_cost = 0.0
+
+    def record(self, **increments):
+        with self._lock:
+            for name, value in increments.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "started": self.started,
+                "used": self.used,
+                "cancelled": self.cancelled,
+                "capped": self.capped,
+                "fallbacks": self.fallbacks,
+                "wasted_cost": round(self.wasted_cost, 3),
+            }
+
+
+speculation_metrics = SpeculationMetrics()
+
+
+class Speculation:
+    """
+    Ramos especulativos de um pedido
+
+    - start(): arranca o ramo se o custo acumulado não passar `cost_cap`
+    - result(): resultado do ramo; se não foi iniciado (teto), corre agora
+    - cancel() / cancel_all(): cancela os ramos não usados; o custo de um ramo
+      já iniciado conta como desperdício
+
+    Ramos que correm numa pool de threads não são interrompidos ao cancelar,
+    apenas deixam de ser esperados.
+    """
+
+    def __init__(self, cost_cap: float, metrics: SpeculationMetrics = speculation_metrics):
+        self.cost_cap = cost_cap
+        self.metrics = metrics
+        self.spent = 0.0
+        self._tasks: Dict[str, "asyncio.Future"] = {}
+        self._costs: Dict[str, float] = {}
+        self._used: set = set()
+
+    def start(self, name: str, factory: Callable[[], Awaitable[Any]], cost: float) -> bool:
+        """Arranca o ramo em background (False se ultrapassar o teto de custo)"""
+        if self.spent + cost > self.cost_cap:
+            self.metrics.record(capped=1)
+            return False
+        self._tasks[name] = asyncio.ensure_future(factory())
+        self._costs[name] = cost
+        self.spent += cost
+        self.metrics.record(started=1)
+        return True
+
+    def started(self, name: str) -> bool:
+        return name in self._tasks
+
+    async def result(self, name: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """Resultado do ramo especulativo, ou de `factory` se o ramo não arrancou"""
+        task = self._tasks.get(name)
+        if task is None:
+            return await factory()
+        self._used.add(name)
+        self.metrics.record(used=1)
+        return await task
+
+    def fallback(self):
+        """Regista que a rota escolhida ficou sem resposta e outro ramo a substituiu"""
+        self.metrics.record(fallbacks=1)
+
+    def cancel(self, name: str):
+        task = self._tasks.get(name)
+        if task is None or name in self._used:
+            return
+        self._used.add(name)
+        if not task.done():
+            task.cancel()
+        elif not task.cancelled():
+            # Resultado já não interessa; ler a exceção evita o aviso do asyncio
+            task.exception()
+        self.metrics.record(cancelled=1, wasted_cost=self._costs[name])
+        logger.info(f"✂️ Ramo especulativo {name} cancelado")
+
+    def cancel_all(self):
+        for name in list(self._tasks):
+            self.cancel(name)
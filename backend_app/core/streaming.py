@@ -0,0 +1,88 @@
+"""
+Protocolo de Streaming das Respostas do Chat
+Codifica os eventos SSE de /api/message/stream em versões negociáveis
+"""
+
+import hashlib
+import json
+from typing import Any, Dict, Optional
+
+# Versão 1: cada evento "content" leva o fragmento e o texto acumulado completo
+STREAM_PROTOCOL_V1 = 1
+# Versão 2: eventos "delta" compactos com número de sequência + verificação final
+STREAM_PROTOCOL_V2 = 2
+
+SUPPORTED_STREAM_PROTOCOLS = (STREAM_PROTOCOL_V1, STREAM_PROTOCOL_V2)
+DEFAULT_STREAM_PROTOCOL = STREAM_PROTOCOL_V1
+
+
+def negotiate_stream_protocol(requested: Optional[int]) -> int:
+    """
+    Escolhe a versão do protocolo a usar para um pedido
+
+    Args:
+        requested: Versão pedida pelo cliente (None para clientes antigos)
+
+    Returns:
+        int: A versão suportada mais alta que não excede a pedida
+    """
+    if requested is None:
+        return DEFAULT_STREAM_PROTOCOL
+
+    candidates = [version for version in SUPPORTED_STREAM_PROTOCOLS if version <= requested]
+    return max(candidates) if candidates else DEFAULT_STREAM_PROTOCOL
+
+
+class StreamEncoder:
+    """
+    Converte os eventos do stream em linhas SSE segundo a versão negociada
+
+    Na versão 2 apenas os deltas seguem no fio; o evento final leva o
+    comprimento (em code points) e o SHA-256 do texto para o cliente
+    verificar a reconstrução.
+    """
+
+    def __init__(self, version: int = DEFAULT_STREAM_PROTOCOL):
+        self.version = version
+        self._sequence = 0
+        self._length = 0
+        self._digest = hashlib.sha256()
+        self._accumulated = []  # Só usado na versão 1
+
+    def event(self, payload: Dict[str, Any]) -> str:
+        """Codifica um evento genérico (metadata, context, error...)"""
+        if self.version >= STREAM_PROTOCOL_V2:
+            data = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+        else:
+            data = json.dumps(payload)
+        return f"data: {data}\n\n"
+
+    def content(self, chunk: str) -> str:
+        """Codifica um fragmento de texto da resposta"""
+        self._length += len(chunk)
+        self._digest.update(chunk.encode("utf-8"))
+
+        if self.version >= STREAM_PROTOCOL_V2:
+            payload = {"type": "delta", "seq": self._sequence, "delta": chunk}
+            self._sequence += 1
+            return self.event(payload)
+
+        self._accumulated.append(chunk)
+        return self.event({
+            "type": "content",
+            "chunk": chunk,
+            "accumulated": "".join(self._accumulated)
+        })
+
+    def complete(self, payload: Dict[str, Any], final_response: str) -> str:
+        """Codifica o evento final com os dados de verificação da versão"""
+        payload = dict(payload, type="complete")
+
+        if self.version >= STREAM_PROTOCOL_V2:
+            payload["seq_count"] = self._sequence
+            payload["length"] = self._length
+            payload["sha256"] = self._digest.hexdigest()
+        else:
+            payload["final_response"] = final_response
+
+        return self.event(payload)
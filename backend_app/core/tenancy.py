@@ -0,0 +1,203 @@
+"""
+Multi-Tenancy da Memória Semântica
+Com MEMORY_MULTI_TENANCY cada utilizador (user_id) é um tenant: no Weaviate um
+tenant da coleção TenantConversationMemory e no índice local um shard
+próprio. Cada pesquisa só percorre os vetores do seu utilizador.
+
+Tenants sem atividade recente no chat_history são descarregados (COLD) e
+reativados (HOT) na primeira utilização seguinte.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from ..models.database import ChatHistory, SessionLocal
+
+logger = logging.getLogger(__name__)
+
+MEMORY_MULTI_TENANCY = os.getenv("MEMORY_MULTI_TENANCY", "false").lower() in ("1", "true", "yes")
+TENANT_MEMORY_COLLECTION = "TenantConversationMemory"
+ANONYMOUS_TENANT = "anonymous"
+
+# Tenants sem mensagens há mais do que isto são descarregados para armazenamento frio
+TENANT_IDLE_SECONDS = float(os.getenv("TENANT_IDLE_SECONDS", str(6 * 3600)))
+TENANT_SWEEP_INTERVAL = float(os.getenv("TENANT_SWEEP_INTERVAL", "600"))
+
+_TENANT_NAME = re.compile(r"^[A-Za-z0-9_-]{1,62}$")
+_UPDATE_CHUNK = 100
+
+
+def tenant_for(user_id: Optional[str]) -> str:
+    """
+    Nome do tenant de um utilizador (caracteres aceites pelo Weaviate e por
+    nomes de diretórios); sessões sem user_id partilham o tenant anónimo
+    """
+    if not user_id:
+        return ANONYMOUS_TENANT
+    if _TENANT_NAME.match(user_id):
+        return f"u-{user_id}"
+    return "h-" + hashlib.sha256(user_id.encode("utf-8")).hexdigest()[:40]
+
+
+def active_tenants(session_factory: Callable, since: datetime) -> set:
+    """Tenants com mensagens no chat_history desde `since`"""
+    db = session_factory()
+    try:
+        rows = (
+            db.query(ChatHistory.user_id)
+            .filter(ChatHistory.timestamp >= since)
+            .group_by(ChatHistory.user_id)
+            .all()
+        )
+        return {tenant_for(user_id) for (user_id,) in rows}
+    finally:
+        db.close()
+
+
+class WeaviateTenantRegistry:
+    """
+    Ativação preguiçosa e descarga dos tenants de uma coleção do Weaviate
+
+    - ensure_active(): cria o tenant ou passa-o a HOT na primeira utilização
+      deste worker (depois fica em cache)
+    - offload_idle(): passa a COLD os tenants HOT sem atividade recente; é
+      idempotente, por isso vários workers podem executá-lo em simultâneo
+    """
+
+    def __init__(self, client_factory: Optional[Callable] = None,
+                 collection_name: str = TENANT_MEMORY_COLLECTION,
+                 session_factory: Callable = SessionLocal,
+                 idle_seconds: float = TENANT_IDLE_SECONDS,
+                 sweep_interval: float = TENANT_SWEEP_INTERVAL):
+        if client_factory is None:
+            from .weaviate_client import get_weaviate_client
+            client_factory = get_weaviate_client
+        self.client_factory = client_factory
+        self.collection_name = collection_name
+        self.session_factory = session_factory
+        self.idle_seconds = idle_seconds
+        self.sweep_interval = sweep_interval
+
+        self._hot: set = set()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.activations = 0
+        self.offloaded = 0
+
+    def ensure_active(self, tenant: str):
+        """Garante que o tenant existe e está HOT antes de ler ou escrever"""
+        if tenant in self._hot:
+            return
+        from weaviate.schema.crud_schema import Tenant, TenantActivityStatus
+
+        schema = self.client_factory().schema
+        with self._lock:
+            if tenant in self._hot:
+                return
+            try:
+                schema.update_class_tenants(self.collection_name, [Tenant(tenant, TenantActivityStatus.HOT)])
+            except Exception:
+                # Tenant ainda não existe
+                schema.add_class_tenants(self.collection_name, [Tenant(tenant)])
+            self._hot.add(tenant)
+            self.activations += 1
+            logger.info(f"🔥 Tenant {tenant} ativo em {self.collection_name}")
+
+    def forget(self, tenant: str):
+        """Esquece o estado em cache (ex.: outro worker descarregou o tenant)"""
+        with self._lock:
+            self._hot.discard(tenant)
+
+    def offload_idle(self) -> List[str]:
+        """Passa a COLD os tenants HOT sem mensagens nos últimos `idle_seconds`"""
+        from weaviate.schema.crud_schema import Tenant, TenantActivityStatus
+
+        schema = self.client_factory().schema
+        hot = [
+            tenant.name for tenant in schema.get_class_tenants(self.collection_name)
+            if tenant.activity_status == TenantActivityStatus.HOT
+        ]
+        recent = active_tenants(self.session_factory, datetime.utcnow() - timedelta(seconds=self.idle_seconds))
+        idle = [tenant for tenant in hot if tenant not in recent]
+
+        for start in range(0, len(idle), _UPDATE_CHUNK):
+            chunk = idle[start:start + _UPDATE_CHUNK]
+            schema.update_class_tenants(
+                self.collection_name, [Tenant(tenant, TenantActivityStatus.COLD) for tenant in chunk]
+            )
+        with self._lock:
+            for tenant in idle:
+                self._hot.discard(tenant)
+        self.offloaded += len(idle)
+        if idle:
+            logger.info(f"🧊 {len(idle)} tenants inativos descarregados de {self.collection_name}")
+        return idle
+
+    def start(self):
+        """Inicia a descarga periódica em background (idempotente)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="tenant-offload", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        self._stop_event.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def stats(self) -> Dict:
+        return {
+            "collection_name": self.collection_name,
+            "hot_tenants_cached": len(self._hot),
+            "activations": self.activations,
+            "offloaded": self.offloaded,
+        }
+
+    def _run(self):
+        while not self._stop_event.wait(self.sweep_interval):
+            try:
+                self.offload_idle()
+            except Exception as e:
+                logger.error(f"❌ Erro ao descarregar tenants inativos: {e}")
+
+
+# Registo global do processo
+_tenant_registry: Optional[WeaviateTenantRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_tenant_registry() -> WeaviateTenantRegistry:
+    """
+    Obtém o registo de tenants do Weaviate do worker
+
+    Returns:
+        WeaviateTenantRegistry: Instância partilhada
+    """
+    global _tenant_registry
+
+    if _tenant_registry is None:
+        with _registry_lock:
+            if _tenant_registry is None:
+                _tenant_registry = WeaviateTenantRegistry()
+
+    return _tenant_registry
+
+
+def stop_tenant_registry():
+    """Pára a descarga periódica de tenants (shutdown)"""
+    global _tenant_registry
+
+    with _registry_lock:
+        registry, _tenant_registry = _tenant_registry, None
+    if registry is not None:
+        registry.stop()
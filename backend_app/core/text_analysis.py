@@ -0,0 +1,62 @@
+"""
+Análise de Texto para Pesquisa por Palavras-chave
+Extração de palavras-chave reutilizável com stopwords e expressões pré-compiladas
+"""
+
+import re
+from typing import Iterable, List
+
+# Palavras muito comuns em português que não ajudam a encontrar memórias
+PORTUGUESE_STOPWORDS = frozenset({
+    'a', 'o', 'e', 'é', 'de', 'da', 'do', 'em', 'um', 'uma', 'com', 'para',
+    'por', 'que', 'qual', 'quem', 'como', 'quando', 'onde', 'porque', 'minha',
+    'meu', 'sua', 'seu', 'são', 'está', 'estão'
+})
+
+# Sequências de letras/dígitos (Unicode), ignorando pontuação como "?" ou ","
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+class KeywordAnalyzer:
+    """
+    Extrai palavras-chave de uma pergunta para pesquisa BM25
+
+    O padrão de tokenização é compilado uma vez e as stopwords ficam num
+    frozenset, pelo que a mesma instância pode ser partilhada entre pedidos.
+    """
+
+    def __init__(self, stopwords: Iterable[str] = PORTUGUESE_STOPWORDS, min_length: int = 3):
+        """
+        Args:
+            stopwords: Palavras a ignorar (comparadas em minúsculas)
+            min_length: Comprimento mínimo de uma palavra-chave
+        """
+        self.stopwords = frozenset(word.lower() for word in stopwords)
+        self.min_length = min_length
+
+    def tokenize(self, text: str) -> List[str]:
+        """Divide o texto em tokens em minúsculas"""
+        return _TOKEN_PATTERN.findall(text.lower())
+
+    def extract_keywords(self, text: str) -> List[str]:
+        """
+        Devolve as palavras-chave do texto, sem repetições e pela ordem original
+
+        Args:
+            text: Texto da pergunta
+
+        Returns:
+            Lista de palavras-chave
+        """
+        keywords = []
+        seen = set()
+        for token in self.tokenize(text):
+            if len(token) < self.min_length or token in self.stopwords or token in seen:
+                continue
+            seen.add(token)
+            keywords.append(token)
+        return keywords
+
+
+# Analisador partilhado para as pesquisas de memória em português
+portuguese_analyzer = KeywordAnalyzer()
@@ -3,7 +3,7 @@ Database models for Ethic Companion V2
 SQLAlchemy models for PostgreSQL database
 """
 
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, create_engine
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, Index, create_engine, false, inspect, text
 from sqlalchemy.orm import declarative_base, sessionmaker
 from datetime import datetime
 import os
@@ -18,16 +18,55 @@ class ChatHistory(Base):
     __tablename__ = "chat_history"
     
     id = Column(Integer, primary_key=True, index=True)
-    session_id = Column(String(255), nullable=False, index=True)
+    session_id = Column(String(255), nullable=False)
+    user_id = Column(String(255), nullable=True)  # Memory tenant; NULL for anonymous sessions
+    sequence = Column(Integer, nullable=True)  # Monotonic position within the session
     message_type = Column(String(50), nullable=False)  # 'user' or 'assistant'
     user_message = Column(Text, nullable=True)  # For user messages
     assistant_message = Column(Text, nullable=True)  # For assistant responses
     timestamp = Column(DateTime, default=datetime.utcnow, nullable=False)
-    processed = Column(Boolean, default=False)  # For tracking if stored in vector DB
+    processed = Column(Boolean, default=False, server_default=false())  # For tracking if stored in vector DB
+    claimed_at = Column(DateTime, nullable=True)  # Outbox batch reservation (expires if the worker dies)
+    
+    __table_args__ = (
+        # History reads are range scans on (session_id, sequence) in index order;
+        # only the small columns are included (message text can exceed the btree row limit)
+        Index(
+            "ix_chat_history_session_sequence",
+            "session_id",
+            "sequence",
+            unique=True,
+            postgresql_include=["message_type", "timestamp"],
+        ),
+        # Partial index: the outbox indexer only ever scans rows still waiting for Weaviate
+        Index(
+            "ix_chat_history_pending",
+            "id",
+            postgresql_where=text("processed = false"),
+            sqlite_where=text("processed = 0"),
+        ),
+        # Last activity per user, used to offload idle memory tenants
+        Index("ix_chat_history_user_timestamp", "user_id", "timestamp"),
+    )
     
     def __repr__(self):
         return f"<ChatHistory(id={self.id}, session={self.session_id}, type={self.message_type})>"
 
+class SessionSummary(Base):
+    """
+    Rolling summary of a session's older turns
+    Covers every chat_history message up to last_sequence; newer turns are sent verbatim
+    """
+    __tablename__ = "session_summaries"
+    
+    session_id = Column(String(255), primary_key=True)
+    summary = Column(Text, nullable=False)
+    last_sequence = Column(Integer, nullable=False)  # Last chat_history.sequence folded into the summary
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f"<SessionSummary(session={self.session_id}, last_sequence={self.last_sequence})>"
+
 # Database configuration
 def get_database_url():
     """
@@ -50,9 +89,49 @@ engine = create_engine(
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-def create_tables():
-    """Create all database tables"""
-    Base.metadata.create_all(bind=engine)
+def create_tables(bind=engine):
+    """Create all database tables and apply additive schema upgrades"""
+    Base.metadata.create_all(bind=bind)
+    _ensure_columns(bind)
+    _ensure_indexes(bind)
+
+def _ensure_columns(bind):
+    """
+    Add columns introduced after the tables were first created
+    Existing chat_history rows get their per-session sequence backfilled
+    (rows written before user_id existed stay anonymous)
+    """
+    existing = {column["name"] for column in inspect(bind).get_columns("chat_history")}
+
+    if "sequence" not in existing:
+        with bind.begin() as connection:
+            connection.execute(text("ALTER TABLE chat_history ADD COLUMN sequence INTEGER"))
+            connection.execute(text("""
+                UPDATE chat_history
+                SET sequence = ranked.sequence
+                FROM (
+                    SELECT id, ROW_NUMBER() OVER (PARTITION BY session_id ORDER BY timestamp, id) AS sequence
+                    FROM chat_history
+                ) AS ranked
+                WHERE chat_history.id = ranked.id
+            """))
+
+    if "user_id" not in existing:
+        with bind.begin() as connection:
+            connection.execute(text("ALTER TABLE chat_history ADD COLUMN user_id VARCHAR(255)"))
+
+    if "claimed_at" not in existing:
+        with bind.begin() as connection:
+            connection.execute(text("ALTER TABLE chat_history ADD COLUMN claimed_at TIMESTAMP"))
+
+def _ensure_indexes(bind):
+    """
+    Create indexes added after the tables were first created
+    (create_all only creates indexes together with new tables)
+    """
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
 
 def get_db():
     """
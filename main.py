@@ -1,6 +1,16 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from backend_app.api import router
+from backend_app.core.memory import close_vector_memory
+from backend_app.core.executors import shutdown_executors
+from backend_app.core.group_commit import stop_chat_history_writer
+from backend_app.core.embeddings import get_embedding_batcher, stop_embedding_pipeline
+from backend_app.core.intent_router import stop_route_batcher
+from backend_app.core.session_summaries import stop_session_summarizer
+from backend_app.core.memory_backends import close_memory_backend, uses_weaviate
+from backend_app.core.outbox_indexer import stop_outbox_indexer
+from backend_app.core.tenancy import MEMORY_MULTI_TENANCY, get_tenant_registry, stop_tenant_registry
 from backend_app.core.config import load_api_keys, validate_api_keys
 from backend_app.models.database import create_tables
 import logging
@@ -31,10 +41,36 @@ try:
 except Exception as e:
     logger.error(f"❌ Erro ao inicializar database: {e}")
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Gere recursos partilhados do worker (arranque e encerramento)"""
+    try:
+        # Escolher já o fornecedor de embeddings (o aviso de recurso aparece no arranque)
+        get_embedding_batcher()
+    except Exception as e:
+        logger.error(f"❌ Fornecedor de embeddings indisponível: {e}")
+        # Continuar mesmo com erro: as rotas sem memória não dependem dele
+    if MEMORY_MULTI_TENANCY and uses_weaviate():
+        # Descarregar periodicamente os tenants sem atividade recente
+        get_tenant_registry().start()
+    yield
+    # Fechar a ligação Weaviate partilhada do worker
+    close_vector_memory()
+    stop_chat_history_writer()
+    stop_outbox_indexer()
+    stop_tenant_registry()
+    stop_session_summarizer()
+    stop_route_batcher()
+    close_memory_backend()
+    stop_embedding_pipeline()
+    shutdown_executors()
+    logger.info("🔒 Ligações partilhadas fechadas")
+
 app = FastAPI(
     title="Chat Application API",
     description="API para aplicação de chat",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configurar CORS
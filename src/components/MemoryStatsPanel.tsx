@@ -8,7 +8,7 @@ import { ChatResponse } from '../hooks/useHybridMemoryChat';
 
 interface MemoryStatsProps {
   memoryStats: {
-    stats: ChatResponse['memory_stats'];
+    stats: NonNullable<ChatResponse['memory_stats']>;
     status: string;
   } | null;
   contextInfo: ChatResponse['context_used'] | null;
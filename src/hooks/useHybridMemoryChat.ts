@@ -25,16 +25,29 @@ export interface Message {
   isComplete?: boolean;   // Nova propriedade para indicar se está completa
 }
 
+// Versão do protocolo de streaming pedida ao backend (v2 = apenas deltas)
+const STREAM_PROTOCOL_VERSION = 2;
+
 export interface StreamChunk {
-  type: 'metadata' | 'context' | 'content' | 'complete' | 'error';
+  type: 'metadata' | 'context' | 'content' | 'delta' | 'complete' | 'error';
+  protocol?: number;
   chunk?: string;
   accumulated?: string;
+  seq?: number;
+  delta?: string;
+  seq_count?: number;
+  length?: number;
+  sha256?: string;
   session_id?: string;
   timestamp?: string;
   context_info?: any;
   memory_stats?: any;
   final_response?: string;
   message?: string;
+  metrics?: {
+    time_to_first_token: number;
+    total_time: number;
+  };
 }
 
 export interface ChatResponse {
@@ -48,7 +61,7 @@ export interface ChatResponse {
     has_recent: boolean;
     has_semantic: boolean;
   };
-  memory_stats: {
+  memory_stats?: {
     postgresql: {
       total_messages: number;
       unique_sessions: number;
@@ -63,7 +76,7 @@ export interface ChatResponse {
 }
 
 export interface MemoryStats {
-  stats: ChatResponse['memory_stats'];
+  stats: NonNullable<ChatResponse['memory_stats']>;
   status: string;
 }
 
@@ -72,6 +85,7 @@ export interface ChatHookOptions {
   sessionId?: string;
   contextMode?: 'hybrid' | 'recent_only' | 'semantic_only' | 'none';
   autoGenerateSessionId?: boolean;
+  includeMemoryStats?: boolean;  // Pedir estatísticas de memória em cada resposta
 }
 
 export interface ChatHookReturn {
@@ -102,12 +116,34 @@ export interface ChatHookReturn {
 
 const DEFAULT_API_BASE = 'http://localhost:8000';
 
+// SHA-256 em hexadecimal (null se a Web Crypto API não estiver disponível)
+async function sha256Hex(text: string): Promise<string | null> {
+  if (typeof crypto === 'undefined' || !crypto.subtle) return null;
+  const digest = await crypto.subtle.digest('SHA-256', new TextEncoder().encode(text));
+  return Array.from(new Uint8Array(digest))
+    .map(byte => byte.toString(16).padStart(2, '0'))
+    .join('');
+}
+
+// Verifica se o texto reconstruído a partir dos deltas corresponde ao enviado
+async function verifyStreamedText(text: string, chunk: StreamChunk): Promise<boolean> {
+  if (chunk.length !== undefined && Array.from(text).length !== chunk.length) {
+    return false;
+  }
+  if (chunk.sha256) {
+    const digest = await sha256Hex(text);
+    if (digest !== null && digest !== chunk.sha256) return false;
+  }
+  return true;
+}
+
 export function useHybridMemoryChat(options: ChatHookOptions = {}): ChatHookReturn {
   const {
     apiBaseUrl = DEFAULT_API_BASE,
     sessionId: initialSessionId,
     contextMode: initialContextMode = 'hybrid',
-    autoGenerateSessionId = true
+    autoGenerateSessionId = true,
+    includeMemoryStats = false
   } = options;
 
   // Estados principais
@@ -200,6 +236,8 @@ export function useHybridMemoryChat(options: ChatHookOptions = {}): ChatHookRetu
           message: messageText,
           session_id: sessionId,
           context_mode: contextMode,
+          stream_protocol: STREAM_PROTOCOL_VERSION,
+          include_stats: includeMemoryStats,
         }),
       });
 
@@ -207,6 +245,12 @@ export function useHybridMemoryChat(options: ChatHookOptions = {}): ChatHookRetu
         throw new Error(`HTTP ${response.status}: ${response.statusText}`);
       }
 
+      // Estado do protocolo negociado (servidores antigos não anunciam versão)
+      let protocol = 1;
+      let streamedText = '';
+      let expectedSeq = 0;
+      let streamCorrupted = false;
+
       const reader = response.body?.getReader();
       if (!reader) {
         throw new Error('Stream não disponível');
@@ -231,6 +275,7 @@ export function useHybridMemoryChat(options: ChatHookOptions = {}): ChatHookRetu
               
               switch (chunk.type) {
                 case 'metadata':
+                  protocol = chunk.protocol || 1;
                   if (chunk.session_id && chunk.session_id !== sessionId) {
                     setSessionId(chunk.session_id);
                   }
@@ -243,21 +288,45 @@ export function useHybridMemoryChat(options: ChatHookOptions = {}): ChatHookRetu
                   break;
 
                 case 'content':
-                  // Atualizar mensagem com novo chunk
+                  // Protocolo v1: chunk + texto acumulado
+                  streamedText = chunk.accumulated || streamedText + (chunk.chunk || '');
+                  setMessages(prev => prev.map(msg => 
+                    msg.id === assistantMessageId 
+                      ? { ...msg, text: streamedText }
+                      : msg
+                  ));
+                  break;
+
+                case 'delta':
+                  // Protocolo v2: apenas o delta, com número de sequência
+                  if (chunk.seq !== expectedSeq) {
+                    streamCorrupted = true;
+                  }
+                  expectedSeq = (chunk.seq ?? expectedSeq) + 1;
+                  streamedText += chunk.delta || '';
                   setMessages(prev => prev.map(msg => 
                     msg.id === assistantMessageId 
-                      ? { ...msg, text: chunk.accumulated || msg.text + (chunk.chunk || '') }
+                      ? { ...msg, text: streamedText }
                       : msg
                   ));
                   break;
 
                 case 'complete':
+                  if (protocol >= 2) {
+                    const verified = !streamCorrupted
+                      && chunk.seq_count === expectedSeq
+                      && await verifyStreamedText(streamedText, chunk);
+                    if (!verified) {
+                      setError('A resposta recebida está incompleta. Tenta novamente.');
+                    }
+                  }
+
                   // Finalizar mensagem
                   setMessages(prev => prev.map(msg => 
                     msg.id === assistantMessageId 
                       ? { 
                           ...msg, 
-                          text: chunk.final_response || msg.text,
+                          text: chunk.final_response || streamedText || msg.text,
                           isStreaming: false,
                           isComplete: true,
                           timestamp: new Date(chunk.timestamp || Date.now()),
@@ -320,7 +389,7 @@ export function useHybridMemoryChat(options: ChatHookOptions = {}): ChatHookRetu
       setIsLoading(false);
       abortControllerRef.current = null;
     }
-  }, [apiBaseUrl, sessionId, contextMode, isLoading]);
+  }, [apiBaseUrl, sessionId, contextMode, isLoading, includeMemoryStats]);
 
   // Função original (fallback)
   const sendMessage = useCallback(async (messageText: string) => {
@@ -358,6 +427,7 @@ export function useHybridMemoryChat(options: ChatHookOptions = {}): ChatHookRetu
           message: messageText,
           session_id: sessionId,
           context_mode: contextMode,
+          include_stats: includeMemoryStats,
         }),
       });
 
@@ -408,7 +478,7 @@ export function useHybridMemoryChat(options: ChatHookOptions = {}): ChatHookRetu
       setIsLoading(false);
       abortControllerRef.current = null;
     }
-  }, [sessionId, contextMode, isLoading, makeApiRequest]);
+  }, [sessionId, contextMode, isLoading, makeApiRequest, includeMemoryStats]);
 
   // Função para obter estatísticas de memória
   const refreshMemoryStats = useCallback(async () => {
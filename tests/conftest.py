@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Fixtures partilhadas pelos testes (SQLite em memória e relógio simulado)
+"""
+
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from backend_app.models.database import Base
+
+
+class FakeClock:
+    """Relógio monotónico controlado pelo teste (avança com `now += segundos`)"""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def sqlite_engine():
+    """Base de dados SQLite em memória, partilhada por todas as threads do teste"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session_factory(sqlite_engine):
+    """sessionmaker sobre o esquema completo da aplicação"""
+    Base.metadata.create_all(bind=sqlite_engine)
+    return sessionmaker(bind=sqlite_engine)
+
+
+@pytest.fixture
+def fake_clock():
+    return FakeClock()
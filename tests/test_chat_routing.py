@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Testes do encaminhamento do /chat: a classificação e a pesquisa usam só a
+pergunta do utilizador, o contexto vai apenas para o prompt da resposta
+(especialistas simulados)
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from backend_app.api import chat
+
+CONTEXT = "## Conversa recente\nU: Falámos sobre Kant\nA: Sim, sobre o imperativo categórico"
+
+
+def test_web_route_gets_the_raw_question_and_the_context_separately(monkeypatch):
+    calls = []
+
+    async def fake_web_search(question, context=""):
+        calls.append((question, context))
+        return "resposta web"
+
+    monkeypatch.setattr(chat, "execute_web_search", fake_web_search)
+    reply = asyncio.run(chat.process_with_context("Quem é o presidente do Brasil?", CONTEXT))
+
+    assert reply == "resposta web"
+    assert calls == [("Quem é o presidente do Brasil?", CONTEXT)]
+
+
+def test_memory_route_is_classified_without_the_context(monkeypatch):
+    questions = []
+
+    async def fake_memory_search(question):
+        questions.append(question)
+        return "resposta da memória"
+
+    async def unexpected_web_search(question, context=""):
+        raise AssertionError("a pergunta não devia ir para a web")
+
+    monkeypatch.setattr(chat, "execute_memory_search", fake_memory_search)
+    monkeypatch.setattr(chat, "execute_web_search", unexpected_web_search)
+    # O contexto fala de notícias de hoje, mas só a pergunta é classificada
+    reply = asyncio.run(chat.process_with_context("Lembras-te do que te contei?", "notícias de hoje, 2024"))
+
+    assert reply == "resposta da memória"
+    assert questions == ["Lembras-te do que te contei?"]
+
+
+def test_answer_prompt_carries_the_context():
+    prompt = chat.web_search_prompt.format(question="Quem?", context=CONTEXT, search_results="1. x")
+    assert CONTEXT in prompt and "Question: Quem?" in prompt
+    assert chat.with_context("Responda", "") == "Responda"
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Testes da montagem do contexto de memória com orçamento de tokens
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from backend_app.core.context_assembler import (
+    ELISION, MEMORIES_HEADER, RECENT_HEADER, ContextAssembler, analyze_context, estimate_tokens
+)
+
+
+def _history(turns, length=40):
+    messages = []
+    for i in range(turns):
+        messages.append({"type": "user", "content": f"pergunta {i} " + "x" * length})
+        messages.append({"type": "assistant", "content": f"resposta {i} " + "y" * length})
+    return messages
+
+
+def _memories(count):
+    return [
+        {"session_id": f"s{i}", "user_message": f"memória {i}", "assistant_message": "ok"}
+        for i in range(count)
+    ]
+
+
+def test_context_never_exceeds_the_budget():
+    assembler = ContextAssembler(max_tokens=200, max_message_tokens=60, memory_reserve_tokens=50)
+    assembled = assembler.assemble(_history(50, length=300), _memories(20))
+
+    assert estimate_tokens(assembled.text) <= 200
+    assert assembled.total_tokens <= 200
+    assert assembled.sections["recent"] > 0 and assembled.sections["memories"] > 0
+    assert assembled.dropped > 0
+
+
+def test_recent_turns_are_kept_newest_first_without_gaps():
+    assembler = ContextAssembler(max_tokens=80, memory_reserve_tokens=0)
+    assembled = assembler.assemble(_history(10), [])
+
+    lines = assembled.text.splitlines()
+    assert lines[0] == RECENT_HEADER
+    # O turno mais recente fica sempre e a ordem continua cronológica
+    assert lines[-1].startswith("A: resposta 9")
+    numbers = [int(line.split()[2]) for line in lines[1:]]
+    assert numbers == sorted(numbers) and numbers[-1] == 9
+    assert MEMORIES_HEADER not in assembled.text
+
+
+def test_memories_follow_search_rank_and_use_the_reserve():
+    assembler = ContextAssembler(max_tokens=120, memory_reserve_tokens=40)
+    assembled = assembler.assemble(_history(20), _memories(10))
+
+    memory_lines = assembled.text.split(MEMORIES_HEADER)[1].strip().splitlines()
+    assert memory_lines[0].startswith("- U: memória 0 → A: ok")
+    assert [line.split()[3] for line in memory_lines] == [str(i) for i in range(len(memory_lines))]
+
+
+def test_long_messages_keep_head_and_tail():
+    assembler = ContextAssembler(max_tokens=500, max_message_tokens=30)
+    long_message = "início " + "palavra " * 200 + "fim"
+    assembled = assembler.assemble([{"type": "user", "content": long_message}], [])
+
+    line = assembled.text.splitlines()[1]
+    assert ELISION in line and line.startswith("U: início") and line.endswith("fim")
+    assert estimate_tokens(line) <= 30
+    assert assembled.elided == 1
+
+
+def test_empty_context_and_analysis():
+    assembler = ContextAssembler()
+    assert assembler.assemble([], []).text == ""
+
+    assembled = assembler.assemble(_history(2), _memories(3) + ["texto simples"])
+    analysis = analyze_context(assembled.text)
+    assert analysis["recent_count"] == assembled.recent_count == 2
+    assert analysis["semantic_count"] == assembled.semantic_count == 4
+    assert analysis["tokens"]["recent"] > 0 and analysis["tokens"]["memories"] > 0
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Testes da cache de embeddings por hash de conteúdo
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from backend_app.core.embeddings import (
+    DiskEmbeddingTable, EmbeddingBatcher, EmbeddingCache, QueryEmbedder, content_key
+)
+
+
+class CountingProvider:
+    name = "teste:modelo"
+
+    def __init__(self):
+        self.calls = []
+
+    def embed(self, texts):
+        self.calls.append(list(texts))
+        return [np.full(4, len(text), dtype=np.float32) for text in texts]
+
+
+def test_repeated_questions_are_embedded_once():
+    provider = CountingProvider()
+    embedder = QueryEmbedder(batcher=EmbeddingBatcher(provider, window_ms=1),
+                             cache=EmbeddingCache(provider.name, disk_dir=None))
+
+    first = embedder.embed_query("Como me chamo?")
+    second = embedder.embed_query("  Como me   chamo? ")
+
+    assert provider.calls == [["Como me chamo?"]]
+    assert np.array_equal(first, second)
+    stats = embedder.stats()
+    assert stats["memory_hits"] == 1
+    assert stats["hit_ratio"] == 0.5
+    assert stats["memory_bytes"] == 16
+
+
+def test_keys_depend_on_model():
+    assert content_key("modelo-a", "olá") != content_key("modelo-b", "olá")
+
+
+def test_lru_evicts_oldest_vectors():
+    cache = EmbeddingCache("teste", max_entries=2, disk_dir=None)
+    for text in ("a", "b", "c"):
+        cache.put(content_key("teste", text), np.zeros(4, dtype=np.float32))
+
+    assert cache.get(content_key("teste", "a")) is None
+    assert cache.get(content_key("teste", "c")) is not None
+    assert cache.stats()["entries"] == 2
+
+
+def test_disk_tier_survives_restarts(tmp_path):
+    provider = CountingProvider()
+    cache = EmbeddingCache(provider.name, disk_dir=str(tmp_path), disk_slots=64)
+    vector = cache.get_or_compute("Gosto de filosofia", provider.embed)
+    cache.flush()
+
+    # Nova instância (outro worker ou reinício): a memória está vazia, o disco não
+    restarted = EmbeddingCache(provider.name, disk_dir=str(tmp_path), disk_slots=64)
+    cached = restarted.get_or_compute("Gosto de filosofia", provider.embed)
+
+    assert len(provider.calls) == 1
+    assert np.array_equal(vector, cached)
+    assert restarted.stats()["disk_hits"] == 1
+    assert restarted.stats()["disk_bytes"] == 64 * 32 + 64 * 4 * 4 + 64 * 8
+
+
+def test_disk_table_rejects_torn_or_foreign_slots(tmp_path):
+    table = DiskEmbeddingTable(str(tmp_path), "teste", dimensions=4, slots=8)
+    key = content_key("teste", "Gosto de filosofia")
+    table.put(key, np.ones(4, dtype=np.float32))
+    assert np.array_equal(table.get(key), np.ones(4))
+
+    # Vetor reescrito sem o checksum correspondente (escrita a meio noutro worker)
+    slot = next(slot for slot in range(8) if table.keys[slot].any())
+    table.vectors[slot] = np.zeros(4, dtype=np.float32)
+    assert table.get(key) is None
+
+
+def test_full_probe_window_keeps_every_key_consistent(tmp_path):
+    table = DiskEmbeddingTable(str(tmp_path), "teste", dimensions=2, slots=4)
+    keys = [content_key("teste", f"pergunta {i}") for i in range(20)]
+    for i, key in enumerate(keys):
+        table.put(key, np.full(2, i, dtype=np.float32))
+
+    # Com a tabela cheia há substituições, mas nenhuma chave devolve o vetor de outra
+    for i, key in enumerate(keys):
+        vector = table.get(key)
+        assert vector is None or np.array_equal(vector, np.full(2, i))
+    assert sum(table.get(key) is not None for key in keys) == 4
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Testes do pipeline de embeddings (fornecedores e agrupamento em lotes)
+"""
+
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from backend_app.core import embeddings
+from backend_app.core.batching import MicroBatcher
+from backend_app.core.embeddings import (
+    EmbeddingBatcher, HashingEmbeddingProvider, create_embedding_provider
+)
+
+
+class RecordingProvider:
+    name = "teste:lotes"
+
+    def __init__(self):
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def embed(self, texts):
+        with self.lock:
+            self.batches.append(list(texts))
+        return [np.full(3, len(text), dtype=np.float32) for text in texts]
+
+
+def test_concurrent_texts_share_provider_calls():
+    provider = RecordingProvider()
+    batcher = EmbeddingBatcher(provider, window_ms=100, max_batch=64)
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(lambda i: batcher.embed([f"texto {i % 4}"])[0], range(16)))
+    batcher.stop()
+
+    assert [int(vector[0]) for vector in results] == [len("texto 0")] * 16
+    assert len(provider.batches) < 16
+    # Textos repetidos no mesmo lote só são calculados uma vez
+    assert all(len(batch) == len(set(batch)) for batch in provider.batches)
+    assert batcher.stats()["items"] == 16
+
+
+def test_batches_respect_the_size_limit():
+    provider = RecordingProvider()
+    batcher = EmbeddingBatcher(provider, window_ms=200, max_batch=4)
+
+    vectors = batcher.embed([f"frase {i}" for i in range(10)])
+    batcher.stop()
+
+    assert len(vectors) == 10
+    assert max(len(batch) for batch in provider.batches) <= 4
+
+
+def test_provider_errors_reach_every_caller():
+    def failing(items):
+        raise ConnectionError("fornecedor indisponível")
+
+    batcher = MicroBatcher(failing, window_ms=50, max_batch=8)
+    futures = [batcher.submit(i) for i in range(3)]
+
+    for future in futures:
+        with pytest.raises(ConnectionError):
+            future.result(timeout=5)
+    assert batcher.stats()["failed_batches"] >= 1
+    batcher.stop()
+
+
+def test_hashing_provider_is_deterministic_and_lexical():
+    provider = HashingEmbeddingProvider(dimensions=256)
+    ethics, ethics_again, weather = provider.embed([
+        "A ética de Kant e o imperativo categórico",
+        "Kant: ética e imperativo categórico",
+        "Vai chover amanhã em Lisboa",
+    ])
+
+    assert ethics.shape == (256,)
+    assert np.isclose(np.linalg.norm(ethics), 1.0)
+    assert np.array_equal(ethics, provider.embed(["A ética de Kant e o imperativo categórico"])[0])
+    assert float(ethics @ ethics_again) > float(ethics @ weather)
+
+
+def test_unknown_provider_is_rejected():
+    assert create_embedding_provider("hashing").name.startswith("hashing:")
+    with pytest.raises(ValueError):
+        create_embedding_provider("inexistente")
+
+
+def test_remote_providers_require_their_api_key(monkeypatch):
+    monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+    with pytest.raises(ValueError, match="GOOGLE_API_KEY"):
+        create_embedding_provider("gemini")
+
+    monkeypatch.setenv("GOOGLE_API_KEY", "chave-de-teste")
+    assert create_embedding_provider("gemini").name.startswith("gemini:")
+
+
+def test_missing_api_key_falls_back_to_hashing(monkeypatch):
+    monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+    monkeypatch.setattr(embeddings, "EMBEDDING_PROVIDER", "gemini")
+    monkeypatch.setattr(embeddings, "_embedding_batcher", None)
+    monkeypatch.setattr(embeddings, "_query_embedder", None)
+
+    try:
+        assert embeddings.get_embedding_batcher().provider.name.startswith("hashing:")
+    finally:
+        embeddings.stop_embedding_pipeline()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Testes do escritor group commit do chat_history
+(SQLite em memória)
+"""
+
+import asyncio
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import inspect, text
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from backend_app.core import memory_manager
+from backend_app.core.group_commit import GroupCommitWriter
+from backend_app.core.session_cache import RecentHistoryCache
+from backend_app.models.database import ChatHistory, create_tables
+
+
+class CountingSession:
+    """Envolve uma sessão SQLAlchemy e conta os commits"""
+
+    commits = 0
+
+    def __init__(self, session):
+        self.session = session
+
+    def execute(self, *args, **kwargs):
+        return self.session.execute(*args, **kwargs)
+
+    def commit(self):
+        CountingSession.commits += 1
+        self.session.commit()
+
+    def rollback(self):
+        self.session.rollback()
+
+    def close(self):
+        self.session.close()
+
+
+def test_concurrent_turns_share_one_commit(session_factory):
+    CountingSession.commits = 0
+    writer = GroupCommitWriter(session_factory=lambda: CountingSession(session_factory()), window_ms=200)
+
+    futures = [
+        writer.submit(f"s{i}", f"pergunta {i}", f"resposta {i}", datetime(2024, 1, 1))
+        for i in range(10)
+    ]
+    for future in futures:
+        future.result(timeout=5)
+    writer.stop()
+
+    db = session_factory()
+    rows = db.query(ChatHistory).order_by(ChatHistory.id).all()
+    assert len(rows) == 20
+    assert [(row.message_type, row.processed) for row in rows[:2]] == [("user", False), ("assistant", False)]
+    assert rows[1].assistant_message == "resposta 0"
+    assert CountingSession.commits == 1
+    assert writer.stats()["avg_batch_size"] == 10
+
+
+def test_blocking_writes_from_threads_are_acknowledged(session_factory):
+    writer = GroupCommitWriter(session_factory=session_factory, window_ms=20)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(
+            lambda i: writer.write("s1", f"pergunta {i}", f"resposta {i}", datetime(2024, 1, 1)),
+            range(16)
+        ))
+    writer.stop()
+
+    assert session_factory().query(ChatHistory).count() == 32
+    assert writer.stats()["batches"] < 16
+
+
+def test_legacy_async_saves_join_one_batch(session_factory, monkeypatch):
+    CountingSession.commits = 0
+    writer = GroupCommitWriter(session_factory=lambda: CountingSession(session_factory()), window_ms=100)
+    monkeypatch.setattr(memory_manager, "get_chat_history_writer", lambda: writer)
+
+    manager = memory_manager.MemoryManager.__new__(memory_manager.MemoryManager)
+    manager.history_cache = RecentHistoryCache()
+    manager.summarizer = SimpleNamespace(schedule=lambda session_id: None)
+    manager._save_to_weaviate = lambda *args: True
+
+    async def scenario():
+        return await asyncio.gather(*[
+            manager.add_message_async(f"s{i}", f"pergunta {i}", f"resposta {i}") for i in range(5)
+        ])
+
+    # Pedidos do mesmo event loop esperam juntos pelo mesmo commit
+    assert asyncio.run(scenario()) == [True] * 5
+    writer.stop()
+    assert session_factory().query(ChatHistory).count() == 10
+    assert CountingSession.commits == 1
+
+
+def test_bad_turn_does_not_fail_the_rest_of_the_batch(session_factory):
+    writer = GroupCommitWriter(session_factory=session_factory, window_ms=200)
+
+    good = writer.submit("s1", "olá", "olá!", datetime(2024, 1, 1))
+    bad = writer.submit(None, "sem sessão", "erro", datetime(2024, 1, 1))  # session_id é NOT NULL
+
+    good.result(timeout=5)
+    with pytest.raises(Exception):
+        bad.result(timeout=5)
+    writer.stop()
+
+    assert session_factory().query(ChatHistory).count() == 2
+
+
+def test_sequences_are_monotonic_per_session_across_batches(session_factory):
+    writer = GroupCommitWriter(session_factory=session_factory, window_ms=50)
+
+    writer.write("s1", "a", "b", datetime(2024, 1, 1))
+    first = [writer.submit(session, "c", "d", datetime(2024, 1, 1)) for session in ("s1", "s2", "s1")]
+    for future in first:
+        future.result(timeout=5)
+    writer.stop()
+
+    db = session_factory()
+    sequences = [
+        (row.session_id, row.sequence)
+        for row in db.query(ChatHistory).order_by(ChatHistory.session_id, ChatHistory.sequence)
+    ]
+    assert sequences == [("s1", 1), ("s1", 2), ("s1", 3), ("s1", 4), ("s1", 5), ("s1", 6), ("s2", 1), ("s2", 2)]
+
+
+def test_schema_upgrade_backfills_sequences(sqlite_engine):
+    with sqlite_engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE chat_history (id INTEGER PRIMARY KEY, session_id VARCHAR(255) NOT NULL, "
+            "message_type VARCHAR(50) NOT NULL, user_message TEXT, assistant_message TEXT, "
+            "timestamp DATETIME NOT NULL, processed BOOLEAN)"
+        ))
+        for row_id, session_id, message_type in [(1, "s1", "user"), (2, "s1", "assistant"),
+                                                 (3, "s2", "user"), (4, "s1", "user")]:
+            connection.execute(text(
+                "INSERT INTO chat_history (id, session_id, message_type, timestamp, processed) "
+                "VALUES (:id, :session_id, :message_type, '2024-01-01 00:00:00', 1)"
+            ), {"id": row_id, "session_id": session_id, "message_type": message_type})
+
+    create_tables(sqlite_engine)
+
+    with sqlite_engine.connect() as connection:
+        rows = connection.execute(text("SELECT id, sequence FROM chat_history ORDER BY id")).all()
+        indexes = {index["name"] for index in inspect(sqlite_engine).get_indexes("chat_history")}
+    assert [tuple(row) for row in rows] == [(1, 1), (2, 2), (3, 1), (4, 3)]
+    assert "ix_chat_history_session_sequence" in indexes
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Testes da memória hierárquica (vetores de segmentos de sessão + turnos)
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from backend_app.core.local_index import LocalVectorIndex
+from backend_app.core.memory_backends import (
+    HierarchicalMemoryBackend, LocalMemoryBackend, MemoryFilter, segment_id_for
+)
+
+
+def _backend(coarse_segments=2, segment_turns=20):
+    return HierarchicalMemoryBackend(
+        LocalMemoryBackend(LocalVectorIndex(), certainty=0.0),
+        LocalMemoryBackend(LocalVectorIndex(), certainty=0.0),
+        coarse_segments=coarse_segments, segment_turns=segment_turns
+    )
+
+
+def _turn(session_id, sequence, vector):
+    return {"id": f"{session_id}-{sequence}", "vector": vector, "sequence": sequence,
+            "properties": {"session_id": session_id, "content": f"{session_id} {sequence}",
+                           "timestamp": f"2024-01-01T00:00:{sequence:02d}+00:00"}}
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float64)
+    return vector / np.linalg.norm(vector)
+
+
+def test_segment_vector_is_the_mean_and_replay_is_idempotent():
+    backend = _backend()
+    vectors = [[1.0, 0.0, 0.0], [0.0, 2.0, 0.0], [0.0, 0.0, 3.0]]
+    backend.add_many([_turn("s1", 1, vectors[0]), _turn("s1", 3, vectors[1])])
+    backend.add_many([_turn("s1", 5, vectors[2])])
+    # Reindexação (outbox repetido): os turnos já contados não entram de novo
+    backend.add_many([_turn("s1", 3, vectors[1]), _turn("s1", 5, vectors[2])])
+
+    segment = backend.segments.fetch(segment_id_for("s1", 0))
+    expected = np.mean([_unit(vector) for vector in vectors], axis=0)
+    assert segment["turn_count"] == 3 and segment["turn_sequences"] == [1, 3, 5]
+    assert np.isclose(segment["centroid_norm"], np.linalg.norm(expected))
+    assert np.allclose(_unit(segment["vector"]), _unit(expected), atol=1e-5)
+
+
+def test_turns_indexed_out_of_order_are_counted():
+    backend = _backend()
+    backend.add_many([_turn("s1", 5, [0.0, 1.0])])
+    # Turno anterior que ficou pendente (par por chegar) e só agora foi indexado
+    backend.add_many([_turn("s1", 1, [1.0, 0.0]), _turn("s1", 1, [1.0, 0.0])])
+    backend.add_many([_turn("s1", 5, [0.0, 1.0])])
+
+    segment = backend.segments.fetch(segment_id_for("s1", 0))
+    assert segment["turn_count"] == 2 and segment["turn_sequences"] == [1, 5]
+    assert np.allclose(_unit(segment["vector"]), _unit([1.0, 1.0]), atol=1e-5)
+
+
+def test_long_sessions_are_split_into_segments():
+    backend = _backend(segment_turns=2)
+    backend.add_many([_turn("s1", sequence, [1.0, 0.0]) for sequence in (1, 3, 5, 7, 9)])
+
+    assert backend.segments.fetch(segment_id_for("s1", 0))["turn_count"] == 2
+    assert backend.segments.fetch(segment_id_for("s1", 1))["turn_count"] == 2
+    assert backend.segments.fetch(segment_id_for("s1", 2))["turn_count"] == 1
+
+
+def test_search_drills_down_into_the_closest_sessions():
+    backend = _backend(coarse_segments=1)
+    backend.add_many([_turn("filosofia", 1, [1.0, 0.1, 0.0]), _turn("filosofia", 3, [0.9, 0.0, 0.1])])
+    backend.add_many([_turn("culinaria", 1, [0.0, 1.0, 0.1]), _turn("culinaria", 3, [0.1, 0.9, 0.0])])
+
+    memories = backend.search([1.0, 0.0, 0.0], 5)
+    assert {memory["session_id"] for memory in memories} == {"filosofia"}
+    assert backend.stats()["coarse_searches"] == 1
+
+    # Sessão já fixada pelo filtro: pesquisa direta nos turnos
+    memories = backend.search([1.0, 0.0, 0.0], 5, MemoryFilter(session_id="culinaria"))
+    assert {memory["session_id"] for memory in memories} == {"culinaria"}
+    assert backend.stats()["flat_searches"] == 1
+
+
+def test_search_falls_back_to_turns_without_segments():
+    backend = _backend()
+    backend.turns.add_many([_turn("s1", 1, [1.0, 0.0])])
+
+    assert [memory["id"] for memory in backend.search([1.0, 0.0], 3)] == ["s1-1"]
+    assert backend.stats()["flat_searches"] == 1
+
+
+def test_local_index_filters_by_a_set_of_sessions():
+    index = LocalVectorIndex()
+    vectors = np.eye(3, dtype=np.float32) + 0.1
+    index.add_many(["a", "b", "c"], vectors, [{"session_id": "s1"}, {"session_id": "s2"}, {"session_id": "s3"}])
+
+    assert {memory["id"] for memory in index.search(vectors[0], 5, session_ids=["s2", "s3"])} == {"b", "c"}
+    assert index.search(vectors[0], 5, session_ids=["desconhecida"]) == []
+
+
+def test_weaviate_where_clause_for_a_set_of_sessions():
+    where = MemoryFilter(user_id="ana").narrowed(["s1", "s2"]).to_weaviate_where()
+    assert where["operator"] == "And"
+    sessions = where["operands"][0]
+    assert sessions["operator"] == "Or"
+    assert [operand["valueString"] for operand in sessions["operands"]] == ["s1", "s2"]
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Testes da recuperação de contexto do MemoryManager híbrido
+(PostgreSQL e Weaviate simulados)
+"""
+
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from backend_app.core import hybrid_memory_manager
+from backend_app.core.hybrid_memory_manager import MemoryManager
+
+LOOKUP_DELAY = 0.2
+
+
+class FakeResult(list):
+    def fetchone(self):
+        return self[0] if self else None
+
+
+class SlowDB:
+    """Sessão SQLAlchemy simulada com queries bloqueantes"""
+
+    def __init__(self, rows=None):
+        self.rows = rows or []
+        self.executed = []
+
+    def execute(self, query, params=None):
+        time.sleep(LOOKUP_DELAY)
+        self.executed.append((str(query), params))
+        return FakeResult(self.rows)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class SlowQuery:
+    """Builder de queries Weaviate v3 simulado"""
+
+    def __init__(self, objects):
+        self.objects = objects
+
+    def get(self, *args):
+        return self
+
+    def __getattr__(self, name):
+        if name.startswith("with_"):
+            return lambda *args, **kwargs: self
+        raise AttributeError(name)
+
+    def do(self):
+        time.sleep(LOOKUP_DELAY)
+        return {"data": {"Get": {"ConversationMemory": self.objects}}}
+
+
+class FakeEmbedder:
+    def embed_query(self, text):
+        return np.ones(4, dtype=np.float32)
+
+
+class SlowWeaviate:
+    def __init__(self, objects=None):
+        self.schema = SimpleNamespace(exists=lambda name: True)
+        self.query = SlowQuery(objects or [])
+
+
+def _row(message_type, text, timestamp=None, sequence=None):
+    return SimpleNamespace(
+        message_type=message_type,
+        sequence=sequence,
+        user_message=text if message_type == "user" else None,
+        assistant_message=text if message_type == "assistant" else None,
+        timestamp=timestamp or datetime(2024, 1, 1),
+    )
+
+
+def test_context_lookups_overlap(monkeypatch):
+    db = SlowDB(rows=[_row("assistant", "Olá Ana!", sequence=2), _row("user", "Chamo-me Ana", sequence=1)])
+    weaviate_client = SlowWeaviate(objects=[{
+        "content": "", "session_id": "outra", "timestamp": "",
+        "user_message": "Gosto de filosofia", "assistant_message": "Ótimo!",
+    }])
+    monkeypatch.setattr(hybrid_memory_manager, "get_query_embedder", FakeEmbedder)
+    manager = MemoryManager(db_session=db, weaviate_client=weaviate_client)
+
+    started = time.perf_counter()
+    context = asyncio.run(manager.get_context(session_id="s1", query="Como me chamo?"))
+    elapsed = time.perf_counter() - started
+
+    # A latência deve ser próxima da maior pesquisa, não da soma das duas
+    assert elapsed < LOOKUP_DELAY * 1.8
+    assert "Chamo-me Ana" in context
+    assert "Gosto de filosofia" in context
+
+
+def test_context_lookups_do_not_block_event_loop(monkeypatch):
+    monkeypatch.setattr(hybrid_memory_manager, "get_query_embedder", FakeEmbedder)
+    manager = MemoryManager(db_session=SlowDB(), weaviate_client=SlowWeaviate())
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker_task = asyncio.create_task(ticker())
+        await manager.get_context(session_id="s2", query="ética")
+        ticker_task.cancel()
+        return ticks
+
+    assert asyncio.run(scenario()) >= 5
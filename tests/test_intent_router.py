@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Testes do router de intenção local (regras, centróides, cache e LLM de recurso)
+"""
+
+import asyncio
+import json
+import os
+import sys
+import threading
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from backend_app.core.embeddings import HashingEmbeddingProvider
+from backend_app.core.intent_router import (
+    MEMORY_SEARCH, WEB_SEARCH, BatchedRouteClassifier, CentroidClassifier, IntentRouter, RuleClassifier,
+    normalize_question, parse_batch_routes, parse_route
+)
+
+
+class FakeLLM:
+    def __init__(self, answer):
+        self.answer = answer
+        self.questions = []
+
+    async def __call__(self, question):
+        self.questions.append(question)
+        return self.answer
+
+
+def _centroids():
+    provider = HashingEmbeddingProvider(dimensions=256)
+    examples = {
+        WEB_SEARCH: ["preço do petróleo", "resultado das eleições", "cotação do euro"],
+        MEMORY_SEARCH: ["a minha família", "o meu trabalho", "a minha opinião"],
+    }
+    return CentroidClassifier(examples, embed_texts=provider.embed,
+                              embed_query=lambda text: provider.embed([text])[0], margin=0.05)
+
+
+def test_normalization_and_rules():
+    assert normalize_question("  Lembras-te   do que FALÁMOS?! ") == "lembras te do que falamos"
+    rules = RuleClassifier()
+    assert rules.classify(normalize_question("Lembras-te do que falámos?")).route == MEMORY_SEARCH
+    assert rules.classify(normalize_question("Quem é o presidente de França?")).route == WEB_SEARCH
+    # Sinais das duas rotas ou nenhum: as regras não decidem
+    assert rules.classify(normalize_question("O que falámos hoje?")) is None
+    assert rules.classify(normalize_question("Gosto de gatos")) is None
+
+
+def test_confident_rules_skip_the_llm_and_are_cached():
+    router = IntentRouter()
+    llm = FakeLLM("memory_search")
+
+    decision = asyncio.run(router.classify("Quem é o presidente do Brasil?", llm_classify=llm))
+    assert (decision.route, decision.source, decision.cached) == (WEB_SEARCH, "rules", False)
+    decision = asyncio.run(router.classify("quem é o PRESIDENTE do brasil", llm_classify=llm))
+    assert decision.cached and decision.route == WEB_SEARCH
+    assert llm.questions == []
+    assert router.stats()["cache_hits"] == 1
+
+
+def test_centroids_decide_when_rules_are_silent():
+    router = IntentRouter(centroid_classifier=_centroids())
+    llm = FakeLLM("web_search")
+
+    decision = asyncio.run(router.classify("a minha família e o meu trabalho", llm_classify=llm))
+    assert decision.route == MEMORY_SEARCH and decision.source == "centroid"
+    assert llm.questions == []
+
+
+def test_llm_is_only_called_when_unsure_and_raw_question_is_sent():
+    router = IntentRouter(min_confidence=0.999)
+    llm = FakeLLM("Classification: memory_search")
+
+    decision = asyncio.run(router.classify("Gosto de gatos", llm_classify=llm))
+    assert decision.route == MEMORY_SEARCH and decision.source == "llm"
+    assert llm.questions == ["Gosto de gatos"]
+    # Decisões do LLM também ficam em cache
+    assert asyncio.run(router.classify("gosto de gatos", llm_classify=llm)).cached
+    assert len(llm.questions) == 1
+
+
+def test_failures_fall_back_to_the_default_route():
+    async def broken_llm(question):
+        raise RuntimeError("sem quota")
+
+    router = IntentRouter()
+    decision = asyncio.run(router.classify("Gosto de gatos", llm_classify=broken_llm))
+    assert decision.route == WEB_SEARCH and decision.source == "default"
+    # Decisões incertas não ficam em cache
+    assert not asyncio.run(router.classify("Gosto de gatos")).cached
+    assert router.stats()["llm_failures"] == 1
+    assert parse_route("nada") is None
+
+
+def test_batch_answers_are_matched_by_question_number():
+    assert parse_batch_routes('{"2": "web_search", "1": "memory_search"}', 3) == [MEMORY_SEARCH, WEB_SEARCH, None]
+    assert parse_batch_routes("1. web_search\n3. memory_search", 3) == [WEB_SEARCH, None, MEMORY_SEARCH]
+    assert parse_batch_routes('["web_search", "memory_search"]', 2) == [WEB_SEARCH, MEMORY_SEARCH]
+    # Array sem números e com rótulos a mais ou a menos: nenhuma posição é fiável
+    assert parse_batch_routes('["memory_search", "web_search"]', 3) == [None, None, None]
+    assert parse_batch_routes('["memory_search", "web_search", "web_search"]', 2) == [None, None]
+    assert parse_batch_routes("não sei", 1) == [None]
+
+
+def test_concurrent_llm_classifications_share_one_call():
+    prompts = []
+    lock = threading.Lock()
+
+    def fake_llm(prompt):
+        with lock:
+            prompts.append(prompt)
+        # Um rótulo por número de pergunta, como pede o prompt em lote
+        lines = prompt.split("Questions:")[1].split("Labels:")[0].strip().splitlines()
+        return json.dumps({line.split(".")[0]: "memory_search" if "lembras" in line.lower() else "web_search"
+                           for line in reversed(lines)})
+
+    batched = BatchedRouteClassifier(fake_llm, window_ms=50, max_batch=8)
+    router = IntentRouter(min_confidence=0.999)
+    questions = [f"Lembras-te do tema {i}?" if i % 2 else f"Tema genérico {i}" for i in range(6)]
+
+    async def scenario():
+        return await asyncio.gather(*[router.classify(q, llm_classify=batched.classify) for q in questions])
+
+    decisions = asyncio.run(scenario())
+    batched.stop()
+
+    assert len(prompts) == 1
+    assert [d.route for d in decisions] == [MEMORY_SEARCH if i % 2 else WEB_SEARCH for i in range(6)]
+    assert all(d.source == "llm" for d in decisions)
+    assert batched.stats()["avg_batch_size"] == 6
+
+
+def test_centroid_fit_failures_back_off_before_retrying(fake_clock):
+    calls = []
+    provider = HashingEmbeddingProvider(dimensions=256)
+
+    def flaky_embed(texts):
+        calls.append(len(texts))
+        if len(calls) < 3:
+            raise RuntimeError("sem quota")
+        return provider.embed(texts)
+
+    centroids = CentroidClassifier(_centroids().examples, embed_texts=flaky_embed,
+                                   embed_query=lambda text: provider.embed([text])[0], margin=0.05,
+                                   retry_seconds=60, max_retry_seconds=90, clock=fake_clock)
+    router = IntentRouter(centroid_classifier=centroids)
+
+    # Durante a pausa os exemplos não voltam a ser vetorizados
+    for _ in range(3):
+        asyncio.run(router.classify("a minha família e o meu trabalho"))
+    assert len(calls) == 1 and not centroids.available
+
+    # Segunda falha: a pausa duplica até ao máximo
+    fake_clock.now += 60
+    asyncio.run(router.classify("a minha família e o meu trabalho"))
+    assert len(calls) == 2
+    fake_clock.now += 60
+    assert not centroids.available
+    fake_clock.now += 30
+    decision = asyncio.run(router.classify("a minha família e o meu trabalho"))
+    assert len(calls) == 3 and decision.source == "centroid"
+    assert router.stats()["centroid_failures"] == 2
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Testes do analisador de palavras-chave e da pesquisa BM25 da VectorMemory
+"""
+
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from backend_app.core.memory import VectorMemory
+from backend_app.core.text_analysis import KeywordAnalyzer, portuguese_analyzer
+
+
+def test_analyzer_drops_stopwords_punctuation_and_duplicates():
+    keywords = portuguese_analyzer.extract_keywords("Qual é o meu nome? O meu nome, lembras-te?")
+    assert keywords == ["nome", "lembras"]
+
+
+def test_analyzer_accepts_custom_stopwords():
+    analyzer = KeywordAnalyzer(stopwords={"Python"}, min_length=2)
+    assert analyzer.extract_keywords("python é fixe") == ["fixe"]
+
+
+class FakeQuery:
+    def __init__(self, objects):
+        self.objects = objects
+        self.calls = []
+
+    def bm25(self, **kwargs):
+        self.calls.append(kwargs)
+        return SimpleNamespace(objects=self.objects)
+
+
+def _vector_memory_with(objects):
+    query = FakeQuery(objects)
+    collection = SimpleNamespace(query=query)
+    client = SimpleNamespace(collections=SimpleNamespace(get=lambda name: collection))
+    return VectorMemory(client=client), query
+
+
+def _obj(text, score):
+    return SimpleNamespace(properties={"text": text}, metadata=SimpleNamespace(score=score))
+
+
+def test_search_memory_sends_one_ranked_query():
+    vector_memory, query = _vector_memory_with([_obj("O meu nome é Ana", 2.5), _obj("Gosto de Lisboa", 0.4)])
+
+    results = vector_memory.search_memory_with_scores("Qual é o meu nome em Lisboa?", limit=2)
+
+    assert len(query.calls) == 1
+    assert query.calls[0]["query"] == "nome lisboa"
+    assert query.calls[0]["limit"] == 2
+    assert results == [("O meu nome é Ana", 2.5), ("Gosto de Lisboa", 0.4)]
+
+
+def test_search_memory_applies_score_threshold():
+    vector_memory, _ = _vector_memory_with([_obj("O meu nome é Ana", 2.5), _obj("Gosto de Lisboa", 0.4)])
+
+    assert vector_memory.search_memory("nome lisboa", limit=2, min_score=1.0) == ["O meu nome é Ana"]
+
+
+def test_search_memory_without_keywords_skips_query():
+    vector_memory, query = _vector_memory_with([])
+
+    assert vector_memory.search_memory("o que é?") == []
+    assert query.calls == []
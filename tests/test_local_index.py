@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Testes do índice vetorial local e dos armazenamentos de memória
+(dados sintéticos agrupados, Weaviate simulado)
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from backend_app.core.local_index import LocalVectorIndex
+from backend_app.core.memory_backends import LocalMemoryBackend, ReadThroughMemoryBackend
+from backend_app.core.outbox_indexer import MemoryOutboxIndexer
+from backend_app.models.database import ChatHistory
+
+
+def _clustered(count, dimensions=32, clusters=20, seed=7):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimensions))
+    labels = rng.integers(0, clusters, size=count)
+    return (centers[labels] + 0.3 * rng.normal(size=(count, dimensions))).astype(np.float32)
+
+
+def _fill(index, vectors, sessions=4):
+    ids = [f"m{i}" for i in range(len(vectors))]
+    metadata = [{"session_id": f"s{i % sessions}", "content": f"memória {i}"} for i in range(len(vectors))]
+    index.add_many(ids, vectors, metadata)
+    return ids
+
+
+def test_ivf_search_matches_exact_search():
+    vectors = _clustered(3000)
+    exact = LocalVectorIndex(train_threshold=10 ** 9)
+    ivf = LocalVectorIndex(train_threshold=500, nprobe=8)
+    _fill(exact, vectors)
+    _fill(ivf, vectors)
+    assert ivf.stats()["lists"] > 0
+
+    queries = _clustered(50, seed=11)
+    recall = []
+    for query in queries:
+        expected = {memory["id"] for memory in exact.search(query, limit=10)}
+        found = {memory["id"] for memory in ivf.search(query, limit=10)}
+        recall.append(len(expected & found) / 10)
+
+    assert np.mean(recall) >= 0.9
+
+
+def test_session_filters_and_min_score():
+    index = LocalVectorIndex()
+    vectors = _clustered(200)
+    _fill(index, vectors)
+
+    others = index.search(vectors[0], limit=20, exclude_session="s0")
+    assert others and all(memory["session_id"] != "s0" for memory in others)
+
+    own = index.search(vectors[0], limit=5, session_id="s0")
+    assert own[0]["id"] == "m0"
+    assert np.isclose(own[0]["score"], 1.0, atol=1e-5)
+    assert all(memory["session_id"] == "s0" for memory in own)
+
+    assert all(memory["score"] >= 0.5 for memory in index.search(vectors[0], limit=50, min_score=0.5))
+
+
+def test_delete_upsert_and_compaction():
+    index = LocalVectorIndex()
+    vectors = _clustered(400)
+    ids = _fill(index, vectors)
+
+    assert index.delete("m0")
+    assert not index.delete("m0")
+    assert "m0" not in {memory["id"] for memory in index.search(vectors[0], limit=5)}
+
+    # Reinserir o mesmo id substitui o registo em vez de duplicar
+    index.add("m1", vectors[2], {"session_id": "s9", "content": "nova"})
+    assert len(index) == len(ids) - 1
+    assert index.search(vectors[2], limit=1, session_id="s9")[0]["content"] == "nova"
+
+    removed = index.delete_session("s0")
+    assert removed > 0
+    assert not index.search(vectors[4], limit=10, session_id="s0")
+    assert len(index) == len(ids) - 1 - removed
+
+
+def test_persistence_reloads_vectors_and_watermark(tmp_path):
+    vectors = _clustered(1200)
+    index = LocalVectorIndex(directory=str(tmp_path), train_threshold=500)
+    _fill(index, vectors)
+    index.delete("m3")
+    index.watermark = 42
+    before = [memory["id"] for memory in index.search(vectors[5], limit=5)]
+    index.close()
+
+    reopened = LocalVectorIndex(directory=str(tmp_path), train_threshold=500)
+    assert len(reopened) == 1199
+    assert reopened.watermark == 42
+    assert [memory["id"] for memory in reopened.search(vectors[5], limit=5)] == before
+    assert "m3" not in {memory["id"] for memory in reopened.search(vectors[3], limit=5)}
+
+
+@pytest.mark.parametrize("quantization, minimum_recall", [("int8", 0.95), ("pq", 0.8)])
+def test_quantized_search_reranks_with_exact_scores(quantization, minimum_recall):
+    vectors = _clustered(3000, dimensions=64)
+    exact = LocalVectorIndex(train_threshold=10 ** 9)
+    quantized = LocalVectorIndex(train_threshold=500, quantization=quantization, pq_subvectors=16, rerank=4)
+    _fill(exact, vectors)
+    _fill(quantized, vectors)
+
+    stats = quantized.stats()
+    assert stats["quantization"] == quantization
+    assert stats["code_bytes"] < stats["vector_bytes"] / 3
+
+    recall = []
+    for query in _clustered(40, dimensions=64, seed=11):
+        expected = exact.search(query, limit=10)
+        found = quantized.search(query, limit=10)
+        recall.append(len({m["id"] for m in expected} & {m["id"] for m in found}) / 10)
+        # As pontuações devolvidas são as exatas, não as aproximadas
+        exact_scores = {m["id"]: m["score"] for m in exact.search(query, limit=len(vectors))}
+        assert all(np.isclose(m["score"], exact_scores[m["id"]], atol=1e-5) for m in found)
+
+    assert np.mean(recall) >= minimum_recall
+
+
+def test_quantized_index_persists_codes_and_retrains_on_config_change(tmp_path):
+    vectors = _clustered(1200, dimensions=32)
+    index = LocalVectorIndex(directory=str(tmp_path), train_threshold=500, quantization="pq", pq_subvectors=8)
+    _fill(index, vectors)
+    before = [memory["id"] for memory in index.search(vectors[7], limit=5)]
+    index.close()
+
+    reopened = LocalVectorIndex(directory=str(tmp_path), train_threshold=500, quantization="pq", pq_subvectors=8)
+    assert reopened.stats()["quantization"] == "pq"
+    assert [memory["id"] for memory in reopened.search(vectors[7], limit=5)] == before
+    reopened.close()
+
+    switched = LocalVectorIndex(directory=str(tmp_path), train_threshold=500, quantization="int8")
+    assert switched.stats()["quantization"] == "int8"
+    assert switched.search(vectors[7], limit=1)[0]["id"] == "m7"
+
+
+def test_unknown_quantization_is_rejected():
+    with pytest.raises(ValueError):
+        LocalVectorIndex(quantization="fp4")
+
+
+class FakeRemote:
+    def __init__(self, memories):
+        self.memories = memories
+        self.searches = 0
+        self.added = []
+
+    def search(self, vector, limit, exclude_session=None, include_vectors=False):
+        self.searches += 1
+        return [dict(memory) for memory in self.memories][:limit]
+
+    def add_many(self, records):
+        self.added.extend(records)
+
+
+def test_read_through_caches_each_query_for_its_ttl(fake_clock):
+    vectors = _clustered(3, dimensions=8)
+    remote = FakeRemote([
+        {"id": f"r{i}", "score": 0.9, "vector": vectors[i].tolist(), "content": f"remota {i}",
+         "session_id": "antiga", "timestamp": "", "user_message": "", "assistant_message": ""}
+        for i in range(3)
+    ])
+    backend = ReadThroughMemoryBackend(LocalMemoryBackend(LocalVectorIndex()), remote,
+                                       ttl_seconds=30, clock=fake_clock)
+
+    first = backend.search(vectors[0], limit=1)
+    assert first[0]["id"] == "r0" and "vector" not in first[0]
+    assert remote.searches == 1
+
+    second = backend.search(vectors[0], limit=1)
+    assert [(m["id"], m["content"], m["score"]) for m in second] == [("r0", "remota 0", 0.9)]
+    assert remote.searches == 1
+    assert backend.stats()["query_hits"] == 1
+
+    # Os registos já estão no índice local, mas uma pesquisa nova vai ao Weaviate
+    backend.search(vectors[1], limit=1)
+    backend.search(vectors[0], limit=2)
+    assert remote.searches == 3
+
+    fake_clock.now += 31
+    backend.search(vectors[0], limit=1)
+    assert remote.searches == 4
+
+
+def test_read_through_writes_invalidate_cached_queries():
+    vectors = _clustered(2, dimensions=8)
+    remote = FakeRemote([
+        {"id": "r0", "score": 0.9, "vector": vectors[0].tolist(), "content": "remota",
+         "session_id": "antiga", "timestamp": "", "user_message": "", "assistant_message": ""}
+    ])
+    remote.delete = lambda memory_id, user_id=None: remote.memories.clear()
+    backend = ReadThroughMemoryBackend(LocalMemoryBackend(LocalVectorIndex()), remote)
+
+    backend.search(vectors[0], limit=1)
+    backend.add_many([{"id": "n1", "vector": vectors[1].tolist(), "properties": {"content": "nova"}}])
+    backend.search(vectors[0], limit=1)
+    assert remote.searches == 2
+
+    backend.delete("r0")
+    assert backend.search(vectors[0], limit=1) == []
+    assert remote.searches == 3
+
+
+def test_local_backend_tails_history_by_watermark(session_factory):
+
+    db = session_factory()
+    old = datetime.utcnow() - timedelta(minutes=5)
+    db.add(ChatHistory(session_id="s1", message_type="user", user_message="Chamo-me Ana", timestamp=old))
+    db.add(ChatHistory(session_id="s1", message_type="assistant", assistant_message="Olá Ana!", timestamp=old))
+    # Linha recente: ainda dentro do atraso de estabilização
+    db.add(ChatHistory(session_id="s2", message_type="user", user_message="Olá", timestamp=datetime.utcnow()))
+    db.commit()
+    db.close()
+
+    backend = LocalMemoryBackend(LocalVectorIndex(), certainty=0.0)
+    indexer = MemoryOutboxIndexer(backend_factory=lambda: backend,
+                                  embed_documents=lambda texts: [[float(len(text)), 1.0] for text in texts],
+                                  session_factory=session_factory, settle_seconds=60)
+
+    assert indexer.drain_once() == 2
+    assert backend.watermark == 2
+    assert len(backend.index) == 1
+    assert indexer.drain_once() == 0
+
+    # O processed do outbox partilhado fica intacto para os outros workers
+    db = session_factory()
+    assert db.query(ChatHistory).filter(ChatHistory.processed == True).count() == 0  # noqa: E712
+    db.close()
+
+
+def test_tail_watermark_stops_at_unsettled_and_unpaired_rows(session_factory):
+
+    now = datetime.utcnow()
+    old = now - timedelta(minutes=5)
+    rows = [
+        ("s1", 1, "user", old), ("s2", 1, "user", old),           # 1, 2: respostas fora do lote
+        ("s2", 2, "assistant", old), ("s1", 2, "assistant", old),  # 3, 4
+        ("s3", 1, "user", now), ("s3", 2, "assistant", now),       # 5, 6: por estabilizar
+        ("s4", 1, "user", old),                                    # 7: sem resposta (ainda)
+        ("s5", 1, "user", old), ("s5", 2, "assistant", old),       # 8, 9
+    ]
+    db = session_factory()
+    for session_id, sequence, message_type, timestamp in rows:
+        db.add(ChatHistory(session_id=session_id, sequence=sequence, message_type=message_type,
+                           user_message="pergunta", assistant_message="resposta", timestamp=timestamp))
+    db.commit()
+    db.close()
+
+    backend = LocalMemoryBackend(LocalVectorIndex(), certainty=0.0)
+    indexer = MemoryOutboxIndexer(backend_factory=lambda: backend,
+                                  embed_documents=lambda texts: [[float(len(text)), 1.0] for text in texts],
+                                  session_factory=session_factory, batch_size=1, settle_seconds=60, orphan_seconds=3600)
+
+    # Lotes de 2 linhas: as perguntas vão buscar a resposta fora do lote
+    assert indexer.drain_once() == 4
+    assert backend.watermark == 2 and len(backend.index) == 2
+    assert indexer.drain_once() == 2
+    assert backend.watermark == 4 and len(backend.index) == 2
+
+    # A troca por estabilizar segura a marca d'água
+    indexer.batch_size = 10
+    assert indexer.drain_once() == 0
+    assert backend.watermark == 4
+
+    # Estável: indexa s3 e s5, mas a pergunta sem resposta ainda pode emparelhar
+    indexer.settle_seconds = 0
+    assert indexer.drain_once() == 4
+    assert backend.watermark == 6 and len(backend.index) == 4
+
+    # Passada a idade de órfã a marca d'água avança sem reindexar s5
+    indexer.orphan_seconds = 60
+    assert indexer.drain_once() == 1
+    assert backend.watermark == 9 and len(backend.index) == 4
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Testes dos filtros da pesquisa semântica aplicados dentro da query vetorial
+(Weaviate simulado e índice local)
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from backend_app.core.local_index import LocalVectorIndex
+from backend_app.core.memory_backends import LocalMemoryBackend, MemoryFilter, WeaviateMemoryBackend
+
+
+class RecordingQuery:
+    """Cliente v3 simulado que regista a cadeia de chamadas da query"""
+
+    def __init__(self, objects):
+        self.objects = objects
+        self.calls = {}
+        self.query = self
+
+    def get(self, collection_name, properties):
+        self.collection_name = collection_name
+        return self
+
+    def __getattr__(self, name):
+        if not name.startswith("with_"):
+            raise AttributeError(name)
+
+        def record(argument):
+            self.calls[name] = argument
+            return self
+        return record
+
+    def do(self):
+        return {"data": {"Get": {self.collection_name: self.objects[:self.calls["with_limit"]]}}}
+
+
+def test_filters_translate_to_a_single_where_clause():
+    since = datetime(2024, 1, 1)
+    where = MemoryFilter(exclude_session="s1", user_id="u1", since=since).to_weaviate_where()
+
+    assert where["operator"] == "And"
+    assert {"path": ["session_id"], "operator": "NotEqual", "valueString": "s1"} in where["operands"]
+    assert {"path": ["user_id"], "operator": "Equal", "valueString": "u1"} in where["operands"]
+    assert {"path": ["timestamp"], "operator": "GreaterThanEqual",
+            "valueDate": "2024-01-01T00:00:00+00:00"} in where["operands"]
+
+    assert MemoryFilter(session_id="s2").to_weaviate_where()["operator"] == "Equal"
+    assert MemoryFilter().to_weaviate_where() is None
+
+
+def test_weaviate_backend_pushes_filters_and_never_over_fetches():
+    objects = [
+        {"content": f"memória {i}", "session_id": "outra", "_additional": {"id": f"id{i}", "certainty": 0.9}}
+        for i in range(10)
+    ]
+    client = RecordingQuery(objects)
+    backend = WeaviateMemoryBackend(client=client)
+
+    memories = backend.search([0.1, 0.2], 3, MemoryFilter(exclude_session="atual"))
+
+    assert client.calls["with_limit"] == 3
+    assert client.calls["with_where"]["operator"] == "NotEqual"
+    assert [memory["id"] for memory in memories] == ["id0", "id1", "id2"]
+
+    client.calls.clear()
+    backend.search([0.1, 0.2], 3)
+    assert "with_where" not in client.calls
+
+
+def test_dominant_session_does_not_starve_results():
+    index = LocalVectorIndex()
+    rng = np.random.default_rng(3)
+    base = rng.normal(size=16).astype(np.float32)
+    # 50 memórias da sessão atual muito próximas da pergunta e 5 de outras sessões
+    close = base + 0.01 * rng.normal(size=(50, 16))
+    far = base + 1.0 * rng.normal(size=(5, 16))
+    index.add_many([f"a{i}" for i in range(50)], close, [{"session_id": "atual"}] * 50)
+    index.add_many([f"b{i}" for i in range(5)], far, [{"session_id": f"s{i}"} for i in range(5)])
+
+    backend = LocalMemoryBackend(index, certainty=0.0)
+    memories = backend.search(base, 3, MemoryFilter(exclude_session="atual"))
+
+    assert len(memories) == 3
+    assert all(memory["session_id"] != "atual" for memory in memories)
+
+
+def test_local_index_filters_by_user_and_time_window(tmp_path):
+    now = datetime(2024, 6, 1, tzinfo=timezone.utc)
+    index = LocalVectorIndex(directory=str(tmp_path))
+    vectors = np.eye(4, dtype=np.float32) + 0.1
+    index.add_many(["old", "new", "other-user", "undated"], vectors, [
+        {"session_id": "s1", "user_id": "ana", "timestamp": (now - timedelta(days=90)).isoformat()},
+        {"session_id": "s2", "user_id": "ana", "timestamp": (now - timedelta(days=1)).isoformat()},
+        {"session_id": "s3", "user_id": "rui", "timestamp": (now - timedelta(days=1)).isoformat()},
+        {"session_id": "s4", "user_id": "ana"},
+    ])
+
+    recent = MemoryFilter(user_id="ana", since=now - timedelta(days=30))
+    assert [m["id"] for m in index.search(vectors[0], 4, **recent.index_arguments())] == ["new"]
+    assert {m["id"] for m in index.search(vectors[0], 4, user_id="ana")} == {"old", "new", "undated"}
+    assert index.search(vectors[0], 4, user_id="desconhecido") == []
+    # Datas sem fuso são tratadas como UTC
+    assert [m["id"] for m in index.search(vectors[0], 4, until=datetime(2024, 4, 1))] == ["old"]
+
+    index.close()
+    reopened = LocalVectorIndex(directory=str(tmp_path))
+    assert [m["id"] for m in reopened.search(vectors[0], 4, **recent.index_arguments())] == ["new"]
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Testes do snapshot em cache das estatísticas de memória
+"""
+
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from backend_app.core.memory_stats import MemoryStatsCache
+
+
+class CountingLoader:
+    def __init__(self):
+        self.calls = 0
+        self.called = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.called.set()
+        return {
+            "postgresql": {"total_messages": 10 * self.calls, "unique_sessions": 1, "last_message": None},
+            "weaviate": {"total_vectors": 5, "collection_name": "ConversationMemory"},
+            "status": "operational",
+        }
+
+
+def test_snapshot_is_reused_within_ttl():
+    cache = MemoryStatsCache(ttl_seconds=60)
+    loader = CountingLoader()
+
+    first = cache.get(loader)
+    second = cache.get(loader)
+
+    assert loader.calls == 1
+    assert first["cached"] is False
+    assert second["cached"] is True
+    assert second["postgresql"]["total_messages"] == 10
+
+
+def test_writes_update_snapshot_without_queries():
+    cache = MemoryStatsCache(ttl_seconds=60)
+    loader = CountingLoader()
+    cache.get(loader)
+
+    cache.record_write(2, datetime(2024, 5, 1, 12, 0))
+    stats = cache.get(loader)
+
+    assert loader.calls == 1
+    assert stats["postgresql"]["total_messages"] == 12
+    assert stats["postgresql"]["last_message"] == "2024-05-01T12:00:00"
+
+
+def test_stale_snapshot_is_served_while_refreshing_in_background():
+    cache = MemoryStatsCache(ttl_seconds=0.01)
+    loader = CountingLoader()
+    cache.get(loader)
+    loader.called.clear()
+    time.sleep(0.02)
+
+    stale = cache.get(loader)
+    assert stale["postgresql"]["total_messages"] == 10
+    assert loader.called.wait(timeout=2)
+
+    deadline = time.monotonic() + 2
+    while cache.get(loader)["postgresql"]["total_messages"] != 20 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert cache.get(loader, force=True)["postgresql"]["total_messages"] >= 20
+
+
+def test_error_snapshots_are_not_cached():
+    cache = MemoryStatsCache(ttl_seconds=60)
+    calls = []
+
+    def failing_loader():
+        calls.append(1)
+        return {"status": "error", "message": "sem ligação"}
+
+    cache.get(failing_loader)
+    cache.get(failing_loader)
+    assert len(calls) == 2
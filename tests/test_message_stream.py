@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Testes do endpoint /api/message/stream com agente e memória simulados
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend_app.api import chat_with_memory
+from backend_app.core import ai_agent
+from backend_app.core.ai_agent import EthicCompanionAgent
+
+
+class FakeMemoryManager:
+    """MemoryManager mínimo para testes sem PostgreSQL/Weaviate"""
+
+    def __init__(self):
+        self.saved = []
+
+    async def get_context(self, session_id, query, **kwargs):
+        return ""
+
+    def get_memory_stats(self):
+        return {"status": "operational"}
+
+    async def add_message_async(self, session_id, user_message, assistant_message, **kwargs):
+        self.saved.append((session_id, user_message, assistant_message))
+        return True
+
+
+class FakeAgent:
+    """Agente que emite tokens com pequenas pausas, como um LLM real"""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+
+    async def stream_message(self, message, session_id):
+        for token in self.tokens:
+            await asyncio.sleep(0.01)
+            yield token
+
+
+def _collect_events(tokens, payload=None):
+    memory_manager = FakeMemoryManager()
+    app = chat_with_memory.app
+    app.dependency_overrides[chat_with_memory.get_memory_manager] = lambda: memory_manager
+    app.dependency_overrides[chat_with_memory.get_ai_agent] = lambda: FakeAgent(tokens)
+    try:
+        client = TestClient(app)
+        body = {"message": "Olá", "session_id": "sessao-teste"}
+        body.update(payload or {})
+        response = client.post("/api/message/stream", json=body)
+        assert response.status_code == 200
+        events = [
+            json.loads(line[len("data: "):])
+            for line in response.text.splitlines()
+            if line.startswith("data: ")
+        ]
+        return events, memory_manager
+    finally:
+        app.dependency_overrides.clear()
+
+
+def test_stream_forwards_tokens_as_generated():
+    tokens = ["Olá", ", ", "tudo", " bem?"]
+    events, memory_manager = _collect_events(tokens)
+
+    content = [event for event in events if event["type"] == "content"]
+    assert [event["chunk"] for event in content] == tokens
+
+    complete = events[-1]
+    assert complete["type"] == "complete"
+    assert complete["final_response"] == "".join(tokens)
+    assert complete["metrics"]["time_to_first_token"] <= complete["metrics"]["total_time"]
+    assert memory_manager.saved == [("sessao-teste", "Olá", "".join(tokens))]
+
+
+def test_stream_protocol_v2_sends_only_deltas():
+    tokens = ["A ética ", "é ", "prática 🌱"]
+    events, _ = _collect_events(tokens, {"stream_protocol": 2})
+
+    assert events[0]["protocol"] == 2
+    deltas = [event for event in events if event["type"] == "delta"]
+    assert [event["seq"] for event in deltas] == list(range(len(tokens)))
+    assert all("accumulated" not in event for event in deltas)
+
+    rebuilt = "".join(event["delta"] for event in deltas)
+    complete = events[-1]
+    assert "final_response" not in complete
+    assert complete["seq_count"] == len(tokens)
+    assert complete["length"] == len(rebuilt)
+    assert complete["sha256"] == hashlib.sha256(rebuilt.encode("utf-8")).hexdigest()
+
+
+def test_stream_protocol_negotiation_falls_back_to_supported_version():
+    events, _ = _collect_events(["ok"], {"stream_protocol": 99})
+    assert events[0]["protocol"] == 2
+
+    events, _ = _collect_events(["ok"])
+    assert events[0]["protocol"] == 1
+    assert events[-1]["final_response"] == "ok"
+
+
+def test_stream_reports_error_on_empty_response():
+    events, memory_manager = _collect_events([])
+
+    assert events[-1]["type"] == "error"
+    assert memory_manager.saved == []
+
+
+class BrokenLLM:
+    """LLM que falha depois de `tokens` fragmentos"""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+
+    async def astream(self, messages):
+        for token in self.tokens:
+            yield SimpleNamespace(content=token)
+        raise RuntimeError("ligação perdida")
+
+
+def _direct_agent(llm):
+    agent = EthicCompanionAgent.__new__(EthicCompanionAgent)
+    agent.agent_executor = None
+    agent.llm = llm
+    return agent
+
+
+def test_direct_llm_failure_after_first_token_is_raised(monkeypatch):
+    # As mensagens do LangChain podem não estar disponíveis no ambiente de testes
+    monkeypatch.setattr(ai_agent, "SystemMessage", SimpleNamespace, raising=False)
+    monkeypatch.setattr(ai_agent, "HumanMessage", SimpleNamespace, raising=False)
+
+    async def collect(agent):
+        return [chunk async for chunk in agent.stream_message("Olá", "sessao-teste")]
+
+    # Antes do primeiro fragmento: pedido de desculpa em vez da resposta
+    assert asyncio.run(collect(_direct_agent(BrokenLLM([]))))[0].startswith("Desculpa")
+    # Depois: o erro chega ao endpoint, que não dá a resposta parcial como completa
+    with pytest.raises(RuntimeError):
+        asyncio.run(collect(_direct_agent(BrokenLLM(["A ética "]))))
+
+
+if __name__ == "__main__":
+    test_stream_forwards_tokens_as_generated()
+    test_stream_protocol_v2_sends_only_deltas()
+    test_stream_protocol_negotiation_falls_back_to_supported_version()
+    test_stream_reports_error_on_empty_response()
+    print("✅ Testes de streaming concluídos")
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Testes do indexador outbox do Weaviate
+(SQLite em memória e cliente Weaviate simulado)
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from backend_app.core import memory_manager
+from backend_app.core.group_commit import GroupCommitWriter
+from backend_app.core.memory_backends import WeaviateMemoryBackend
+from backend_app.core.outbox_indexer import MemoryOutboxIndexer, pair_turns
+from backend_app.core.session_cache import RecentHistoryCache
+from backend_app.models.database import ChatHistory
+
+
+class FakeBatch:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.objects = []
+        self.imports = 0
+
+    def configure(self, **kwargs):
+        pass
+
+    def add_data_object(self, data_object, class_name, uuid=None, vector=None):
+        assert vector is not None
+        self.objects.append((uuid, data_object))
+
+    def create_objects(self):
+        self.imports += 1
+        if self.fail:
+            raise ConnectionError("Weaviate indisponível")
+        return [{"result": {}} for _ in self.objects]
+
+
+def _embed(texts):
+    return [[float(len(text)), 1.0] for text in texts]
+
+
+def _add_turn(factory, session_id, user_message, assistant_message):
+    db = factory()
+    timestamp = datetime(2024, 1, 1)
+    db.add(ChatHistory(session_id=session_id, message_type="user", user_message=user_message, timestamp=timestamp))
+    db.add(ChatHistory(session_id=session_id, message_type="assistant", assistant_message=assistant_message, timestamp=timestamp))
+    db.commit()
+    db.close()
+
+
+def _pending(factory):
+    db = factory()
+    count = db.query(ChatHistory).filter(ChatHistory.processed == False).count()  # noqa: E712
+    db.close()
+    return count
+
+
+def _row(row_id, session_id, message_type):
+    return SimpleNamespace(id=row_id, session_id=session_id, message_type=message_type)
+
+
+def test_pair_turns_groups_by_session():
+    rows = [_row(1, "a", "user"), _row(2, "b", "user"), _row(3, "a", "assistant"),
+            _row(4, "b", "assistant"), _row(5, "a", "assistant"), _row(6, "b", "user")]
+
+    turns, unpaired = pair_turns(rows)
+
+    assert [(u.id, a.id) for u, a in turns] == [(1, 3), (2, 4)]
+    # A resposta solta e a pergunta com a resposta fora do lote ficam por decidir
+    assert [row.id for row in unpaired] == [5, 6]
+
+
+def test_drain_indexes_pending_turns_in_one_batch(session_factory):
+    _add_turn(session_factory, "s1", "Chamo-me Ana", "Olá Ana!")
+    _add_turn(session_factory, "s2", "Gosto de ética", "Ótimo!")
+    batch = FakeBatch()
+    indexer = MemoryOutboxIndexer(backend_factory=lambda: WeaviateMemoryBackend(SimpleNamespace(batch=batch)),
+                                    embed_documents=_embed, session_factory=session_factory)
+
+    assert indexer.drain_once() == 4
+    assert batch.imports == 1
+    assert [obj["session_id"] for _, obj in batch.objects] == ["s1", "s2"]
+    assert batch.objects[0][1]["content"] == "Utilizador: Chamo-me Ana\n\nAssistente: Olá Ana!"
+    assert _pending(session_factory) == 0
+    assert indexer.drain_once() == 0
+
+
+def test_failed_import_leaves_rows_pending_with_stable_ids(session_factory):
+    _add_turn(session_factory, "s1", "Chamo-me Ana", "Olá Ana!")
+    failing = FakeBatch(fail=True)
+    indexer = MemoryOutboxIndexer(backend_factory=lambda: WeaviateMemoryBackend(SimpleNamespace(batch=failing)),
+                                    embed_documents=_embed, session_factory=session_factory)
+
+    with pytest.raises(ConnectionError):
+        indexer.drain_once()
+    assert _pending(session_factory) == 2
+
+    retry = FakeBatch()
+    indexer.backend_factory = lambda: WeaviateMemoryBackend(SimpleNamespace(batch=retry))
+    assert indexer.drain_once() == 2
+    # Reenvios usam o mesmo UUID, por isso não criam duplicados
+    assert retry.objects[0][0] == failing.objects[0][0]
+
+
+def _add_row(factory, session_id, sequence, message_type, timestamp, processed=False):
+    db = factory()
+    db.add(ChatHistory(session_id=session_id, sequence=sequence, message_type=message_type,
+                       user_message="pergunta", assistant_message="resposta",
+                       timestamp=timestamp, processed=processed))
+    db.commit()
+    db.close()
+
+
+def _processed_ids(factory):
+    db = factory()
+    ids = [row.id for row in db.query(ChatHistory).filter(ChatHistory.processed == True)]  # noqa: E712
+    db.close()
+    return sorted(ids)
+
+
+def test_unpaired_rows_wait_for_their_partner_or_the_orphan_age(session_factory):
+    now = datetime.utcnow()
+    old = now - timedelta(hours=2)
+    _add_row(session_factory, "s1", 1, "user", now)                     # 1: par pendente fora do lote
+    _add_row(session_factory, "s2", 1, "user", old)                     # 2: par já processado
+    _add_row(session_factory, "s2", 2, "assistant", old, processed=True)
+    _add_row(session_factory, "s3", 1, "user", now)                     # 4: sem par, recente
+    _add_row(session_factory, "s4", 1, "user", old)                     # 5: sem par, antiga
+    _add_row(session_factory, "s1", 2, "assistant", now)                # 6: fora do primeiro lote
+
+    batch = FakeBatch()
+    indexer = MemoryOutboxIndexer(backend_factory=lambda: WeaviateMemoryBackend(SimpleNamespace(batch=batch)),
+                                  embed_documents=_embed, session_factory=session_factory,
+                                  batch_size=2, orphan_seconds=600)
+
+    assert indexer.drain_once() == 2
+    assert _processed_ids(session_factory) == [2, 3, 5]
+    assert batch.objects == []
+
+    # No lote seguinte a troca de s1 fica completa e a linha recente continua pendente
+    indexer.batch_size = 10
+    assert indexer.drain_once() == 2
+    assert _processed_ids(session_factory) == [1, 2, 3, 5, 6]
+    assert [obj["session_id"] for _, obj in batch.objects] == ["s1"]
+
+
+def test_rows_are_claimed_without_holding_locks_during_the_import(session_factory):
+    _add_turn(session_factory, "s1", "Chamo-me Ana", "Olá Ana!")
+    seen = []
+
+    class ClaimCheckingBatch(FakeBatch):
+        def create_objects(self):
+            # Durante a escrita as linhas já estão reservadas (transação confirmada)
+            db = session_factory()
+            seen.extend((row.processed, row.claimed_at is not None) for row in db.query(ChatHistory))
+            db.close()
+            return super().create_objects()
+
+    batch = ClaimCheckingBatch()
+    indexer = MemoryOutboxIndexer(backend_factory=lambda: WeaviateMemoryBackend(SimpleNamespace(batch=batch)),
+                                  embed_documents=_embed, session_factory=session_factory)
+
+    assert indexer.drain_once() == 2
+    assert seen == [(False, True), (False, True)]
+    db = session_factory()
+    assert all(row.processed and row.claimed_at is None for row in db.query(ChatHistory))
+    db.close()
+
+
+def test_sessions_claimed_by_another_worker_are_left_to_it(session_factory):
+    _add_turn(session_factory, "s1", "Chamo-me Ana", "Olá Ana!")
+    _add_turn(session_factory, "s1", "Gosto de ética", "Ótimo!")
+    _add_turn(session_factory, "s2", "Olá", "Olá!")
+
+    # Outro worker reservou a primeira troca de s1 e ainda a está a indexar
+    db = session_factory()
+    db.query(ChatHistory).filter(ChatHistory.id.in_([1, 2])).update(
+        {ChatHistory.claimed_at: datetime.utcnow()}, synchronize_session=False
+    )
+    db.commit()
+    db.close()
+
+    batch = FakeBatch()
+    indexer = MemoryOutboxIndexer(backend_factory=lambda: WeaviateMemoryBackend(SimpleNamespace(batch=batch)),
+                                  embed_documents=_embed, session_factory=session_factory)
+
+    assert indexer.drain_once() == 2
+    assert [obj["session_id"] for _, obj in batch.objects] == ["s2"]
+
+    # Com a reserva concluída, a sessão fica livre para qualquer worker
+    db = session_factory()
+    db.query(ChatHistory).filter(ChatHistory.id.in_([1, 2])).update(
+        {ChatHistory.processed: True, ChatHistory.claimed_at: None}, synchronize_session=False
+    )
+    db.commit()
+    db.close()
+    assert indexer.drain_once() == 2
+    assert [obj["session_id"] for _, obj in batch.objects] == ["s2", "s1"]
+
+
+def test_legacy_manager_indexes_and_searches_through_the_outbox(session_factory, monkeypatch):
+    writer = GroupCommitWriter(session_factory=session_factory, window_ms=10)
+    notified = []
+    searches = []
+
+    class FakeBackend:
+        def search(self, vector, limit, filters):
+            searches.append((limit, filters.exclude_session))
+            return [{"content": "U: Kant → A: imperativo"}]
+
+    monkeypatch.setattr(memory_manager, "get_chat_history_writer", lambda: writer)
+    monkeypatch.setattr(memory_manager, "get_outbox_indexer", lambda: SimpleNamespace(notify=lambda: notified.append(1)))
+    monkeypatch.setattr(memory_manager, "get_query_embedder", lambda: SimpleNamespace(embed_query=lambda text: [1.0, 0.0]))
+    monkeypatch.setattr(memory_manager, "get_memory_backend", FakeBackend)
+
+    manager = memory_manager.MemoryManager.__new__(memory_manager.MemoryManager)
+    manager.history_cache = RecentHistoryCache()
+    manager.summarizer = SimpleNamespace(schedule=lambda session_id: None)
+
+    assert manager.add_message("s1", "Quem foi Kant?", "Um filósofo.")
+    writer.stop()
+
+    # Nenhum vetor calculado no pedido: as linhas ficam para o outbox
+    assert [row.processed for row in session_factory().query(ChatHistory)] == [False, False]
+    assert notified == [1]
+    # A pesquisa lê o mesmo armazenamento que o outbox preenche
+    assert manager._get_semantic_memories("Kant", 3, exclude_session="s1") == ["U: Kant → A: imperativo"]
+    assert searches == [(3, "s1")]
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Testes da cache semântica de respostas (embeddings por hashing, relógio simulado)
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from backend_app.api import chat
+from backend_app.core.embeddings import HashingEmbeddingProvider
+from backend_app.core.response_cache import SemanticResponseCache
+
+PROVIDER = HashingEmbeddingProvider(dimensions=512)
+
+
+def _cache(**kwargs):
+    kwargs.setdefault("ttls", {"web_search": 60, "general": 3600})
+    return SemanticResponseCache(embed_query=lambda text: PROVIDER.embed([text])[0], **kwargs)
+
+
+def test_near_identical_questions_hit_and_others_miss():
+    cache = _cache(threshold=0.9)
+    assert cache.store("Quem é o presidente de França?", "Emmanuel Macron", "web_search")
+
+    assert cache.lookup("quem é o presidente de frança") == "Emmanuel Macron"
+    assert cache.lookup("Qual é a capital do Japão?") is None
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1 and stats["hit_ratio"] == 0.5
+    assert stats["hits_by_route"] == {"web_search": 1}
+
+
+def test_each_route_has_its_own_ttl_and_session_routes_are_not_stored(fake_clock):
+    cache = _cache(clock=fake_clock)
+    cache.store("Qual é a cotação do euro?", "1.08 dólares", "web_search")
+    cache.store("O que é a ética das virtudes?", "Aristóteles...", "general")
+    assert not cache.store("Qual é o meu nome?", "Ana", "memory_search")
+
+    fake_clock.now += 120
+    assert cache.lookup("Qual é a cotação do euro?") is None
+    assert cache.lookup("O que é a ética das virtudes?") == "Aristóteles..."
+    assert cache.stats()["entries"] == 1
+
+
+def test_full_cache_replaces_the_entry_that_expires_first():
+    cache = _cache(max_entries=2)
+    cache.store("pergunta geral", "a", "general")
+    cache.store("pergunta web", "b", "web_search")
+    cache.store("outra pergunta", "c", "general")
+
+    assert cache.lookup("pergunta web") is None
+    assert cache.lookup("pergunta geral") == "a" and cache.lookup("outra pergunta") == "c"
+
+
+def test_chat_uses_the_cache_only_without_session_memory(monkeypatch):
+    cache = _cache()
+    searches = []
+
+    async def fake_search(question):
+        searches.append(question)
+        return "1. resultado"
+
+    async def fake_answer(question, context, results):
+        return f"resposta para {question}"
+
+    monkeypatch.setattr(chat, "get_response_cache", lambda: cache)
+    monkeypatch.setattr(chat, "search_web", fake_search)
+    monkeypatch.setattr(chat, "answer_from_search", fake_answer)
+
+    question = "Quem ganhou o Nobel da Paz?"
+    first = asyncio.run(chat.execute_web_search(question))
+    second = asyncio.run(chat.execute_web_search(question))
+    assert first == second and len(searches) == 1
+
+    # Com contexto de memória a cache é ignorada e a resposta não é guardada
+    asyncio.run(chat.execute_web_search(question, "## Conversa recente\nU: olá"))
+    assert len(searches) == 2
+    assert cache.stats()["stores"] == 1
+
+
+def test_chat_endpoint_caches_context_free_answers(monkeypatch):
+    from backend_app.core.memory_manager import MemoryManager
+
+    cache = _cache()
+    searches = []
+
+    async def fake_search(question):
+        searches.append(question)
+        return "1. resultado"
+
+    async def fake_answer(question, context, results):
+        return f"resposta para {question}"
+
+    monkeypatch.setattr(chat, "get_response_cache", lambda: cache)
+    monkeypatch.setattr(chat, "search_web", fake_search)
+    monkeypatch.setattr(chat, "answer_from_search", fake_answer)
+
+    # Sessão nova sem memórias: o MemoryManager devolve um contexto vazio
+    context = MemoryManager.__new__(MemoryManager)._format_context([], [], None)
+    assert context == ""
+
+    question = "Quem é o presidente do Brasil?"
+    for speculative in (False, True, True):
+        monkeypatch.setattr(chat, "SPECULATIVE_EXPERTS", speculative)
+        assert asyncio.run(chat.process_with_context(question, context)) == f"resposta para {question}"
+
+    # Uma única pesquisa: as seguintes (também a especulativa) vêm da cache
+    assert searches == [question]
+    assert cache.stats()["hits"] == 2
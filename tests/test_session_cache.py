@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Testes da cache de histórico recente por sessão
+"""
+
+import asyncio
+import os
+import sys
+from datetime import datetime
+from types import SimpleNamespace
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from backend_app.core import hybrid_memory_manager
+from backend_app.core.hybrid_memory_manager import MemoryManager
+from backend_app.core.session_cache import RecentHistoryCache
+
+
+def _msg(kind, content):
+    return {'type': kind, 'content': content, 'timestamp': datetime(2024, 1, 1)}
+
+
+def test_unprimed_session_is_a_miss_and_append_is_ignored():
+    cache = RecentHistoryCache(messages_per_session=4)
+    cache.append("s1", [_msg('user', 'olá')])
+
+    assert cache.get("s1", 2) is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_ring_buffer_keeps_latest_messages():
+    cache = RecentHistoryCache(messages_per_session=4)
+    cache.prime("s1", [_msg('user', 'a'), _msg('assistant', 'b')])
+    cache.append("s1", [_msg('user', 'c'), _msg('assistant', 'd'), _msg('user', 'e')])
+
+    assert [m['content'] for m in cache.get("s1", 4)] == ['b', 'c', 'd', 'e']
+    assert [m['content'] for m in cache.get("s1", 2)] == ['d', 'e']
+    assert cache.get("s1", 5) is None  # Pedido maior que o buffer vai à base de dados
+    assert cache.stats()["cached_chars"] == 4
+
+
+def test_lru_eviction_by_sessions_and_chars():
+    cache = RecentHistoryCache(messages_per_session=4, max_sessions=2, max_chars=10)
+    cache.prime("s1", [_msg('user', 'aaaa')])
+    cache.prime("s2", [_msg('user', 'bbbb')])
+    cache.get("s1", 1)  # s1 passa a ser a mais recente
+    cache.prime("s3", [_msg('user', 'cccc')])
+
+    assert cache.get("s2", 1) is None
+    assert cache.get("s1", 1) is not None
+
+    cache.append("s3", [_msg('assistant', 'dddddd')])  # excede max_chars
+    stats = cache.stats()
+    assert stats["cached_chars"] <= 10
+    assert stats["evictions"] == 2
+
+
+def test_expired_sessions_are_reloaded():
+    cache = RecentHistoryCache(messages_per_session=4, ttl_seconds=0)
+    cache.prime("s1", [_msg('user', 'a')])
+
+    assert cache.get("s1", 1) is None
+
+
+class CountingDB:
+    def __init__(self):
+        self.queries = []
+        self.last_sequence = None
+
+    def execute(self, query, params=None):
+        self.queries.append(str(query))
+        return []
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+def _manager(db, monkeypatch):
+    # Sem pesquisas vetoriais nestes testes: nenhum fornecedor de embeddings
+    monkeypatch.setattr(hybrid_memory_manager, "get_query_embedder", lambda: None)
+    weaviate_client = SimpleNamespace(schema=SimpleNamespace(exists=lambda name: True))
+    manager = MemoryManager(db_session=db, weaviate_client=weaviate_client)
+    manager.history_cache = RecentHistoryCache(messages_per_session=10)
+    manager.outbox = SimpleNamespace(notify=lambda: None)
+
+    def write(session_id, *args, **kwargs):
+        db.last_sequence = (db.last_sequence or 0) + 2
+        return [db.last_sequence - 1, db.last_sequence]
+
+    manager.writer = SimpleNamespace(write=write)
+    return manager
+
+
+def test_follow_up_turns_skip_the_database(monkeypatch):
+    db = CountingDB()
+    manager = _manager(db, monkeypatch)
+
+    first = asyncio.run(manager._get_recent_history("nova-sessao", 5))
+    manager.add_message("nova-sessao", "Chamo-me Ana", "Olá Ana!")
+    reads_after_first_turn = len(db.queries)
+    second = asyncio.run(manager._get_recent_history("nova-sessao", 5))
+
+    assert first == []
+    assert [m['content'] for m in second] == ["Chamo-me Ana", "Olá Ana!"]
+    # Nenhuma consulta à base de dados no segundo turno
+    assert len(db.queries) == reads_after_first_turn
+    assert manager.history_cache.stats()["hits"] == 1
+
+
+def test_sessions_only_read_from_the_database_expire_sooner(fake_clock):
+    cache = RecentHistoryCache(messages_per_session=4, ttl_seconds=600, read_ttl_seconds=30, clock=fake_clock)
+    cache.prime("lida", [_msg('user', 'a')])
+    cache.prime("escrita", [_msg('user', 'a')])
+    cache.append("escrita", [_msg('assistant', 'b')])
+
+    fake_clock.now += 60
+    # Outro worker pode ter gravado na sessão só lida: volta à base de dados
+    assert cache.get("lida", 1) is None
+    # A sessão escrita por este worker continua válida
+    assert [m['content'] for m in cache.get("escrita", 2)] == ['a', 'b']
+
+
+def test_prime_merges_by_sequence():
+    cache = RecentHistoryCache(messages_per_session=4)
+    cache.prime("s1", [dict(_msg('user', 'a'), sequence=1), dict(_msg('assistant', 'b'), sequence=2)])
+    cache.append("s1", [dict(_msg('user', 'c'), sequence=3), dict(_msg('assistant', 'd'), sequence=4)])
+    # Leitura da base de dados anterior ao append: não apaga as mensagens novas
+    cache.prime("s1", [dict(_msg('user', 'a'), sequence=1), dict(_msg('assistant', 'b'), sequence=2)])
+
+    assert [m['content'] for m in cache.get("s1", 4)] == ['a', 'b', 'c', 'd']
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Testes da paginação por keyset do histórico de sessões
+(SQLite em memória)
+"""
+
+import functools
+import json
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from fastapi.testclient import TestClient
+
+from backend_app.api import chat_with_memory
+from backend_app.core.session_history import (
+    decode_cursor, encode_cursor, fetch_history_page, iter_history, parse_fields
+)
+from backend_app.models.database import ChatHistory
+
+
+def _add_history(factory, turns=5):
+    db = factory()
+    for turn in range(turns):
+        for offset, message_type in enumerate(("user", "assistant")):
+            db.add(ChatHistory(
+                session_id="s1",
+                sequence=turn * 2 + offset + 1,
+                message_type=message_type,
+                user_message=f"pergunta {turn}" if message_type == "user" else None,
+                assistant_message=f"resposta {turn}" if message_type == "assistant" else None,
+                timestamp=datetime(2024, 1, 1),
+            ))
+    db.add(ChatHistory(session_id="s2", sequence=1, message_type="user", user_message="outra", timestamp=datetime(2024, 1, 1)))
+    db.commit()
+    db.close()
+
+
+def test_pages_follow_the_cursor_without_gaps(session_factory):
+    _add_history(session_factory)
+    db = session_factory()
+
+    first, cursor = fetch_history_page(db, "s1", limit=4)
+    second, cursor = fetch_history_page(db, "s1", decode_cursor(cursor), limit=4)
+    third, cursor = fetch_history_page(db, "s1", decode_cursor(cursor), limit=4)
+
+    sequences = [message["sequence"] for message in first + second + third]
+    assert sequences == list(range(1, 11))
+    assert first[0] == {"sequence": 1, "type": "user", "content": "pergunta 0", "timestamp": "2024-01-01T00:00:00"}
+    assert cursor is None
+
+
+def test_descending_order_and_field_selection(session_factory):
+    _add_history(session_factory)
+    db = session_factory()
+
+    messages, cursor = fetch_history_page(db, "s1", limit=3, fields=parse_fields("type,content"), descending=True)
+
+    assert messages == [
+        {"type": "assistant", "content": "resposta 4"},
+        {"type": "user", "content": "pergunta 4"},
+        {"type": "assistant", "content": "resposta 3"},
+    ]
+    assert decode_cursor(cursor) == 8
+
+
+def test_invalid_fields_and_cursors_are_rejected():
+    with pytest.raises(ValueError):
+        parse_fields("content,password")
+    with pytest.raises(ValueError):
+        decode_cursor("não-é-um-cursor")
+    assert decode_cursor(encode_cursor(42)) == 42
+
+
+def test_iter_history_reads_page_by_page(session_factory):
+    _add_history(session_factory)
+    opened = []
+
+    def counting_factory():
+        opened.append(1)
+        return session_factory()
+
+    messages = list(iter_history("s1", page_size=3, fields=("sequence",), session_factory=counting_factory))
+
+    assert [message["sequence"] for message in messages] == list(range(1, 11))
+    assert len(opened) == 4
+
+
+def test_history_endpoint_json_and_ndjson(session_factory, monkeypatch):
+    _add_history(session_factory)
+    monkeypatch.setattr(chat_with_memory, "get_db_session", session_factory)
+    monkeypatch.setattr(chat_with_memory, "iter_history",
+                        functools.partial(iter_history, session_factory=session_factory))
+    client = TestClient(chat_with_memory.app)
+
+    page = client.get("/api/sessions/s1/history", params={"limit": 4}).json()
+    assert [message["sequence"] for message in page["messages"]] == [1, 2, 3, 4]
+    following = client.get("/api/sessions/s1/history", params={"limit": 4, "cursor": page["next_cursor"]}).json()
+    assert following["messages"][0]["sequence"] == 5
+
+    response = client.get("/api/sessions/s1/history", params={"format": "ndjson", "limit": 3, "fields": "sequence"})
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert [json.loads(line) for line in response.text.splitlines()] == [{"sequence": n} for n in range(1, 11)]
+
+    assert client.get("/api/sessions/s1/history", params={"cursor": "xyz"}).status_code == 400
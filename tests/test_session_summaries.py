@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Testes dos resumos incrementais por sessão (SQLite em memória, resumidor simulado)
+"""
+
+import asyncio
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from backend_app.core import hybrid_memory_manager
+from backend_app.core.context_assembler import SUMMARY_HEADER, ContextAssembler
+from backend_app.core.hybrid_memory_manager import MemoryManager
+from backend_app.core.session_cache import RecentHistoryCache
+from backend_app.core.session_summaries import SessionSummarizer, unsummarized_messages
+from backend_app.models.database import ChatHistory, SessionSummary
+
+
+def _add_turns(factory, session_id, start, count):
+    db = factory()
+    for turn in range(start, start + count):
+        db.add(ChatHistory(session_id=session_id, message_type="user", sequence=2 * turn + 1,
+                           user_message=f"pergunta {turn}", timestamp=datetime.utcnow()))
+        db.add(ChatHistory(session_id=session_id, message_type="assistant", sequence=2 * turn + 2,
+                           assistant_message=f"resposta {turn}", timestamp=datetime.utcnow()))
+    db.commit()
+    db.close()
+
+
+class RecordingSummarizer:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, summary, messages):
+        self.calls.append((summary, [message["content"] for message in messages]))
+        return (summary + " | " if summary else "") + ",".join(message["content"] for message in messages)
+
+
+def test_summary_folds_older_turns_every_n_turns(session_factory):
+    fake = RecordingSummarizer()
+    summarizer = SessionSummarizer(summarize_fn=fake, session_factory=session_factory, every_turns=2, keep_recent_turns=3)
+
+    _add_turns(session_factory, "s1", 0, 4)
+    # Só 1 turno fora da janela recente: ainda não resume
+    assert not summarizer.update("s1")
+    assert summarizer.get("s1") is None
+
+    _add_turns(session_factory, "s1", 4, 1)
+    assert summarizer.update("s1")
+    assert fake.calls[-1] == ("", ["pergunta 0", "resposta 0", "pergunta 1", "resposta 1"])
+    assert summarizer.get("s1")["last_sequence"] == 4
+
+    # Incremental: o resumo anterior é passado ao resumidor com os turnos novos
+    _add_turns(session_factory, "s1", 5, 2)
+    assert summarizer.update("s1")
+    previous, messages = fake.calls[-1]
+    assert previous.startswith("pergunta 0") and messages[0] == "pergunta 2"
+    assert summarizer.get("s1")["last_sequence"] == 8
+
+    db = session_factory()
+    assert db.get(SessionSummary, "s1").last_sequence == 8
+    db.close()
+
+
+def test_concurrent_update_from_another_worker_is_not_overwritten(session_factory):
+    _add_turns(session_factory, "s1", 0, 6)
+    first = SessionSummarizer(summarize_fn=RecordingSummarizer(), session_factory=session_factory,
+                              every_turns=2, keep_recent_turns=1)
+    assert first.update("s1")
+    _add_turns(session_factory, "s1", 6, 4)
+
+    class RacingSummarizer(RecordingSummarizer):
+        def __call__(self, summary, messages):
+            # Outro worker grava primeiro enquanto este ainda está a resumir
+            db = session_factory()
+            db.get(SessionSummary, "s1").last_sequence = 99
+            db.commit()
+            db.close()
+            return super().__call__(summary, messages)
+
+    second = SessionSummarizer(summarize_fn=RacingSummarizer(), session_factory=session_factory,
+                               every_turns=2, keep_recent_turns=1)
+    assert not second.update("s1")
+    db = session_factory()
+    assert db.get(SessionSummary, "s1").last_sequence == 99
+    db.close()
+
+
+def test_no_database_session_is_held_during_the_llm_call(session_factory):
+    _add_turns(session_factory, "s1", 0, 6)
+    open_sessions = []
+
+    class TrackedSession:
+        def __init__(self):
+            self.session = session_factory()
+            open_sessions.append(self)
+
+        def __getattr__(self, name):
+            return getattr(self.session, name)
+
+        def close(self):
+            open_sessions.remove(self)
+            self.session.close()
+
+    class CheckingSummarizer(RecordingSummarizer):
+        def __call__(self, summary, messages):
+            assert open_sessions == []
+            return super().__call__(summary, messages)
+
+    summarizer = SessionSummarizer(summarize_fn=CheckingSummarizer(), session_factory=TrackedSession,
+                                   every_turns=2, keep_recent_turns=1)
+    assert summarizer.update("s1")
+    assert open_sessions == []
+    assert summarizer.get("s1")["last_sequence"] == 10
+
+
+def test_schedule_runs_off_thread_with_one_job_per_session(session_factory):
+    _add_turns(session_factory, "s1", 0, 6)
+    release = threading.Event()
+    calls = []
+
+    def slow_summary(summary, messages):
+        calls.append(threading.current_thread().name)
+        release.wait(2)
+        return "resumo"
+
+    summarizer = SessionSummarizer(summarize_fn=slow_summary, session_factory=session_factory,
+                                   every_turns=2, keep_recent_turns=1, max_concurrency=1)
+    for _ in range(5):
+        summarizer.schedule("s1")
+    assert summarizer.stats()["pending"] == 1
+
+    release.set()
+    deadline = time.time() + 2
+    while summarizer.stats()["pending"] and time.time() < deadline:
+        time.sleep(0.01)
+    assert len(calls) == 1 and calls[0].startswith("session-summary")
+    assert summarizer.get("s1")["summary"] == "resumo"
+    summarizer.stop()
+
+
+def test_summary_comes_first_in_the_context():
+    assembled = ContextAssembler(max_tokens=200).assemble(
+        [{"type": "user", "content": "olá"}, {"type": "assistant", "content": "olá!"}], [],
+        summary="A Ana estuda filosofia."
+    )
+    assert assembled.text.startswith(SUMMARY_HEADER + "\nA Ana estuda filosofia.")
+    assert assembled.sections["summary"] > 0
+
+
+def _manager(factory, last_sequence, monkeypatch):
+    # As memórias de longo prazo são simuladas: nenhum fornecedor de embeddings
+    monkeypatch.setattr(hybrid_memory_manager, "get_query_embedder", lambda: None)
+    manager = MemoryManager(db_session=factory(),
+                            weaviate_client=SimpleNamespace(schema=SimpleNamespace(exists=lambda name: True)))
+    manager.history_cache = RecentHistoryCache(messages_per_session=20)
+    manager.summarizer = SimpleNamespace(
+        every_turns=2, get=lambda session_id: {"summary": "resumo antigo", "last_sequence": last_sequence}
+    )
+
+    async def no_memories(*args, **kwargs):
+        return []
+
+    manager._get_semantic_memories = no_memories
+    return manager
+
+
+def _turns_in(context):
+    return [int(turn) for turn in re.findall(r"pergunta (\d+)", context)]
+
+
+def test_unsummarized_messages_need_a_window_that_reaches_the_summary():
+    window = [{"type": "user", "content": "", "sequence": sequence} for sequence in range(5, 9)]
+    assert [m["sequence"] for m in unsummarized_messages(window, 6)] == [7, 8]
+    # A janela começa depois da primeira mensagem por resumir: não chega
+    assert unsummarized_messages(window, 2) is None
+    assert unsummarized_messages([{"type": "user", "content": ""}], 0) is None
+
+
+def test_context_sends_only_the_turns_after_the_summary(session_factory, monkeypatch):
+    _add_turns(session_factory, "s1", 0, 10)  # sequências 1..20
+
+    # Resumo em dia (até ao turno 6) e resumo que já cobre parte da janela recente
+    context = asyncio.run(_manager(session_factory, 14, monkeypatch).get_context("s1", "ética", recent_limit=2))
+    assert _turns_in(context) == [7, 8, 9]
+    context = asyncio.run(_manager(session_factory, 16, monkeypatch).get_context("s1", "ética", recent_limit=2))
+    assert _turns_in(context) == [8, 9]
+
+
+def test_stale_or_lagging_summary_does_not_drop_turns(session_factory, monkeypatch):
+    _add_turns(session_factory, "s1", 0, 10)
+
+    # Resumo desatualizado (cache) até ao turno 2: os turnos 3 a 6 vêm da base de dados
+    context = asyncio.run(_manager(session_factory, 6, monkeypatch).get_context("s1", "ética", recent_limit=2))
+    assert _turns_in(context) == [3, 4, 5, 6, 7, 8, 9]
+
+    # Resumo muito atrasado: os turnos por resumir são limitados aos mais recentes
+    monkeypatch.setattr(hybrid_memory_manager, "SESSION_SUMMARY_MAX_PENDING_TURNS", 4)
+    context = asyncio.run(_manager(session_factory, 0, monkeypatch).get_context("s1", "ética", recent_limit=2))
+    assert _turns_in(context) == [6, 7, 8, 9]
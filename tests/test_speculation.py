@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Testes da execução especulativa dos especialistas (memória e web em paralelo
+com a classificação, pesquisas simuladas)
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from backend_app.api import chat
+from backend_app.core.speculation import Speculation, SpeculationMetrics
+
+
+def _patch_experts(monkeypatch, route, memories, events):
+    async def fake_classify(input_dict):
+        events.append("classify")
+        await asyncio.sleep(0.01)
+        return route
+
+    def fake_memories(question):
+        events.append("memory")
+        return memories
+
+    async def fake_web(question):
+        events.append("web-start")
+        await asyncio.sleep(0.05)
+        events.append("web-done")
+        return "1. resultado"
+
+    async def fake_answer(question, context, results):
+        return f"web: {results} | {context}"
+
+    monkeypatch.setattr(chat, "classify_question", fake_classify)
+    monkeypatch.setattr(chat, "search_memories", fake_memories)
+    monkeypatch.setattr(chat, "search_web", fake_web)
+    monkeypatch.setattr(chat, "answer_from_search", fake_answer)
+
+
+def test_memory_hit_cancels_the_web_search(monkeypatch):
+    events = []
+    _patch_experts(monkeypatch, "memory_search", ["U: Kant → A: imperativo"], events)
+
+    reply = asyncio.run(chat.speculative_answer("Lembras-te de Kant?", "ctx"))
+    assert reply.startswith("Com base nas nossas conversas anteriores")
+    # Os três ramos arrancaram juntos e a pesquisa web nunca terminou
+    assert {"classify", "memory", "web-start"} <= set(events)
+    assert "web-done" not in events
+
+
+def test_empty_memory_falls_back_to_the_running_web_search(monkeypatch):
+    events = []
+    _patch_experts(monkeypatch, "memory_search", [], events)
+
+    reply = asyncio.run(chat.speculative_answer("Lembras-te de Kant?", "ctx"))
+    assert reply == "web: 1. resultado | ctx"
+    # A pesquisa web especulativa foi reutilizada, não repetida
+    assert events.count("web-start") == 1
+
+
+def test_failed_branches_never_repeat_the_web_search(monkeypatch):
+    events = []
+    _patch_experts(monkeypatch, "memory_search", [], events)
+
+    def broken_memories(question):
+        raise ConnectionError("Weaviate indisponível")
+
+    # Memória em erro: responde a pesquisa web que já estava a correr
+    monkeypatch.setattr(chat, "search_memories", broken_memories)
+    assert asyncio.run(chat.speculative_answer("Lembras-te de Kant?", "ctx")) == "web: 1. resultado | ctx"
+    assert events.count("web-start") == 1
+
+    async def broken_web(question):
+        events.append("web-start")
+        raise ConnectionError("Tavily indisponível")
+
+    # Web em erro: só o LLM, sem segunda pesquisa
+    events.clear()
+    monkeypatch.setattr(chat, "classify_question", lambda input_dict: asyncio.sleep(0, "web_search"))
+    monkeypatch.setattr(chat, "search_web", broken_web)
+    monkeypatch.setattr(chat, "llm_only_answer", lambda question, context: f"llm: {question}")
+    assert asyncio.run(chat.speculative_answer("Quem ganhou o jogo?", "ctx")) == "llm: Quem ganhou o jogo?"
+    assert events.count("web-start") == 1
+
+
+def test_cost_cap_defers_branches_until_they_are_needed():
+    async def scenario():
+        metrics = SpeculationMetrics()
+        speculation = Speculation(cost_cap=1.0, metrics=metrics)
+        calls = []
+
+        async def branch(name):
+            calls.append(name)
+            return name
+
+        assert speculation.start("memory", lambda: branch("memory"), 0.2)
+        assert not speculation.start("web", lambda: branch("web"), 1.0)
+        await asyncio.sleep(0)
+        assert calls == ["memory"]
+
+        # O ramo não iniciado corre quando a rota o pede
+        assert await speculation.result("web", lambda: branch("web")) == "web"
+        speculation.cancel_all()
+        return metrics.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["started"] == 1 and stats["capped"] == 1
+    assert stats["cancelled"] == 1 and stats["wasted_cost"] == 0.2
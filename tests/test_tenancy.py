@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Testes da memória semântica multi-tenant
+(shards locais por utilizador, Weaviate e esquema simulados)
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import inspect, text
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from backend_app.core.local_index import LocalVectorIndex
+from backend_app.core.memory_backends import LocalMemoryBackend, MemoryFilter, WeaviateMemoryBackend
+from backend_app.core.tenancy import ANONYMOUS_TENANT, WeaviateTenantRegistry, tenant_for
+from backend_app.models.database import ChatHistory, _ensure_columns
+
+
+def _records(user_id, vectors, prefix):
+    return [
+        {"id": f"{prefix}{i}", "vector": vector,
+         "properties": {"session_id": f"s-{prefix}", "user_id": user_id, "content": f"{prefix} {i}"}}
+        for i, vector in enumerate(vectors)
+    ]
+
+
+def test_tenant_names_are_safe_and_stable():
+    assert tenant_for(None) == tenant_for("") == ANONYMOUS_TENANT
+    assert tenant_for("ana_1") == "u-ana_1"
+    hashed = tenant_for("ana@example.com")
+    assert hashed.startswith("h-") and hashed == tenant_for("ana@example.com")
+    assert hashed != tenant_for("rui@example.com")
+
+
+def test_local_shards_only_search_their_user():
+    backend = LocalMemoryBackend(LocalVectorIndex(), certainty=0.0, multi_tenant=True)
+    vectors = np.eye(4, dtype=np.float32) + 0.1
+    backend.add_many(_records("ana", vectors[:2], "a") + _records("rui", vectors[2:], "r")
+                     + _records(None, vectors[:1], "x"))
+
+    assert {m["id"] for m in backend.search(vectors[2], 5, MemoryFilter(user_id="ana"))} == {"a0", "a1"}
+    assert {m["id"] for m in backend.search(vectors[0], 5, MemoryFilter(user_id="rui"))} == {"r0", "r1"}
+    assert [m["id"] for m in backend.search(vectors[0], 5)] == ["x0"]
+    # Utilizador sem memórias: nenhum shard é criado
+    assert backend.search(vectors[0], 5, MemoryFilter(user_id="novo")) == []
+    assert backend.stats()["open_tenant_shards"] == 2
+
+
+def test_idle_shards_are_offloaded_and_reloaded(tmp_path):
+    vectors = np.eye(8, dtype=np.float32) + 0.1
+    backend = LocalMemoryBackend(LocalVectorIndex(directory=str(tmp_path)), certainty=0.0,
+                                 multi_tenant=True, max_active_tenants=2)
+    for i, user_id in enumerate(["ana", "rui", "eva"]):
+        backend.add_many(_records(user_id, vectors[2 * i:2 * i + 2], user_id))
+
+    stats = backend.stats()
+    assert stats["open_tenant_shards"] == 2 and stats["offloaded_tenant_shards"] == 1
+
+    # O shard da ana foi fechado e volta a ser aberto a partir do disco
+    found = backend.search(vectors[0], 5, MemoryFilter(user_id="ana"))
+    assert [m["id"] for m in found][:1] == ["ana0"]
+    assert os.path.isdir(tmp_path / "tenants" / "u-ana")
+
+
+def test_watermark_is_checkpointed_after_the_shards(tmp_path):
+    vectors = np.eye(4, dtype=np.float32)
+    backend = LocalMemoryBackend(LocalVectorIndex(directory=str(tmp_path)), certainty=0.0,
+                                 multi_tenant=True, checkpoint_every=10)
+    backend.add_many(_records("ana", vectors, "a"))
+    backend.watermark = 5
+    reopened = LocalMemoryBackend(LocalVectorIndex(directory=str(tmp_path)), multi_tenant=True)
+    assert reopened.watermark == 0
+
+    backend.watermark = 12
+    reopened = LocalMemoryBackend(LocalVectorIndex(directory=str(tmp_path)), certainty=0.0, multi_tenant=True)
+    assert reopened.watermark == 12
+    assert len(reopened.search(vectors[0], 5, MemoryFilter(user_id="ana"))) == 4
+
+
+class FakeTenants:
+    def __init__(self):
+        self.activated = []
+        self.forgotten = []
+
+    def ensure_active(self, tenant):
+        self.activated.append(tenant)
+
+    def forget(self, tenant):
+        self.forgotten.append(tenant)
+
+    def stats(self):
+        return {}
+
+
+class FakeBatch:
+    def __init__(self):
+        self.objects = []
+
+    def configure(self, **kwargs):
+        pass
+
+    def add_data_object(self, **kwargs):
+        self.objects.append(kwargs)
+
+    def create_objects(self):
+        return []
+
+
+class FakeTenantClient:
+    """Cliente v3 simulado; a primeira pesquisa falha como num tenant COLD"""
+
+    def __init__(self, failures=1):
+        self.batch = FakeBatch()
+        self.query = self
+        self.failures = failures
+        self.tenants = []
+
+    def get(self, collection_name, properties):
+        self.collection_name = collection_name
+        return self
+
+    def with_near_vector(self, argument):
+        return self
+
+    def with_tenant(self, tenant):
+        self.tenants.append(tenant)
+        return self
+
+    def with_where(self, where):
+        return self
+
+    def with_additional(self, additional):
+        return self
+
+    def with_limit(self, limit):
+        return self
+
+    def do(self):
+        if self.failures:
+            self.failures -= 1
+            return {"errors": [{"message": "tenant not active"}]}
+        return {"data": {"Get": {self.collection_name: [
+            {"content": "memória", "user_id": "ana", "_additional": {"id": "m1", "certainty": 0.9}}
+        ]}}}
+
+
+def test_weaviate_backend_writes_and_searches_the_users_tenant():
+    client = FakeTenantClient()
+    tenants = FakeTenants()
+    backend = WeaviateMemoryBackend(client=client, multi_tenant=True, tenants=tenants)
+    assert backend.collection_name == "TenantConversationMemory"
+
+    backend.add_many(_records("ana", [[0.1, 0.2]], "a") + _records(None, [[0.3, 0.4]], "x"))
+    assert [obj["tenant"] for obj in client.batch.objects] == ["u-ana", ANONYMOUS_TENANT]
+
+    memories = backend.search([0.1, 0.2], 3, MemoryFilter(user_id="ana"))
+    assert [memory["id"] for memory in memories] == ["m1"]
+    # Tenant descarregado por outro worker: esquecido, reativado e pesquisa repetida
+    assert tenants.forgotten == ["u-ana"]
+    assert client.tenants == ["u-ana", "u-ana"]
+
+
+class FakeSchema:
+    def __init__(self, tenants):
+        self.tenants = tenants
+        self.updates = []
+
+    def get_class_tenants(self, class_name):
+        from weaviate.schema.crud_schema import Tenant
+        return [Tenant(name, status) for name, status in self.tenants.items()]
+
+    def update_class_tenants(self, class_name, tenants):
+        self.updates.extend(tenants)
+        for tenant in tenants:
+            self.tenants[tenant.name] = tenant.activity_status
+
+
+def test_offload_idle_marks_inactive_tenants_cold(session_factory):
+    from weaviate.schema.crud_schema import TenantActivityStatus
+
+    db = session_factory()
+    db.add(ChatHistory(session_id="s1", message_type="user", user_message="Olá", user_id="ana",
+                       timestamp=datetime.utcnow()))
+    db.add(ChatHistory(session_id="s2", message_type="user", user_message="Olá", user_id="rui",
+                       timestamp=datetime.utcnow() - timedelta(days=2)))
+    db.commit()
+    db.close()
+
+    schema = FakeSchema({"u-ana": TenantActivityStatus.HOT, "u-rui": TenantActivityStatus.HOT,
+                         "u-eva": TenantActivityStatus.COLD})
+
+    class Client:
+        pass
+
+    client = Client()
+    client.schema = schema
+    registry = WeaviateTenantRegistry(client_factory=lambda: client, session_factory=session_factory,
+                                      idle_seconds=3600)
+
+    assert registry.offload_idle() == ["u-rui"]
+    assert schema.tenants["u-rui"] == TenantActivityStatus.COLD
+    assert schema.tenants["u-ana"] == TenantActivityStatus.HOT
+    # Idempotente: nada mais a descarregar
+    assert registry.offload_idle() == []
+
+
+def test_user_id_column_is_added_to_existing_tables(sqlite_engine):
+    with sqlite_engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE chat_history (id INTEGER PRIMARY KEY, session_id VARCHAR(255), "
+            "message_type VARCHAR(50), user_message TEXT, assistant_message TEXT, "
+            "timestamp DATETIME, processed BOOLEAN, sequence INTEGER)"
+        ))
+
+    _ensure_columns(sqlite_engine)
+
+    columns = {column["name"] for column in inspect(sqlite_engine).get_columns("chat_history")}
+    assert "user_id" in columns
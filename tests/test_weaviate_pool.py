@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Testes da pool de ligação Weaviate partilhada da VectorMemory
+"""
+
+import os
+import sys
+import threading
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from backend_app.core import memory
+
+
+class FakeCollections:
+    def __init__(self):
+        self.list_calls = 0
+
+    def list_all(self):
+        self.list_calls += 1
+        return {"MemoryItem": object()}
+
+
+class FakeClient:
+    def __init__(self):
+        self.collections = FakeCollections()
+        self.ready = True
+        self.closed = False
+
+    def is_ready(self):
+        return self.ready
+
+    def close(self):
+        self.closed = True
+
+
+def _patch_connect(monkeypatch):
+    created = []
+
+    def fake_connect():
+        client = FakeClient()
+        created.append(client)
+        return client
+
+    monkeypatch.setattr(memory, "_connect_weaviate", fake_connect)
+    return created
+
+
+def test_pool_connects_and_checks_schema_once(monkeypatch):
+    created = _patch_connect(monkeypatch)
+    pool = memory.WeaviateConnectionPool(health_check_interval=0)
+
+    clients = []
+    threads = [
+        threading.Thread(target=lambda: clients.append(pool.get_client()))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(created) == 1
+    assert all(client is created[0] for client in clients)
+    assert created[0].collections.list_calls == 1
+
+
+def test_unhealthy_connection_is_replaced(monkeypatch):
+    created = _patch_connect(monkeypatch)
+    pool = memory.WeaviateConnectionPool(health_check_interval=0)
+
+    first = pool.get_client()
+    first.ready = False
+    assert pool.check_health() is False
+    assert first.closed
+
+    second = pool.get_client()
+    assert second is not first
+    assert len(created) == 2
+
+
+def test_pooled_vector_memory_does_not_close_shared_client(monkeypatch):
+    _patch_connect(monkeypatch)
+    monkeypatch.setattr(memory, "_connection_pool", None)
+
+    vector_memory = memory.get_vector_memory()
+    vector_memory.close()
+    assert not vector_memory.client.closed
+
+    memory.close_vector_memory()
+    assert vector_memory.client.closed